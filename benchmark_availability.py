@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark therapist slot search: the hour-by-hour walk with a linear scan
+of every appointment per candidate vs the bisect-based engine in
+wellbeing.utils.availability.
+
+Generates busy 90-day calendars, checks that both searches return the same
+slots (and that the engine matches a brute-force check for other slot
+lengths and buffers), then times the next-K search as calendars grow and
+the earliest slot across the whole pool (wellbeing.services.slot_search),
+as crisis intake asks for it.
+
+Usage:
+    python benchmark_availability.py [--therapists 50] [--days 90] [--occupancy 0.85] [--count 20]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from wellbeing.services.slot_search import TherapistCandidate, earliest_slots
+from wellbeing.utils.availability import (
+    DEFAULT_WORKING_HOURS,
+    BookedIntervals,
+    iter_free_slots,
+    next_free_slots,
+    working_windows
+)
+
+
+def busy_calendar(rng, start, days, occupancy, working_hours=DEFAULT_WORKING_HOURS):
+    """Hourly appointments filling about occupancy of the working hours, plus some off-grid ones."""
+    appointments = []
+    for window_start, window_end in working_windows(working_hours, start, start + timedelta(days=days)):
+        slot = window_start
+        while slot + timedelta(hours=1) <= window_end:
+            if rng.random() < occupancy:
+                # A few sessions start on the half hour or run long
+                offset = timedelta(minutes=30) if rng.random() < 0.1 else timedelta(0)
+                appointment = {'datetime': slot + offset}
+                if rng.random() < 0.1:
+                    appointment['duration'] = 90
+                appointments.append(appointment)
+            slot += timedelta(hours=1)
+    return appointments
+
+
+def legacy_slots(appointments, working_hours, start, days, count):
+    """The previous search: every working hour, every appointment per hour."""
+    existing_times = [apt['datetime'] for apt in appointments]
+    slots = []
+    for day_offset in range(days):
+        check_date = start + timedelta(days=day_offset)
+        day_name = check_date.strftime('%A').lower()
+        for start_hour, end_hour in working_hours.get(day_name) or []:
+            for hour in range(start_hour, end_hour):
+                slot_time = check_date.replace(hour=hour, minute=0, second=0, microsecond=0)
+                if all(abs((slot_time - existing).total_seconds()) / 3600 >= 1 for existing in existing_times):
+                    slots.append(slot_time)
+                    if len(slots) >= count:
+                        return slots
+    return slots
+
+
+def brute_force_slots(appointments, working_hours, start, end, slot, buffer, step):
+    """Every aligned candidate checked against every booking."""
+    booked = [(apt['datetime'], apt['datetime'] + timedelta(minutes=apt.get('duration', 60)))
+              for apt in appointments]
+    slots = []
+    for window_start, window_end in working_windows(working_hours, start, end):
+        candidate = window_start
+        while candidate + slot <= window_end:
+            if candidate >= start and all(
+                    candidate + slot + buffer <= booked_start or candidate - buffer >= booked_end
+                    for booked_start, booked_end in booked):
+                slots.append(candidate)
+            candidate += step
+    return slots
+
+
+def best_of(runs, fn):
+    """Fastest of several runs (ms) and the last result."""
+    timings, result = [], None
+    for _ in range(runs):
+        begin = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - begin) * 1000)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--therapists', type=int, default=50)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--occupancy', type=float, default=0.85)
+    parser.add_argument('--count', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    start = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    end = start + timedelta(days=args.days)
+    calendars = [busy_calendar(rng, start, args.days, args.occupancy) for _ in range(args.therapists)]
+    # Legacy search only understands whole-hour, one-hour sessions
+    hourly = [[apt for apt in calendar if apt['datetime'].minute == 0 and 'duration' not in apt]
+              for calendar in calendars]
+    bookings = sum(len(calendar) for calendar in calendars)
+
+    print(f"🧪 Slot search: {args.therapists} therapists, {args.days} days, "
+          f"{bookings:,} bookings ({args.occupancy:.0%} occupancy), next {args.count} slots")
+    print("=" * 70)
+
+    legacy_ms, expected = best_of(args.runs, lambda: [
+        legacy_slots(calendar, DEFAULT_WORKING_HOURS, start, args.days, args.count) for calendar in hourly])
+    build_ms, booked = best_of(args.runs, lambda: [BookedIntervals.from_appointments(c) for c in hourly])
+    search_ms, actual = best_of(args.runs, lambda: [
+        next_free_slots(intervals, DEFAULT_WORKING_HOURS, start, end, args.count) for intervals in booked])
+
+    print(f"Hour walk + linear scan       {legacy_ms:9.1f} ms")
+    print(f"Build sorted intervals        {build_ms:9.1f} ms")
+    print(f"Bisect search                 {search_ms:9.1f} ms   "
+          f"({legacy_ms / max(build_ms + search_ms, 1e-6):.0f}x faster)")
+    print(f"Slots identical:              {'yes' if expected == actual else 'NO'}")
+
+    # Other slot lengths, steps and buffers against a brute-force check
+    mismatches = 0
+    for calendar in calendars[:10]:
+        intervals = BookedIntervals.from_appointments(calendar)
+        for slot, buffer, step in ((50, 10, 60), (30, 0, 15), (90, 15, 30), (60, 5, 60)):
+            options = dict(slot=timedelta(minutes=slot), buffer=timedelta(minutes=buffer),
+                           step=timedelta(minutes=step))
+            if list(iter_free_slots(intervals, DEFAULT_WORKING_HOURS, start, end, **options)) != \
+                    brute_force_slots(calendar, DEFAULT_WORKING_HOURS, start, end, **options):
+                mismatches += 1
+    print(f"Lengths/buffers vs brute force: {'match' if not mismatches else f'{mismatches} MISMATCHES'}")
+
+    # Cost per slot as the calendar grows (a single therapist, all slots)
+    print("-" * 70)
+    for days in (30, 90, 365):
+        calendar = busy_calendar(rng, start, days, args.occupancy)
+        intervals = BookedIntervals.from_appointments(calendar)
+        window_end = start + timedelta(days=days)
+        search_ms, slots = best_of(args.runs, lambda: list(
+            iter_free_slots(intervals, DEFAULT_WORKING_HOURS, start, window_end)))
+        per_slot_us = search_ms * 1000 / max(len(slots), 1)
+        print(f"{days:4d} days, {len(intervals):6,} intervals: {len(slots):5,} free slots "
+              f"in {search_ms:7.2f} ms ({per_slot_us:.1f} µs/slot)")
+
+    # Earliest slot across the pool: one at a time vs merged iterators
+    print("-" * 70)
+    candidates = [
+        TherapistCandidate({'_id': f'{index:024x}'}, None, rng.randint(0, 20), calendar)
+        for index, calendar in enumerate(calendars)
+    ]
+    one_by_one_ms, expected = best_of(args.runs, lambda: min(
+        (candidate.next_slot(start, end), candidate.caseload, str(candidate.therapist_id))
+        for candidate in candidates))
+    merged_ms, matches = best_of(args.runs, lambda: earliest_slots(candidates, start, end))
+    match = matches[0]
+    same = expected == (match.datetime, match.candidate.caseload, str(match.candidate.therapist_id))
+    print(f"Pool of {len(candidates)}: earliest slot {match.datetime:%a %d %b %H:%M} "
+          f"in {merged_ms:.2f} ms (per-therapist loop {one_by_one_ms:.2f} ms, "
+          f"{'same' if same else 'DIFFERENT'} pick)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-turn Claude client overhead: new client per message vs the
+shared pooled client from wellbeing.services.claude_client.
+
+Runs against a local fake Anthropic HTTP server, so the numbers measure
+client construction and connection setup only, not model latency. Plain
+HTTP has no TLS handshake, so the real-world gain is larger than shown.
+
+Usage:
+    python benchmark_claude_client.py [turns]
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import anthropic
+
+from wellbeing.services.claude_client import get_claude_client, close_claude_clients
+
+API_KEY = 'sk-ant-REDACTED'
+MODEL = 'claude-3-haiku-20240307'
+
+FAKE_MESSAGE = {
+    'id': 'msg_benchmark',
+    'type': 'message',
+    'role': 'assistant',
+    'model': MODEL,
+    'content': [{'type': 'text', 'text': "That sounds stressful. • Take short breaks • Sleep well"}],
+    'stop_reason': 'end_turn',
+    'stop_sequence': None,
+    'usage': {'input_tokens': 42, 'output_tokens': 17}
+}
+
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    """Minimal /v1/messages endpoint with HTTP/1.1 keep-alive."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        body = json.dumps(FAKE_MESSAGE).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAnthropicHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def send_turn(client):
+    return client.messages.create(
+        model=MODEL,
+        max_tokens=100,
+        messages=[{'role': 'user', 'content': "I'm stressed about exams"}]
+    )
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(label, turns, make_client, close_each=False):
+    timings = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        client = make_client()
+        send_turn(client)
+        timings.append((time.perf_counter() - start) * 1000)
+        if close_each:
+            client.close()
+    print(f"{label:<28} p50 {percentile(timings, 50):7.2f} ms   p99 {percentile(timings, 99):7.2f} ms")
+    return timings
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    server, base_url = start_fake_server()
+
+    print(f"🧪 Claude client overhead benchmark ({turns} turns against {base_url})")
+    print("=" * 70)
+
+    # Warm up both paths so imports and first-request costs are excluded
+    send_turn(anthropic.Anthropic(api_key=API_KEY, base_url=base_url, max_retries=0))
+    send_turn(get_claude_client(API_KEY, timeout=30, base_url=base_url))
+
+    before = run(
+        "before: client per turn",
+        turns,
+        lambda: anthropic.Anthropic(api_key=API_KEY, base_url=base_url, max_retries=0),
+        close_each=True
+    )
+    after = run(
+        "after: pooled client",
+        turns,
+        lambda: get_claude_client(API_KEY, timeout=30, base_url=base_url)
+    )
+
+    print("=" * 70)
+    saved_p50 = percentile(before, 50) - percentile(after, 50)
+    saved_p99 = percentile(before, 99) - percentile(after, 99)
+    print(f"Saved per turn: p50 {saved_p50:.2f} ms, p99 {saved_p99:.2f} ms")
+
+    close_claude_clients()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark the admin mood reports: list-based analysis (one Python pass per
+report) vs the columnar NumPy engine in wellbeing.services.mood_analytics.
+
+Generates a synthetic year of mood entries, checks that both engines
+produce identical reports, and times them against MOOD_ANALYTICS_BUDGET_MS.
+With --mongo the entries are also written to a scratch database so the
+projected load (BSON decode into columns) is timed too.
+
+Usage:
+    python benchmark_mood_analytics.py [--entries 120000] [--users 3000] [--days 365]
+                                       [--mongo mongodb://localhost:27017] [--budget-ms 1000]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from wellbeing.blueprints.admin.mood_reports import analyze_mood_data
+from wellbeing.services.mood_analytics import (
+    MOOD_PROJECTION,
+    MOODS,
+    MoodColumns,
+    analyze_mood_columns
+)
+
+TRIGGERS = ['exams', 'sleep', 'family', 'friends', 'money', 'exercise', 'work',
+            'relationships', 'health', 'weather', 'social media', 'deadlines']
+MOOD_WEIGHTS = [0.25, 0.15, 0.3, 0.18, 0.12]
+
+
+def synthetic_moods(entries, users, start_date, end_date, seed=7):
+    """Mood documents spread over the range, in timestamp order."""
+    rng = random.Random(seed)
+    span = (end_date - start_date).total_seconds()
+    offsets = sorted(rng.random() * span for _ in range(entries))
+    user_ids = [f"{rng.getrandbits(96):024x}" for _ in range(users)]
+    # A few very active users so every engagement bucket is populated
+    user_weights = [rng.paretovariate(1.5) for _ in range(users)]
+
+    moods = []
+    for offset, user_id in zip(offsets, rng.choices(user_ids, user_weights, k=entries)):
+        doc = {
+            'user_id': user_id,
+            'mood': rng.choices(MOODS, MOOD_WEIGHTS)[0],
+            'timestamp': start_date + timedelta(seconds=offset),
+            'context': ''
+        }
+        if rng.random() < 0.8:
+            doc['intensity'] = rng.randint(1, 10)
+        if rng.random() < 0.6:
+            doc['triggers'] = rng.sample(TRIGGERS, rng.randint(1, 3))
+        moods.append(doc)
+    return moods
+
+
+def best_of(runs, fn):
+    """Fastest of several runs (ms) and the last result."""
+    timings, result = [], None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--entries', type=int, default=120000)
+    parser.add_argument('--users', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--budget-ms', type=float, default=1000)
+    parser.add_argument('--mongo', help='MongoDB URI for the end-to-end load timing')
+    args = parser.parse_args()
+
+    end_date = datetime.now(timezone.utc)
+    start_date = end_date - timedelta(days=args.days)
+    moods = synthetic_moods(args.entries, args.users, start_date, end_date)
+
+    print(f"🧪 Mood analytics: {len(moods):,} entries, {args.users:,} users, {args.days} days")
+    print("=" * 70)
+
+    list_ms, expected = best_of(args.runs, lambda: analyze_mood_data(moods, start_date, end_date))
+    decode_ms, columns = best_of(args.runs, lambda: MoodColumns(moods))
+    reports_ms, actual = best_of(args.runs, lambda: analyze_mood_columns(columns, start_date, end_date, end_date))
+
+    print(f"List analysis (6 passes)      {list_ms:9.1f} ms")
+    print(f"Columnar decode               {decode_ms:9.1f} ms")
+    print(f"Columnar reports (bincounts)  {reports_ms:9.1f} ms")
+    print(f"Columnar total                {decode_ms + reports_ms:9.1f} ms   "
+          f"({list_ms / (decode_ms + reports_ms):.1f}x faster)")
+
+    mismatched = [key for key in expected if expected[key] != actual.get(key)]
+    print(f"Reports identical:            {'yes' if not mismatched else 'NO: ' + ', '.join(mismatched)}")
+
+    if args.mongo:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo, tz_aware=True)
+        collection = client['wellbeing_benchmark']['moods']
+        collection.drop()
+        collection.insert_many([dict(doc) for doc in moods], ordered=False)
+        collection.create_index([('timestamp', 1), ('user_id', 1)])
+        query = {'timestamp': {'$gte': start_date, '$lte': end_date}}
+
+        full_ms, _ = best_of(args.runs, lambda: analyze_mood_data(
+            list(collection.find(query).sort('timestamp', 1)), start_date, end_date))
+        columnar_ms, _ = best_of(args.runs, lambda: analyze_mood_columns(
+            MoodColumns(collection.find(query, MOOD_PROJECTION).sort('timestamp', 1).batch_size(5000)),
+            start_date, end_date))
+        print("-" * 70)
+        print(f"End to end, full documents    {full_ms:9.1f} ms")
+        print(f"End to end, projected columns {columnar_ms:9.1f} ms")
+        client.drop_database('wellbeing_benchmark')
+        total_ms = columnar_ms
+    else:
+        total_ms = decode_ms + reports_ms
+
+    print("=" * 70)
+    verdict = 'within' if total_ms <= args.budget_ms else 'OVER'
+    print(f"{verdict} budget: {total_ms:.1f} ms of {args.budget_ms:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
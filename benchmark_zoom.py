@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark Zoom meeting calls against a local fake Zoom server
+(wellbeing.utils.fake_zoom): the previous client (a new manager, OAuth
+token and TCP connection per meeting) vs the pooled client in
+wellbeing.utils.zoom_integration, one at a time and batched on the worker
+pool.
+
+Also checks that concurrent callers share one token, that 429/503
+responses are retried, and that a revoked token is refreshed.
+
+Usage:
+    python benchmark_zoom.py [--meetings 40] [--latency 0.02]
+"""
+import argparse
+import base64
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+from wellbeing.utils.fake_zoom import FakeZoomServer
+
+
+def appointment(index):
+    return {
+        'datetime': datetime.now() + timedelta(days=1, hours=index),
+        'crisis_level': 'normal',
+        'notes': f'Benchmark appointment {index}',
+        'appointment_id': f'bench-{index}'
+    }
+
+
+def legacy_create(zoom, meeting_data):
+    """The previous flow: fresh manager, so a token request, then the meeting, each on a new connection."""
+    env = zoom.env()
+    credentials = base64.b64encode(f"{env['ZOOM_CLIENT_ID']}:{env['ZOOM_CLIENT_SECRET']}".encode()).decode()
+    token = requests.post(env['ZOOM_OAUTH_URL'], headers={'Authorization': f'Basic {credentials}'},
+                          data={'grant_type': 'account_credentials', 'account_id': env['ZOOM_ACCOUNT_ID']},
+                          timeout=30).json()['access_token']
+    response = requests.post(f"{env['ZOOM_API_BASE_URL']}/users/me/meetings", json=meeting_data,
+                             headers={'Authorization': f'Bearer {token}'}, timeout=30)
+    return response.status_code == 201
+
+
+def timed(zoom, fn):
+    """(ms, result, server stats) for one run."""
+    zoom.reset_stats()
+    begin = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - begin) * 1000, result, zoom.stats()
+
+
+def report(label, ms, stats, count):
+    print(f"{label:<30}{ms:9.1f} ms  {ms / count:6.1f} ms/meeting  "
+          f"{stats['connections']:4d} connections  {stats['token_grants']:4d} tokens")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--meetings', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.02, help='fake Zoom response time in seconds')
+    args = parser.parse_args()
+
+    with FakeZoomServer(latency=args.latency) as zoom:
+        # The client reads its settings from the environment
+        os.environ.update(zoom.env())
+        os.environ.setdefault('ZOOM_BACKOFF_SECONDS', '0.01')
+        from wellbeing.utils import zoom_integration as client
+        client.ZOOM_BACKOFF_SECONDS = float(os.environ['ZOOM_BACKOFF_SECONDS'])
+        # Per-meeting log lines would swamp the report
+        logging.getLogger(client.__name__).setLevel(logging.ERROR)
+
+        count = args.meetings
+        print(f"🧪 Zoom client: {count} meetings, {args.latency * 1000:.0f} ms simulated Zoom latency, "
+              f"{client.ZOOM_WORKERS} workers, pool of {client.ZOOM_POOL_SIZE}")
+        print("=" * 86)
+
+        manager = client.get_zoom_manager()
+        meeting_data = [manager._prepare_meeting_data(appointment(i)) for i in range(count)]
+        legacy_ms, created, stats = timed(zoom, lambda: [legacy_create(zoom, data) for data in meeting_data])
+        report('Per-call manager (previous)', legacy_ms, stats, count)
+        assert all(created)
+
+        serial_ms, results, stats = timed(zoom, lambda: [
+            client.create_zoom_therapy_meeting(appointment(i)) for i in range(count)])
+        report('Pooled, one at a time', serial_ms, stats, count)
+        assert all(success for success, _ in results)
+
+        batch_ms, results, stats = timed(zoom, lambda: client.create_zoom_therapy_meetings(
+            [(appointment(i), None, None) for i in range(count)]))
+        report('Pooled, batched', batch_ms, stats, count)
+        assert all(success for success, _ in results)
+        print(f"{'':30}{legacy_ms / max(batch_ms, 1e-6):9.1f}x faster than per-call")
+
+        meeting_ids = [info['zoom_meeting_id'] for _, info in results]
+        cancel_ms, cancelled, stats = timed(zoom, lambda: client.cancel_zoom_meetings(meeting_ids))
+        report('Batched cancellations', cancel_ms, stats, count)
+
+        # Concurrent callers with no cached token: one grant between them
+        print("-" * 86)
+        manager.invalidate_access_token()
+        _, results, stats = timed(zoom, lambda: client.create_zoom_therapy_meetings(
+            [(appointment(i), None, None) for i in range(client.ZOOM_WORKERS * 3)]))
+        print(f"Cold start, {len(results)} concurrent creates: {stats['token_grants']} token request(s)")
+
+        # Rate limiting and outages are retried
+        zoom.fail_next(429, 2, retry_after=0.01)
+        zoom.fail_next(503)
+        _, (success, info), stats = timed(zoom, lambda: client.create_zoom_therapy_meeting(appointment(0)))
+        print(f"429, 429, 503 then success: {'created' if success else 'FAILED'} "
+              f"after {stats['requests'].get('POST meetings', 0)} attempts")
+
+        # A revoked token is refreshed once and the call repeated
+        zoom.revoke_tokens()
+        _, (success, _), stats = timed(zoom, lambda: client.cancel_zoom_meeting(str(info['zoom_meeting_id'])))
+        print(f"Revoked token: cancel {'succeeded' if success else 'FAILED'} "
+              f"with {stats['token_grants']} new token")
+
+
+if __name__ == '__main__':
+    main()
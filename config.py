@@ -68,11 +68,22 @@ class Config:
     CLAUDE_MAX_RETRIES = int(os.getenv('CLAUDE_MAX_RETRIES', '3'))
     CLAUDE_RETRY_DELAY = float(os.getenv('CLAUDE_RETRY_DELAY', '1.0'))  # seconds
     
+    # Claude HTTP connection pool (shared client, reused across chat turns)
+    CLAUDE_BASE_URL = os.getenv('CLAUDE_BASE_URL')  # None = Anthropic default
+    CLAUDE_HTTP_MAX_CONNECTIONS = int(os.getenv('CLAUDE_HTTP_MAX_CONNECTIONS', '20'))
+    CLAUDE_HTTP_MAX_KEEPALIVE = int(os.getenv('CLAUDE_HTTP_MAX_KEEPALIVE', '10'))
+    CLAUDE_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('CLAUDE_HTTP_KEEPALIVE_EXPIRY', '60'))  # seconds
+    
     # Budget Management Settings
     MAX_MONTHLY_SPEND = float(os.getenv('MAX_MONTHLY_SPEND', '5.00'))  # $5 budget
     USAGE_ALERT_THRESHOLD = float(os.getenv('USAGE_ALERT_THRESHOLD', '4.00'))  # Alert at $4
     DAILY_SPENDING_LIMIT = float(os.getenv('DAILY_SPENDING_LIMIT', '0.50'))  # $0.50 per day
     
+    # Spend ledger: enforces the budget and CLAUDE_RATE_LIMIT_* before each paid call
+    SPEND_LEDGER_ENABLED = os.getenv('SPEND_LEDGER_ENABLED', 'True') == 'True'
+    SPEND_LEDGER_CHECKPOINT_SECONDS = int(os.getenv('SPEND_LEDGER_CHECKPOINT_SECONDS', '30'))
+    SPEND_LEDGER_REDIS_URL = os.getenv('SPEND_LEDGER_REDIS_URL')  # None = checkpoint to MongoDB
+    
     # Chatbot Configuration - UPDATED FOR SHORT RESPONSES
     CHATBOT_SYSTEM_PROMPT = os.getenv('CHATBOT_SYSTEM_PROMPT', 
         """You are a university counseling chatbot. CRITICAL: Keep ALL responses under 30 words maximum.
@@ -83,6 +94,78 @@ class Config:
         - Never exceed 30 words per response"""
     )
     
+    # Response cache for repeated openers ("I'm stressed about exams"), per worker
+    CHATBOT_CACHE_ENABLED = os.getenv('CHATBOT_CACHE_ENABLED', 'True') == 'True'
+    CHATBOT_CACHE_MAX_ENTRIES = int(os.getenv('CHATBOT_CACHE_MAX_ENTRIES', '500'))
+    CHATBOT_CACHE_TTL = int(os.getenv('CHATBOT_CACHE_TTL', '3600'))  # seconds
+    CHATBOT_CACHE_APPROXIMATE = os.getenv('CHATBOT_CACHE_APPROXIMATE', 'True') == 'True'  # needs scikit-learn
+    CHATBOT_CACHE_SIMILARITY = float(os.getenv('CHATBOT_CACHE_SIMILARITY', '0.85'))  # cosine threshold
+    CHATBOT_CACHE_MIN_WORDS = int(os.getenv('CHATBOT_CACHE_MIN_WORDS', '3'))  # skip "yes", "thanks"
+    CHATBOT_CACHE_EXCLUDED_TOPICS = ['crisis']  # never served from cache
+    
+    # Per-user conversation context cache (last turns per user)
+    CHAT_CONTEXT_CACHE_ENABLED = os.getenv('CHAT_CONTEXT_CACHE_ENABLED', 'True') == 'True'
+    CHAT_CONTEXT_MAX_USERS = int(os.getenv('CHAT_CONTEXT_MAX_USERS', '1000'))  # in-process LRU bound
+    CHAT_CONTEXT_MAX_TURNS = int(os.getenv('CHAT_CONTEXT_MAX_TURNS', '5'))  # turns cached per user
+    CHAT_CONTEXT_TURNS = int(os.getenv('CHAT_CONTEXT_TURNS', '1'))  # turns sent to Claude as context
+    CHAT_CONTEXT_REDIS_URL = os.getenv('CHAT_CONTEXT_REDIS_URL')  # defaults to a Redis SOCKETIO_MESSAGE_QUEUE
+    
+    # Write-behind queue: chat and log inserts are batched on a background thread
+    WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'True') == 'True'
+    WRITE_BEHIND_MAX_QUEUE = int(os.getenv('WRITE_BEHIND_MAX_QUEUE', '10000'))  # bounded memory
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '100'))  # docs per insert_many
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '0.25'))  # seconds
+    WRITE_BEHIND_BLOCK_TIMEOUT = float(os.getenv('WRITE_BEHIND_BLOCK_TIMEOUT', '1.0'))  # backpressure wait
+    WRITE_BEHIND_MAX_RETRIES = int(os.getenv('WRITE_BEHIND_MAX_RETRIES', '3'))  # per failed insert
+    WRITE_BEHIND_RETRY_BACKOFF = float(os.getenv('WRITE_BEHIND_RETRY_BACKOFF', '0.5'))  # seconds, doubled per retry
+    WRITE_BEHIND_SPILL_PATH = os.getenv('WRITE_BEHIND_SPILL_PATH')  # None = <instance>/write_behind_spill.jsonl
+    
+    # Socket.IO across several worker processes: emits go through a pub/sub
+    # message queue (redis://...; local:// is an in-process stand-in for tests)
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')  # None = single process
+    SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'wellbeing-socketio')
+    SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+    
+    # Socket.IO presence registry (who is online, who is in which room)
+    PRESENCE_REDIS_URL = os.getenv('PRESENCE_REDIS_URL')  # defaults to a Redis SOCKETIO_MESSAGE_QUEUE
+    PRESENCE_TTL_SECONDS = int(os.getenv('PRESENCE_TTL_SECONDS', '86400'))  # expires entries of dead workers
+    
+    # Run the index advisor (explain() on hot query shapes) at startup
+    INDEX_ADVISOR_ON_STARTUP = os.getenv('INDEX_ADVISOR_ON_STARTUP', 'False') == 'True'
+    
+    # Admin chat analytics charts are cached per (range, topic), per worker
+    ADMIN_ANALYTICS_CACHE_TTL = int(os.getenv('ADMIN_ANALYTICS_CACHE_TTL', '300'))  # seconds
+    
+    # Student dashboard: independent sections are queried on a thread pool and
+    # kept per user for a short TTL (invalidated on mood/chat/appointment writes)
+    DASHBOARD_MAX_WORKERS = int(os.getenv('DASHBOARD_MAX_WORKERS', '8'))  # shared by all requests
+    DASHBOARD_CACHE_ENABLED = os.getenv('DASHBOARD_CACHE_ENABLED', 'True') == 'True'
+    DASHBOARD_CACHE_TTL_SECONDS = int(os.getenv('DASHBOARD_CACHE_TTL_SECONDS', '30'))
+    DASHBOARD_CACHE_MAX_USERS = int(os.getenv('DASHBOARD_CACHE_MAX_USERS', '2000'))  # in-process LRU bound
+    DASHBOARD_REDIS_URL = os.getenv('DASHBOARD_REDIS_URL')  # shares invalidations; defaults to a Redis SOCKETIO_MESSAGE_QUEUE
+    DASHBOARD_TIMING_HEADER = os.getenv('DASHBOARD_TIMING_HEADER', 'False') == 'True'  # always on in debug
+    
+    # Admin mood reports (vectorized with NumPy); slower runs are logged
+    MOOD_ANALYTICS_BUDGET_MS = int(os.getenv('MOOD_ANALYTICS_BUDGET_MS', '1000'))
+    
+    # CSV / NDJSON exports are streamed from the cursor in constant memory
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))  # documents per cursor batch
+    EXPORT_CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', '65536'))  # response chunk size
+    EXPORT_GZIP = os.getenv('EXPORT_GZIP', 'True') == 'True'  # when the client sends Accept-Encoding: gzip
+    
+    # Background export jobs for large admin reports (run on the app scheduler)
+    EXPORT_JOB_WORKERS = int(os.getenv('EXPORT_JOB_WORKERS', '2'))  # concurrent report builds per process
+    EXPORT_JOB_DIR = os.getenv('EXPORT_JOB_DIR')  # None = <instance>/exports; must be shared by all workers
+    EXPORT_JOB_TTL_HOURS = int(os.getenv('EXPORT_JOB_TTL_HOURS', '24'))  # finished files are deleted after this
+    EXPORT_JOBS_INLINE = False  # build in the request (tests)
+    
+    # Therapist matching index
+    MATCHING_INDEX_TTL_SECONDS = int(os.getenv('MATCHING_INDEX_TTL_SECONDS', '300'))  # full rebuild; bounds staleness across workers
+    CASELOAD_RECONCILE_MINUTES = int(os.getenv('CASELOAD_RECONCILE_MINUTES', '60'))  # recount therapist caseload counters; 0 disables
+    CASELOAD_RECONCILE_GRACE_SECONDS = int(os.getenv('CASELOAD_RECONCILE_GRACE_SECONDS', '60'))  # skip therapists with writes this recent
+    NOTIFICATION_COUNTER_REBUILD_MINUTES = int(os.getenv('NOTIFICATION_COUNTER_REBUILD_MINUTES', '60'))  # repair drifted notification counters; 0 disables
+    CONVERSATION_COUNTER_REBUILD_MINUTES = int(os.getenv('CONVERSATION_COUNTER_REBUILD_MINUTES', '60'))  # repair drifted therapist chat totals; 0 disables
+    
     # Crisis Detection Settings
     CRISIS_DETECTION_ENABLED = os.getenv('CRISIS_DETECTION_ENABLED', 'True') == 'True'
     CRISIS_KEYWORDS = [
@@ -271,6 +354,15 @@ class TestingConfig(Config):
     # Shorter token expiry for faster testing
     PASSWORD_RESET_TOKEN_EXPIRY = timedelta(minutes=5)
     
+    # Exercise the message-queue code path without a Redis server
+    SOCKETIO_MESSAGE_QUEUE = 'local://'
+    
+    # Build export jobs synchronously, no scheduler threads
+    EXPORT_JOBS_INLINE = True
+    CASELOAD_RECONCILE_MINUTES = 0
+    NOTIFICATION_COUNTER_REBUILD_MINUTES = 0
+    CONVERSATION_COUNTER_REBUILD_MINUTES = 0
+    
     # ===== NEW: Testing Claude Settings =====
     # Mock Claude settings for testing
     CLAUDE_API_KEY = 'sk-ant-REDACTED'  # Mock key
@@ -288,6 +380,9 @@ class TestingConfig(Config):
     
     # Disable actual API calls in testing
     CLAUDE_MOCK_RESPONSES = True
+    CHATBOT_CACHE_ENABLED = False
+    WRITE_BEHIND_ENABLED = False  # tests read their own writes immediately
+    DASHBOARD_CACHE_ENABLED = False
     
     @staticmethod
     def init_app(app):
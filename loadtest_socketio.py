@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Load test for multi-worker Socket.IO fan-out through the message queue.
+
+Starts several Socket.IO servers ("workers") in this process, each with its
+own client manager on the same channel, and attaches thousands of simulated
+student and therapist sockets to them. Each pair shares a connection room,
+and the student and therapist of a pair sit on different workers, so every
+message has to cross the message queue to reach the therapist. Sockets are
+simulated below the transport (no HTTP), so the numbers measure the pub/sub
+path and the presence registry, not the network.
+
+Usage:
+    python loadtest_socketio.py [--pairs 2000] [--workers 4] [--messages 5000]
+                                [--rate 1000] [--queue local:// | redis://localhost:6379/0]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import socketio as python_socketio
+
+from wellbeing.utils.presence import PresenceRegistry
+from wellbeing.utils.socketio_queue import make_client_manager
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+EVENT = 'new_message'
+
+
+class DeliveryRecorder:
+    """Collects (message, socket) deliveries and their latency."""
+
+    def __init__(self):
+        self.latencies = []
+        self.delivered = 0
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+
+    def record(self, payload):
+        latency = (time.perf_counter() - payload['sent_at']) * 1000
+        with self._lock:
+            self.latencies.append(latency)
+            self.delivered += 1
+            self._done.notify_all()
+
+    def wait_for(self, expected, timeout):
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self.delivered < expected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._done.wait(remaining)
+        return True
+
+
+class SimulatedWorker(python_socketio.Server):
+    """Socket.IO server whose outgoing packets are recorded instead of sent."""
+
+    def __init__(self, name, recorder, **kwargs):
+        super().__init__(async_mode='threading', **kwargs)
+        self.name = name
+        self.recorder = recorder
+
+    def _send_eio_packet(self, eio_sid, eio_pkt):
+        self._record(eio_pkt.data)
+
+    def _send_packet(self, eio_sid, pkt):
+        self._record(pkt.encode())
+
+    def _record(self, encoded):
+        if not isinstance(encoded, str) or '[' not in encoded:
+            return
+        event, *args = json.loads(encoded[encoded.index('['):])
+        if event == EVENT and args:
+            self.recorder.record(args[0])
+
+    def open_socket(self):
+        """Simulate an Engine.IO connection joining the default namespace."""
+        eio_sid = uuid.uuid4().hex
+        self._handle_eio_connect(eio_sid, {})
+        return self.manager.connect(eio_sid, '/'), eio_sid
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pairs', type=int, default=2000, help='student-therapist pairs (2 sockets each)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--rate', type=float, default=1000, help='messages per second')
+    parser.add_argument('--queue', default='local://', help='message queue URL')
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    channel = f"wellbeing-loadtest-{uuid.uuid4().hex[:8]}"
+    recorder = DeliveryRecorder()
+    workers = [
+        SimulatedWorker(f"worker-{i}", recorder, client_manager=make_client_manager(args.queue, channel=channel))
+        for i in range(args.workers)
+    ]
+
+    redis_client = None
+    if args.queue.startswith(('redis://', 'rediss://')) and REDIS_AVAILABLE:
+        redis_client = redis.Redis.from_url(args.queue, decode_responses=True)
+    presence = PresenceRegistry(redis_client=redis_client, ttl_seconds=600)
+
+    print(f"🧪 Socket.IO fan-out load test: {args.pairs * 2} sockets on {args.workers} workers via {args.queue}")
+    print("=" * 70)
+
+    # ----- connect -----
+    start = time.perf_counter()
+    pairs = []
+    for i in range(args.pairs):
+        student_id, therapist_id = f"s{i:06d}", f"t{i % max(args.pairs // 20, 1):06d}"
+        room_id = f"connection_{min(student_id, therapist_id)}_{max(student_id, therapist_id)}"
+        student_worker = workers[i % args.workers]
+        therapist_worker = workers[(i + 1) % args.workers]
+        for worker, user_id, role in ((student_worker, student_id, 'student'),
+                                      (therapist_worker, therapist_id, 'therapist')):
+            sid, eio_sid = worker.open_socket()
+            worker.enter_room(sid, room_id)
+            presence.add_connection(sid, user_id, user_role=role, connected_at=datetime.now(timezone.utc))
+            presence.join_room(sid, room_id)
+        pairs.append((student_worker, room_id))
+    connect_seconds = time.perf_counter() - start
+    print(f"Connected {args.pairs * 2} sockets in {connect_seconds:.2f}s "
+          f"({args.pairs * 2 / connect_seconds:,.0f} sockets/s, {presence.connection_count()} in presence)")
+
+    # Presence checks a therapist status request makes for a whole caseload
+    caseload = [f"s{i:06d}" for i in random.sample(range(args.pairs), min(50, args.pairs))]
+    start = time.perf_counter()
+    for _ in range(100):
+        presence.online_users(caseload)
+    print(f"Caseload online check ({len(caseload)} students): {(time.perf_counter() - start) * 10:.3f} ms")
+
+    # ----- fan-out -----
+    time.sleep(0.2)  # let every manager's listener subscribe
+    interval = 1.0 / args.rate if args.rate else 0
+    start = time.perf_counter()
+    for n in range(args.messages):
+        worker, room_id = random.choice(pairs)
+        worker.emit(EVENT, {'seq': n, 'sent_at': time.perf_counter()}, room=room_id)
+        if interval:
+            next_send = start + (n + 1) * interval
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    send_seconds = time.perf_counter() - start
+
+    expected = args.messages * 2  # student and therapist both receive each message
+    complete = recorder.wait_for(expected, args.timeout)
+    total_seconds = time.perf_counter() - start
+
+    print("=" * 70)
+    print(f"Sent {args.messages} messages in {send_seconds:.2f}s; "
+          f"delivered {recorder.delivered}/{expected}{'' if complete else ' (timed out)'} in {total_seconds:.2f}s")
+    if recorder.latencies:
+        latencies = recorder.latencies
+        print(f"Fan-out latency  p50 {percentile(latencies, 50):7.2f} ms   p95 {percentile(latencies, 95):7.2f} ms   "
+              f"p99 {percentile(latencies, 99):7.2f} ms   max {max(latencies):7.2f} ms")
+        print(f"Throughput       {recorder.delivered / total_seconds:,.0f} deliveries/s")
+
+    for worker in workers:
+        close = getattr(worker.manager, 'close', None)
+        if close:
+            close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,18 @@
 
 from flask import session, request
 from flask_socketio import emit, join_room, leave_room, disconnect
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from bson.objectid import ObjectId
 import json
 
 from wellbeing import socketio, mongo, logger
+from wellbeing.models.notification import create_notification, get_notification_counts, user_room
+from wellbeing.models.therapist_chat import (
+    get_unread_counts_for_therapist,
+    insert_therapist_chat,
+    mark_conversation_read
+)
+from wellbeing.utils.presence import get_presence_registry
 
 # Import connection utilities
 try:
@@ -21,9 +28,8 @@ except ImportError:
     def get_user_role(user_id):
         return 'unknown'
 
-# Store active connections
-active_connections = {}
-user_rooms = {}
+# Active connections and room membership live in the presence registry
+# (wellbeing/utils/presence.py), indexed by sid, user and room
 
 # ===== CONNECTION MANAGEMENT =====
 
@@ -41,13 +47,14 @@ def handle_connect(auth=None):
         user_role = get_user_role(user_id)
         
         # Store connection info
-        active_connections[request.sid] = {
-            'user_id': user_id,
-            'user_role': user_role,
-            'connected_at': datetime.now(timezone.utc),
-            'ip_address': request.remote_addr,
-            'user_agent': request.headers.get('User-Agent', 'Unknown')
-        }
+        get_presence_registry().add_connection(
+            request.sid,
+            user_id,
+            user_role=user_role,
+            connected_at=datetime.now(timezone.utc),
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent', 'Unknown')
+        )
         
         logger.info(f"Socket.IO connection established: {user_role} {user_id} (SID: {request.sid})")
         
@@ -62,6 +69,14 @@ def handle_connect(auth=None):
         # Send initial status
         emit('status_update', get_user_status(user_id, user_role))
         
+        # Per-user room for pushed notification counters (replaces polling)
+        join_room(user_room(user_id))
+        counts = get_notification_counts(user_id)
+        emit('notification_counts', {
+            'unread_count': counts['unread'],
+            'total_count': counts['total']
+        })
+        
         return True
         
     except Exception as e:
@@ -73,19 +88,15 @@ def handle_connect(auth=None):
 def handle_disconnect():
     """Handle client disconnection"""
     try:
-        if request.sid in active_connections:
-            connection_info = active_connections[request.sid]
+        # Remove from active connections (and every room index)
+        connection_info = get_presence_registry().remove_connection(request.sid)
+        if connection_info:
             user_id = connection_info['user_id']
             user_role = connection_info['user_role']
             
             # Leave all rooms
-            if request.sid in user_rooms:
-                for room in user_rooms[request.sid]:
-                    leave_room(room)
-                del user_rooms[request.sid]
-            
-            # Remove from active connections
-            del active_connections[request.sid]
+            for room in connection_info['rooms']:
+                leave_room(room)
             
             logger.info(f"Socket.IO disconnection: {user_role} {user_id} (SID: {request.sid})")
             
@@ -101,11 +112,11 @@ def handle_disconnect():
 def handle_join_connection_room(data):
     """Join a room for student-therapist communication"""
     try:
-        if request.sid not in active_connections:
+        connection_info = get_presence_registry().get_connection(request.sid)
+        if connection_info is None:
             emit('error', {'message': 'Not authenticated'})
             return
         
-        connection_info = active_connections[request.sid]
         user_id = connection_info['user_id']
         user_role = connection_info['user_role']
         
@@ -138,16 +149,16 @@ def handle_join_connection_room(data):
         join_room(room_id)
         
         # Track user rooms
-        if request.sid not in user_rooms:
-            user_rooms[request.sid] = set()
-        user_rooms[request.sid].add(room_id)
+        presence = get_presence_registry()
+        presence.join_room(request.sid, room_id)
         
         # Update connection info
-        active_connections[request.sid].update({
-            'current_room': room_id,
-            'student_id': student_id,
-            'therapist_id': therapist_id
-        })
+        presence.update_connection(
+            request.sid,
+            current_room=room_id,
+            student_id=student_id,
+            therapist_id=therapist_id
+        )
         
         logger.info(f"User {user_id} ({user_role}) joined room {room_id}")
         
@@ -179,10 +190,10 @@ def handle_join_connection_room(data):
 def handle_leave_connection_room(data):
     """Leave a connection room"""
     try:
-        if request.sid not in active_connections:
+        connection_info = get_presence_registry().get_connection(request.sid)
+        if connection_info is None:
             return
         
-        connection_info = active_connections[request.sid]
         user_id = connection_info['user_id']
         user_role = connection_info['user_role']
         
@@ -195,12 +206,12 @@ def handle_leave_connection_room(data):
         leave_room(room_id)
         
         # Remove from user rooms
-        if request.sid in user_rooms and room_id in user_rooms[request.sid]:
-            user_rooms[request.sid].remove(room_id)
+        presence = get_presence_registry()
+        presence.leave_room(request.sid, room_id)
         
         # Update connection info
-        if 'current_room' in active_connections[request.sid]:
-            del active_connections[request.sid]['current_room']
+        if 'current_room' in connection_info:
+            presence.update_connection(request.sid, current_room=None)
         
         logger.info(f"User {user_id} ({user_role}) left room {room_id}")
         
@@ -226,11 +237,11 @@ def handle_leave_connection_room(data):
 def handle_real_time_message(data):
     """Handle real-time message sending"""
     try:
-        if request.sid not in active_connections:
+        connection_info = get_presence_registry().get_connection(request.sid)
+        if connection_info is None:
             emit('error', {'message': 'Not authenticated'})
             return
         
-        connection_info = active_connections[request.sid]
         user_id = connection_info['user_id']
         user_role = connection_info['user_role']
         
@@ -261,12 +272,11 @@ def handle_real_time_message(data):
             'metadata': data.get('metadata', {})
         }
         
-        result = mongo.db.therapist_chats.insert_one(message_data)
-        message_id = result.inserted_id
+        message_id = insert_therapist_chat(message_data)
         
         # Create notification for recipient
         recipient_id = therapist_id if user_role == 'student' else student_id
-        mongo.db.notifications.insert_one({
+        create_notification({
             'user_id': ObjectId(recipient_id),
             'type': 'new_message',
             'message': f'New message from your {"student" if user_role == "therapist" else "therapist"}',
@@ -306,10 +316,10 @@ def handle_real_time_message(data):
 def handle_mark_messages_read(data):
     """Mark messages as read in real-time"""
     try:
-        if request.sid not in active_connections:
+        connection_info = get_presence_registry().get_connection(request.sid)
+        if connection_info is None:
             return
         
-        connection_info = active_connections[request.sid]
         user_id = connection_info['user_id']
         user_role = connection_info['user_role']
         
@@ -320,33 +330,18 @@ def handle_mark_messages_read(data):
             return
         
         # Mark messages as read
-        sender_role = 'therapist' if user_role == 'student' else 'student'
+        marked = mark_conversation_read(student_id, therapist_id, user_role)
         
-        result = mongo.db.therapist_chats.update_many(
-            {
-                'student_id': ObjectId(student_id),
-                'therapist_id': ObjectId(therapist_id),
-                'sender': sender_role,
-                'read': False
-            },
-            {
-                '$set': {
-                    'read': True,
-                    'read_at': datetime.now(timezone.utc)
-                }
-            }
-        )
-        
-        if result.modified_count > 0:
+        if marked > 0:
             # Notify room of read status
             room_id = f"connection_{min(student_id, therapist_id)}_{max(student_id, therapist_id)}"
             emit('messages_read', {
                 'reader_role': user_role,
-                'count': result.modified_count,
+                'count': marked,
                 'timestamp': datetime.now(timezone.utc).isoformat()
             }, room=room_id, include_self=False)
             
-            logger.info(f"Marked {result.modified_count} messages as read by {user_role} {user_id}")
+            logger.info(f"Marked {marked} messages as read by {user_role} {user_id}")
         
     except Exception as e:
         logger.error(f"Error marking messages as read: {str(e)}")
@@ -357,10 +352,10 @@ def handle_mark_messages_read(data):
 def handle_appointment_status_update(data):
     """Handle real-time appointment status updates"""
     try:
-        if request.sid not in active_connections:
+        connection_info = get_presence_registry().get_connection(request.sid)
+        if connection_info is None:
             return
         
-        connection_info = active_connections[request.sid]
         user_id = connection_info['user_id']
         user_role = connection_info['user_role']
         
@@ -413,10 +408,10 @@ def handle_appointment_status_update(data):
 def handle_typing_start(data):
     """Handle typing indicator start"""
     try:
-        if request.sid not in active_connections:
+        connection_info = get_presence_registry().get_connection(request.sid)
+        if connection_info is None:
             return
         
-        connection_info = active_connections[request.sid]
         user_role = connection_info['user_role']
         
         student_id = data.get('student_id')
@@ -440,10 +435,10 @@ def handle_typing_start(data):
 def handle_typing_stop(data):
     """Handle typing indicator stop"""
     try:
-        if request.sid not in active_connections:
+        connection_info = get_presence_registry().get_connection(request.sid)
+        if connection_info is None:
             return
         
-        connection_info = active_connections[request.sid]
         user_role = connection_info['user_role']
         
         student_id = data.get('student_id')
@@ -469,10 +464,10 @@ def handle_typing_stop(data):
 def handle_status_update_request(data):
     """Handle request for status update"""
     try:
-        if request.sid not in active_connections:
+        connection_info = get_presence_registry().get_connection(request.sid)
+        if connection_info is None:
             return
         
-        connection_info = active_connections[request.sid]
         user_id = connection_info['user_id']
         user_role = connection_info['user_role']
         
@@ -498,11 +493,9 @@ def get_user_status(user_id: str, user_role: str) -> dict:
             # Get assigned therapist status
             student = mongo.db.users.find_one({'_id': ObjectId(user_id)})
             if student and student.get('assigned_therapist_id'):
-                therapist_online = any(
-                    conn['user_id'] == str(student['assigned_therapist_id'])
-                    for conn in active_connections.values()
+                status['therapist_online'] = get_presence_registry().is_online(
+                    str(student['assigned_therapist_id'])
                 )
-                status['therapist_online'] = therapist_online
             
             # Get unread message count
             status['unread_messages'] = mongo.db.therapist_chats.count_documents({
@@ -518,30 +511,26 @@ def get_user_status(user_id: str, user_role: str) -> dict:
                 'status': 'active'
             })
             
-            online_students = []
-            total_unread = 0
+            assignments = list(assignments)
             
-            for assignment in assignments:
-                student_id = str(assignment['student_id'])
-                student_online = any(
-                    conn['user_id'] == student_id
-                    for conn in active_connections.values()
-                )
-                
-                if student_online:
-                    online_students.append(student_id)
-                
-                # Count unread messages from this student
-                unread = mongo.db.therapist_chats.count_documents({
-                    'student_id': assignment['student_id'],
-                    'therapist_id': ObjectId(user_id),
-                    'sender': 'student',
-                    'read': False
-                })
-                total_unread += unread
+            # One indexed lookup for the whole caseload
+            online = get_presence_registry().online_users(
+                str(assignment['student_id']) for assignment in assignments
+            )
+            
+            # Unread messages from every assigned student in one aggregation
+            unread_by_student = get_unread_counts_for_therapist(
+                user_id, [assignment['student_id'] for assignment in assignments]
+            )
+            
+            online_students = [
+                str(assignment['student_id']) for assignment in assignments
+                if str(assignment['student_id']) in online
+            ]
             
             status['online_students'] = online_students
-            status['unread_messages'] = total_unread
+            status['unread_messages'] = sum(unread_by_student.values())
+            status['unread_by_student'] = unread_by_student
         
         return status
         
@@ -553,14 +542,14 @@ def get_room_status(room_id: str, student_id: str, therapist_id: str) -> dict:
     """Get status for a connection room"""
     try:
         # Count active users in room
-        active_users = []
-        for sid, conn in active_connections.items():
-            if sid in user_rooms and room_id in user_rooms[sid]:
-                active_users.append({
-                    'user_id': conn['user_id'],
-                    'user_role': conn['user_role'],
-                    'connected_at': conn['connected_at'].isoformat()
-                })
+        active_users = [
+            {
+                'user_id': conn['user_id'],
+                'user_role': conn['user_role'],
+                'connected_at': conn['connected_at'].isoformat()
+            }
+            for conn in get_presence_registry().room_members(room_id)
+        ]
         
         # Get recent activity
         recent_messages = mongo.db.therapist_chats.count_documents({
@@ -641,14 +630,16 @@ def handle_admin_get_connections():
     """Admin endpoint to get all active connections"""
     try:
         # In production, add admin role check
-        if request.sid not in active_connections:
+        presence = get_presence_registry()
+        connection_info = presence.get_connection(request.sid)
+        if connection_info is None:
             return
         
-        connection_info = active_connections[request.sid]
         # Add admin role check here
         
+        connections = presence.connections()
         connections_summary = []
-        for sid, conn in active_connections.items():
+        for sid, conn in connections:
             connections_summary.append({
                 'session_id': sid,
                 'user_id': conn['user_id'],
@@ -660,12 +651,9 @@ def handle_admin_get_connections():
             })
         
         emit('admin_connections_data', {
-            'total_connections': len(active_connections),
+            'total_connections': len(connections),
             'connections': connections_summary,
-            'room_count': len(set(
-                conn.get('current_room') for conn in active_connections.values() 
-                if conn.get('current_room')
-            )),
+            'room_count': len({conn.get('current_room') for _, conn in connections if conn.get('current_room')}),
             'timestamp': datetime.now(timezone.utc).isoformat()
         })
         
@@ -679,16 +667,15 @@ def handle_admin_get_connections():
 def default_error_handler(e):
     """Handle Socket.IO errors"""
     logger.error(f"Socket.IO error: {str(e)}")
-    if request.sid in active_connections:
-        connection_info = active_connections[request.sid]
+    connection_info = get_presence_registry().get_connection(request.sid)
+    if connection_info:
         logger.error(f"Error context: User {connection_info['user_id']} ({connection_info['user_role']})")
     
     emit('error', {'message': 'An unexpected error occurred'})
 
 # Export utility functions for external use
 __all__ = [
-    'active_connections',
-    'user_rooms', 
+    'get_presence_registry',
     'get_user_status',
     'get_room_status',
     'emit_user_status_update'
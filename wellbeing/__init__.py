@@ -64,13 +64,14 @@ def test_claude_connection(app):
     """Test Claude API connection during startup."""
     try:
         import anthropic
+        from wellbeing.services.claude_client import claude_client
         
         api_key = app.config.get('CLAUDE_API_KEY')
         if not api_key:
             return False
             
-        # Quick test to see if API key works
-        client = anthropic.Anthropic(api_key=api_key)
+        # Quick test to see if API key works (also warms the shared pool)
+        client = claude_client()
         
         # Try a minimal API call
         test_response = client.messages.create(
@@ -212,7 +213,8 @@ def create_app(test_config=None):
     app.wsgi_app = ProxyFix(app.wsgi_app)
 
     mongo.init_app(app)
-    socketio.init_app(app)
+    from wellbeing.utils.socketio_queue import socketio_options
+    socketio.init_app(app, **socketio_options(app.config))
 
     from wellbeing.utils.enhanced_scheduling import enhance_existing_scheduling_routes
     
@@ -258,6 +260,14 @@ def create_app(test_config=None):
         from wellbeing.models import create_indexes
         create_indexes()
         
+        # Optionally explain() the registered hot queries and flag collection scans
+        if app.config.get('INDEX_ADVISOR_ON_STARTUP'):
+            try:
+                from wellbeing.utils.index_registry import run_index_advisor
+                run_index_advisor()
+            except Exception as e:
+                logger.error(f"❌ Index advisor failed: {e}")
+        
         # REMOVED: Both model initializations (no longer needed)
         # OLD CODE (removed):
         # from wellbeing.ml.model_loader import initialize_original_model, initialize_bert_model
@@ -309,6 +319,34 @@ def create_app(test_config=None):
             # Continue without moderation - the app should still work
         # ======================================================================
 
+        # Dashboard invalidations from this worker must reach the shared
+        # store even before it assembles a dashboard itself
+        try:
+            from wellbeing.services.dashboard_service import get_dashboard_assembler
+            get_dashboard_assembler()
+        except Exception as e:
+            logger.error(f"❌ Failed to initialize dashboard cache: {e}")
+
+        # ============== THERAPIST CASELOAD RECONCILIATION ==============
+        try:
+            from wellbeing.services.caseload import schedule_caseload_reconciliation
+            schedule_caseload_reconciliation(app)
+        except Exception as e:
+            logger.error(f"❌ Failed to schedule caseload reconciliation: {e}")
+        # ===============================================================
+
+        # Notification and conversation counters are approximate; repair drift periodically
+        try:
+            from wellbeing.models.notification import schedule_notification_counter_rebuild
+            schedule_notification_counter_rebuild(app)
+        except Exception as e:
+            logger.error(f"❌ Failed to schedule notification counter rebuild: {e}")
+        try:
+            from wellbeing.models.therapist_chat import schedule_conversation_counter_rebuild
+            schedule_conversation_counter_rebuild(app)
+        except Exception as e:
+            logger.error(f"❌ Failed to schedule conversation counter rebuild: {e}")
+
         # ============== INITIALIZE BUDGET TRACKING SYSTEM ==============
         logger.info("Initializing budget tracking system...")
         try:
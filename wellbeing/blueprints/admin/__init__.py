@@ -6,4 +6,5 @@ from . import routes
 
 from . import mood_reports
 
-from . import api_budget 
\ No newline at end of file
+from . import api_budget 
+from . import export_jobs
@@ -3,18 +3,26 @@ Admin API routes for Claude budget and spending reports.
 File: wellbeing/blueprints/admin/api_budget.py
 """
 import datetime
-import csv
-from io import StringIO
-from flask import jsonify, request, current_app, make_response
+from flask import jsonify, request, current_app, make_response, session
 from bson import ObjectId
 from wellbeing.utils.decorators import login_required, admin_required
+from wellbeing.models.usage_rollup import (
+    get_usage_totals, iter_user_usage, get_daily_usage, get_bucket_unique_users,
+    backfill_usage_rollups
+)
 from wellbeing import logger
 
 # Import mongo the same way your working admin routes do
 from wellbeing import mongo
+from wellbeing.utils.batch_loader import BatchLoader, LOADER_COLLECTIONS
+from wellbeing.utils.streaming_export import csv_chunks, stream_csv
+from wellbeing.services.export_jobs import ExportOutput, enqueue_export, export_builder, json_output
 
 # Import the admin blueprint from the package
 from . import admin_bp
+from .export_jobs import job_response
+
+DETAILED_CSV_TOP_USERS = 20  # users listed in the detailed CSV
 
 
 @admin_bp.route('/api/budget/debug')
@@ -312,16 +320,7 @@ def export_report():
                 'supported_formats': ['csv', 'json']
             }), 400
         
-        # Generate export data based on type
-        if report_type == 'users':
-            export_data = get_user_spending_report(period_days, limit=1000, sort_by='total_cost')
-            filename = f'claude_user_spending_{datetime.date.today()}'
-        elif report_type == 'detailed':
-            export_data = generate_detailed_export_data(period_days)
-            filename = f'claude_detailed_report_{datetime.date.today()}'
-        else:  # summary
-            export_data = get_system_spending_summary(period_days)
-            filename = f'claude_budget_summary_{datetime.date.today()}'
+        export_data, filename = build_export_data(report_type, period_days, stream=format_type == 'csv')
         
         if format_type == 'json':
             response = make_response(jsonify(export_data))
@@ -330,11 +329,7 @@ def export_report():
             return response
             
         elif format_type == 'csv':
-            csv_content = convert_to_csv(export_data, report_type)
-            response = make_response(csv_content)
-            response.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
-            response.headers['Content-Type'] = 'text/csv'
-            return response
+            return stream_csv(csv_rows(export_data, report_type), f'{filename}.csv')
             
     except Exception as e:
         logger.error(f"Error exporting budget report: {e}")
@@ -344,6 +339,54 @@ def export_report():
         }), 500
 
 
+@admin_bp.route('/api/budget/export/jobs', methods=['POST'])
+@login_required
+@admin_required
+def export_report_job():
+    """
+    Queue a budget report export and return its job id.
+
+    Same parameters as /api/budget/export (days, format, type), as JSON or
+    query args. Poll the returned status_url or listen for
+    'export_job_ready' on Socket.IO, then fetch download_url.
+    """
+    try:
+        params = request.get_json(silent=True) or request.args
+        job_params = {
+            'days': int(params.get('days', 30)),
+            'format': str(params.get('format', 'csv')).lower(),
+            'type': params.get('type', 'detailed')
+        }
+        if job_params['format'] not in ['csv', 'json']:
+            return jsonify({
+                'error': 'Unsupported export format',
+                'supported_formats': ['csv', 'json']
+            }), 400
+        
+        job = enqueue_export('budget_report', job_params, session['user'])
+        return jsonify(job_response(job)), 202
+        
+    except Exception as e:
+        logger.error(f"Error queueing budget report export: {e}")
+        return jsonify({
+            'error': str(e),
+            'status': 'failed'
+        }), 500
+
+
+@export_builder('budget_report')
+def build_budget_report_export(params, progress):
+    """Export job builder for /api/budget/export/jobs."""
+    report_type = params.get('type', 'detailed')
+    export_data, filename = build_export_data(report_type, params.get('days', 30), progress,
+                                              stream=params.get('format') != 'json')
+    
+    progress(90, 'writing file')
+    if params.get('format') == 'json':
+        return json_output(export_data, f'{filename}.json')
+    return ExportOutput(csv_chunks(csv_rows(export_data, report_type)), f'{filename}.csv', 'text/csv')
+
+
 @admin_bp.route('/api/budget/alerts')
 @login_required
 @admin_required
@@ -407,53 +450,41 @@ def budget_alerts():
         }), 500
 
 
+@admin_bp.route('/api/budget/rollups/rebuild', methods=['POST'])
+@login_required
+@admin_required
+def rebuild_budget_rollups():
+    """Rebuild the daily usage rollups from the raw chats collection."""
+    try:
+        days = request.args.get('days', type=int)
+        since = datetime.datetime.utcnow() - datetime.timedelta(days=days) if days else None
+
+        written = backfill_usage_rollups(since=since)
+
+        return jsonify({
+            'status': 'success',
+            'rebuilt': written,
+            'since': since.date().isoformat() if since else None,
+            'generated_at': datetime.datetime.utcnow().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"Error rebuilding budget rollups: {e}")
+        return jsonify({
+            'error': str(e),
+            'status': 'failed'
+        }), 500
+
+
 # Helper Functions
 def get_system_spending_summary(days=30):
     """Get system-wide spending summary for the specified period."""
     try:
-        end_date = datetime.datetime.utcnow()
-        start_date = end_date - datetime.timedelta(days=days)
-        
-        # First, let's update your existing create_chat function to store cost data
-        # Your chatbot service already calculates costs, we just need to store them
+        # Read the pre-aggregated daily rollups instead of scanning every chat
+        data = get_usage_totals(days)
+        total_messages = data.get('message_count', 0)
         
-        pipeline = [
-            {
-                '$match': {
-                    'timestamp': {'$gte': start_date, '$lte': end_date}
-                }
-            },
-            {
-                '$group': {
-                    '_id': None,
-                    'total_messages': {'$sum': 1},
-                    'unique_users': {'$addToSet': '$user_id'},
-                    'avg_confidence': {'$avg': {'$ifNull': ['$confidence', 0]}},
-                    # Sum estimated_cost if it exists, otherwise calculate from tokens
-                    'total_cost': {
-                        '$sum': {
-                            '$cond': {
-                                'if': {'$ne': ['$estimated_cost', None]},
-                                'then': '$estimated_cost',
-                                'else': {
-                                    '$multiply': [
-                                        {'$ifNull': ['$tokens_used', 0]},
-                                        0.000005  # Rough estimate: $0.000005 per token for Haiku
-                                    ]
-                                }
-                            }
-                        }
-                    },
-                    'total_tokens': {'$sum': {'$ifNull': ['$tokens_used', 0]}}
-                }
-            }
-        ]
-        
-        result = list(mongo.db.chats.aggregate(pipeline))
-        
-        if result:
-            data = result[0]
-            total_messages = data.get('total_messages', 0)
+        if total_messages:
             total_cost = data.get('total_cost', 0)
             total_tokens = data.get('total_tokens', 0)
             
@@ -461,8 +492,8 @@ def get_system_spending_summary(days=30):
                 'total_cost': round(total_cost, 6),
                 'total_messages': total_messages,
                 'total_tokens': total_tokens,
-                'unique_users': len(data.get('unique_users', [])),
-                'avg_confidence': round(data.get('avg_confidence', 0), 2),
+                'unique_users': data.get('unique_users', 0),
+                'avg_confidence': round(data.get('confidence_sum', 0) / total_messages, 2),
                 'period_days': days,
                 'avg_cost_per_message': round(total_cost / max(total_messages, 1), 6),
                 'avg_cost_per_day': round(total_cost / days, 6)
@@ -496,146 +527,7 @@ def get_system_spending_summary(days=30):
 def get_user_spending_report(period_days, limit, sort_by):
     """Get detailed user spending report."""
     try:
-        end_date = datetime.datetime.utcnow()
-        start_date = end_date - datetime.timedelta(days=period_days)
-        
-        # First, let's get the raw data and debug the user_id types
-        pipeline = [
-            {
-                '$match': {
-                    'timestamp': {'$gte': start_date, '$lte': end_date}
-                }
-            },
-            {
-                '$group': {
-                    '_id': '$user_id',
-                    'message_count': {'$sum': 1},
-                    'avg_confidence': {'$avg': {'$ifNull': ['$confidence', 0]}},
-                    'last_activity': {'$max': '$timestamp'},
-                    'first_activity': {'$min': '$timestamp'},
-                    # Calculate total cost from estimated_cost or tokens
-                    'total_cost': {
-                        '$sum': {
-                            '$cond': {
-                                'if': {'$ne': ['$estimated_cost', None]},
-                                'then': '$estimated_cost',
-                                'else': {
-                                    '$multiply': [
-                                        {'$ifNull': ['$tokens_used', 0]},
-                                        0.000005  # Rough estimate for Haiku
-                                    ]
-                                }
-                            }
-                        }
-                    },
-                    'total_tokens': {'$sum': {'$ifNull': ['$tokens_used', 0]}}
-                }
-            },
-            {
-                '$addFields': {
-                    'avg_cost_per_message': {
-                        '$cond': {
-                            'if': {'$gt': ['$message_count', 0]},
-                            'then': {'$divide': ['$total_cost', '$message_count']},
-                            'else': 0
-                        }
-                    },
-                    'daily_avg_cost': {
-                        '$divide': ['$total_cost', period_days]
-                    }
-                }
-            }
-        ]
-        
-        # Add sorting
-        sort_field_map = {
-            'total_cost': {'total_cost': -1},
-            'message_count': {'message_count': -1},
-            'avg_cost': {'avg_cost_per_message': -1}
-        }
-        
-        sort_criteria = sort_field_map.get(sort_by, {'total_cost': -1})
-        pipeline.append({'$sort': sort_criteria})
-        pipeline.append({'$limit': limit})
-        
-        results = list(mongo.db.chats.aggregate(pipeline))
-        
-        # Format results and manually lookup users
-        formatted_results = []
-        for result in results:
-            user_id = result['_id']
-            
-            # Try different ways to find the user
-            user_info = None
-            
-            # Method 1: Direct lookup if user_id is already ObjectId
-            if isinstance(user_id, ObjectId):
-                user_info = mongo.db.users.find_one({'_id': user_id})
-            
-            # Method 2: Convert string to ObjectId if needed
-            elif isinstance(user_id, str):
-                try:
-                    if ObjectId.is_valid(user_id):
-                        user_info = mongo.db.users.find_one({'_id': ObjectId(user_id)})
-                    else:
-                        # Try finding by other fields if it's not a valid ObjectId
-                        user_info = mongo.db.users.find_one({'$or': [
-                            {'username': user_id},
-                            {'email': user_id},
-                            {'user_id': user_id}
-                        ]})
-                except:
-                    pass
-            
-            # Extract username from user info
-            username = "Unknown"
-            email = "Unknown"
-            
-            if user_info:
-                # Try different username field combinations
-                if 'first_name' in user_info and 'last_name' in user_info:
-                    first_name = user_info.get('first_name', '').strip()
-                    last_name = user_info.get('last_name', '').strip()
-                    if first_name or last_name:
-                        username = f"{first_name} {last_name}".strip()
-                elif 'username' in user_info and user_info['username']:
-                    username = user_info['username']
-                elif 'email' in user_info and user_info['email']:
-                    username = user_info['email'].split('@')[0]  # Use email prefix as username
-                
-                # Get email
-                if 'email' in user_info and user_info['email']:
-                    email = user_info['email']
-            
-            # If still unknown, try to make a meaningful display from user_id
-            if username == "Unknown":
-                if isinstance(user_id, str) and '@' in user_id:
-                    username = user_id.split('@')[0]
-                    email = user_id
-                elif isinstance(user_id, str):
-                    username = f"User {user_id[:8]}..."  # Show first 8 chars of user_id
-                else:
-                    username = f"User {str(user_id)[:8]}..."
-            
-            formatted_results.append({
-                'user_id': str(user_id) if user_id else 'Unknown',
-                'username': username,
-                'email': email,
-                'total_cost': round(result.get('total_cost', 0), 6),
-                'message_count': result.get('message_count', 0),
-                'total_tokens': result.get('total_tokens', 0),
-                'avg_cost_per_message': round(result.get('avg_cost_per_message', 0), 6),
-                'avg_tokens_per_message': round(result.get('total_tokens', 0) / max(result.get('message_count', 1), 1), 1),
-                'avg_confidence': round(result.get('avg_confidence', 0), 2),
-                'last_activity': result['last_activity'].isoformat() if result.get('last_activity') else None,
-                'first_activity': result['first_activity'].isoformat() if result.get('first_activity') else None,
-                'daily_avg_cost': round(result.get('daily_avg_cost', 0), 6),
-                'activity_days': (result['last_activity'] - result['first_activity']).days + 1 if result.get('last_activity') and result.get('first_activity') else 1,
-                'debug_user_id_type': type(user_id).__name__,  # For debugging
-                'debug_user_found': user_info is not None  # For debugging
-            })
-        
-        return formatted_results
+        return list(iter_user_spending(period_days, sort_by, limit))
         
     except Exception as e:
         logger.error(f"Error getting user spending report: {e}")
@@ -644,93 +536,157 @@ def get_user_spending_report(period_days, limit, sort_by):
         return []
 
 
+def iter_user_spending(period_days, sort_by='total_cost', limit=None):
+    """
+    Formatted per-user spending, read from the rollup cursor.
+
+    Users are formatted EXPORT_BATCH_SIZE at a time, each batch with its
+    own user lookup, so a streamed export holds one batch in memory
+    however many users there are (all of them when limit is None).
+    """
+    sort_field_map = {
+        'total_cost': 'total_cost',
+        'message_count': 'message_count',
+        'avg_cost': 'avg_cost_per_message'
+    }
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    
+    # Per-user daily rollups hold one document per active user-day
+    batch = []
+    for result in iter_user_usage(period_days, sort_field_map.get(sort_by, 'total_cost'), limit):
+        batch.append(result)
+        if len(batch) >= batch_size:
+            yield from format_user_spending(batch, period_days)
+            batch = []
+    if batch:
+        yield from format_user_spending(batch, period_days)
+
+
+def format_user_spending(results, period_days):
+    """Report rows for a batch of per-user rollup totals."""
+    # Every ObjectId-shaped user in the batch is fetched in one $in
+    users = BatchLoader(LOADER_COLLECTIONS['users']).prime([
+        result['_id'] for result in results
+        if isinstance(result['_id'], ObjectId)
+        or (isinstance(result['_id'], str) and ObjectId.is_valid(result['_id']))
+    ])
+    for result in results:
+        user_id = result['_id']
+
+        # Try different ways to find the user
+        user_info = None
+
+        # Method 1: Direct lookup if user_id is already ObjectId
+        if isinstance(user_id, ObjectId):
+            user_info = users.load(user_id)
+
+        # Method 2: Convert string to ObjectId if needed
+        elif isinstance(user_id, str):
+            try:
+                if ObjectId.is_valid(user_id):
+                    user_info = users.load(user_id)
+                else:
+                    # Try finding by other fields if it's not a valid ObjectId
+                    user_info = mongo.db.users.find_one({'$or': [
+                        {'username': user_id},
+                        {'email': user_id},
+                        {'user_id': user_id}
+                    ]})
+            except:
+                pass
+
+        # Extract username from user info
+        username = "Unknown"
+        email = "Unknown"
+
+        if user_info:
+            # Try different username field combinations
+            if 'first_name' in user_info and 'last_name' in user_info:
+                first_name = user_info.get('first_name', '').strip()
+                last_name = user_info.get('last_name', '').strip()
+                if first_name or last_name:
+                    username = f"{first_name} {last_name}".strip()
+            elif 'username' in user_info and user_info['username']:
+                username = user_info['username']
+            elif 'email' in user_info and user_info['email']:
+                username = user_info['email'].split('@')[0]  # Use email prefix as username
+
+            # Get email
+            if 'email' in user_info and user_info['email']:
+                email = user_info['email']
+
+        # If still unknown, try to make a meaningful display from user_id
+        if username == "Unknown":
+            if isinstance(user_id, str) and '@' in user_id:
+                username = user_id.split('@')[0]
+                email = user_id
+            elif isinstance(user_id, str):
+                username = f"User {user_id[:8]}..."  # Show first 8 chars of user_id
+            else:
+                username = f"User {str(user_id)[:8]}..."
+
+        yield {
+            'user_id': str(user_id) if user_id else 'Unknown',
+            'username': username,
+            'email': email,
+            'total_cost': round(result.get('total_cost', 0), 6),
+            'message_count': result.get('message_count', 0),
+            'total_tokens': result.get('total_tokens', 0),
+            'avg_cost_per_message': round(result.get('avg_cost_per_message', 0), 6),
+            'avg_tokens_per_message': round(result.get('total_tokens', 0) / max(result.get('message_count', 1), 1), 1),
+            'avg_confidence': round(result.get('confidence_sum', 0) / max(result.get('message_count', 1), 1), 2),
+            'last_activity': result['last_activity'].isoformat() if result.get('last_activity') else None,
+            'first_activity': result['first_activity'].isoformat() if result.get('first_activity') else None,
+            'daily_avg_cost': round(result.get('total_cost', 0) / period_days, 6),
+            'activity_days': (result['last_activity'] - result['first_activity']).days + 1 if result.get('last_activity') and result.get('first_activity') else 1,
+            'debug_user_id_type': type(user_id).__name__,  # For debugging
+            'debug_user_found': user_info is not None  # For debugging
+        }
+
+
+
 def get_cost_trends(days, granularity):
     """Get historical cost trends data."""
     try:
-        end_date = datetime.datetime.utcnow()
-        start_date = end_date - datetime.timedelta(days=days)
+        # One rollup document per day; weekly/monthly buckets are summed here
+        daily_rows = get_daily_usage(days)
         
-        # Create grouping based on granularity
         if granularity == 'daily':
-            group_format = {
-                'year': {'$year': '$timestamp'},
-                'month': {'$month': '$timestamp'},
-                'day': {'$dayOfMonth': '$timestamp'}
-            }
+            bucket_format = '%Y-%m-%d'
         elif granularity == 'weekly':
-            group_format = {
-                'year': {'$year': '$timestamp'},
-                'week': {'$week': '$timestamp'}
-            }
+            bucket_format = '%Y-W%U'  # Sunday-based weeks, like Mongo's $week
         else:  # monthly
-            group_format = {
-                'year': {'$year': '$timestamp'},
-                'month': {'$month': '$timestamp'}
-            }
+            bucket_format = '%Y-%m'
         
-        pipeline = [
-            {
-                '$match': {
-                    'timestamp': {'$gte': start_date, '$lte': end_date}
-                }
-            },
-            {
-                '$group': {
-                    '_id': group_format,
-                    'message_count': {'$sum': 1},
-                    'unique_users': {'$addToSet': '$user_id'},
-                    # Calculate total cost
-                    'total_cost': {
-                        '$sum': {
-                            '$cond': {
-                                'if': {'$ne': ['$estimated_cost', None]},
-                                'then': '$estimated_cost',
-                                'else': {
-                                    '$multiply': [
-                                        {'$ifNull': ['$tokens_used', 0]},
-                                        0.000005  # Rough estimate for Haiku
-                                    ]
-                                }
-                            }
-                        }
-                    },
-                    'total_tokens': {'$sum': {'$ifNull': ['$tokens_used', 0]}}
-                }
-            },
-            {
-                '$addFields': {
-                    'unique_user_count': {'$size': '$unique_users'},
-                    'avg_cost_per_message': {
-                        '$cond': {
-                            'if': {'$gt': ['$message_count', 0]},
-                            'then': {'$divide': ['$total_cost', '$message_count']},
-                            'else': 0
-                        }
-                    }
-                }
-            },
-            {'$sort': {'_id': 1}}
-        ]
+        buckets = {}
+        for row in daily_rows:
+            date_str = row['date'].strftime(bucket_format)
+            bucket = buckets.setdefault(date_str, {
+                'message_count': 0, 'total_cost': 0, 'total_tokens': 0, 'unique_users': 0
+            })
+            bucket['message_count'] += row.get('message_count', 0)
+            bucket['total_cost'] += row.get('total_cost', 0)
+            bucket['total_tokens'] += row.get('total_tokens', 0)
+            bucket['unique_users'] += row.get('unique_users', 0)
         
-        results = list(mongo.db.chats.aggregate(pipeline))
+        # A user active on several days counts once per week/month
+        if granularity != 'daily':
+            for date_str, unique_users in get_bucket_unique_users(days, bucket_format).items():
+                if date_str in buckets:
+                    buckets[date_str]['unique_users'] = unique_users
         
         # Format results
         formatted_results = []
-        for result in results:
-            if granularity == 'daily':
-                date_str = f"{result['_id']['year']}-{result['_id']['month']:02d}-{result['_id']['day']:02d}"
-            elif granularity == 'weekly':
-                date_str = f"{result['_id']['year']}-W{result['_id']['week']:02d}"
-            else:
-                date_str = f"{result['_id']['year']}-{result['_id']['month']:02d}"
-            
+        for date_str in sorted(buckets):
+            bucket = buckets[date_str]
+            message_count = bucket['message_count']
             formatted_results.append({
                 'date': date_str,
-                'total_cost': round(result.get('total_cost', 0), 6),
-                'message_count': result.get('message_count', 0),
-                'total_tokens': result.get('total_tokens', 0),
-                'unique_users': result.get('unique_user_count', 0),
-                'avg_cost_per_message': round(result.get('avg_cost_per_message', 0), 6)
+                'total_cost': round(bucket['total_cost'], 6),
+                'message_count': message_count,
+                'total_tokens': bucket['total_tokens'],
+                'unique_users': bucket['unique_users'],
+                'avg_cost_per_message': round(bucket['total_cost'] / message_count, 6) if message_count > 0 else 0
             })
         
         return formatted_results
@@ -1088,17 +1044,57 @@ def generate_budget_assessment(report_data):
     return assessment
 
 
-def generate_detailed_export_data(period_days):
-    """Generate comprehensive data for detailed export."""
+def build_export_data(report_type, period_days, progress=None, stream=False):
+    """
+    Report data and base filename for a budget export type.
+
+    stream: For CSV (csv_rows). The users report is then a generator over
+        every user, read from the rollup cursor one batch at a time, and
+        the detailed report only loads the top users its CSV shows.
+    """
+    if report_type == 'users':
+        if progress:
+            progress(10, 'user breakdown')
+        if stream:
+            export_data = iter_user_spending(period_days, sort_by='total_cost')
+        else:
+            export_data = get_user_spending_report(period_days, limit=1000, sort_by='total_cost')
+        filename = f'claude_user_spending_{datetime.date.today()}'
+    elif report_type == 'detailed':
+        export_data = generate_detailed_export_data(period_days, progress,
+                                                    user_limit=DETAILED_CSV_TOP_USERS if stream else 1000)
+        filename = f'claude_detailed_report_{datetime.date.today()}'
+    else:  # summary
+        if progress:
+            progress(10, 'system summary')
+        export_data = get_system_spending_summary(period_days)
+        filename = f'claude_budget_summary_{datetime.date.today()}'
+    return export_data, filename
+
+
+def generate_detailed_export_data(period_days, progress=None, user_limit=1000):
+    """
+    Generate comprehensive data for detailed export.
+    
+    progress(percent, stage) is called between sections when run as an
+    export job; user_limit caps the user breakdown.
+    """
+    progress = progress or (lambda percent, stage: None)
+    progress(5, 'system summary')
+    system_summary = get_system_spending_summary(period_days)
+    progress(30, 'user breakdown')
+    user_breakdown = get_user_spending_report(period_days, limit=user_limit, sort_by='total_cost')
+    progress(65, 'daily trends')
+    daily_trends = get_cost_trends(period_days, 'daily')
     return {
         'metadata': {
             'period_days': period_days,
             'generated_at': datetime.datetime.utcnow().isoformat(),
             'export_type': 'detailed'
         },
-        'system_summary': get_system_spending_summary(period_days),
-        'user_breakdown': get_user_spending_report(period_days, limit=1000, sort_by='total_cost'),
-        'daily_trends': get_cost_trends(period_days, 'daily'),
+        'system_summary': system_summary,
+        'user_breakdown': user_breakdown,
+        'daily_trends': daily_trends,
         'config': {
             'monthly_budget': current_app.config.get('MAX_MONTHLY_SPEND', 5.00),
             'daily_budget': current_app.config.get('DAILY_SPENDING_LIMIT', 0.50),
@@ -1108,53 +1104,45 @@ def generate_detailed_export_data(period_days):
     }
 
 
-def convert_to_csv(export_data, report_type):
-    """Convert report data to CSV format."""
-    output = StringIO()
-    
+def csv_rows(export_data, report_type):
+    """Yield report data as CSV rows (streamed by stream_csv)."""
     if report_type == 'users':
         fieldnames = ['user_id', 'username', 'email', 'total_cost', 'message_count', 
                      'total_tokens', 'avg_cost_per_message', 'avg_tokens_per_message',
                      'avg_confidence', 'last_activity', 'daily_avg_cost']
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
+        yield fieldnames
         
         for user in export_data:
-            writer.writerow(user)
+            yield [user.get(field, '') for field in fieldnames]
     
     elif report_type == 'summary':
-        writer = csv.writer(output)
-        writer.writerow(['Metric', 'Value'])
+        yield ['Metric', 'Value']
         
         for key, value in export_data.items():
             if isinstance(value, (int, float, str)):
-                writer.writerow([key.replace('_', ' ').title(), value])
+                yield [key.replace('_', ' ').title(), value]
     
     elif report_type == 'detailed':
         # Create multiple sections in CSV
-        writer = csv.writer(output)
         
         # System summary section
-        writer.writerow(['=== SYSTEM SUMMARY ==='])
-        writer.writerow(['Metric', 'Value'])
+        yield ['=== SYSTEM SUMMARY ===']
+        yield ['Metric', 'Value']
         system_summary = export_data.get('system_summary', {})
         for key, value in system_summary.items():
-            writer.writerow([key.replace('_', ' ').title(), value])
+            yield [key.replace('_', ' ').title(), value]
         
-        writer.writerow([])  # Empty row
+        yield []  # Empty row
         
         # User breakdown section
-        writer.writerow(['=== TOP USERS BY SPENDING ==='])
-        user_fieldnames = ['User ID', 'Username', 'Total Cost', 'Message Count', 'Avg Cost/Message']
-        writer.writerow(user_fieldnames)
+        yield ['=== TOP USERS BY SPENDING ===']
+        yield ['User ID', 'Username', 'Total Cost', 'Message Count', 'Avg Cost/Message']
         
-        for user in export_data.get('user_breakdown', [])[:20]:  # Top 20 users
-            writer.writerow([
+        for user in export_data.get('user_breakdown', [])[:DETAILED_CSV_TOP_USERS]:
+            yield [
                 user['user_id'],
                 user['username'],
                 user['total_cost'],
                 user['message_count'],
                 user['avg_cost_per_message']
-            ])
-    
-    return output.getvalue()
\ No newline at end of file
+            ]
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+Admin routes for background export jobs: status polling and downloads.
+File: wellbeing/blueprints/admin/export_jobs.py
+
+Jobs are created by the report endpoints (see api_budget.export_report_job
+and routes.generate_report); these routes only read them.
+"""
+import os
+from flask import jsonify, request, session, send_file, url_for
+from wellbeing import logger
+from wellbeing.utils.decorators import login_required, admin_required
+from wellbeing.services.export_jobs import (
+    STATUS_DONE, export_path, get_export_job, list_export_jobs, public_job
+)
+
+from . import admin_bp
+
+
+def job_response(job):
+    """public_job() plus the URLs a client needs."""
+    view = public_job(job)
+    view['status_url'] = url_for('admin.export_job_status', job_id=view['job_id'])
+    if job.get('status') == STATUS_DONE:
+        view['download_url'] = url_for('admin.download_export_job', job_id=view['job_id'])
+    return view
+
+
+@admin_bp.route('/api/export-jobs')
+@login_required
+@admin_required
+def export_jobs():
+    """The current admin's recent export jobs."""
+    try:
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        jobs = [job_response(job) for job in list_export_jobs(session['user'], limit)]
+        return jsonify({'jobs': jobs})
+    except Exception as e:
+        logger.error(f"Error listing export jobs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/api/export-jobs/<job_id>')
+@login_required
+@admin_required
+def export_job_status(job_id):
+    """Poll one job's status and progress."""
+    job = get_export_job(job_id, session['user'])
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    return jsonify(job_response(job))
+
+
+@admin_bp.route('/api/export-jobs/<job_id>/download')
+@login_required
+@admin_required
+def download_export_job(job_id):
+    """Download a finished job's file."""
+    job = get_export_job(job_id, session['user'])
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    if job.get('status') != STATUS_DONE:
+        return jsonify({'error': 'Export is not ready', 'status': job.get('status')}), 409
+
+    path = export_path(job)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Export file has expired'}), 410
+    return send_file(path, mimetype=job.get('mimetype'), as_attachment=True,
+                     download_name=job['filename'])
@@ -1,13 +1,13 @@
 
 from datetime import datetime, timezone, timedelta
 from bson.objectid import ObjectId
-from flask import render_template, request, jsonify, flash, redirect, url_for, Response
+from flask import render_template, request, jsonify, flash, redirect, url_for
 from collections import Counter, defaultdict
 from wellbeing import mongo, logger
 from wellbeing.utils.decorators import admin_required
 from wellbeing.blueprints.admin import admin_bp  
-from io import StringIO
-import csv
+from wellbeing.services.mood_analytics import NUMPY_AVAILABLE, get_mood_report
+from wellbeing.utils.streaming_export import iter_cursor, stream_csv, stream_ndjson
 
 # ===================================
 # MOOD ANALYTICS HELPER FUNCTIONS
@@ -29,6 +29,13 @@ def get_mood_analytics_data(date_range='30_days', user_filter=None):
         else:
             start_date = end_date - timedelta(days=30)  # default
         
+        # Columnar engine: one projected query, vectorized reports
+        if NUMPY_AVAILABLE:
+            try:
+                return get_mood_report(start_date, end_date, user_filter) or get_empty_analytics()
+            except Exception as e:
+                logger.error(f"Vectorized mood analytics failed, using list analysis: {e}")
+        
         # Build query
         query = {
             "timestamp": {"$gte": start_date, "$lte": end_date}
@@ -410,10 +417,11 @@ def api_mood_analytics():
 @admin_bp.route('/export_mood_report')
 @admin_required
 def export_mood_report():
-    """Export mood report as CSV."""
+    """Export mood report as CSV (or NDJSON with ?format=ndjson), streamed from the cursor."""
     try:
         date_range = request.args.get('range', '30_days')
         user_filter = request.args.get('user_id')
+        export_format = request.args.get('format', 'csv')
         
         # Calculate date range
         end_date = datetime.now(timezone.utc)
@@ -436,42 +444,33 @@ def export_mood_report():
         if user_filter:
             query["user_id"] = user_filter
         
-        # Get mood data
-        moods = list(mongo.db.moods.find(query).sort("timestamp", 1))
-        
-        # Create CSV
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Date', 'User ID', 'Mood', 'Intensity', 'Triggers', 'Context'])
-        
-        # Write data
-        for mood in moods:
-            triggers = mood.get('triggers', [])
-            if isinstance(triggers, list):
-                triggers_str = ', '.join(triggers)
-            else:
-                triggers_str = str(triggers) if triggers else ''
-            
-            writer.writerow([
-                mood['timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-                mood['user_id'],
-                mood['mood'],
-                mood.get('intensity', ''),
-                triggers_str,
-                mood.get('context', '')
-            ])
-        
-        output.seek(0)
-        
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': f'attachment; filename=mood_report_{date_range}_{datetime.now().strftime("%Y%m%d")}.csv'
-            }
-        )
+        # Get mood data (iterated in batches, never loaded as a whole)
+        projection = {'_id': 0, 'timestamp': 1, 'user_id': 1, 'mood': 1, 'intensity': 1, 'triggers': 1, 'context': 1}
+        moods = iter_cursor(mongo.db.moods.find(query, projection).sort("timestamp", 1))
+        filename = f'mood_report_{date_range}_{datetime.now().strftime("%Y%m%d")}'
+        
+        if export_format == 'ndjson':
+            return stream_ndjson(moods, f'{filename}.ndjson')
+        
+        def rows():
+            for mood in moods:
+                triggers = mood.get('triggers', [])
+                if isinstance(triggers, list):
+                    triggers_str = ', '.join(triggers)
+                else:
+                    triggers_str = str(triggers) if triggers else ''
+                
+                yield [
+                    mood['timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
+                    mood['user_id'],
+                    mood['mood'],
+                    mood.get('intensity', ''),
+                    triggers_str,
+                    mood.get('context', '')
+                ]
+        
+        return stream_csv(rows(), f'{filename}.csv',
+                          header=['Date', 'User ID', 'Mood', 'Intensity', 'Triggers', 'Context'])
         
     except Exception as e:
         logger.error(f"Error exporting mood report: {e}")
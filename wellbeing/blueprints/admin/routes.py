@@ -5,6 +5,8 @@ from datetime import datetime, timezone
 from bson.objectid import ObjectId
 import secrets
 import string
+import threading
+import time
 from werkzeug.security import generate_password_hash
 import pandas as pd
 from flask import render_template,current_app, redirect, url_for, request, jsonify, flash, make_response, session
@@ -14,12 +16,21 @@ from wellbeing import mongo, logger
 from wellbeing.utils.file_handlers import handle_video_upload
 from wellbeing.models.user import find_user_by_id, get_all_users
 from wellbeing.models.resource import create_resource, update_resource, delete_resource
+from wellbeing.models.chat_context import forget_user_context
+from wellbeing.models.therapist_chat import forget_conversation_counters
+from wellbeing.utils.batch_loader import prime
+from wellbeing.services.dashboard_service import invalidate_dashboard
+from wellbeing.services.caseload import assign_student, caseload_of, unassign_student
+from wellbeing.services.therapist_matching import invalidate_matching_index
+from wellbeing.utils.streaming_export import iter_cursor, stream_csv, stream_ndjson
+from wellbeing.services.export_jobs import enqueue_export, export_builder, json_output
 from wellbeing.utils.email import send_therapist_credentials, send_password_reset
 from wellbeing.utils.automated_moderation import generate_automated_moderation_report, AutomatedModerator
 from wellbeing.utils.moderation_setup import ModerationConfig
 from datetime import timedelta
 from . import mood_reports
 from . import admin_bp
+from .export_jobs import job_response
 
 # Helper function to generate a random password
 def generate_random_password(length=12):
@@ -53,7 +64,8 @@ def dashboard():
     recent_activity = []
     
     try:
-        recent_activity_cursor = mongo.db.chats.find().sort('timestamp', -1).limit(10)
+        recent_activity_cursor = list(mongo.db.chats.find().sort('timestamp', -1).limit(10))
+        users = prime('users', [msg.get('user_id') for msg in recent_activity_cursor])
         
         for msg in recent_activity_cursor:
             try:
@@ -65,10 +77,8 @@ def dashboard():
                 if user_id:
                     try:
                         # Try to find the user in the users collection
-                        if isinstance(user_id, ObjectId):
-                            user = mongo.db.users.find_one({'_id': user_id})
-                        elif isinstance(user_id, str) and ObjectId.is_valid(user_id):
-                            user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
+                        if isinstance(user_id, ObjectId) or (isinstance(user_id, str) and ObjectId.is_valid(user_id)):
+                            user = users.load(user_id)
                     except Exception as e:
                         pass
                 
@@ -144,13 +154,14 @@ def dashboard_data():
     
     recent_activity = []
     try:
-        recent_activity_cursor = mongo.db.chats.find().sort('timestamp', -1).limit(10)
+        recent_activity_cursor = list(mongo.db.chats.find().sort('timestamp', -1).limit(10))
+        users = prime('users', [msg.get('user_id') for msg in recent_activity_cursor])
         
         for msg in recent_activity_cursor:
             try:
                 # Get user information
                 user_id = msg.get('user_id')
-                user = find_user_by_id(user_id)
+                user = users.load(user_id)
                 username = "Unknown"
                 
                 # Extract username from user document
@@ -509,6 +520,8 @@ def delete_chat(chat_id):
         
         # Delete the chat
         mongo.db.chats.delete_one({'_id': chat_obj_id})
+        forget_user_context(chat.get('user_id'))
+        invalidate_dashboard(chat.get('user_id'), 'chats')
         
         # Add a log entry for this deletion
         mongo.db.admin_logs.insert_one({
@@ -543,46 +556,8 @@ def chat_analytics_data():
         date_range = request.args.get('range', '30days')
         topic_filter = request.args.get('topic', 'all')
         
-        # Calculate date filter
-        from datetime import datetime, timedelta
-        now = datetime.now()
-        
-        if date_range == '7days':
-            start_date = now - timedelta(days=7)
-        elif date_range == '30days':
-            start_date = now - timedelta(days=30)
-        elif date_range == '3months':
-            start_date = now - timedelta(days=90)
-        elif date_range == '6months':
-            start_date = now - timedelta(days=180)
-        elif date_range == '1year':
-            start_date = now - timedelta(days=365)
-        else:
-            start_date = datetime(2020, 1, 1)  # All time
-        
-        # Build query filter
-        query_filter = {'timestamp': {'$gte': start_date}}
-        
-        if topic_filter != 'all':
-            query_filter['$or'] = [
-                {'conversation_context.topic': topic_filter},
-                {'topic': topic_filter}
-            ]
-        
-        # Get chat data
-        chats = list(mongo.db.chats.find(query_filter))
-        
-        # Process data for analytics
-        analytics_data = {
-            'total_conversations': len(chats),
-            'unique_users': len(set(chat.get('user_id') for chat in chats if chat.get('user_id'))),
-            'average_confidence': sum(float(chat.get('confidence', 0)) for chat in chats) / len(chats) if chats else 0,
-            'daily_counts': get_daily_conversation_counts(chats, start_date),
-            'topic_distribution': get_topic_distribution(chats),
-            'confidence_distribution': get_confidence_distribution(chats),
-            'hourly_distribution': get_hourly_distribution(chats),
-            'user_engagement': get_user_engagement_stats(chats)
-        }
+        # Every chart series comes from one server-side $facet aggregation
+        analytics_data = get_chat_analytics_summary(date_range, topic_filter)
         
         return jsonify(analytics_data)
         
@@ -602,25 +577,7 @@ def generate_report():
         date_range = data.get('dateRange', '30days')
         specific_topic = data.get('specificTopic', 'all')
         report_format = data.get('reportFormat', 'detailed')
-        
-        # Get filtered chat data
-        chat_data = get_filtered_chat_data(date_range, specific_topic)
-        
-        # Generate report based on type
-        if report_type == 'comprehensive':
-            report = generate_comprehensive_report(chat_data, date_range)
-        elif report_type == 'topic-focused':
-            report = generate_topic_focused_report(chat_data, specific_topic, date_range)
-        elif report_type == 'user-engagement':
-            report = generate_user_engagement_report(chat_data, date_range)
-        elif report_type == 'wellbeing-trends':
-            report = generate_wellbeing_trends_report(chat_data, date_range)
-        elif report_type == 'confidence-analysis':
-            report = generate_confidence_analysis_report(chat_data, date_range)
-        elif report_type == 'crisis-detection':
-            report = generate_crisis_detection_report(chat_data, date_range)
-        else:
-            report = generate_comprehensive_report(chat_data, date_range)
+        run_async = bool(data.get('async'))
         
         # Log report generation
         mongo.db.admin_logs.insert_one({
@@ -631,16 +588,68 @@ def generate_report():
                 'report_type': report_type,
                 'date_range': date_range,
                 'topic': specific_topic,
-                'format': report_format
+                'format': report_format,
+                'async': run_async
             }
         })
         
-        return jsonify(report)
+        if run_async:
+            # Built by an export worker; the client polls status_url or
+            # waits for 'export_job_ready', then fetches download_url
+            job = enqueue_export('chat_report', {
+                'report_type': report_type,
+                'date_range': date_range,
+                'topic': specific_topic
+            }, session['user'])
+            return jsonify(job_response(job)), 202
+        
+        return jsonify(build_chat_report(report_type, date_range, specific_topic))
         
     except Exception as e:
         logger.error(f"Error generating report: {e}")
         return jsonify({'error': str(e)}), 500
 
+
+def build_chat_report(report_type, date_range, specific_topic, progress=None):
+    """Query the chats and build one report type."""
+    if progress:
+        progress(10, 'loading chats')
+    
+    # Get filtered chat data (message text only for reports that scan it)
+    chat_data = get_filtered_chat_data(
+        date_range, specific_topic,
+        include_message=report_type in ('wellbeing-trends', 'crisis-detection')
+    )
+    
+    if progress:
+        progress(50, f'analysing {len(chat_data)} chats')
+    
+    # Generate report based on type
+    if report_type == 'comprehensive':
+        return generate_comprehensive_report(chat_data, date_range)
+    elif report_type == 'topic-focused':
+        return generate_topic_focused_report(chat_data, specific_topic, date_range)
+    elif report_type == 'user-engagement':
+        return generate_user_engagement_report(chat_data, date_range)
+    elif report_type == 'wellbeing-trends':
+        return generate_wellbeing_trends_report(chat_data, date_range)
+    elif report_type == 'confidence-analysis':
+        return generate_confidence_analysis_report(chat_data, date_range)
+    elif report_type == 'crisis-detection':
+        return generate_crisis_detection_report(chat_data, date_range)
+    else:
+        return generate_comprehensive_report(chat_data, date_range)
+
+
+@export_builder('chat_report')
+def build_chat_report_export(params, progress):
+    """Export job builder for generate_report with async set."""
+    report_type = params.get('report_type', 'comprehensive')
+    report = build_chat_report(report_type, params.get('date_range', '30days'),
+                               params.get('topic', 'all'), progress)
+    progress(90, 'writing file')
+    return json_output(report, f'chat_report_{report_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+
 @admin_bp.route('/export-chat-report/<format>')
 @login_required
 @admin_required
@@ -652,11 +661,15 @@ def export_chat_report(format):
         date_range = request.args.get('range', '30days')
         topic = request.args.get('topic', 'all')
         
-        chat_data = get_filtered_chat_data(date_range, topic)
-        
-        if format == 'csv':
-            return export_csv_report(chat_data, report_type)
+        if format in ('csv', 'ndjson'):
+            # Streamed straight from the cursor, one batch in memory at a time
+            chats = iter_cursor(find_filtered_chats(date_range, topic, include_message=True, include_response=True))
+            if format == 'ndjson':
+                filename = f'chat_report_{report_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.ndjson'
+                return stream_ndjson(chats, filename)
+            return export_csv_report(chats, report_type)
         elif format == 'pdf':
+            chat_data = get_filtered_chat_data(date_range, topic, include_message=True, include_response=True)
             return export_pdf_report(chat_data, report_type, date_range)
         else:
             return jsonify({'error': 'Unsupported format'}), 400
@@ -792,26 +805,33 @@ def get_user_engagement_stats(chats):
         'new_users': total_users - return_users
     }
 
-def get_filtered_chat_data(date_range, topic):
-    """Get filtered chat data based on parameters."""
-    from datetime import datetime, timedelta
-    
-    # Calculate date filter
+# Fields the analytics helpers read; message and response bodies are left out
+CHAT_ANALYTICS_FIELDS = {
+    'timestamp': 1,
+    'user_id': 1,
+    'confidence': 1,
+    'topic': 1,
+    'conversation_context.topic': 1,
+    'category': 1
+}
+
+def get_analytics_start_date(date_range):
+    """Start of the reporting window for a range key."""
     now = datetime.now()
     if date_range == '7days':
-        start_date = now - timedelta(days=7)
+        return now - timedelta(days=7)
     elif date_range == '30days':
-        start_date = now - timedelta(days=30)
+        return now - timedelta(days=30)
     elif date_range == '3months':
-        start_date = now - timedelta(days=90)
+        return now - timedelta(days=90)
     elif date_range == '6months':
-        start_date = now - timedelta(days=180)
+        return now - timedelta(days=180)
     elif date_range == '1year':
-        start_date = now - timedelta(days=365)
-    else:
-        start_date = datetime(2020, 1, 1)  # All time
-    
-    # Build query filter
+        return now - timedelta(days=365)
+    return datetime(2020, 1, 1)  # All time
+
+def build_chat_query_filter(start_date, topic):
+    """Chat query for a window and optional topic."""
     query_filter = {'timestamp': {'$gte': start_date}}
     
     if topic != 'all':
@@ -820,7 +840,183 @@ def get_filtered_chat_data(date_range, topic):
             {'topic': topic}
         ]
     
-    return list(mongo.db.chats.find(query_filter))
+    return query_filter
+
+def get_filtered_chat_data(date_range, topic, include_message=False, include_response=False):
+    """
+    Get filtered chat data based on parameters.
+    
+    Only the analytics fields are loaded by default; message and response
+    bodies are fetched only when a report or export actually needs them.
+    """
+    return list(find_filtered_chats(date_range, topic, include_message, include_response))
+
+def find_filtered_chats(date_range, topic, include_message=False, include_response=False):
+    """Cursor over the filtered chats (see get_filtered_chat_data), for streaming."""
+    start_date = get_analytics_start_date(date_range)
+    
+    projection = dict(CHAT_ANALYTICS_FIELDS)
+    if include_message:
+        projection['message'] = 1
+    if include_response:
+        projection['response'] = 1
+    
+    return mongo.db.chats.find(build_chat_query_filter(start_date, topic), projection)
+
+# Short-lived cache of chart data keyed by (range, topic). Per worker on
+# purpose: nothing invalidates it, so every worker is at most one TTL behind
+_analytics_cache = {}
+_analytics_cache_lock = threading.Lock()
+
+def get_chat_analytics_summary(date_range, topic):
+    """
+    Chart data for the chat analytics dashboard.
+    
+    Runs a single $facet aggregation over the matching chats (timestamps,
+    users, confidence and topic only) and caches the result for
+    ADMIN_ANALYTICS_CACHE_TTL seconds per (range, topic).
+    """
+    ttl = current_app.config.get('ADMIN_ANALYTICS_CACHE_TTL', 300)
+    key = (date_range, topic)
+    now = time.monotonic()
+    
+    with _analytics_cache_lock:
+        cached = _analytics_cache.get(key)
+        if cached and now - cached[0] < ttl:
+            return cached[1]
+    
+    analytics_data = aggregate_chat_analytics(get_analytics_start_date(date_range), topic)
+    
+    with _analytics_cache_lock:
+        if ttl > 0:
+            _analytics_cache[key] = (now, analytics_data)
+        # Drop expired entries so unusual range/topic combinations don't pile up
+        for stale_key in [k for k, (stored, _) in _analytics_cache.items() if now - stored >= ttl]:
+            del _analytics_cache[stale_key]
+    
+    return analytics_data
+
+def aggregate_chat_analytics(start_date, topic):
+    """Compute every chat analytics series server-side in one round trip."""
+    # Confidence as a number; unparseable values become null and count as "low"
+    confidence_value = {'$convert': {'input': '$confidence', 'to': 'double', 'onError': None, 'onNull': 0}}
+    
+    pipeline = [
+        {'$match': build_chat_query_filter(start_date, topic)},
+        {'$project': {
+            '_id': 0,
+            'timestamp': 1,
+            'user_id': 1,
+            'confidence': confidence_value,
+            'topic': {'$ifNull': ['$conversation_context.topic', {'$ifNull': ['$topic', '$category']}]}
+        }},
+        {'$facet': {
+            'totals': [
+                {'$group': {
+                    '_id': None,
+                    'count': {'$sum': 1},
+                    'avg_confidence': {'$avg': {'$ifNull': ['$confidence', 0]}}
+                }}
+            ],
+            'daily': [
+                {'$match': {'timestamp': {'$ne': None}}},
+                {'$group': {
+                    '_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamp'}},
+                    'count': {'$sum': 1}
+                }}
+            ],
+            'hourly': [
+                {'$match': {'timestamp': {'$ne': None}}},
+                {'$group': {'_id': {'$hour': '$timestamp'}, 'count': {'$sum': 1}}}
+            ],
+            'topics': [
+                {'$match': {'topic': {'$nin': [None, '']}}},
+                {'$group': {'_id': '$topic', 'count': {'$sum': 1}}},
+                {'$sort': {'count': -1}}
+            ],
+            'confidence': [
+                {'$group': {
+                    '_id': {'$switch': {
+                        'branches': [
+                            {'case': {'$eq': ['$confidence', None]}, 'then': 'low'},
+                            {'case': {'$gte': [
+                                {'$cond': [{'$lte': ['$confidence', 1]}, {'$multiply': ['$confidence', 100]}, '$confidence']},
+                                80
+                            ]}, 'then': 'high'},
+                            {'case': {'$gte': [
+                                {'$cond': [{'$lte': ['$confidence', 1]}, {'$multiply': ['$confidence', 100]}, '$confidence']},
+                                50
+                            ]}, 'then': 'medium'}
+                        ],
+                        'default': 'low'
+                    }},
+                    'count': {'$sum': 1}
+                }}
+            ],
+            'users': [
+                {'$match': {'user_id': {'$nin': [None, '']}}},
+                {'$group': {'_id': '$user_id', 'count': {'$sum': 1}}},
+                {'$group': {
+                    '_id': None,
+                    'total_users': {'$sum': 1},
+                    'total_conversations': {'$sum': '$count'},
+                    'return_users': {'$sum': {'$cond': [{'$gt': ['$count', 1]}, 1, 0]}}
+                }}
+            ]
+        }}
+    ]
+    
+    facets = next(mongo.db.chats.aggregate(pipeline, allowDiskUse=True), {})
+    
+    totals = (facets.get('totals') or [{}])[0]
+    
+    # Daily counts, with missing dates filled in as 0
+    daily_counts = {row['_id']: row['count'] for row in facets.get('daily', [])}
+    daily = []
+    current_date = start_date.date()
+    end_date = datetime.now().date()
+    while current_date <= end_date:
+        date_str = current_date.strftime('%Y-%m-%d')
+        daily.append({'date': date_str, 'count': daily_counts.get(date_str, 0)})
+        current_date += timedelta(days=1)
+    
+    hourly_counts = {row['_id']: row['count'] for row in facets.get('hourly', [])}
+    
+    topic_rows = facets.get('topics', [])
+    topic_total = sum(row['count'] for row in topic_rows)
+    
+    confidence_counts = {row['_id']: row['count'] for row in facets.get('confidence', [])}
+    
+    users = (facets.get('users') or [{}])[0]
+    total_users = users.get('total_users', 0)
+    return_users = users.get('return_users', 0)
+    
+    return {
+        'total_conversations': totals.get('count', 0),
+        'unique_users': total_users,
+        'average_confidence': totals.get('avg_confidence') or 0,
+        'daily_counts': daily,
+        'topic_distribution': [
+            {
+                'topic': row['_id'],
+                'count': row['count'],
+                'percentage': round((row['count'] / topic_total * 100), 1) if topic_total > 0 else 0
+            }
+            for row in topic_rows[:10]
+        ],
+        'confidence_distribution': {
+            'high': confidence_counts.get('high', 0),
+            'medium': confidence_counts.get('medium', 0),
+            'low': confidence_counts.get('low', 0)
+        },
+        'hourly_distribution': [{'hour': hour, 'count': hourly_counts.get(hour, 0)} for hour in range(24)],
+        'user_engagement': {
+            'total_users': total_users,
+            'avg_conversations_per_user': round(users.get('total_conversations', 0) / total_users, 1) if total_users else 0,
+            'return_users': return_users,
+            'new_users': total_users - return_users
+        }
+    }
 
 def generate_comprehensive_report(chat_data, date_range):
     """Generate a comprehensive analysis report."""
@@ -967,37 +1163,22 @@ def generate_crisis_detection_report(chat_data, date_range):
     }
 
 def export_csv_report(chat_data, report_type):
-    """Export chat data as CSV."""
-    import csv
-    from io import StringIO
-    from flask import make_response
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    
-    # Write headers
+    """Stream chat data (any iterable, typically a cursor) as CSV."""
     headers = ['Timestamp', 'User ID', 'Message', 'Response', 'Confidence', 'Topic']
-    writer.writerow(headers)
-    
-    # Write data
-    for chat in chat_data:
-        row = [
-            chat.get('timestamp', '').strftime('%Y-%m-%d %H:%M:%S') if chat.get('timestamp') else '',
-            chat.get('user_id', ''),
-            str(chat.get('message', '')).replace('\n', ' ').replace('\r', ' ')[:200],  # Truncate long messages
-            str(chat.get('response', '')).replace('\n', ' ').replace('\r', ' ')[:200],  # Truncate long responses
-            chat.get('confidence', ''),
-            chat.get('topic') or chat.get('conversation_context', {}).get('topic', '')
-        ]
-        writer.writerow(row)
     
-    # Create response
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=chat_report_{report_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    def rows():
+        for chat in chat_data:
+            yield [
+                chat.get('timestamp', '').strftime('%Y-%m-%d %H:%M:%S') if chat.get('timestamp') else '',
+                chat.get('user_id', ''),
+                str(chat.get('message', '')).replace('\n', ' ').replace('\r', ' ')[:200],  # Truncate long messages
+                str(chat.get('response', '')).replace('\n', ' ').replace('\r', ' ')[:200],  # Truncate long responses
+                chat.get('confidence', ''),
+                chat.get('topic') or chat.get('conversation_context', {}).get('topic', '')
+            ]
     
-    return response
+    filename = f'chat_report_{report_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    return stream_csv(rows(), filename, header=headers)
 
 def export_pdf_report(chat_data, report_type, date_range):
     """Export report as PDF (placeholder - would need a PDF library like reportlab)."""
@@ -1320,7 +1501,11 @@ def user_management():
                 }
             ]
             
-            students_cursor = mongo.db.students.aggregate(students_pipeline)
+            students_cursor = list(mongo.db.students.aggregate(students_pipeline))
+            therapists = prime('therapists', [
+                student['assignment'][0].get('therapist_id')
+                for student in students_cursor if student.get('assignment')
+            ])
             
             for student in students_cursor:
                 # Get assigned therapist info if exists
@@ -1328,7 +1513,7 @@ def user_management():
                 if student.get('assignment') and len(student['assignment']) > 0:
                     assignment = student['assignment'][0]
                     if assignment.get('therapist_id'):
-                        therapist = mongo.db.therapists.find_one({'_id': assignment['therapist_id']})
+                        therapist = therapists.load(assignment['therapist_id'])
                         if therapist:
                             assigned_therapist = therapist.get('name', 'Unknown Therapist')
                 
@@ -1376,14 +1561,6 @@ def user_management():
                         'path': '$user_info',
                         'preserveNullAndEmptyArrays': True
                     }
-                },
-                {
-                    '$lookup': {
-                        'from': 'therapist_assignments',
-                        'localField': '_id',
-                        'foreignField': 'therapist_id',
-                        'as': 'assignments'
-                    }
                 }
             ]
             
@@ -1391,7 +1568,7 @@ def user_management():
             
             for therapist in therapists_cursor:
                 # Get current student count
-                current_students = len(therapist.get('assignments', []))
+                current_students = caseload_of(therapist)
                 
                 # Get completed sessions count
                 session_count = mongo.db.appointments.count_documents({
@@ -1557,18 +1734,12 @@ def add_user(user_type):
                 therapist_id = ObjectId(data['assigned_therapist_id'])
                 therapist = mongo.db.therapists.find_one({'_id': therapist_id})
                 if therapist:
+                    # Create assignment, taking a place in the therapist's caseload
+                    if not assign_student(user_id, therapist_id):
+                        # Rollback user creation
+                        mongo.db.users.delete_one({'_id': user_id})
+                        return jsonify({'success': False, 'error': 'Therapist has reached maximum capacity'}), 400
                     student_data['assigned_therapist_id'] = therapist_id
-                    
-                    # Create assignment
-                    assignment_data = {
-                        'therapist_id': therapist_id,
-                        'student_id': user_id,
-                        'status': 'active',
-                        'auto_assigned': False,
-                        'created_at': datetime.now(),
-                        'updated_at': datetime.now()
-                    }
-                    mongo.db.therapist_assignments.insert_one(assignment_data)
             
             mongo.db.students.insert_one(student_data)
             
@@ -1605,6 +1776,7 @@ def add_user(user_type):
             }
             
             mongo.db.therapists.insert_one(therapist_data)
+            invalidate_matching_index()
         
         return jsonify({
             'success': True,
@@ -1685,47 +1857,16 @@ def update_user(user_type, user_id):
                     if not therapist:
                         return jsonify({'success': False, 'error': 'Invalid therapist selected'}), 400
                     
-                    # Check therapist capacity
-                    current_assignments = mongo.db.therapist_assignments.count_documents({
-                        'therapist_id': therapist_oid,
-                        'status': 'active'
-                    })
-                    if current_assignments >= therapist.get('max_students', 20):
+                    # Reserve a place (capacity-checked atomically) and move the assignment
+                    if not assign_student(user_object_id, therapist_oid):
                         return jsonify({'success': False, 'error': 'Therapist has reached maximum capacity'}), 400
                     
                     student_updates['assigned_therapist_id'] = therapist_oid
-                    
-                    # Update or create assignment
-                    existing_assignment = mongo.db.therapist_assignments.find_one({'student_id': user_object_id})
-                    if existing_assignment:
-                        # Update existing assignment
-                        mongo.db.therapist_assignments.update_one(
-                            {'student_id': user_object_id},
-                            {'$set': {
-                                'therapist_id': therapist_oid,
-                                'status': 'active',
-                                'updated_at': datetime.now()
-                            }}
-                        )
-                    else:
-                        # Create new assignment
-                        assignment_data = {
-                            'therapist_id': therapist_oid,
-                            'student_id': user_object_id,
-                            'status': 'active',
-                            'auto_assigned': False,
-                            'created_at': datetime.now(),
-                            'updated_at': datetime.now()
-                        }
-                        mongo.db.therapist_assignments.insert_one(assignment_data)
                 else:
                     # Unassign therapist
                     student_updates['assigned_therapist_id'] = None
-                    # Deactivate assignment
-                    mongo.db.therapist_assignments.update_many(
-                        {'student_id': user_object_id},
-                        {'$set': {'status': 'inactive', 'updated_at': datetime.now()}}
-                    )
+                    # Deactivate assignment and release the therapist's place
+                    unassign_student(user_object_id)
             
             # Update student document
             if len(student_updates) > 1:  # More than just updated_at
@@ -1777,6 +1918,7 @@ def update_user(user_type, user_id):
             # Update therapist document
             if len(therapist_updates) > 1:  # More than just updated_at
                 mongo.db.therapists.update_one({'_id': user_object_id}, {'$set': therapist_updates})
+                invalidate_matching_index()
         
         return jsonify({
             'success': True,
@@ -1815,6 +1957,7 @@ def toggle_user_status(user_type, user_id):
                 {'_id': user_object_id},
                 {'$set': {'status': new_status, 'updated_at': datetime.now()}}
             )
+            invalidate_matching_index()
         
         return jsonify({
             'success': True,
@@ -1838,19 +1981,24 @@ def delete_user(user_type, user_id):
         if user_type == 'student':
             # Delete student and related data
             mongo.db.students.delete_one({'_id': user_object_id})
+            unassign_student(user_object_id)
             mongo.db.therapist_assignments.delete_many({'student_id': user_object_id})
             mongo.db.appointments.delete_many({'user_id': user_object_id})
             mongo.db.intake_assessments.delete_many({'student_id': user_object_id})
             mongo.db.shared_resources.delete_many({'student_id': user_object_id})
             mongo.db.therapist_chats.delete_many({'student_id': user_object_id})
+            forget_conversation_counters(student_id=user_object_id)
+            invalidate_dashboard(user_object_id)
             
         elif user_type == 'therapist':
             # Delete therapist and related data
             mongo.db.therapists.delete_one({'_id': user_object_id})
             mongo.db.therapist_assignments.delete_many({'therapist_id': user_object_id})
+            invalidate_matching_index()
             mongo.db.appointments.delete_many({'therapist_id': user_object_id})
             mongo.db.shared_resources.delete_many({'therapist_id': user_object_id})
             mongo.db.therapist_chats.delete_many({'therapist_id': user_object_id})
+            forget_conversation_counters(therapist_id=user_object_id)
             mongo.db.therapist_availability.delete_many({'therapist_id': user_object_id})
         
         return jsonify({
@@ -1879,21 +2027,25 @@ def moderation_dashboard():
             'auto_detected': True
         }).sort('created_at', -1).limit(10))
         
-        # Add student names to alerts
-        for alert in recent_alerts:
-            student = mongo.db.users.find_one({'_id': alert['student_id']})
-            if student:
-                alert['student_name'] = f"{student.get('first_name', '')} {student.get('last_name', '')}"
-        
         # Get recent moderation actions
         recent_actions = list(mongo.db.automated_moderation_log.find({
             'timestamp': {'$gte': datetime.now() - timedelta(hours=24)}
         }).sort('timestamp', -1).limit(20))
         
+        # Students and senders for both lists in one $in
+        users = prime('users', [alert['student_id'] for alert in recent_alerts])
+        users.prime(action.get('sender_id') for action in recent_actions)
+        
+        # Add student names to alerts
+        for alert in recent_alerts:
+            student = users.load(alert['student_id'])
+            if student:
+                alert['student_name'] = f"{student.get('first_name', '')} {student.get('last_name', '')}"
+        
         # Add user names to actions
         for action in recent_actions:
             if 'sender_id' in action:
-                user = mongo.db.users.find_one({'_id': action['sender_id']})
+                user = users.load(action['sender_id'])
                 if user:
                     action['user_name'] = f"{user.get('first_name', '')} {user.get('last_name', '')}"
         
@@ -2098,8 +2250,9 @@ def crisis_alerts():
         alerts = list(mongo.db.crisis_alerts.find(query).sort('created_at', -1))
         
         # Add user details
+        users = prime('users', [alert['student_id'] for alert in alerts])
         for alert in alerts:
-            student = mongo.db.users.find_one({'_id': alert['student_id']})
+            student = users.load(alert['student_id'])
             if student:
                 alert['student_name'] = f"{student.get('first_name', '')} {student.get('last_name', '')}"
                 alert['student_email'] = student.get('email', '')
@@ -1,8 +1,14 @@
 """API endpoints for chat functionality using Claude API"""
+import uuid
 from flask import request, jsonify, session, current_app
 from wellbeing.blueprints.api import api_bp
+from wellbeing.extensions import socketio
 from wellbeing.utils.decorators import login_required, csrf_protected
-from wellbeing.services.chatbot_service import process_message
+from wellbeing.services.chatbot_service import process_message, stream_message, get_response_cache
+from wellbeing.services.spend_ledger import get_spend_ledger
+from wellbeing.models.chat_context import get_context_cache
+from wellbeing.utils.write_behind import get_write_queue
+from wellbeing.utils.presence import get_presence_registry
 from wellbeing.models.chat import save_feedback, archive_chats
 from wellbeing import logger
 
@@ -72,37 +78,38 @@ def chat():
                 "detected_intent": "service_unavailable"
             }), 503
         
-        # Check budget limits before processing
-        monthly_budget = current_app.config.get('MAX_MONTHLY_SPEND', 5.00)
-        daily_budget = current_app.config.get('DAILY_SPENDING_LIMIT', 0.50)
-        
-        # Get current usage (simplified check - in production you'd check actual usage)
-        from wellbeing.models.chat import get_chat_analytics
-        daily_usage = get_chat_analytics(user_id, days=1).get('total_cost', 0)
-        monthly_usage = get_chat_analytics(user_id, days=30).get('total_cost', 0)
-        
-        if monthly_usage >= monthly_budget:
-            logger.warning(f"Monthly budget exceeded for user {user_id}: ${monthly_usage:.4f}")
-            return jsonify({
-                "error": "Budget limit reached",
-                "chat_id": None,
-                "response": f"You've reached your monthly chat budget of ${monthly_budget}. Please contact support or wait until next month.",
-                "confidence": 0.0,
-                "model": "budget_limit",
-                "detected_intent": "budget_exceeded"
-            }), 429
-        
-        if daily_usage >= daily_budget:
-            logger.warning(f"Daily budget exceeded for user {user_id}: ${daily_usage:.4f}")
+        # Streaming mode: hand off to a Socket.IO background task and return
+        # straight away; tokens arrive as chat_stream_token events
+        socket_id = request.json.get("socket_id")
+        if request.json.get("stream") and socket_id:
+            # Only stream to a socket this user opened
+            connection = get_presence_registry().get_connection(socket_id)
+            if connection is None or connection.get('user_id') != str(user_id):
+                logger.warning(f"Rejected stream to socket {socket_id} not owned by user {user_id}")
+                return jsonify({
+                    "error": "Invalid socket",
+                    "chat_id": None,
+                    "response": "Your chat connection was lost. Please refresh the page and try again.",
+                    "confidence": 0.0,
+                    "model": "validation_error",
+                    "detected_intent": "invalid_socket"
+                }), 400
+            stream_id = str(uuid.uuid4())
+            logger.info(f"Streaming message for user {user_id} (stream {stream_id})")
+            socketio.start_background_task(
+                stream_message,
+                current_app._get_current_object(),
+                user_id,
+                user_input,
+                socket_id,
+                stream_id
+            )
             return jsonify({
-                "error": "Daily limit reached",
-                "chat_id": None,
-                "response": f"You've reached your daily chat limit of ${daily_budget}. Please try again tomorrow.",
-                "confidence": 0.0,
-                "model": "daily_limit",
-                "detected_intent": "daily_limit_exceeded"
-            }), 429
-        
+                "streaming": True,
+                "stream_id": stream_id,
+                "chat_id": None
+            }), 202
+
         # Process message using Claude service
         try:
             logger.info("Processing message with Claude service...")
@@ -136,16 +143,6 @@ def chat():
                 logger.warning(f"Crisis message detected for user {user_id}")
                 formatted_response['is_crisis'] = True
             
-            # Add budget info to response
-            remaining_monthly = max(0, monthly_budget - monthly_usage - response_data.get('estimated_cost', 0))
-            remaining_daily = max(0, daily_budget - daily_usage - response_data.get('estimated_cost', 0))
-            
-            formatted_response['budget_info'] = {
-                'remaining_monthly': round(remaining_monthly, 4),
-                'remaining_daily': round(remaining_daily, 4),
-                'usage_warning': remaining_monthly < (monthly_budget * 0.1)  # Warn at 90% usage
-            }
-            
             return jsonify(formatted_response)
             
         except Exception as service_error:
@@ -225,6 +222,7 @@ def reset_chat():
 
 
 @api_bp.route('/chat/status', methods=['GET'])
+@login_required
 def chat_status():
     """API endpoint to check chat service status."""
     try:
@@ -251,6 +249,7 @@ def chat_status():
                 "crisis_detection": current_app.config.get('CRISIS_DETECTION_ENABLED', True),
                 "topic_classification": True,
                 "conversation_memory": True,
+                "streaming_responses": True,
                 "feedback_collection": True,
                 "cost_tracking": True,
                 "budget_monitoring": True
@@ -258,31 +257,32 @@ def chat_status():
             "available_models": list(current_app.config.get('AVAILABLE_CLAUDE_MODELS', {}).keys())
         }
         
-        # If user is logged in, add user-specific info
-        if 'user' in session:
-            user_id = session['user']
-            status_data["user_authenticated"] = True
-            status_data["user_id"] = str(user_id)
+        # Response cache hit/miss counters
+        response_cache = get_response_cache()
+        status_data["features"]["response_cache"] = response_cache is not None
+        if response_cache is not None:
+            status_data["response_cache"] = response_cache.get_stats()
+        
+        # Conversation context cache hit/miss counters
+        context_cache = get_context_cache()
+        status_data["features"]["context_cache"] = context_cache is not None
+        if context_cache is not None:
+            status_data["context_cache"] = context_cache.get_stats()
+        
+        # Write-behind queue and spend ledger internals are for admins only
+        if session.get('role') == 'admin':
+            write_queue = get_write_queue()
+            status_data["features"]["write_behind"] = write_queue is not None
+            if write_queue is not None:
+                status_data["write_behind"] = write_queue.get_stats()
             
-            # Add user's current usage
-            try:
-                from wellbeing.models.chat import get_chat_analytics
-                daily_usage = get_chat_analytics(user_id, days=1).get('total_cost', 0)
-                monthly_usage = get_chat_analytics(user_id, days=30).get('total_cost', 0)
-                
-                status_data["user_usage"] = {
-                    "daily_spent": round(daily_usage, 4),
-                    "monthly_spent": round(monthly_usage, 4),
-                    "daily_remaining": round(max(0, daily_budget - daily_usage), 4),
-                    "monthly_remaining": round(max(0, monthly_budget - monthly_usage), 4),
-                    "daily_percentage": round((daily_usage / daily_budget) * 100, 1) if daily_budget > 0 else 0,
-                    "monthly_percentage": round((monthly_usage / monthly_budget) * 100, 1) if monthly_budget > 0 else 0
-                }
-            except Exception as analytics_error:
-                logger.error(f"Error getting user analytics: {analytics_error}")
-                status_data["user_usage"] = {"error": "Unable to fetch usage data"}
-        else:
-            status_data["user_authenticated"] = False
+            spend_ledger = get_spend_ledger()
+            status_data["features"]["spend_ledger"] = spend_ledger is not None
+            if spend_ledger is not None:
+                status_data["spend_ledger"] = spend_ledger.get_stats()
+        
+        status_data["user_authenticated"] = True
+        status_data["user_id"] = str(session['user'])
         
         return jsonify(status_data)
         
@@ -13,6 +13,7 @@ from wellbeing import mongo, logger
 from wellbeing.utils.validators import validate_email, validate_password
 from wellbeing_modules import LicenseValidator, TestDataGenerator
 from wellbeing.utils.email import send_password_reset_email
+from wellbeing.services.therapist_matching import invalidate_matching_index
 
 @auth_bp.route('/')
 def index():
@@ -504,6 +505,7 @@ def register():
                 
                 # Insert therapist
                 mongo.db.therapists.insert_one(therapist_data)
+                invalidate_matching_index()
                 
                 flash(f'✅ Therapist account created successfully! License: {license_number}', 'success')
             
@@ -8,6 +8,7 @@ from flask import render_template, session, redirect, url_for, jsonify, request,
 from wellbeing.models.user import find_user_by_id
 from wellbeing.utils.decorators import login_required
 from wellbeing.services.chatbot_service import process_message
+from wellbeing.services.claude_client import claude_client
 from wellbeing.models.chat import get_recent_chats
 from wellbeing import logger
 
@@ -77,7 +78,7 @@ def model_status():
         if api_key_configured:
             try:
                 # Test with a simple API call
-                client = anthropic.Anthropic(api_key=api_key)
+                client = claude_client()
                 
                 # Test with a minimal message to verify API access
                 test_response = client.messages.create(
@@ -221,7 +222,7 @@ def health_check():
         try:
             api_key = current_app.config.get('CLAUDE_API_KEY')
             if api_key and api_key.startswith('sk-ant-'):
-                client = anthropic.Anthropic(api_key=api_key)
+                client = claude_client()
                 # Quick API test with minimal tokens
                 test_response = client.messages.create(
                     model=current_app.config.get('CLAUDE_MODEL', 'claude-3-haiku-20240307'),
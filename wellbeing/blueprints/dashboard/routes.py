@@ -3,13 +3,12 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from bson.objectid import ObjectId
-from flask import render_template, session, redirect, url_for, flash, request, jsonify, Response
+from flask import render_template, session, redirect, url_for, flash, request, jsonify, Response, make_response, current_app
 from datetime import datetime, timezone, timedelta
-import csv
-import io
 import uuid
 import json
 import redis
+import time
 from functools import wraps
 from typing import Dict, List, Optional, Tuple, Any
 from wellbeing.blueprints.dashboard import dashboard_bp
@@ -17,6 +16,16 @@ from wellbeing.utils.decorators import login_required
 from wellbeing.utils.automated_moderation import send_auto_moderated_message, AutomatedModerator
 from wellbeing import mongo, logger
 from wellbeing.models.user import find_user_by_id, update_user_settings
+from wellbeing.models.therapist_chat import insert_therapist_chat
+from wellbeing.utils.batch_loader import prime
+from wellbeing.utils.streaming_export import iter_cursor, stream_csv
+from wellbeing.services.dashboard_service import (
+    get_dashboard_assembler,
+    invalidate_appointment_dashboard,
+    invalidate_dashboard,
+    server_timing_header
+)
+from wellbeing.services.caseload import assign_student
 
 from wellbeing.utils.mental_health import (
     detect_crisis_level,
@@ -36,8 +45,11 @@ from wellbeing.utils.scheduling import (
 
 from wellbeing.utils.zoom_integration import (
     create_zoom_therapy_meeting,
+    create_zoom_therapy_meetings,
     update_zoom_meeting,
-    cancel_zoom_meeting
+    cancel_zoom_meeting,
+    get_zoom_manager,
+    submit_zoom_task
 )
 
 from wellbeing.utils.appointments import (
@@ -1167,6 +1179,7 @@ class AppointmentManager:
             
             # Insert appointment
             result = mongo.db.appointments.insert_one(appointment_data)
+            invalidate_dashboard(student_id, 'appointments')
             appointment_id = result.inserted_id
             
             appointment_data['appointment_id'] = appointment_id
@@ -1264,9 +1277,13 @@ def index():
         _initialize_user_progress(user_id, user)
         
         # Get dashboard data
-        dashboard_data = _get_dashboard_data(user_id, user)
+        start = time.perf_counter()
+        dashboard_data, timings = _get_dashboard_data(user_id, user)
         
-        return render_template('dashboard.html', **dashboard_data)
+        response = make_response(render_template('dashboard.html', **dashboard_data))
+        if current_app.debug or current_app.config.get('DASHBOARD_TIMING_HEADER'):
+            response.headers['Server-Timing'] = server_timing_header(timings, (time.perf_counter() - start) * 1000)
+        return response
         
     except Exception as e:
         logger.error(f"Dashboard error for user {session.get('user')}: {str(e)}")
@@ -1292,24 +1309,38 @@ def _initialize_user_progress(user_id: ObjectId, user: Dict[str, Any]):
         )
         user['progress'] = default_progress
 
-def _get_dashboard_data(user_id: ObjectId, user: Dict[str, Any]) -> Dict[str, Any]:
-    """Get all dashboard data in organized format"""
-    # Basic user data
-    recent_chats = list(mongo.db.chats.find({"user_id": str(user_id)}).sort("timestamp", -1).limit(5))
-    recommended_resources = list(mongo.db.resources.find().limit(2))
-    latest_mood = mongo.db.moods.find_one({"user_id": str(user_id)}, sort=[("timestamp", -1)])
-    
-    # Intake and therapist data
-    intake_completed = mongo.db.intake_assessments.find_one({'student_id': user_id})
-    assigned_therapist = _get_assigned_therapist(user)
-    
-    # Appointment data
-    appointment_status = get_user_appointment_status(user_id, mongo.db)
-    next_appointment = _get_next_appointment(user_id, assigned_therapist, appointment_status)
-    all_appointments = _get_all_appointments(user_id, assigned_therapist)
-    
-    # Categorize appointments
+def _get_dashboard_data(user_id: ObjectId, user: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Get all dashboard data in organized format, plus per-section timings"""
+    sections, timings = get_dashboard_assembler().assemble(user_id, [
+        # Independent queries, run concurrently
+        {
+            'recent_chats': lambda done: list(mongo.db.chats.find({"user_id": str(user_id)}).sort("timestamp", -1).limit(5)),
+            'resources': lambda done: list(mongo.db.resources.find().limit(2)),
+            'latest_mood': lambda done: mongo.db.moods.find_one({"user_id": str(user_id)}, sort=[("timestamp", -1)]),
+            'intake_completed': lambda done: mongo.db.intake_assessments.find_one({'student_id': user_id}),
+            'assigned_therapist': lambda done: _get_assigned_therapist(user),
+            'appointment_status': lambda done: get_user_appointment_status(user_id, mongo.db),
+        },
+        # Need the therapist and appointment status
+        {
+            'next_appointment': lambda done: _get_next_appointment(user_id, done['assigned_therapist'], done['appointment_status']),
+            'all_appointments': lambda done: _get_all_appointments(user_id, done['assigned_therapist']),
+        }
+    ], version=str(user.get('assigned_therapist_id')))
+    
+    recent_chats = sections['recent_chats']
+    recommended_resources = sections['resources']
+    latest_mood = sections['latest_mood']
+    intake_completed = sections['intake_completed']
+    assigned_therapist = sections['assigned_therapist']
+    appointment_status = sections['appointment_status']
+    next_appointment = sections['next_appointment']
+    all_appointments = sections['all_appointments']
+    
+    # Categorize appointments (time-dependent, so never cached)
     now = datetime.now()
+    if next_appointment and next_appointment.get('datetime'):
+        next_appointment['time_diff_minutes'] = (next_appointment['datetime'] - now).total_seconds() / 60
     upcoming_appointments = [
         apt for apt in all_appointments 
         if apt.get('datetime') and apt['datetime'] > now and apt.get('status') not in ['cancelled', 'completed']
@@ -1345,7 +1376,7 @@ def _get_dashboard_data(user_id: ObjectId, user: Dict[str, Any]) -> Dict[str, An
         'past_appointments': past_appointments,
         'has_active_appointment': appointment_status['has_active_appointment'],
         'active_appointment': appointment_status.get('active_appointment')
-    }
+    }, timings
 
 def _get_assigned_therapist(user: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Get assigned therapist with proper error handling"""
@@ -1566,6 +1597,7 @@ def cancel_appointment():
         }
         
         result = mongo.db.appointments.update_one(query, {'$set': update_data})
+        invalidate_dashboard(user_id, 'appointments')
         
         if result.modified_count == 0:
             return jsonify({'success': False, 'message': 'No active appointment found to cancel'}), 404
@@ -1591,8 +1623,8 @@ def _handle_zoom_cancellation_async(appointment_id: str):
         
         if appointment and appointment.get('zoom_meeting_id'):
             if not str(appointment['zoom_meeting_id']).startswith('fallback'):
-                from threading import Thread
-                Thread(target=cancel_zoom_meeting_in_appointment, args=(appointment_id,)).start()
+                # Bounded Zoom worker pool instead of a thread per cancellation
+                submit_zoom_task(cancel_zoom_meeting_in_appointment, appointment['_id'])
     except Exception as e:
         logger.error(f"Error handling Zoom cancellation: {str(e)}")
 
@@ -1619,6 +1651,7 @@ def reschedule_appointment():
                 }
             }
         )
+        invalidate_dashboard(user_id, 'appointments')
         
         if result.modified_count > 0:
             logger.info(f"User {user_id} cancelled appointment for rescheduling")
@@ -1665,12 +1698,13 @@ def _handle_intake_submission():
         crisis_level = crisis_result['level']
         
         # Find therapist
-        therapist = assign_therapist_immediately(intake_data)
+        therapist = assign_therapist_immediately(intake_data, crisis_level)
         
         if therapist:
             return _process_intake_with_therapist(intake_data, therapist, crisis_level, can_schedule, user_id)
         else:
             mongo.db.intake_assessments.insert_one(intake_data)
+            invalidate_dashboard(user_id, 'intake')
             flash('Assessment completed! We\'ll find you a therapist soon.', 'info')
             return redirect(url_for('dashboard.index'))
             
@@ -1762,6 +1796,7 @@ def _assign_therapist_without_appointment(intake_data: Dict[str, Any], therapist
         'blocked_by_existing_appointment': True
     })
     mongo.db.intake_assessments.insert_one(intake_data)
+    invalidate_dashboard(user_id, 'intake')
     
     # Update user records
     _update_user_therapist_assignment(therapist, user_id)
@@ -1792,6 +1827,7 @@ def _update_records_with_appointment(
             'zoom_integrated': zoom_success
         })
         mongo.db.intake_assessments.insert_one(intake_data)
+        invalidate_dashboard(user_id, 'intake')
         
         # Update student record
         mongo.db.students.update_one(
@@ -1830,6 +1866,7 @@ def _update_records_without_appointment(
             'auto_scheduled': False
         })
         mongo.db.intake_assessments.insert_one(intake_data)
+        invalidate_dashboard(user_id, 'intake')
         
         # Update student record
         mongo.db.students.update_one(
@@ -1866,30 +1903,9 @@ def _update_user_therapist_assignment(therapist: Dict[str, Any], user_id: str):
             }}
         )
         
-        # Create or update therapist_assignments record (THIS WAS MISSING!)
-        mongo.db.therapist_assignments.update_one(
-            {
-                'therapist_id': therapist_object_id,
-                'student_id': user_object_id
-            },
-            {
-                '$set': {
-                    'therapist_id': therapist_object_id,
-                    'student_id': user_object_id,
-                    'status': 'active',
-                    'auto_assigned': True,
-                    'created_at': datetime.now(),
-                    'updated_at': datetime.now()
-                }
-            },
-            upsert=True  # Create if doesn't exist
-        )
-        
-        # Update therapist's current student count
-        mongo.db.therapists.update_one(
-            {'_id': therapist_object_id},
-            {'$inc': {'current_students': 1}}
-        )
+        # Create or update therapist_assignments record and the therapist's caseload counter
+        # (no capacity refusal: intake already prefers therapists with room, and a student must be placed)
+        assign_student(user_object_id, therapist_object_id, auto_assigned=True, enforce_capacity=False)
         
         logger.info(f"Successfully created therapist assignment: therapist {therapist_object_id} -> student {user_object_id}")
         
@@ -1919,14 +1935,7 @@ def migrate_existing_student_assignments():
             
             if not existing_assignment:
                 # Create the missing assignment
-                mongo.db.therapist_assignments.insert_one({
-                    'therapist_id': therapist_id,
-                    'student_id': user_id,
-                    'status': 'active',
-                    'auto_assigned': True,
-                    'created_at': user.get('assignment_date', datetime.now()),
-                    'updated_at': datetime.now()
-                })
+                assign_student(user_id, therapist_id, auto_assigned=True, enforce_capacity=False)
                 migrated_count += 1
                 logger.info(f"Migrated assignment: therapist {therapist_id} -> student {user_id}")
         
@@ -2083,6 +2092,7 @@ def _get_formatted_appointments(user_id: ObjectId, therapist: Optional[Dict[str,
                     {'_id': apt['_id']},
                     {'$set': {'status': 'completed', 'auto_completed': True}}
                 )
+                invalidate_dashboard(user_id, 'appointments')
                 apt['status'] = 'completed'
                 apt['auto_completed'] = True
         
@@ -2826,6 +2836,7 @@ def api_reschedule_appointment():
             {'_id': ObjectId(appointment_id)},
             {'$set': update_data}
         )
+        invalidate_appointment_dashboard(appointment)
         
         # Update OAuth Zoom meeting if integrated
         zoom_success = False
@@ -2874,6 +2885,7 @@ def api_cancel_appointment():
                 }
             }
         )
+        invalidate_appointment_dashboard(appointment)
         
         # Cancel OAuth Zoom meeting if integrated
         zoom_success = False
@@ -2899,9 +2911,7 @@ def get_zoom_integration_status():
     """Get the status of OAuth Zoom integration for the system"""
     
     try:
-        from wellbeing.utils.zoom_integration import ZoomMeetingManager
-        
-        zoom_manager = ZoomMeetingManager()
+        zoom_manager = get_zoom_manager()
         has_credentials = bool(zoom_manager.client_id and zoom_manager.client_secret and zoom_manager.account_id)
         
         # Test OAuth functionality
@@ -3196,6 +3206,7 @@ def api_cancel_session():
                 }
             }
         )
+        invalidate_dashboard(user_id, 'appointments')
         
         # Cancel Zoom meeting if exists (using your existing function)
         if appointment.get('zoom_meeting_id'):
@@ -3259,6 +3270,7 @@ def api_delete_appointment():
                 }
             }
         )
+        invalidate_dashboard(user_id, 'appointments')
         
         logger.info(f"Appointment {appointment_id} soft-deleted by student {user_id}")
         
@@ -3428,59 +3440,60 @@ def migrate_to_zoom_integration():
     """Helper function to migrate existing appointments to use Zoom integration"""
     try:
         # Find appointments with Google Meet links
-        google_meet_appointments = mongo.db.appointments.find({
+        google_meet_appointments = list(mongo.db.appointments.find({
             'meeting_info.platform': {'$in': ['Google Meet', 'Google Calendar']}
-        })
+        }))
+        users = prime('users', [apt.get('student_id') for apt in google_meet_appointments])
+        therapists = prime('therapists', [apt.get('therapist_id') for apt in google_meet_appointments])
         
-        migrated_count = 0
+        # Appointments that can get a Zoom meeting, with their meeting requests
+        to_migrate = []
         for apt in google_meet_appointments:
-            # Try to create a new Zoom meeting for this appointment
             if apt.get('student_id') and apt.get('therapist_id'):
-                student = mongo.db.users.find_one({'_id': apt['student_id']})
-                therapist = mongo.db.therapists.find_one({'_id': apt['therapist_id']})
+                student = users.load(apt['student_id'])
+                therapist = therapists.load(apt['therapist_id'])
                 
                 if student and therapist and student.get('email') and therapist.get('email'):
-                    # Create OAuth Zoom meeting
                     zoom_appointment_data = {
                         'datetime': apt.get('datetime', datetime.now() + timedelta(hours=1)),
                         'crisis_level': apt.get('crisis_level', 'normal'),
                         'notes': apt.get('notes', 'Migrated appointment'),
                         'appointment_id': str(apt['_id'])
                     }
-                    
-                    try:
-                        success, result = create_zoom_therapy_meeting(
-                            zoom_appointment_data, 
-                            student['email'], 
-                            therapist['email']
-                        )
-                        
-                        if success and result.get('created_method') == 'zoom_oauth':
-                            # Update appointment with Zoom info
-                            mongo.db.appointments.update_one(
-                                {'_id': apt['_id']},
-                                {
-                                    '$set': {
-                                        'zoom_meeting_id': result.get('zoom_meeting_id'),
-                                        'meeting_info': {
-                                            'meet_link': result.get('meet_link'),
-                                            'host_link': result.get('host_link'),
-                                            'platform': 'Zoom',
-                                            'meeting_password': result.get('meeting_password'),
-                                            'dial_in': result.get('dial_in'),
-                                            'meeting_uuid': result.get('meeting_uuid'),
-                                            'created_method': 'migration'
-                                        },
-                                        'zoom_integrated': True,
-                                        'migrated_to_zoom': True,
-                                        'migration_date': datetime.utcnow()
-                                    }
-                                }
-                            )
-                            migrated_count += 1
-                            logger.info(f"Migrated appointment {apt['_id']} to OAuth Zoom")
-                    except Exception as e:
-                        logger.error(f"Failed to migrate appointment {apt['_id']}: {str(e)}")
+                    to_migrate.append((apt, (zoom_appointment_data, student['email'], therapist['email'])))
+        
+        # Create OAuth Zoom meetings concurrently on the Zoom worker pool
+        results = create_zoom_therapy_meetings([meeting for _, meeting in to_migrate])
+        
+        migrated_count = 0
+        for (apt, _), (success, result) in zip(to_migrate, results):
+            try:
+                if success and result.get('created_method') == 'zoom_oauth':
+                    # Update appointment with Zoom info
+                    mongo.db.appointments.update_one(
+                        {'_id': apt['_id']},
+                        {
+                            '$set': {
+                                'zoom_meeting_id': result.get('zoom_meeting_id'),
+                                'meeting_info': {
+                                    'meet_link': result.get('meet_link'),
+                                    'host_link': result.get('host_link'),
+                                    'platform': 'Zoom',
+                                    'meeting_password': result.get('meeting_password'),
+                                    'dial_in': result.get('dial_in'),
+                                    'meeting_uuid': result.get('meeting_uuid'),
+                                    'created_method': 'migration'
+                                },
+                                'zoom_integrated': True,
+                                'migrated_to_zoom': True,
+                                'migration_date': datetime.utcnow()
+                            }
+                        }
+                    )
+                    migrated_count += 1
+                    logger.info(f"Migrated appointment {apt['_id']} to OAuth Zoom")
+            except Exception as e:
+                logger.error(f"Failed to migrate appointment {apt['_id']}: {str(e)}")
         
         logger.info(f"Successfully migrated {migrated_count} appointments to OAuth Zoom integration")
         return migrated_count
@@ -3548,8 +3561,7 @@ def get_system_health_status():
         
         # Test Zoom integration
         try:
-            from wellbeing.utils.zoom_integration import ZoomMeetingManager
-            zoom_manager = ZoomMeetingManager()
+            zoom_manager = get_zoom_manager()
             if zoom_manager.client_id and zoom_manager.client_secret:
                 status['zoom_integration'] = True
         except Exception as e:
@@ -3697,7 +3709,7 @@ def _send_cancellation_notification(appointment: Dict[str, Any], reason: str):
                 'message_type': 'cancellation_notice',
                 'read': False
             }
-            mongo.db.therapist_chats.insert_one(chat_message)
+            insert_therapist_chat(chat_message)
             
             logger.info(f"Cancellation notification sent to therapist {therapist['_id']}")
             
@@ -3926,56 +3938,48 @@ def download_data():
         return redirect(url_for('dashboard.index'))
     
     try:
-        # Create CSV file in memory
-        memory_file = io.StringIO()
-        writer = csv.writer(memory_file)
-        
-        # Write user profile data
-        writer.writerow(['Profile Information'])
-        writer.writerow(['First Name', 'Last Name', 'Email', 'Student ID', 'Role', 'Created At'])
-        writer.writerow([
-            user.get('first_name', ''),
-            user.get('last_name', ''),
-            user.get('email', ''),
-            user.get('student_id', ''),
-            user.get('role', ''),
-            user.get('created_at', datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
-        ])
-        
-        writer.writerow([])  # Empty row as separator
-        
-        # Write mood data
-        writer.writerow(['Mood Tracking History'])
-        writer.writerow(['Date', 'Mood', 'Notes'])
-        
-        moods = mongo.db.moods.find({"user_id": str(user_id)}).sort("timestamp", -1)
-        for mood in moods:
-            writer.writerow([
-                mood.get('timestamp', datetime.now()).strftime('%Y-%m-%d %H:%M:%S'),
-                mood.get('mood', ''),
-                mood.get('context', '')
-            ])
-        
-        writer.writerow([])  # Empty row as separator
-        
-        # Write chat history
-        writer.writerow(['Recent Conversations'])
-        writer.writerow(['Date', 'Message'])
-        
-        chats = mongo.db.chats.find({"user_id": str(user_id)}).sort("timestamp", -1)
-        for chat in chats:
-            writer.writerow([
-                chat.get('timestamp', datetime.now()).strftime('%Y-%m-%d %H:%M:%S'),
-                chat.get('message', '')
-            ])
+        def rows():
+            # Write user profile data
+            yield ['Profile Information']
+            yield ['First Name', 'Last Name', 'Email', 'Student ID', 'Role', 'Created At']
+            yield [
+                user.get('first_name', ''),
+                user.get('last_name', ''),
+                user.get('email', ''),
+                user.get('student_id', ''),
+                user.get('role', ''),
+                user.get('created_at', datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+            ]
+            
+            yield []  # Empty row as separator
+            
+            # Write mood data
+            yield ['Mood Tracking History']
+            yield ['Date', 'Mood', 'Notes']
+            
+            moods = mongo.db.moods.find({"user_id": str(user_id)}, {'timestamp': 1, 'mood': 1, 'context': 1}).sort("timestamp", -1)
+            for mood in iter_cursor(moods):
+                yield [
+                    mood.get('timestamp', datetime.now()).strftime('%Y-%m-%d %H:%M:%S'),
+                    mood.get('mood', ''),
+                    mood.get('context', '')
+                ]
+            
+            yield []  # Empty row as separator
+            
+            # Write chat history
+            yield ['Recent Conversations']
+            yield ['Date', 'Message']
+            
+            chats = mongo.db.chats.find({"user_id": str(user_id)}, {'timestamp': 1, 'message': 1}).sort("timestamp", -1)
+            for chat in iter_cursor(chats):
+                yield [
+                    chat.get('timestamp', datetime.now()).strftime('%Y-%m-%d %H:%M:%S'),
+                    chat.get('message', '')
+                ]
         
-        # Prepare response
-        memory_file.seek(0)
-        return Response(
-            memory_file.getvalue(),
-            mimetype="text/csv",
-            headers={"Content-disposition": f"attachment; filename=wellbeing_data_{datetime.now().strftime('%Y%m%d')}.csv"}
-        )
+        # Streamed: moods and chats are read batch by batch while the file downloads
+        return stream_csv(rows(), f"wellbeing_data_{datetime.now().strftime('%Y%m%d')}.csv")
     
     except Exception as e:
         logger.error(f"Data download error: {e}")
@@ -4524,6 +4528,7 @@ def auto_reschedule_missed_session():
                 }
             }
         )
+        invalidate_dashboard(user_id, 'appointments')
         
         # Send notification to therapist (simple version)
         _send_simple_reschedule_notification(therapist, reschedule_request, priority)
@@ -4583,7 +4588,7 @@ def _send_simple_reschedule_notification(therapist, reschedule_request, priority
             'priority': priority
         }
         
-        mongo.db.therapist_chats.insert_one(chat_message)
+        insert_therapist_chat(chat_message)
         
         logger.info(f"Reschedule notification sent to therapist {therapist['_id']}")
         
@@ -9,6 +9,13 @@ from wellbeing.blueprints.therapist import therapist_bp
 from wellbeing.utils.decorators import therapist_required
 from wellbeing import mongo, logger
 from wellbeing.models.therapist import find_therapist_by_id, update_therapist_settings
+from wellbeing.models.therapist_chat import get_unread_counts_for_therapist, insert_therapist_chat
+from wellbeing.models.notification import create_notification
+from wellbeing.utils.batch_loader import prime
+from wellbeing.services.dashboard_service import invalidate_appointment_dashboard
+from wellbeing.services.slot_search import load_candidates, next_slots_by_therapist, search_window
+from wellbeing.services.caseload import assign_student, get_caseload
+from wellbeing.services.therapist_matching import invalidate_matching_index, rank_therapists
 from wellbeing.utils.automated_moderation import send_auto_moderated_message, AutomatedModerator
 from wellbeing.utils.scheduling import (
     create_enhanced_fallback_meeting_link,
@@ -61,7 +68,7 @@ def get_therapist_students_with_fallback(therapist_id):
                     })
                     
                     if not existing:
-                        mongo.db.therapist_assignments.insert_one(assignment_data)
+                        assign_student(user['_id'], therapist_id, auto_assigned=True, enforce_capacity=False)
                         assignments.append(assignment_data)
                         logger.info(f"Created missing assignment for student {user['_id']}")
         
@@ -203,10 +210,36 @@ def index():
         'deleted': {'$ne': True}  # Exclude soft-deleted appointments
     }).sort('datetime', 1))
     
+    # Get pending reschedule requests from students
+    pending_reschedules = list(mongo.db.reschedule_requests.find({
+        'therapist_id': therapist_id,
+        'status': 'pending'
+    }).sort('created_at', -1).limit(5))
+    
+    # Get recent student cancellations (last 24 hours)
+    recent_cancellations = list(mongo.db.appointments.find({
+        'therapist_id': therapist_id,
+        'status': 'cancelled',
+        'cancelled_at': {'$gte': datetime.now() - timedelta(hours=24)}
+    }).sort('cancelled_at', -1))
+    
+    # Get crisis appointments with Zoom status
+    crisis_appointments = list(mongo.db.appointments.find({
+        'therapist_id': therapist_id,
+        'crisis_level': {'$in': ['high', 'critical']},
+        'status': 'confirmed',
+        'datetime': {'$gte': datetime.now()},
+        'deleted': {'$ne': True}
+    }).sort('datetime', 1))
+    
+    # Student records for every list above: one $in per collection (users, then students)
+    people = prime('people', [appt['user_id'] for appt in today_appointments + recent_cancellations + crisis_appointments])
+    people.prime(req['student_id'] for req in pending_reschedules)
+    
     # Add enhanced session controls with Zoom integration
     for appt in today_appointments:
         # Get student info (check both collections)
-        student = mongo.db.users.find_one({'_id': appt['user_id']}) or mongo.db.students.find_one({'_id': appt['user_id']})
+        student = people.load(appt['user_id'])
         if student:
             appt['student_name'] = f"{student['first_name']} {student['last_name']}"
         
@@ -220,40 +253,18 @@ def index():
         appt['zoom_integrated'] = is_zoom_integrated(appt.get('zoom_meeting_id'))
         appt['zoom_status'] = _get_zoom_status(appt)
     
-    # Get pending reschedule requests from students
-    pending_reschedules = list(mongo.db.reschedule_requests.find({
-        'therapist_id': therapist_id,
-        'status': 'pending'
-    }).sort('created_at', -1).limit(5))
-    
     for req in pending_reschedules:
-        student = mongo.db.users.find_one({'_id': req['student_id']}) or mongo.db.students.find_one({'_id': req['student_id']})
+        student = people.load(req['student_id'])
         if student:
             req['student_name'] = f"{student['first_name']} {student['last_name']}"
     
-    # Get recent student cancellations (last 24 hours)
-    recent_cancellations = list(mongo.db.appointments.find({
-        'therapist_id': therapist_id,
-        'status': 'cancelled',
-        'cancelled_at': {'$gte': datetime.now() - timedelta(hours=24)}
-    }).sort('cancelled_at', -1))
-    
     for cancel in recent_cancellations:
-        student = mongo.db.users.find_one({'_id': cancel['user_id']}) or mongo.db.students.find_one({'_id': cancel['user_id']})
+        student = people.load(cancel['user_id'])
         if student:
             cancel['student_name'] = f"{student['first_name']} {student['last_name']}"
     
-    # Get crisis appointments with Zoom status
-    crisis_appointments = list(mongo.db.appointments.find({
-        'therapist_id': therapist_id,
-        'crisis_level': {'$in': ['high', 'critical']},
-        'status': 'confirmed',
-        'datetime': {'$gte': datetime.now()},
-        'deleted': {'$ne': True}
-    }).sort('datetime', 1))
-    
     for appt in crisis_appointments:
-        student = mongo.db.users.find_one({'_id': appt['user_id']}) or mongo.db.students.find_one({'_id': appt['user_id']})
+        student = people.load(appt['user_id'])
         if student:
             appt['student_name'] = f"{student['first_name']} {student['last_name']}"
         
@@ -270,10 +281,7 @@ def index():
     
     # Enhanced statistics with Zoom integration
     stats = {
-        'total_students': mongo.db.therapist_assignments.count_documents({
-            'therapist_id': therapist_id,
-            'status': 'active'
-        }),
+        'total_students': get_caseload(therapist_id),
         'virtual_sessions_today': len(today_appointments),
         'pending_reschedules': len(pending_reschedules),
         'recent_cancellations': len(recent_cancellations),
@@ -611,6 +619,7 @@ def cancel_session_therapist():
                 }
             }
         )
+        invalidate_appointment_dashboard(appointment)
         
         # Notify student
         student = mongo.db.users.find_one({'_id': appointment['user_id']}) or mongo.db.students.find_one({'_id': appointment['user_id']})
@@ -655,6 +664,10 @@ def students():
         
         settings = mongo.db.settings.find_one() or {}
         
+        # Unread messages for the whole caseload in one aggregation
+        unread_by_student = get_unread_counts_for_therapist(therapist_id)
+        users = prime('users', [assignment.get('student_id') for assignment in assignments])
+        
         # Get student details for each assignment
         students_data = []
         for assignment in assignments:
@@ -664,7 +677,7 @@ def students():
                     logger.warning(f"Assignment {assignment.get('_id')} has no student_id field")
                     continue
                     
-                student = mongo.db.users.find_one({'_id': student_id})
+                student = users.load(student_id)
                 if not student:
                     logger.warning(f"Student with ID {student_id} not found")
                     continue
@@ -698,12 +711,7 @@ def students():
                 crisis_level = intake.get('crisis_level', 'normal') if intake else 'normal'
                 
                 # Get unread messages
-                unread_messages = mongo.db.therapist_chats.count_documents({
-                    'student_id': student_id,
-                    'therapist_id': therapist_id,
-                    'sender': 'student',
-                    'read': False
-                })
+                unread_messages = unread_by_student.get(str(student_id), 0)
                 
                 students_data.append({
                     'student': student,
@@ -844,6 +852,7 @@ def process_expired_appointments():
                     }
                 }
             )
+            invalidate_appointment_dashboard(appointment)
             
             
     except Exception as e:
@@ -939,9 +948,10 @@ def auto_reschedule_appointment(appointment_id):
                 }
             }
         )
+        invalidate_appointment_dashboard(appointment)
         
         # Notify student
-        mongo.db.notifications.insert_one({
+        create_notification({
             'user_id': appointment['user_id'],
             'type': 'appointment_auto_rescheduled',
             'message': f'Your virtual session has been automatically rescheduled to {next_slot.strftime("%A, %B %d at %I:%M %p")} due to therapist availability.',
@@ -1006,12 +1016,14 @@ def suggest_alternative_therapist(appointment_id):
                 }
             }
         )
+        invalidate_appointment_dashboard(appointment)
         
         # Create alternative options for student
         alternative_options = []
-        for alt_therapist in alternative_therapists[:3]:  # Top 3 alternatives
+        next_slots = next_slots_by_therapist(alternative_therapists[:3])  # Top 3 alternatives
+        for alt_therapist in alternative_therapists[:3]:
             # Find available slot for this therapist
-            alt_slot = find_next_available_slot(alt_therapist['_id'])
+            alt_slot = next_slots.get(alt_therapist['_id'])
             if alt_slot:
                 alternative_options.append({
                     'therapist_id': str(alt_therapist['_id']),
@@ -1032,7 +1044,7 @@ def suggest_alternative_therapist(appointment_id):
         })
         
         # Notify student with alternatives
-        mongo.db.notifications.insert_one({
+        create_notification({
             'user_id': student_id,
             'type': 'alternative_therapist_suggested',
             'message': f'Your therapist is unavailable. We found {len(alternative_options)} alternative therapists for you to choose from.',
@@ -1083,7 +1095,7 @@ def reschedule_appointment(appointment_id):
         if result.modified_count > 0:
             # Notify student
             appointment = mongo.db.appointments.find_one({'_id': ObjectId(appointment_id)})
-            mongo.db.notifications.insert_one({
+            create_notification({
                 'user_id': appointment['user_id'],
                 'type': 'appointment_rescheduled',
                 'message': f'Your virtual session has been rescheduled to {new_datetime.strftime("%A, %B %d at %I:%M %p")}.',
@@ -1287,39 +1299,18 @@ def get_auto_schedule_slots():
         if not availability or not availability.get('auto_schedule_enabled'):
             return jsonify({'error': 'Auto-scheduling not enabled'}), 400
         
-        # Generate available slots for next 2 weeks
+        # Free slots for the next 2 weeks from one bookings query
+        now = datetime.now()
+        end = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=14)
+        candidate = load_candidates([{'_id': therapist_id}], since=now, until=end)[0]
         slots = []
-        current_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        for day_offset in range(14):
-            check_date = current_date + timedelta(days=day_offset)
-            
-            # Skip if not a working day
-            day_name = check_date.strftime('%A').lower()
-            if day_name not in availability.get('working_days', []):
-                continue
-            
-            # Generate hourly slots within working hours
-            start_hour = int(availability['working_hours']['start'].split(':')[0])
-            end_hour = int(availability['working_hours']['end'].split(':')[0])
-            
-            for hour in range(start_hour, end_hour):
-                slot_time = check_date.replace(hour=hour, minute=0)
-                
-                # Check if slot is available
-                existing = mongo.db.appointments.find_one({
-                    'therapist_id': therapist_id,
-                    'datetime': slot_time,
-                    'status': 'confirmed'
-                })
-                
-                if not existing:
-                    slots.append({
-                        'datetime': slot_time.isoformat(),
-                        'formatted': slot_time.strftime('%A, %B %d at %I:%M %p'),
-                        'day': day_name.title(),
-                        'time': slot_time.strftime('%I:%M %p')
-                    })
+        for slot_time in candidate.free_slots(now, end):
+            slots.append({
+                'datetime': slot_time.isoformat(),
+                'formatted': slot_time.strftime('%A, %B %d at %I:%M %p'),
+                'day': slot_time.strftime('%A'),
+                'time': slot_time.strftime('%I:%M %p')
+            })
         
         return jsonify({
             'available_slots': slots[:20],  # Limit to 20 slots
@@ -1334,53 +1325,13 @@ def get_auto_schedule_slots():
 def find_next_available_slot(therapist_id):
     """Find the next available appointment slot for a therapist"""
     
-    # Get existing appointments for this therapist
-    existing_appointments = list(mongo.db.appointments.find({
-        'therapist_id': ObjectId(therapist_id),
-        'status': 'confirmed',
-        'datetime': {'$gte': datetime.now()}
-    }))
-    
-    # Extract busy times
-    busy_times = [apt['datetime'] for apt in existing_appointments]
-    
-    # Get therapist availability
-    availability = mongo.db.therapist_availability.find_one({'therapist_id': ObjectId(therapist_id)})
-    if not availability:
-        # Default business hours: 9 AM to 5 PM, Monday to Friday
-        business_hours = [(9, 17)]
-        working_days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
-    else:
-        start_hour = int(availability['working_hours']['start'].split(':')[0])
-        end_hour = int(availability['working_hours']['end'].split(':')[0])
-        business_hours = [(start_hour, end_hour)]
-        working_days = availability.get('working_days', ['monday', 'tuesday', 'wednesday', 'thursday', 'friday'])
-    
-    # Start looking from tomorrow
-    current_date = datetime.now() + timedelta(days=1)
-    
-    for day_offset in range(14):  # Look up to 2 weeks ahead
-        check_date = current_date + timedelta(days=day_offset)
-        
-        # Skip if not a working day
-        day_name = check_date.strftime('%A').lower()
-        if day_name not in working_days:
-            continue
-            
-        # Check each hour in business hours
-        for start_hour in range(business_hours[0][0], business_hours[0][1]):
-            slot_time = check_date.replace(hour=start_hour, minute=0, second=0, microsecond=0)
-            
-            # Check if this slot is available (not within 1 hour of existing appointments)
-            slot_available = True
-            for busy_time in busy_times:
-                time_diff = abs((slot_time - busy_time).total_seconds()) / 3600  # Convert to hours
-                if time_diff < 1:  # Less than 1 hour difference
-                    slot_available = False
-                    break
-            
-            if slot_available:
-                return slot_time
+    # Bookings, working hours and buffer from the batched slot search
+    now = datetime.now()
+    start, end = search_window('normal', days_ahead=14, now=now)
+    candidate = load_candidates([{'_id': ObjectId(therapist_id)}], since=now, until=end)[0]
+    slot_time = candidate.next_slot(start, end)
+    if slot_time:
+        return slot_time
     
     # If no slot found, return a default time (next Monday at 2 PM)
     next_monday = datetime.now() + timedelta(days=(7 - datetime.now().weekday()))
@@ -1394,50 +1345,27 @@ def find_alternative_therapists(current_therapist_id, student_intake, appointmen
         therapist_gender = student_intake.get('therapist_gender') if student_intake else 'no_preference'
         crisis_level = student_intake.get('crisis_level') if student_intake else 'normal'
         
-        # Build query for compatible therapists
-        query = {
-            '_id': {'$ne': current_therapist_id},  # Exclude current therapist
-            'status': 'active'
-        }
+        if not primary_concern:
+            return []
+        
+        # Specialists in the student's concern, best match first (matching index)
+        therapists = rank_therapists(
+            specialization=primary_concern,
+            require_specialization=True,
+            gender=therapist_gender,
+            require_gender=True,
+            crisis_level=crisis_level,
+            require_capacity=False,
+            exclude=[current_therapist_id]
+        )
+        
+        # Availability settings and caseloads for all of them in one batch
+        compatible_therapists = [
+            candidate.therapist
+            for candidate in load_candidates(therapists, bookings=False)
+            if candidate.auto_schedule_enabled and candidate.has_capacity
+        ]
         
-        # Add gender preference if specified
-        if therapist_gender and therapist_gender != 'no_preference':
-            query['gender'] = therapist_gender
-        
-        # Find therapists with matching specializations
-        therapists = list(mongo.db.therapists.find(query))
-        
-        # Filter by specialization match and availability
-        compatible_therapists = []
-        for therapist in therapists:
-            # Check if they have matching specializations
-            therapist_specs = therapist.get('specializations', [])
-            if primary_concern and primary_concern in therapist_specs:
-                # Check availability
-                availability = mongo.db.therapist_availability.find_one({
-                    'therapist_id': therapist['_id'],
-                    'auto_schedule_enabled': True
-                })
-                
-                if availability:
-                    # Check if they have capacity
-                    current_load = mongo.db.therapist_assignments.count_documents({
-                        'therapist_id': therapist['_id'],
-                        'status': 'active'
-                    })
-                    
-                    max_students = availability.get('max_students', 20)
-                    if current_load < max_students:
-                        compatible_therapists.append(therapist)
-        
-        # Sort by compatibility score (number of matching specializations)
-        def compatibility_score(therapist):
-            specs = therapist.get('specializations', [])
-            if not primary_concern:
-                return len(specs)
-            return len([s for s in specs if s == primary_concern]) + len(specs)
-        
-        compatible_therapists.sort(key=compatibility_score, reverse=True)
         return compatible_therapists
         
     except Exception as e:
@@ -1550,7 +1478,7 @@ def add_session_notes(appointment_id):
                 mongo.db.session_notes.insert_one(notes_data)
                 
                 # Add notification for student
-                mongo.db.notifications.insert_one({
+                create_notification({
                     'user_id': appointment['user_id'],
                     'type': 'session_notes_added',
                     'message': f'Session notes are now available for your appointment on {appointment["datetime"].strftime("%A, %B %d")}.',
@@ -1771,7 +1699,7 @@ def acknowledge_crisis_alert(alert_id):
             # Optionally notify student that alert was acknowledged
             alert = mongo.db.crisis_alerts.find_one({'_id': ObjectId(alert_id)})
             if alert:
-                mongo.db.notifications.insert_one({
+                create_notification({
                     'user_id': alert['student_id'],
                     'type': 'crisis_response',
                     'message': 'Your therapist has been notified of your message and will respond shortly.',
@@ -2105,16 +2033,19 @@ def resources():
             'therapist_id': therapist_id
         }).sort('shared_at', -1).limit(10))
         
+        # Get students data for sharing dropdown
+        assignments = get_therapist_students_with_fallback(therapist_id)
+        users = prime('users', [shared['student_id'] for shared in recently_shared])
+        users.prime(assignment.get('student_id') for assignment in assignments)
+        
         # Add student details for recently shared resources
         for shared in recently_shared:
-            student = mongo.db.users.find_one({'_id': shared['student_id']})
+            student = users.load(shared['student_id'])
             if student:
                 shared['student_name'] = f"{student['first_name']} {student['last_name']}"
             else:
                 shared['student_name'] = 'Unknown Student'
         
-        # Get students data for sharing dropdown
-        assignments = get_therapist_students_with_fallback(therapist_id)
         students_data = []
         
         for assignment in assignments:
@@ -2123,7 +2054,7 @@ def resources():
                 if not student_id:
                     continue
                     
-                student = mongo.db.users.find_one({'_id': student_id})
+                student = users.load(student_id)
                 if not student:
                     continue
                 
@@ -2282,7 +2213,7 @@ def share_resource():
         if custom_message:
             chat_message += f"\n\nNote: {custom_message}"
         
-        mongo.db.therapist_chats.insert_one({
+        insert_therapist_chat({
             'student_id': ObjectId(student_id),
             'therapist_id': therapist_id,
             'sender': 'therapist',
@@ -2293,7 +2224,7 @@ def share_resource():
         })
         
         # Add notification for student
-        mongo.db.notifications.insert_one({
+        create_notification({
             'user_id': ObjectId(student_id),
             'type': 'resource_shared',
             'message': f'Your therapist shared a resource with you: {resource_for_sharing["title"]}',
@@ -2362,6 +2293,7 @@ def profile():
                         {'_id': therapist_id},
                         {'$set': update_data}
                     )
+                    invalidate_matching_index()
                     
                     logger.info(f"Updated basic profile for therapist {therapist_id}")
                     flash('Profile updated successfully', 'success')
@@ -2427,6 +2359,7 @@ def profile():
                         {'_id': therapist_id},
                         {'$set': professional_update}
                     )
+                    invalidate_matching_index()
                     
                     logger.info(f"Updated professional info for therapist {therapist_id}: license={license_number}, {len(specializations)} specializations")
                     flash('Professional information updated successfully', 'success')
@@ -2506,10 +2439,7 @@ def profile():
                     'therapist_id': therapist_id,
                     'status': 'completed'
                 }),
-                'current_students': mongo.db.therapist_assignments.count_documents({
-                    'therapist_id': therapist_id,
-                    'status': 'active'
-                }),
+                'current_students': get_caseload(therapist_id),
                 'login_count': login_count,
                 'last_login': last_login_str
             }
@@ -2645,6 +2575,7 @@ def process_reschedule_response(request_id):
                     }
                 }
             )
+            invalidate_appointment_dashboard(original_appointment)
             
             # Update reschedule request as accepted
             mongo.db.reschedule_requests.update_one(
@@ -2711,6 +2642,7 @@ def process_reschedule_response(request_id):
                     }
                 }
             )
+            invalidate_appointment_dashboard(original_appointment)
             
             # Cancel Zoom meeting for original appointment
             if original_appointment.get('zoom_meeting_id'):
@@ -2802,6 +2734,7 @@ def quick_reschedule_response():
                     }
                 }
             )
+            invalidate_appointment_dashboard(original_appointment)
             
             # Update request
             mongo.db.reschedule_requests.update_one(
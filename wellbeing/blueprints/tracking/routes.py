@@ -5,6 +5,7 @@ from wellbeing.blueprints.tracking import tracking_bp
 from wellbeing.utils.decorators import login_required, csrf_protected
 from wellbeing import mongo, logger
 from wellbeing.models.user import find_user_by_id
+from wellbeing.services.dashboard_service import invalidate_dashboard
 from collections import Counter
 from io import StringIO
 import csv
@@ -727,6 +728,7 @@ def track_mood_route():
         }
         
         result = mongo.db.moods.insert_one(mood_entry)
+        invalidate_dashboard(user_id, 'moods')
         
         if result.inserted_id:
             new_streak = calculate_mood_streak(user_id)
@@ -1126,6 +1128,7 @@ def reset_today_mood():
             "user_id": user_id,
             "timestamp": {"$gte": today_start, "$lte": today_end}
         })
+        invalidate_dashboard(user_id, 'moods')
         
         if result.deleted_count > 0:
             flash('Today\'s mood entry reset.', 'info')
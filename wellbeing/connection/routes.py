@@ -15,6 +15,19 @@ from typing import Dict, List, Optional, Tuple, Any
 
 from wellbeing import mongo, logger
 from wellbeing.utils.decorators import login_required
+from wellbeing.models.notification import (
+    create_notification,
+    get_notification_counts,
+    mark_notification_read as mark_read
+)
+from wellbeing.models.therapist_chat import (
+    get_conversation_page,
+    get_conversation_total,
+    insert_therapist_chat,
+    mark_conversation_read
+)
+from wellbeing.services.dashboard_service import invalidate_dashboard
+from wellbeing.services.caseload import get_caseload
 from . import connection_bp  # Import the blueprint from __init__.py
 
 # Socket.IO for real-time updates (if available)
@@ -165,8 +178,7 @@ def send_message(student_id=None, therapist_id=None, user_role=None, **kwargs):
                     }
         
         # Insert message
-        result = mongo.db.therapist_chats.insert_one(message_data)
-        message_id = result.inserted_id
+        message_id = insert_therapist_chat(message_data)
         
         # Create notification for recipient
         recipient_id = therapist_id if user_role == 'student' else student_id
@@ -178,7 +190,7 @@ def send_message(student_id=None, therapist_id=None, user_role=None, **kwargs):
             'read': False,
             'created_at': datetime.now(timezone.utc)
         }
-        mongo.db.notifications.insert_one(notification_data)
+        create_notification(notification_data)
         
         # Real-time update
         room_id = f"connection_{min(student_id, therapist_id)}_{max(student_id, therapist_id)}"
@@ -204,38 +216,22 @@ def send_message(student_id=None, therapist_id=None, user_role=None, **kwargs):
 @login_required
 @require_valid_connection
 def get_messages(student_id=None, therapist_id=None, user_role=None, **kwargs):
-    """Get conversation history between student and therapist"""
+    """
+    Get conversation history between student and therapist.
+    
+    Pages newest-first by keyset: pass the previous response's next_cursor
+    as ?cursor= to get older messages. Read-only; use /mark-messages-read
+    to mark the other party's messages read.
+    """
     try:
-        limit = int(request.args.get('limit', 50))
-        offset = int(request.args.get('offset', 0))
+        limit = max(1, min(int(request.args.get('limit', 50)), 100))
+        cursor = request.args.get('cursor')
         
         # Get messages
-        messages = list(mongo.db.therapist_chats.find({
-            'student_id': ObjectId(student_id),
-            'therapist_id': ObjectId(therapist_id)
-        }).sort('timestamp', -1).skip(offset).limit(limit))
-        
-        # Mark messages as read for current user
-        if user_role == 'student':
-            mongo.db.therapist_chats.update_many(
-                {
-                    'student_id': ObjectId(student_id),
-                    'therapist_id': ObjectId(therapist_id),
-                    'sender': 'therapist',
-                    'read': False
-                },
-                {'$set': {'read': True, 'read_at': datetime.now(timezone.utc)}}
-            )
-        else:  # therapist
-            mongo.db.therapist_chats.update_many(
-                {
-                    'student_id': ObjectId(student_id),
-                    'therapist_id': ObjectId(therapist_id),
-                    'sender': 'student',
-                    'read': False
-                },
-                {'$set': {'read': True, 'read_at': datetime.now(timezone.utc)}}
-            )
+        try:
+            messages, next_cursor = get_conversation_page(student_id, therapist_id, limit, cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
         
         # Format messages
         formatted_messages = []
@@ -263,17 +259,37 @@ def get_messages(student_id=None, therapist_id=None, user_role=None, **kwargs):
         
         return jsonify({
             'messages': formatted_messages,
-            'total_count': mongo.db.therapist_chats.count_documents({
-                'student_id': ObjectId(student_id),
-                'therapist_id': ObjectId(therapist_id)
-            }),
-            'has_more': len(messages) == limit
+            'total_count': get_conversation_total(student_id, therapist_id),
+            'has_more': next_cursor is not None,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
         logger.error(f"Error getting messages: {str(e)}")
         return jsonify({'error': 'Failed to get messages'}), 500
 
+@connection_bp.route('/mark-messages-read', methods=['POST'])
+@login_required
+@require_valid_connection
+def mark_messages_read(student_id=None, therapist_id=None, user_role=None, **kwargs):
+    """Mark the other party's messages in a conversation as read (idempotent)"""
+    try:
+        marked = mark_conversation_read(student_id, therapist_id, user_role)
+        
+        if marked:
+            room_id = f"connection_{min(student_id, therapist_id)}_{max(student_id, therapist_id)}"
+            emit_real_time_update(room_id, 'messages_read', {
+                'reader_role': user_role,
+                'count': marked,
+                'timestamp': datetime.now(timezone.utc).isoformat()
+            })
+        
+        return jsonify({'success': True, 'marked_read': marked})
+        
+    except Exception as e:
+        logger.error(f"Error marking messages as read: {str(e)}")
+        return jsonify({'error': 'Failed to mark messages as read'}), 500
+
 # ===== APPOINTMENT COORDINATION =====
 
 @connection_bp.route('/sync-appointment', methods=['POST'])
@@ -355,13 +371,14 @@ def sync_appointment(student_id=None, therapist_id=None, user_role=None, **kwarg
             {'_id': ObjectId(appointment_id)},
             {'$set': update_data}
         )
+        invalidate_dashboard(student_id, 'appointments')
         
         if result.modified_count == 0:
             return jsonify({'error': 'Failed to update appointment'}), 500
         
         # Create notification for other party
         recipient_id = student_id if user_role == 'therapist' else therapist_id
-        mongo.db.notifications.insert_one({
+        create_notification({
             'user_id': ObjectId(recipient_id),
             'type': f'appointment_{action}',
             'message': notification_message,
@@ -511,10 +528,10 @@ def share_resource(student_id=None, therapist_id=None, user_role=None, **kwargs)
         if custom_message:
             message_data['message'] += f"\n\nNote: {custom_message}"
         
-        mongo.db.therapist_chats.insert_one(message_data)
+        insert_therapist_chat(message_data)
         
         # Create notification
-        mongo.db.notifications.insert_one({
+        create_notification({
             'user_id': ObjectId(student_id),
             'type': 'resource_shared',
             'message': f'Your therapist shared a resource: {resource["title"]}',
@@ -624,16 +641,13 @@ def get_notifications():
             }
             formatted_notifications.append(formatted_notif)
         
-        # Get unread count
-        unread_count = mongo.db.notifications.count_documents({
-            'user_id': ObjectId(user_id),
-            'read': False
-        })
+        # Maintained counters (see wellbeing/models/notification.py)
+        counts = get_notification_counts(user_id)
         
         return jsonify({
             'notifications': formatted_notifications,
-            'unread_count': unread_count,
-            'total_count': mongo.db.notifications.count_documents({'user_id': ObjectId(user_id)})
+            'unread_count': counts['unread'],
+            'total_count': counts['total']
         })
         
     except Exception as e:
@@ -647,20 +661,7 @@ def mark_notification_read(notification_id):
     try:
         user_id = session['user']
         
-        result = mongo.db.notifications.update_one(
-            {
-                '_id': ObjectId(notification_id),
-                'user_id': ObjectId(user_id)
-            },
-            {
-                '$set': {
-                    'read': True,
-                    'read_at': datetime.now(timezone.utc)
-                }
-            }
-        )
-        
-        if result.modified_count == 0:
+        if not mark_read(notification_id, user_id):
             return jsonify({'error': 'Notification not found or already read'}), 404
         
         return jsonify({'success': True})
@@ -903,10 +904,7 @@ def get_connection_stats():
             # Get stats for all students
             return jsonify({
                 'role': 'therapist',
-                'total_students': mongo.db.therapist_assignments.count_documents({
-                    'therapist_id': ObjectId(therapist_id),
-                    'status': 'active'
-                }),
+                'total_students': get_caseload(ObjectId(therapist_id)),
                 'total_sessions': mongo.db.appointments.count_documents({
                     'therapist_id': ObjectId(therapist_id),
                     'status': 'completed'
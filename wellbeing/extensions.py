@@ -9,4 +9,5 @@ import logging
 mongo = PyMongo()
 scheduler = BackgroundScheduler()
 logger = logging.getLogger(__name__)
-socketio = SocketIO(cors_allowed_origins="*", async_mode='threading')
\ No newline at end of file
+# async_mode and the message queue come from config in create_app()
+socketio = SocketIO(cors_allowed_origins="*")
\ No newline at end of file
@@ -3,6 +3,10 @@ import uuid
 from bson.objectid import ObjectId
 from flask import current_app
 from wellbeing import mongo
+from wellbeing.utils.write_behind import write_behind, after_insert, flush_write_behind
+from wellbeing.models.chat_context import get_recent_turns, remember_turn, forget_user_context
+from wellbeing.models.usage_rollup import record_chat_usage, ensure_rollup_indexes, backfill_usage_rollups_if_empty
+from wellbeing.services.dashboard_service import invalidate_dashboard
 
 def create_chat(user_id, message, response, confidence, model_used, topic, session_id=None, **kwargs):
     """Create a new chat entry with cost tracking."""
@@ -49,26 +53,44 @@ def create_chat(user_id, message, response, confidence, model_used, topic, sessi
         "archived": False
     }
     
-    # Insert into MongoDB
-    result = mongo.db.chats.insert_one(chat_data)
+    # Queue the insert; the _id is generated client-side so it's known now
+    chat_id = write_behind('chats', chat_data)
+    
+    # Later turns read context from the cache instead of re-querying chats
+    remember_turn(user_id, message, response)
     
     # Log cost tracking info
-    current_app.logger.info(f"Chat created with cost tracking: {result.inserted_id}")
-    current_app.logger.info(f"  - Cost: ${estimated_cost:.6f}, Tokens: {tokens_used}")
+    current_app.logger.debug(f"Chat queued: {chat_id} (cost ${estimated_cost:.6f}, tokens {tokens_used})")
     
-    return str(result.inserted_id)
+    return str(chat_id)
+
+@after_insert('chats')
+def update_usage_rollups(chats):
+    """Keep the budget dashboard rollups in step once chats are written."""
+    for chat in chats:
+        record_chat_usage(
+            chat['user_id'], chat['timestamp'],
+            tokens_used=chat.get('tokens_used', 0),
+            estimated_cost=chat.get('estimated_cost', 0.0),
+            input_tokens=chat.get('input_tokens', 0),
+            output_tokens=chat.get('output_tokens', 0),
+            confidence=chat.get('confidence', 0.0)
+        )
+
+@after_insert('chats')
+def refresh_dashboard_chats(chats):
+    """Recent chats on the dashboard change once the insert has landed."""
+    for user_id in {chat['user_id'] for chat in chats}:
+        invalidate_dashboard(user_id, 'chats')
 
 def get_previous_message(user_id):
-    """Get the previous message and response for a user."""
-    previous = mongo.db.chats.find_one(
-        {"user_id": user_id, "archived": {"$ne": True}},
-        sort=[("timestamp", -1)]
-    )
+    """Get the previous message and response for a user (from the context cache)."""
+    turns = get_recent_turns(user_id, 1)
     
-    if previous:
+    if turns:
         return {
-            "message": previous.get("message", ""),
-            "response": previous.get("response", "")
+            "message": turns[-1].get("message", ""),
+            "response": turns[-1].get("response", "")
         }
     return {"message": "", "response": ""}
 
@@ -112,19 +134,47 @@ def save_feedback(chat_id, user_id, rating, was_helpful, feedback_text):
     mongo.db.feedback.insert_one(feedback_data)
     
     # Update the original chat document with this feedback
-    mongo.db.chats.update_one(
-        {"_id": ObjectId(chat_id)},
-        {"$set": {"feedback": feedback_data}}
+    chat_filter = {"_id": ObjectId(chat_id)}
+    chat_update = {"$set": {"feedback": feedback_data}}
+    if mongo.db.chats.update_one(chat_filter, chat_update).matched_count:
+        return True
+    
+    # The chat may still be in the write-behind queue: give it a moment to land
+    flush_write_behind(current_app.config.get('WRITE_BEHIND_BLOCK_TIMEOUT', 1.0))
+    if mongo.db.chats.update_one(chat_filter, chat_update).matched_count:
+        return True
+    
+    # Still queued: apply_pending_feedback attaches it when the insert lands.
+    # Retry once more in case it landed between the update and this upsert.
+    mongo.db.pending_feedback.replace_one(
+        chat_filter,
+        {"feedback": feedback_data, "created_at": datetime.now(timezone.utc)},
+        upsert=True
     )
+    if mongo.db.chats.update_one(chat_filter, chat_update).matched_count:
+        mongo.db.pending_feedback.delete_one(chat_filter)
     
     return True
 
+@after_insert('chats')
+def apply_pending_feedback(chats):
+    """Attach feedback given before its chat's queued insert landed."""
+    chat_ids = [chat['_id'] for chat in chats]
+    for pending in mongo.db.pending_feedback.find({"_id": {"$in": chat_ids}}):
+        mongo.db.chats.update_one({"_id": pending['_id']}, {"$set": {"feedback": pending['feedback']}})
+        mongo.db.pending_feedback.delete_one({"_id": pending['_id']})
+
 def archive_chats(user_id):
     """Archive all chats for a user."""
+    # Chats still in the write-behind queue would otherwise land unarchived
+    if not flush_write_behind(current_app.config.get('WRITE_BEHIND_BLOCK_TIMEOUT', 1.0)):
+        current_app.logger.warning(f"Archiving chats for {user_id} before the write-behind queue drained")
     result = mongo.db.chats.update_many(
         {"user_id": user_id, "archived": {"$ne": True}},
         {"$set": {"archived": True, "archived_at": datetime.now(timezone.utc)}}
     )
+    forget_user_context(user_id)
+    invalidate_dashboard(user_id, 'chats')
     return result.modified_count
 
 def get_chat_analytics(user_id, days=30):
@@ -266,4 +316,14 @@ def update_existing_chats_with_costs():
         
     except Exception as e:
         current_app.logger.error(f"Error updating existing chats with costs: {e}")
-        return 0
\ No newline at end of file
+        return 0
+
+
+def ensure_cost_tracking_indexes():
+    """
+    Create the indexes used by the budget dashboard and backfill the usage
+    rollups on first start after upgrading.
+    """
+    # chats (timestamp, user_id) lives in the index registry with the others
+    ensure_rollup_indexes()
+    backfill_usage_rollups_if_empty()
@@ -0,0 +1,220 @@
+"""
+Per-user conversation context cache.
+
+Holds the last CHAT_CONTEXT_MAX_TURNS (message, response) turns per user so
+a chat turn doesn't run a sorted find_one on chats for context and again in
+create_chat. On a miss the turns are loaded with one query and cached;
+create_chat appends the new turn and archive_chats invalidates.
+
+The cache lives in Redis lists, so every worker sees the same history
+and archive_chats clears it everywhere, when CHAT_CONTEXT_REDIS_URL is set
+or the Socket.IO message queue is Redis (as for presence). Otherwise it is
+an in-process LRU bounded to CHAT_CONTEXT_MAX_USERS users, which is only
+used for a single process: with a non-Redis message queue (several
+workers) there is no cache and turns are read from MongoDB. Redis errors
+are logged; a failed read is a miss and a failed write is skipped.
+"""
+import json
+import threading
+from collections import OrderedDict
+from flask import current_app
+from wellbeing import mongo, logger
+from wellbeing.utils.socketio_queue import message_queue_url, runs_multiple_workers
+
+# Optional shared backend
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+REDIS_KEY_PREFIX = 'wellbeing:chat_context:'
+
+
+class ConversationContextCache:
+    """Last N chat turns per user, in memory or in Redis."""
+
+    def __init__(self, max_users=1000, max_turns=5, redis_client=None, ttl_seconds=86400):
+        self.max_users = max_users
+        self.max_turns = max_turns
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self._turns = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _key(self, user_id):
+        return f"{REDIS_KEY_PREFIX}{user_id}"
+
+    def get(self, user_id):
+        """Cached turns (oldest first), or None on a miss."""
+        key = str(user_id)
+        if self.redis is not None:
+            try:
+                raw = self.redis.lrange(self._key(key), 0, -1)
+                turns = [turn for turn in map(json.loads, raw) if turn] if raw else None
+            except Exception as e:
+                # Treated as a miss; the caller loads turns from MongoDB
+                logger.error(f"Error reading chat context for {key}: {e}")
+                turns = None
+        else:
+            with self._lock:
+                turns = self._turns.get(key)
+                if turns is not None:
+                    self._turns.move_to_end(key)
+                    turns = list(turns)
+
+        with self._lock:
+            self.stats['hits' if turns is not None else 'misses'] += 1
+        return turns
+
+    def set(self, user_id, turns):
+        """Store a user's full recent history (after a database load)."""
+        key = str(user_id)
+        turns = list(turns)[-self.max_turns:]
+        if self.redis is not None:
+            # A leading null marks the history as known even when it is empty,
+            # so rpushx in append() works for a user's first turn
+            try:
+                pipe = self.redis.pipeline()
+                pipe.delete(self._key(key))
+                pipe.rpush(self._key(key), 'null', *[json.dumps(turn) for turn in turns])
+                pipe.expire(self._key(key), self.ttl_seconds)
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"Error caching chat context for {key}: {e}")
+            return
+
+        with self._lock:
+            self._turns[key] = turns
+            self._turns.move_to_end(key)
+            while len(self._turns) > self.max_users:
+                self._turns.popitem(last=False)
+
+    def append(self, user_id, turn):
+        """
+        Add a new turn for a user whose history is already cached.
+
+        Users not in the cache are left alone; their next read loads the
+        full history (including this turn) from the database.
+        """
+        key = str(user_id)
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.rpushx(self._key(key), json.dumps(turn))
+                pipe.ltrim(self._key(key), -self.max_turns, -1)
+                pipe.expire(self._key(key), self.ttl_seconds)
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"Error appending chat context for {key}: {e}")
+            return
+
+        with self._lock:
+            turns = self._turns.get(key)
+            if turns is None:
+                return
+            turns.append(turn)
+            del turns[:-self.max_turns]
+            self._turns.move_to_end(key)
+
+    def invalidate(self, user_id):
+        key = str(user_id)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._key(key))
+            except Exception as e:
+                logger.error(f"Error invalidating chat context for {key}: {e}")
+        with self._lock:
+            self._turns.pop(key, None)
+            self.stats['invalidations'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'hits': self.stats['hits'],
+                'misses': self.stats['misses'],
+                'invalidations': self.stats['invalidations'],
+                'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0.0,
+                'cached_users': len(self._turns),
+                'backend': 'redis' if self.redis is not None else 'memory'
+            }
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache():
+    """
+    Get the process-wide context cache, or None if disabled in config or
+    if it could only be per-process while several workers are running.
+    """
+    global _context_cache
+    if not current_app.config.get('CHAT_CONTEXT_CACHE_ENABLED', True):
+        return None
+    if _context_cache is None:
+        with _context_cache_lock:
+            if _context_cache is None:
+                config = current_app.config
+                redis_client = None
+                redis_url = config.get('CHAT_CONTEXT_REDIS_URL') or message_queue_url(config)
+                if redis_url and REDIS_AVAILABLE:
+                    redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
+                if redis_client is None and runs_multiple_workers(config):
+                    # One worker's archive_chats could not clear the others' copies
+                    logger.warning("Chat context cache disabled: several workers and no Redis to share it")
+                    _context_cache = False
+                else:
+                    _context_cache = ConversationContextCache(
+                        max_users=config.get('CHAT_CONTEXT_MAX_USERS', 1000),
+                        max_turns=config.get('CHAT_CONTEXT_MAX_TURNS', 5),
+                        redis_client=redis_client
+                    )
+    return _context_cache or None
+
+
+def load_recent_turns(user_id, limit):
+    """Last `limit` non-archived turns for a user from the database, oldest first."""
+    chats = mongo.db.chats.find(
+        {"user_id": user_id, "archived": {"$ne": True}},
+        {"message": 1, "response": 1, "_id": 0},
+        sort=[("timestamp", -1)],
+        limit=limit
+    )
+    turns = [{"message": chat.get("message", ""), "response": chat.get("response", "")} for chat in chats]
+    turns.reverse()
+    return turns
+
+
+def get_recent_turns(user_id, limit=None):
+    """
+    Recent (message, response) turns for a user, oldest first.
+
+    Served from the context cache; a miss costs one query that also fills
+    the cache.
+    """
+    cache = get_context_cache()
+    if cache is None:
+        return load_recent_turns(user_id, limit or 1)
+
+    turns = cache.get(user_id)
+    if turns is None:
+        turns = load_recent_turns(user_id, cache.max_turns)
+        cache.set(user_id, turns)
+    return turns[-limit:] if limit else turns
+
+
+def remember_turn(user_id, message, response):
+    """Append a just-saved turn to the cached history."""
+    cache = get_context_cache()
+    if cache is not None:
+        cache.append(user_id, {"message": message, "response": response})
+
+
+def forget_user_context(user_id):
+    """Drop a user's cached history (after archiving or deleting chats)."""
+    cache = get_context_cache()
+    if cache is not None:
+        cache.invalidate(user_id)
@@ -2,6 +2,7 @@ from datetime import datetime, timezone, time, date, timedelta
 from bson.objectid import ObjectId
 from flask import current_app
 from wellbeing import mongo
+from wellbeing.services.dashboard_service import invalidate_dashboard
 
 def track_mood(user_id, mood, context=None):
     """Track or update a user's mood for today."""
@@ -31,11 +32,13 @@ def track_mood(user_id, mood, context=None):
             {'_id': existing_mood['_id']},
             {'$set': mood_data}
         )
+        invalidate_dashboard(user_id, 'moods')
         return "updated"
     else:
         # Create new mood entry
         mood_data['user_id'] = user_id
         mongo.db.moods.insert_one(mood_data)
+        invalidate_dashboard(user_id, 'moods')
         return "created"
 
 def get_mood_history(user_id, limit=30):
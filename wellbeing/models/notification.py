@@ -0,0 +1,223 @@
+"""
+Notifications with maintained per-user counters.
+
+Every notification insert and mark-as-read also updates one
+notification_counters document per user ({_id: user_id, unread, total}),
+so polling endpoints read two integers instead of running count_documents
+over the user's whole notification history. Each change is pushed to the
+user's Socket.IO room as a 'notification_counts' event, so connected
+clients do not need to poll at all.
+
+Counters are seeded from count_documents the first time a user's counts
+are read, and are approximate: a notification inserted or read while its
+user's counters are being seeded, or recounted, can be missed or counted
+twice. rebuild_notification_counters() recounts every seeded counter on
+the app scheduler every NOTIFICATION_COUNTER_REBUILD_MINUTES and repairs
+the ones that drifted.
+"""
+import threading
+from datetime import datetime, timezone
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo import ReturnDocument, UpdateOne
+from wellbeing import mongo, socketio, logger, scheduler
+
+COUNTER_COLLECTION = 'notification_counters'
+COUNTS_EVENT = 'notification_counts'
+REBUILD_JOB_ID = 'notification_counter_rebuild'
+REBUILD_BATCH_SIZE = 1000
+
+
+def user_room(user_id):
+    """Socket.IO room every connection of a user joins."""
+    return f"user_{user_id}"
+
+
+def _emit_counts(user_id, counts):
+    try:
+        socketio.emit(COUNTS_EVENT, {
+            'unread_count': counts.get('unread', 0),
+            'total_count': counts.get('total', 0)
+        }, room=user_room(user_id))
+    except Exception as e:
+        logger.error(f"Error pushing notification counts: {e}")
+
+
+def _increment(user_id, unread, total):
+    """Apply a counter change and push the new counts (no-op until seeded)."""
+    counts = mongo.db[COUNTER_COLLECTION].find_one_and_update(
+        {'_id': ObjectId(user_id)},
+        {'$inc': {'unread': unread, 'total': total}},
+        return_document=ReturnDocument.AFTER
+    )
+    if counts is not None:
+        _emit_counts(user_id, counts)
+
+
+def create_notification(notification):
+    """
+    Insert one notification and bump the recipient's counters.
+
+    Returns:
+        ObjectId: The inserted notification's _id
+    """
+    notification.setdefault('read', False)
+    notification.setdefault('created_at', datetime.now(timezone.utc))
+    result = mongo.db.notifications.insert_one(notification)
+    _increment(notification['user_id'], 0 if notification['read'] else 1, 1)
+    return result.inserted_id
+
+
+def create_notifications(notifications):
+    """Insert several notifications (insert_many) and bump each recipient once."""
+    if not notifications:
+        return []
+    changes = {}
+    for notification in notifications:
+        notification.setdefault('read', False)
+        notification.setdefault('created_at', datetime.now(timezone.utc))
+        unread, total = changes.get(str(notification['user_id']), (0, 0))
+        changes[str(notification['user_id'])] = (unread + (0 if notification['read'] else 1), total + 1)
+
+    result = mongo.db.notifications.insert_many(notifications)
+    for user_id, (unread, total) in changes.items():
+        _increment(user_id, unread, total)
+    return result.inserted_ids
+
+
+def mark_notification_read(notification_id, user_id):
+    """
+    Mark one of a user's notifications read.
+
+    Returns:
+        bool: False if the notification doesn't exist or was already read
+    """
+    result = mongo.db.notifications.update_one(
+        {'_id': ObjectId(notification_id), 'user_id': ObjectId(user_id), 'read': {'$ne': True}},
+        {'$set': {'read': True, 'read_at': datetime.now(timezone.utc)}}
+    )
+    if result.modified_count == 0:
+        return False
+    _increment(user_id, -1, 0)
+    return True
+
+
+def get_notification_counts(user_id):
+    """
+    Unread and total notification counts for a user.
+
+    Returns:
+        dict: {'unread': int, 'total': int}
+    """
+    counts = mongo.db[COUNTER_COLLECTION].find_one({'_id': ObjectId(user_id)})
+    if counts is None:
+        counts = _seed_counters(user_id)
+    return {'unread': max(counts.get('unread', 0), 0), 'total': counts.get('total', 0)}
+
+
+def _seed_counters(user_id):
+    """Count a user's notifications once and store the counters."""
+    user_id = ObjectId(user_id)
+    counts = {
+        'unread': mongo.db.notifications.count_documents({'user_id': user_id, 'read': False}),
+        'total': mongo.db.notifications.count_documents({'user_id': user_id})
+    }
+    # $setOnInsert: never overwrite counters another worker seeded first
+    seeded = mongo.db[COUNTER_COLLECTION].find_one_and_update(
+        {'_id': user_id},
+        {'$setOnInsert': dict(counts, seeded_at=datetime.now(timezone.utc))},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return seeded or counts
+
+
+def _recount(user_ids):
+    """{user_id: {'unread', 'total'}} from the notifications of these users."""
+    pipeline = [
+        {'$match': {'user_id': {'$in': user_ids}}},
+        {'$group': {
+            '_id': '$user_id',
+            'total': {'$sum': 1},
+            'unread': {'$sum': {'$cond': [{'$eq': ['$read', False]}, 1, 0]}}
+        }}
+    ]
+    return {doc['_id']: doc for doc in mongo.db.notifications.aggregate(pipeline)}
+
+
+def rebuild_notification_counters(user_id=None):
+    """
+    Recount seeded counters from the notifications collection and repair
+    the ones that drifted.
+
+    Counters are read and recounted REBUILD_BATCH_SIZE users at a time.
+    A repair only applies if the counter still holds the values read
+    before the recount, so it never overwrites a change made meanwhile;
+    that counter is checked again on the next run. Unseeded users are
+    left alone (they are counted on their first read).
+
+    Args:
+        user_id: Rebuild one user, or every seeded counter if None
+
+    Returns:
+        int: Number of counters repaired
+    """
+    counters = mongo.db[COUNTER_COLLECTION]
+    query = {'_id': ObjectId(user_id)} if user_id else {}
+    cursor = counters.find(query, {'unread': 1, 'total': 1}).batch_size(REBUILD_BATCH_SIZE)
+
+    repaired = 0
+    batch = []
+    for counter in cursor:
+        batch.append(counter)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            repaired += _repair_counters(batch)
+            batch = []
+    if batch:
+        repaired += _repair_counters(batch)
+    logger.info(f"Repaired {repaired} notification counter documents")
+    return repaired
+
+
+def _repair_counters(observed):
+    actual = _recount([counter['_id'] for counter in observed])
+    operations = []
+    for counter in observed:
+        counts = actual.get(counter['_id'], {'unread': 0, 'total': 0})
+        if counter.get('unread') == counts['unread'] and counter.get('total') == counts['total']:
+            continue
+        operations.append(UpdateOne(
+            {'_id': counter['_id'], 'unread': counter.get('unread'), 'total': counter.get('total')},
+            {'$set': {'unread': counts['unread'], 'total': counts['total'],
+                      'rebuilt_at': datetime.now(timezone.utc)}}
+        ))
+    if not operations:
+        return 0
+    return mongo.db[COUNTER_COLLECTION].bulk_write(operations, ordered=False).modified_count
+
+
+def _rebuild_in_app(app):
+    with app.app_context():
+        try:
+            rebuild_notification_counters()
+        except Exception as e:
+            logger.error(f"Error rebuilding notification counters: {e}")
+
+
+_rebuild_lock = threading.Lock()
+
+
+def schedule_notification_counter_rebuild(app=None):
+    """Rebuild counters every NOTIFICATION_COUNTER_REBUILD_MINUTES on the app scheduler (0 disables it)."""
+    app = app or current_app._get_current_object()
+    minutes = app.config.get('NOTIFICATION_COUNTER_REBUILD_MINUTES', 60)
+    if not minutes:
+        return
+    with _rebuild_lock:
+        scheduler.add_job(
+            _rebuild_in_app, 'interval', args=[app], minutes=minutes,
+            id=REBUILD_JOB_ID, replace_existing=True,
+            coalesce=True, max_instances=1
+        )
+        if not scheduler.running:
+            scheduler.start()
@@ -3,6 +3,7 @@ from bson.objectid import ObjectId
 from werkzeug.security import generate_password_hash
 from flask import current_app
 from wellbeing import mongo
+from wellbeing.services.therapist_matching import invalidate_matching_index
 
 def find_therapist_by_id(therapist_id):
     try:
@@ -32,6 +33,7 @@ def create_therapist(first_name, last_name, email, password):
         }
     }
     result = mongo.db.therapists.insert_one(new_therapist)
+    invalidate_matching_index()
     return result.inserted_id
 
 def update_therapist_settings(therapist_id, settings):
@@ -45,6 +47,7 @@ def update_therapist_status(therapist_id, status):
         {'_id': ObjectId(therapist_id)},
         {'$set': {'status': status}}
     )
+    invalidate_matching_index()
 
 def get_all_therapists(query=None, skip=0, limit=0):
     if query is None:
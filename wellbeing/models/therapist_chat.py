@@ -0,0 +1,280 @@
+"""
+Student-therapist conversation helpers.
+
+- Unread counts: a therapist's caseload is counted with one $group over
+  therapist_chats instead of a count_documents per student. The
+  (therapist_id, sender, read, student_id) index in
+  wellbeing/utils/index_registry.py covers the whole pipeline.
+- History: keyset pagination on (timestamp, _id) with opaque cursor
+  tokens, so a page costs the same however deep into a conversation it is.
+- Totals: a therapist_chat_counters document per conversation, bumped by
+  insert_therapist_chat(), replaces count_documents on every page fetch.
+  The counter is seeded from count_documents on first read and is
+  approximate (a message inserted while it is seeded or recounted can be
+  missed or counted twice), like notification counters;
+  rebuild_conversation_counters() repairs drift every
+  CONVERSATION_COUNTER_REBUILD_MINUTES on the app scheduler.
+"""
+import base64
+import json
+import threading
+from datetime import datetime, timezone
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo import DESCENDING, ReturnDocument, UpdateOne
+from wellbeing import mongo, logger, scheduler
+
+COUNTER_COLLECTION = 'therapist_chat_counters'
+REBUILD_JOB_ID = 'conversation_counter_rebuild'
+REBUILD_BATCH_SIZE = 1000
+
+
+def get_unread_counts_for_therapist(therapist_id, student_ids=None, sender='student'):
+    """
+    Unread messages per student for one therapist, in a single aggregation.
+
+    Args:
+        therapist_id: Therapist ObjectId or string
+        student_ids: Optional iterable restricting the students counted
+        sender: Whose messages count as unread ('student' for the
+            therapist's inbox, 'therapist' for what students haven't read)
+
+    Returns:
+        dict: {student_id (str): unread count}; students with no unread
+        messages are absent
+    """
+    match = {
+        'therapist_id': ObjectId(therapist_id),
+        'sender': sender,
+        'read': False
+    }
+    if student_ids is not None:
+        match['student_id'] = {'$in': [ObjectId(student_id) for student_id in student_ids]}
+
+    pipeline = [
+        {'$match': match},
+        {'$group': {'_id': '$student_id', 'count': {'$sum': 1}}}
+    ]
+    return {str(doc['_id']): doc['count'] for doc in mongo.db.therapist_chats.aggregate(pipeline)}
+
+
+# ===== MESSAGES AND COUNTERS =====
+
+def conversation_key(student_id, therapist_id):
+    return f"{student_id}:{therapist_id}"
+
+
+def insert_therapist_chat(message):
+    """
+    Insert a conversation message and bump the conversation's total.
+
+    Returns:
+        ObjectId: The inserted message's _id
+    """
+    result = mongo.db.therapist_chats.insert_one(message)
+    # No upsert: an unseeded conversation is counted on its first read
+    mongo.db[COUNTER_COLLECTION].update_one(
+        {'_id': conversation_key(message['student_id'], message['therapist_id'])},
+        {'$inc': {'total': 1}}
+    )
+    return result.inserted_id
+
+
+def get_conversation_total(student_id, therapist_id):
+    """Total messages in a conversation, from the maintained counter."""
+    key = conversation_key(student_id, therapist_id)
+    counter = mongo.db[COUNTER_COLLECTION].find_one({'_id': key})
+    if counter is not None:
+        return counter.get('total', 0)
+
+    total = mongo.db.therapist_chats.count_documents({
+        'student_id': ObjectId(student_id),
+        'therapist_id': ObjectId(therapist_id)
+    })
+    # $setOnInsert: never overwrite a counter another worker seeded first
+    seeded = mongo.db[COUNTER_COLLECTION].find_one_and_update(
+        {'_id': key},
+        {'$setOnInsert': {
+            'student_id': ObjectId(student_id),
+            'therapist_id': ObjectId(therapist_id),
+            'total': total,
+            'seeded_at': datetime.now(timezone.utc)
+        }},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return seeded['total'] if seeded is not None else total
+
+
+def rebuild_conversation_counters():
+    """
+    Recount seeded conversation counters and repair the ones that drifted.
+
+    Works REBUILD_BATCH_SIZE counters at a time; a repair only applies if
+    the counter still holds the total read before the recount, so a bump
+    made meanwhile is never overwritten.
+
+    Returns:
+        int: Number of counters repaired
+    """
+    cursor = mongo.db[COUNTER_COLLECTION].find(
+        {}, {'student_id': 1, 'therapist_id': 1, 'total': 1}
+    ).batch_size(REBUILD_BATCH_SIZE)
+
+    repaired = 0
+    batch = []
+    for counter in cursor:
+        batch.append(counter)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            repaired += _repair_counters(batch)
+            batch = []
+    if batch:
+        repaired += _repair_counters(batch)
+    logger.info(f"Repaired {repaired} conversation counter documents")
+    return repaired
+
+
+def _repair_counters(observed):
+    pipeline = [
+        {'$match': {'$or': [
+            {'student_id': counter['student_id'], 'therapist_id': counter['therapist_id']}
+            for counter in observed
+        ]}},
+        {'$group': {
+            '_id': {'student_id': '$student_id', 'therapist_id': '$therapist_id'},
+            'total': {'$sum': 1}
+        }}
+    ]
+    actual = {
+        conversation_key(doc['_id']['student_id'], doc['_id']['therapist_id']): doc['total']
+        for doc in mongo.db.therapist_chats.aggregate(pipeline)
+    }
+
+    operations = []
+    for counter in observed:
+        total = actual.get(counter['_id'], 0)
+        if counter.get('total') == total:
+            continue
+        operations.append(UpdateOne(
+            {'_id': counter['_id'], 'total': counter.get('total')},
+            {'$set': {'total': total, 'rebuilt_at': datetime.now(timezone.utc)}}
+        ))
+    if not operations:
+        return 0
+    return mongo.db[COUNTER_COLLECTION].bulk_write(operations, ordered=False).modified_count
+
+
+def _rebuild_in_app(app):
+    with app.app_context():
+        try:
+            rebuild_conversation_counters()
+        except Exception as e:
+            logger.error(f"Error rebuilding conversation counters: {e}")
+
+
+_rebuild_lock = threading.Lock()
+
+
+def schedule_conversation_counter_rebuild(app=None):
+    """Rebuild counters every CONVERSATION_COUNTER_REBUILD_MINUTES on the app scheduler (0 disables it)."""
+    app = app or current_app._get_current_object()
+    minutes = app.config.get('CONVERSATION_COUNTER_REBUILD_MINUTES', 60)
+    if not minutes:
+        return
+    with _rebuild_lock:
+        scheduler.add_job(
+            _rebuild_in_app, 'interval', args=[app], minutes=minutes,
+            id=REBUILD_JOB_ID, replace_existing=True,
+            coalesce=True, max_instances=1
+        )
+        if not scheduler.running:
+            scheduler.start()
+
+
+def forget_conversation_counters(student_id=None, therapist_id=None):
+    """Drop counters after a user's conversations are deleted."""
+    query = {}
+    if student_id is not None:
+        query['student_id'] = ObjectId(student_id)
+    if therapist_id is not None:
+        query['therapist_id'] = ObjectId(therapist_id)
+    if query:
+        mongo.db[COUNTER_COLLECTION].delete_many(query)
+
+
+def mark_conversation_read(student_id, therapist_id, reader_role):
+    """
+    Mark the other party's unread messages as read.
+
+    Idempotent: only documents still unread are touched, so repeating the
+    call is a no-op.
+
+    Returns:
+        int: Number of messages marked read
+    """
+    sender = 'therapist' if reader_role == 'student' else 'student'
+    result = mongo.db.therapist_chats.update_many(
+        {
+            'student_id': ObjectId(student_id),
+            'therapist_id': ObjectId(therapist_id),
+            'sender': sender,
+            'read': False
+        },
+        {'$set': {'read': True, 'read_at': datetime.now(timezone.utc)}}
+    )
+    return result.modified_count
+
+
+# ===== CURSOR PAGINATION =====
+
+def encode_cursor(message):
+    """Opaque token for the position just after (older than) a message."""
+    raw = json.dumps({'t': message['timestamp'].isoformat(), 'id': str(message['_id'])})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Parse a cursor token.
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(data['t']), ObjectId(data['id'])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def get_conversation_page(student_id, therapist_id, limit=50, cursor=None):
+    """
+    One page of a conversation, newest first, by keyset on (timestamp, _id).
+
+    Args:
+        cursor: Token from a previous page's next_cursor, or None for the
+            newest messages
+
+    Returns:
+        tuple: (messages newest first, next_cursor or None)
+    """
+    query = {
+        'student_id': ObjectId(student_id),
+        'therapist_id': ObjectId(therapist_id)
+    }
+    if cursor:
+        timestamp, message_id = decode_cursor(cursor)
+        query['$or'] = [
+            {'timestamp': {'$lt': timestamp}},
+            {'timestamp': timestamp, '_id': {'$lt': message_id}}
+        ]
+
+    # One extra document tells us whether another page exists
+    messages = list(mongo.db.therapist_chats.find(query)
+                    .sort([('timestamp', DESCENDING), ('_id', DESCENDING)])
+                    .limit(limit + 1))
+    if len(messages) > limit:
+        messages = messages[:limit]
+        return messages, encode_cursor(messages[-1])
+    return messages, None
@@ -0,0 +1,322 @@
+"""
+Pre-aggregated chat usage rollups for the budget dashboard.
+
+create_chat() bumps two small collections with $inc upserts:
+
+- chat_usage_daily: one document per UTC day
+- chat_usage_user_daily: one document per (UTC day, user)
+
+Budget reports read these instead of aggregating the raw chats collection,
+so their cost depends on the number of days (and active users per day) in
+the window rather than on the total chat history.
+"""
+from datetime import datetime, timezone, timedelta
+from flask import current_app
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from wellbeing import mongo
+
+DAILY_COLLECTION = 'chat_usage_daily'
+USER_DAILY_COLLECTION = 'chat_usage_user_daily'
+
+# Same rough per-token fallback the budget reports use for chats saved
+# before estimated_cost was recorded
+FALLBACK_COST_PER_TOKEN = 0.000005
+
+# Lock document claimed by the one worker that runs the first-start backfill
+LOCK_COLLECTION = 'maintenance_locks'
+BACKFILL_LOCK_ID = 'usage_rollup_backfill'
+BULK_BATCH_SIZE = 1000
+
+COUNTER_FIELDS = ('message_count', 'total_cost', 'total_tokens',
+                  'input_tokens', 'output_tokens', 'confidence_sum')
+
+
+def day_key(timestamp):
+    """UTC calendar day for a timestamp, as 'YYYY-MM-DD'."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.strftime('%Y-%m-%d')
+
+
+def day_start(key):
+    """Naive UTC midnight for a 'YYYY-MM-DD' day key."""
+    return datetime.strptime(key, '%Y-%m-%d')
+
+
+def window_start(days, now=None):
+    """First day included in a window of `days` calendar days ending today."""
+    now = now or datetime.now(timezone.utc)
+    return day_start(day_key(now)) - timedelta(days=max(int(days), 1) - 1)
+
+
+def _counters(tokens_used, estimated_cost, input_tokens, output_tokens, confidence):
+    if estimated_cost is None:
+        estimated_cost = (tokens_used or 0) * FALLBACK_COST_PER_TOKEN
+    return {
+        'message_count': 1,
+        'total_cost': float(estimated_cost),
+        'total_tokens': int(tokens_used or 0),
+        'input_tokens': int(input_tokens or 0),
+        'output_tokens': int(output_tokens or 0),
+        'confidence_sum': float(confidence or 0)
+    }
+
+
+def record_chat_usage(user_id, timestamp, tokens_used=0, estimated_cost=0.0,
+                      input_tokens=0, output_tokens=0, confidence=0.0):
+    """
+    Add one chat message to the daily and per-user daily rollups.
+
+    The per-user document is upserted first; when that creates a new
+    document the user is new for the day, so the daily unique_users
+    counter is bumped in the same $inc.
+    """
+    key = day_key(timestamp)
+    counters = _counters(tokens_used, estimated_cost, input_tokens, output_tokens, confidence)
+
+    user_result = mongo.db[USER_DAILY_COLLECTION].update_one(
+        {'_id': f"{key}:{user_id}"},
+        {
+            '$inc': counters,
+            '$min': {'first_activity': timestamp},
+            '$max': {'last_activity': timestamp},
+            '$setOnInsert': {'day': key, 'date': day_start(key), 'user_id': user_id}
+        },
+        upsert=True
+    )
+
+    daily_inc = dict(counters)
+    daily_inc['unique_users'] = 1 if user_result.upserted_id is not None else 0
+    mongo.db[DAILY_COLLECTION].update_one(
+        {'_id': key},
+        {
+            '$inc': daily_inc,
+            '$set': {'updated_at': datetime.now(timezone.utc)},
+            '$setOnInsert': {'day': key, 'date': day_start(key)}
+        },
+        upsert=True
+    )
+
+
+def ensure_rollup_indexes():
+    """Indexes for range scans over the rollup collections."""
+    mongo.db[DAILY_COLLECTION].create_index('date')
+    mongo.db[USER_DAILY_COLLECTION].create_index([('date', 1), ('user_id', 1)])
+    mongo.db[USER_DAILY_COLLECTION].create_index([('user_id', 1), ('date', 1)])
+
+
+def backfill_usage_rollups(since=None):
+    """
+    One-shot rebuild of the rollups from the raw chats collection.
+
+    Args:
+        since (datetime): Only rebuild days from this UTC day onwards
+            (default: the whole history)
+
+    Returns:
+        dict: Number of daily and per-user daily documents written
+
+    Counters are written with $set, so re-running is idempotent. Chats
+    saved while a rebuild of the same day is running may be counted twice
+    or not at all; run it during a quiet period.
+    """
+    match = {}
+    if since is not None:
+        match['timestamp'] = {'$gte': day_start(day_key(since))}
+
+    cost = {
+        '$cond': {
+            'if': {'$ne': [{'$ifNull': ['$estimated_cost', None]}, None]},
+            'then': '$estimated_cost',
+            'else': {'$multiply': [{'$ifNull': ['$tokens_used', 0]}, FALLBACK_COST_PER_TOKEN]}
+        }
+    }
+    pipeline = [
+        {'$match': match},
+        {
+            '$group': {
+                '_id': {
+                    'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamp'}},
+                    'user_id': '$user_id'
+                },
+                'message_count': {'$sum': 1},
+                'total_cost': {'$sum': cost},
+                'total_tokens': {'$sum': {'$ifNull': ['$tokens_used', 0]}},
+                'input_tokens': {'$sum': {'$ifNull': ['$input_tokens', 0]}},
+                'output_tokens': {'$sum': {'$ifNull': ['$output_tokens', 0]}},
+                'confidence_sum': {'$sum': {'$ifNull': ['$confidence', 0]}},
+                'first_activity': {'$min': '$timestamp'},
+                'last_activity': {'$max': '$timestamp'}
+            }
+        }
+    ]
+
+    # Per-user rows are written in batches as the aggregation streams;
+    # only the per-day totals (one entry per day) are held in memory
+    user_ops = []
+    user_days = 0
+    daily = {}
+    for row in mongo.db.chats.aggregate(pipeline, allowDiskUse=True):
+        key = row['_id']['day']
+        user_id = row['_id']['user_id']
+        counters = {field: row.get(field, 0) for field in COUNTER_FIELDS}
+        user_ops.append(UpdateOne(
+            {'_id': f"{key}:{user_id}"},
+            {'$set': dict(counters, day=key, date=day_start(key), user_id=user_id,
+                          first_activity=row.get('first_activity'),
+                          last_activity=row.get('last_activity'))},
+            upsert=True
+        ))
+        user_days += 1
+        if len(user_ops) >= BULK_BATCH_SIZE:
+            mongo.db[USER_DAILY_COLLECTION].bulk_write(user_ops, ordered=False)
+            user_ops = []
+
+        totals = daily.setdefault(key, dict.fromkeys(COUNTER_FIELDS, 0))
+        for field in COUNTER_FIELDS:
+            totals[field] += counters[field]
+        totals['unique_users'] = totals.get('unique_users', 0) + 1
+
+    now = datetime.now(timezone.utc)
+    daily_ops = [
+        UpdateOne(
+            {'_id': key},
+            {'$set': dict(totals, day=key, date=day_start(key), updated_at=now)},
+            upsert=True
+        )
+        for key, totals in daily.items()
+    ]
+
+    if user_ops:
+        mongo.db[USER_DAILY_COLLECTION].bulk_write(user_ops, ordered=False)
+    for i in range(0, len(daily_ops), BULK_BATCH_SIZE):
+        mongo.db[DAILY_COLLECTION].bulk_write(daily_ops[i:i + BULK_BATCH_SIZE], ordered=False)
+
+    current_app.logger.info(
+        f"Usage rollups rebuilt: {len(daily_ops)} days, {user_days} user-days"
+    )
+    return {'days': len(daily_ops), 'user_days': user_days}
+
+
+def backfill_usage_rollups_if_empty():
+    """
+    Run the one-shot backfill when chats exist but no rollups do yet.
+
+    Every worker calls this on start; a lock document in maintenance_locks
+    lets only the first one run it, ever. A failed backfill releases the
+    lock so the next start retries; later rebuilds go through the admin
+    rollup rebuild endpoint.
+    """
+    if mongo.db[DAILY_COLLECTION].find_one({}, {'_id': 1}) is not None:
+        return None
+    if mongo.db.chats.find_one({}, {'_id': 1}) is None:
+        return None
+
+    locks = mongo.db[LOCK_COLLECTION]
+    try:
+        locks.insert_one({'_id': BACKFILL_LOCK_ID, 'started_at': datetime.now(timezone.utc)})
+    except DuplicateKeyError:
+        # Another worker is running it, or already has
+        return None
+
+    try:
+        written = backfill_usage_rollups()
+    except Exception:
+        locks.delete_one({'_id': BACKFILL_LOCK_ID})
+        raise
+    locks.update_one({'_id': BACKFILL_LOCK_ID}, {'$set': {'finished_at': datetime.now(timezone.utc)}})
+    return written
+
+
+def get_usage_totals(days):
+    """
+    System totals over the last `days` calendar days (today included).
+
+    Returns:
+        dict: Summed counters plus the number of distinct users
+    """
+    start = window_start(days)
+    pipeline = [
+        {'$match': {'date': {'$gte': start}}},
+        {'$group': dict(
+            {'_id': None},
+            **{field: {'$sum': f'${field}'} for field in COUNTER_FIELDS}
+        )}
+    ]
+    result = list(mongo.db[DAILY_COLLECTION].aggregate(pipeline))
+    totals = result[0] if result else dict.fromkeys(COUNTER_FIELDS, 0)
+    totals.pop('_id', None)
+
+    # $group/$count rather than distinct(), whose result must fit in one 16MB document
+    counted = list(mongo.db[USER_DAILY_COLLECTION].aggregate([
+        {'$match': {'date': {'$gte': start}}},
+        {'$group': {'_id': '$user_id'}},
+        {'$count': 'users'}
+    ], allowDiskUse=True))
+    totals['unique_users'] = counted[0]['users'] if counted else 0
+    return totals
+
+
+def get_user_usage(days, sort_field='total_cost', limit=50):
+    """
+    Per-user totals over the last `days` calendar days.
+
+    Returns:
+        list: One dict per user, sorted descending by sort_field
+    """
+    return list(iter_user_usage(days, sort_field, limit))
+
+
+def iter_user_usage(days, sort_field='total_cost', limit=None):
+    """get_user_usage() as a cursor (every user when limit is None), for streamed exports."""
+    pipeline = [
+        {'$match': {'date': {'$gte': window_start(days)}}},
+        {'$group': dict(
+            {'_id': '$user_id',
+             'first_activity': {'$min': '$first_activity'},
+             'last_activity': {'$max': '$last_activity'}},
+            **{field: {'$sum': f'${field}'} for field in COUNTER_FIELDS}
+        )},
+        {'$addFields': {
+            'avg_cost_per_message': {
+                '$cond': {
+                    'if': {'$gt': ['$message_count', 0]},
+                    'then': {'$divide': ['$total_cost', '$message_count']},
+                    'else': 0
+                }
+            }
+        }},
+        {'$sort': {sort_field: -1}}
+    ]
+    if limit:
+        pipeline.append({'$limit': limit})
+    return mongo.db[USER_DAILY_COLLECTION].aggregate(pipeline, allowDiskUse=True)
+
+
+def get_daily_usage(days):
+    """Daily rollup documents for the last `days` calendar days, oldest first."""
+    return list(mongo.db[DAILY_COLLECTION].find(
+        {'date': {'$gte': window_start(days)}}
+    ).sort('date', 1))
+
+
+def get_bucket_unique_users(days, bucket_format):
+    """
+    Distinct users per period bucket (e.g. '%Y-W%U' or '%Y-%m').
+
+    Reads per-user daily documents, so cost is bounded by active
+    user-days in the window rather than messages.
+    """
+    pipeline = [
+        {'$match': {'date': {'$gte': window_start(days)}}},
+        {'$group': {
+            '_id': {
+                'bucket': {'$dateToString': {'format': bucket_format, 'date': '$date'}},
+                'user_id': '$user_id'
+            }
+        }},
+        {'$group': {'_id': '$_id.bucket', 'unique_users': {'$sum': 1}}}
+    ]
+    return {row['_id']: row['unique_users']
+            for row in mongo.db[USER_DAILY_COLLECTION].aggregate(pipeline)}
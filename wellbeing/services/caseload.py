@@ -0,0 +1,257 @@
+"""
+Therapist caseload counters.
+
+therapists.current_students is the number of active therapist_assignments
+for that therapist, kept in step with every assignment write:
+
+- assign_student() reserves a place with one guarded $inc
+  (current_students < max_students in the same update), so two concurrent
+  assignments cannot both take a therapist's last place, then activates
+  the assignment and releases the student's previous therapist.
+- unassign_student() deactivates assignments and gives the places back.
+
+Capacity checks and dashboards read the counter (get_caseload,
+get_caseloads, has_capacity) instead of running count_documents over
+therapist_assignments.
+
+Every counter write also stamps therapists.caseload_updated_at.
+reconcile_caseloads() recounts active assignments and repairs any
+counter that drifted (writes from outside this module, crashes between
+the two writes), leaving alone therapists whose counter or assignments
+changed in the last CASELOAD_RECONCILE_GRACE_SECONDS: one of their
+assignment writes may still be waiting for its counter write. It runs on
+the app scheduler every CASELOAD_RECONCILE_MINUTES, and once at startup.
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from flask import current_app
+from pymongo import ReturnDocument, UpdateOne
+
+from wellbeing import mongo, logger, scheduler
+from wellbeing.services.therapist_matching import notify_assignment_change
+
+DEFAULT_MAX_STUDENTS = 20
+RECONCILE_JOB_ID = 'caseload_reconciliation'
+
+
+def _capacity_guard(max_students: Optional[int] = None) -> dict:
+    """Filter matching a therapist with a free place (a missing counter counts as 0)."""
+    limit = max_students if max_students is not None else {'$ifNull': ['$max_students', DEFAULT_MAX_STUDENTS]}
+    return {'$expr': {'$lt': [{'$ifNull': ['$current_students', 0]}, limit]}}
+
+
+def reserve_place(therapist_id, max_students: Optional[int] = None, enforce_capacity: bool = True) -> bool:
+    """
+    Take one place in a therapist's caseload.
+
+    Args:
+        max_students: Limit to enforce instead of the therapist's own max_students
+        enforce_capacity: False to count the student even when the therapist is full
+
+    Returns:
+        bool: False if the therapist is full (or does not exist)
+    """
+    query = {'_id': therapist_id}
+    if enforce_capacity:
+        query.update(_capacity_guard(max_students))
+    return mongo.db.therapists.update_one(query, {
+        '$inc': {'current_students': 1},
+        '$set': {'caseload_updated_at': datetime.now()}
+    }).modified_count == 1
+
+
+def release_place(therapist_id):
+    """Give one place back (never below zero)."""
+    mongo.db.therapists.update_one(
+        {'_id': therapist_id, 'current_students': {'$gt': 0}},
+        {'$inc': {'current_students': -1}, '$set': {'caseload_updated_at': datetime.now()}}
+    )
+
+
+def _deactivate(assignment: dict) -> bool:
+    """Deactivate one assignment and release its place, if it was still active."""
+    result = mongo.db.therapist_assignments.update_one(
+        {'_id': assignment['_id'], 'status': 'active'},
+        {'$set': {'status': 'inactive', 'updated_at': datetime.now()}}
+    )
+    if result.modified_count:
+        release_place(assignment['therapist_id'])
+        return True
+    return False
+
+
+def assign_student(student_id, therapist_id, auto_assigned: bool = False,
+                   enforce_capacity: bool = True, max_students: Optional[int] = None) -> bool:
+    """
+    Make therapist_id the student's one active therapist.
+
+    Args:
+        auto_assigned: Recorded on the assignment
+        enforce_capacity: Refuse if the therapist is full; intake and repair
+            paths pass False so a student is never left without a therapist
+        max_students: Capacity to enforce instead of the therapist's max_students
+
+    Returns:
+        bool: False if the therapist is full; nothing is changed then
+    """
+    if mongo.db.therapist_assignments.find_one(
+            {'student_id': student_id, 'therapist_id': therapist_id, 'status': 'active'}, {'_id': 1}):
+        return True
+
+    if not reserve_place(therapist_id, max_students, enforce_capacity):
+        return False
+
+    now = datetime.now()
+    previous = mongo.db.therapist_assignments.find_one_and_update(
+        {'student_id': student_id, 'therapist_id': therapist_id},
+        {
+            '$set': {'status': 'active', 'auto_assigned': auto_assigned, 'updated_at': now},
+            '$setOnInsert': {'created_at': now}
+        },
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous is not None and previous.get('status') == 'active':
+        # A concurrent request activated it first and holds the place
+        release_place(therapist_id)
+
+    released = [therapist_id]
+    for assignment in mongo.db.therapist_assignments.find(
+            {'student_id': student_id, 'status': 'active', 'therapist_id': {'$ne': therapist_id}}):
+        if _deactivate(assignment):
+            released.append(assignment['therapist_id'])
+
+    notify_assignment_change(*released)
+    return True
+
+
+def unassign_student(student_id, therapist_id=None) -> int:
+    """
+    Deactivate a student's active assignments (only the one with
+    therapist_id, if given) and release their places.
+
+    Returns:
+        int: Number of assignments deactivated
+    """
+    query = {'student_id': student_id, 'status': 'active'}
+    if therapist_id is not None:
+        query['therapist_id'] = therapist_id
+
+    released = [assignment['therapist_id']
+                for assignment in mongo.db.therapist_assignments.find(query)
+                if _deactivate(assignment)]
+    if released:
+        notify_assignment_change(*released)
+    return len(released)
+
+
+def caseload_of(therapist: dict) -> int:
+    """Caseload from a therapist document that is already loaded."""
+    return int(therapist.get('current_students') or 0)
+
+
+def get_caseload(therapist_id) -> int:
+    """A therapist's active caseload (one _id lookup)."""
+    therapist = mongo.db.therapists.find_one({'_id': therapist_id}, {'current_students': 1})
+    return caseload_of(therapist) if therapist else 0
+
+
+def get_caseloads(therapist_ids: Iterable) -> Dict[object, int]:
+    """Caseloads for several therapists from one _id $in lookup (0 for unknown ids)."""
+    therapist_ids = list(therapist_ids)
+    caseloads = {therapist_id: 0 for therapist_id in therapist_ids}
+    for therapist in mongo.db.therapists.find({'_id': {'$in': therapist_ids}}, {'current_students': 1}):
+        caseloads[therapist['_id']] = caseload_of(therapist)
+    return caseloads
+
+
+def has_capacity(therapist: dict, max_students: Optional[int] = None) -> bool:
+    """Whether a loaded therapist document has a free place."""
+    limit = max_students if max_students is not None else therapist.get('max_students') or DEFAULT_MAX_STUDENTS
+    return caseload_of(therapist) < limit
+
+
+def reconcile_caseloads(grace_seconds: Optional[float] = None) -> int:
+    """
+    Recount active assignments and repair drifted counters.
+
+    assign_student reserves a place before activating the assignment and
+    _deactivate releases one after deactivating it, so between those two
+    writes the counter and the recount legitimately differ. Therapists
+    whose counter (caseload_updated_at) or assignments (updated_at)
+    changed within grace_seconds are skipped, so an assignment in flight
+    is never rolled back; they are checked again on the next run. Each
+    repair also only applies if the counter still holds the value read
+    before the recount, so it never overwrites a concurrent assignment.
+
+    Args:
+        grace_seconds: Defaults to CASELOAD_RECONCILE_GRACE_SECONDS
+
+    Returns:
+        int: Number of counters repaired
+    """
+    if grace_seconds is None:
+        grace_seconds = current_app.config.get('CASELOAD_RECONCILE_GRACE_SECONDS', 60)
+    cutoff = datetime.now() - timedelta(seconds=grace_seconds)
+
+    counters = {}
+    busy = set()
+    for therapist in mongo.db.therapists.find({}, {'current_students': 1, 'caseload_updated_at': 1}):
+        counters[therapist['_id']] = therapist.get('current_students')
+        updated_at = therapist.get('caseload_updated_at')
+        if updated_at is not None and updated_at >= cutoff:
+            busy.add(therapist['_id'])
+    actual = {
+        row['_id']: row['count']
+        for row in mongo.db.therapist_assignments.aggregate([
+            {'$match': {'status': 'active'}},
+            {'$group': {'_id': '$therapist_id', 'count': {'$sum': 1}}}
+        ])
+    }
+    # Read after the recount, so an assignment written during it is seen here
+    busy.update(row['_id'] for row in mongo.db.therapist_assignments.aggregate([
+        {'$match': {'updated_at': {'$gte': cutoff}}},
+        {'$group': {'_id': '$therapist_id'}}
+    ]))
+    drifted = [therapist_id for therapist_id, counter in counters.items()
+               if therapist_id not in busy and counter != actual.get(therapist_id, 0)]
+    if not drifted:
+        return 0
+
+    repaired = mongo.db.therapists.bulk_write([
+        UpdateOne({'_id': therapist_id, 'current_students': counters[therapist_id]},
+                  {'$set': {'current_students': actual.get(therapist_id, 0)}})
+        for therapist_id in drifted
+    ], ordered=False).modified_count
+    logger.info(f"Reconciled {repaired} therapist caseload counters")
+    notify_assignment_change(*drifted)
+    return repaired
+
+
+def _reconcile_in_app(app):
+    with app.app_context():
+        try:
+            reconcile_caseloads()
+        except Exception as e:
+            logger.error(f"Error reconciling therapist caseloads: {e}")
+
+
+_reconcile_lock = threading.Lock()
+
+
+def schedule_caseload_reconciliation(app=None):
+    """Reconcile now and every CASELOAD_RECONCILE_MINUTES on the app scheduler (0 disables it)."""
+    app = app or current_app._get_current_object()
+    minutes = app.config.get('CASELOAD_RECONCILE_MINUTES', 60)
+    if not minutes:
+        return
+    with _reconcile_lock:
+        scheduler.add_job(
+            _reconcile_in_app, 'interval', args=[app], minutes=minutes,
+            id=RECONCILE_JOB_ID, replace_existing=True, next_run_time=datetime.now(),
+            coalesce=True, max_instances=1
+        )
+        if not scheduler.running:
+            scheduler.start()
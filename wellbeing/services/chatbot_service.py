@@ -1,24 +1,34 @@
 """
 Chatbot service for processing user messages using Claude API.
 """
+import re
+import time
 import uuid
+import threading
+from collections import OrderedDict
 import anthropic
 from datetime import datetime, timezone
 from flask import current_app
-from wellbeing.models.chat import create_chat, get_previous_message
+from wellbeing.extensions import socketio
+from wellbeing.models.chat import create_chat
+from wellbeing.models.chat_context import get_recent_turns
+from wellbeing.services.claude_client import claude_client, call_with_retries
+from wellbeing.services.spend_ledger import get_spend_ledger, checkpoint_ledger, REASON_USER_HOURLY
+from wellbeing.utils import keyword_matcher
 
-# Crisis keywords for detection - expanded list
-CRISIS_KEYWORDS = [
-    'suicide', 'kill myself', 'end my life', 'want to die', 'hurt myself',
-    'self harm', 'no point living', 'better off dead', 'ending it all',
-    'don\'t want to live', 'cutting', 'overdose', 'jump off', 'hang myself',
-    'self-harm', 'self-injury', 'suicidal thoughts', 'suicidal ideation'
-]
+# Optional approximate-match tier for the response cache
+try:
+    from sklearn.feature_extraction.text import HashingVectorizer
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+# Crisis keywords for detection - expanded list (shared keyword tables)
+CRISIS_KEYWORDS = keyword_matcher.CRISIS_KEYWORDS
 
 def check_for_crisis(message):
     """Check if message contains crisis-related content."""
-    message_lower = message.lower()
-    return any(keyword in message_lower for keyword in CRISIS_KEYWORDS)
+    return bool(keyword_matcher.scan(message, {keyword_matcher.GROUP_CRISIS}))
 
 def get_crisis_response():
     """Get appropriate crisis response."""
@@ -38,23 +48,7 @@ def get_crisis_response():
         "confidence": 1.0,
         "topic": "crisis"
     }
-def get_claude_response(user_input, previous_context=None):
-    """
-    Get response from Claude API.
-    
-    Args:
-        user_input (str): User message
-        previous_context (dict): Previous conversation context
-        
-    Returns:
-        dict: Response data
-    """
-    try:
-        # Set up Claude client
-        client = anthropic.Anthropic(api_key=current_app.config.get('CLAUDE_API_KEY'))
-        
-        # FORCE SHORT RESPONSES - ABSOLUTELY NO FORMATTING
-        system_prompt = """You are a compassionate university mental health assistant. Rules:
+SYSTEM_PROMPT = """You are a compassionate university mental health assistant. Rules:
 - Always start with empathy and validation
 - Response length should fit the situation:
   • Short and warm for greetings, mood check-ins, or quick follow-ups
@@ -74,64 +68,158 @@ def get_claude_response(user_input, previous_context=None):
 
 FORBIDDEN: Never use * _ ** __ or any formatting symbols except bullet points."""
 
-        # Add debug logging
-        current_app.logger.info("FORCING BULLET POINT FORMAT")
-        
-        # Build conversation messages
-        messages = []
+
+class ResponseFormatter:
+    """
+    Incremental version of the Claude response post-processing.
+
+    Strips asterisks/underscores, collapses whitespace and puts each '• '
+    bullet on its own line. Chunks can be fed as they arrive from the
+    stream; the concatenated output is identical to formatting the whole
+    response at once.
+    """
+
+    STRIPPED_CHARS = ('*', '_')
+    BULLET = '•'
+
+    def __init__(self):
+        self.started = False
+        self.pending_space = False
+        self.pending_bullet = False
+        self.bullet_has_space = False
+        self.bullet_confirmed = False
+        self.parts = []
+
+    def feed(self, chunk):
+        """Format a chunk of raw model text and return the text safe to emit."""
+        out = []
+        for ch in chunk:
+            if ch in self.STRIPPED_CHARS:
+                # Formatting chars are removed after the original strip(), so
+                # they still make a preceding '• ' count as non-trailing
+                if self.pending_bullet and self.bullet_has_space:
+                    self.bullet_confirmed = True
+                continue
+            if ch.isspace():
+                # Whitespace is held back until we know it is not trailing
+                if self.pending_bullet:
+                    self.bullet_has_space = True
+                elif self.started:
+                    self.pending_space = True
+                continue
+            if self.pending_bullet:
+                if self.pending_space:
+                    out.append(' ')
+                if self.bullet_has_space:
+                    # '• ' starts a new line unless it opens the response
+                    out.append('\n• ' if self.started else '• ')
+                else:
+                    out.append(self.BULLET)
+                self.started = True
+                self.pending_bullet = False
+                self.bullet_has_space = False
+                self.bullet_confirmed = False
+                self.pending_space = False
+            if ch == self.BULLET:
+                self.pending_bullet = True
+                continue
+            if self.pending_space:
+                out.append(' ')
+                self.pending_space = False
+            out.append(ch)
+            self.started = True
+        text = ''.join(out)
+        self.parts.append(text)
+        return text
+
+    def finish(self):
+        """Flush a held-back trailing bullet; trailing whitespace is dropped."""
+        text = ''
+        if self.pending_bullet:
+            text = ' ' if self.pending_space else ''
+            if self.bullet_confirmed and self.started:
+                text += '\n'
+            text += self.BULLET
+        self.pending_bullet = False
+        self.bullet_has_space = False
+        self.bullet_confirmed = False
+        self.pending_space = False
+        self.parts.append(text)
+        return text
+
+    @property
+    def text(self):
+        return ''.join(self.parts)
+
+
+def clean_response_text(raw_text):
+    """Apply the asterisk/bullet post-processing to a complete response."""
+    formatter = ResponseFormatter()
+    formatter.feed(raw_text)
+    formatter.finish()
+    return formatter.text
+
+
+def build_claude_request(user_input, previous_context=None):
+    """
+    Build the keyword arguments for a Claude messages call.
+    
+    Args:
+        user_input (str): User message
+        previous_context (dict or list): Previous turn, or recent turns
+            oldest first, each with 'message' and 'response'
         
-        # Add previous context if available
-        if previous_context and previous_context.get('message') and previous_context.get('response'):
+    Returns:
+        dict: model, max_tokens, temperature, system and messages
+    """
+    messages = []
+    
+    # Add previous context if available
+    turns = previous_context if isinstance(previous_context, list) else [previous_context]
+    for turn in turns:
+        if turn and turn.get('message') and turn.get('response'):
             messages.extend([
-                {"role": "user", "content": previous_context['message']},
-                {"role": "assistant", "content": previous_context['response']}
+                {"role": "user", "content": turn['message']},
+                {"role": "assistant", "content": turn['response']}
             ])
+    
+    # Add current user message
+    messages.append({"role": "user", "content": user_input})
+    
+    return {
+        "model": current_app.config.get('CLAUDE_MODEL', 'claude-sonnet-4-20250514'),
+        "max_tokens": current_app.config.get('CLAUDE_MAX_TOKENS', 600),  # UPDATED DEFAULT
+        "temperature": current_app.config.get('CLAUDE_TEMPERATURE', 0.7),
+        "system": SYSTEM_PROMPT,
+        "messages": messages
+    }
+
+
+def get_claude_response(user_input, previous_context=None):
+    """
+    Get response from Claude API.
+    
+    Args:
+        user_input (str): User message
+        previous_context (dict or list): Previous turn(s), see build_claude_request
         
-        # Add current user message
-        messages.append({"role": "user", "content": user_input})
+    Returns:
+        dict: Response data
+    """
+    try:
+        # Shared client: keep-alive connections are reused across turns
+        client = claude_client()
         
-        # Get correct model and max_tokens from config
-        model = current_app.config.get('CLAUDE_MODEL', 'claude-sonnet-4-20250514')
-        max_tokens = current_app.config.get('CLAUDE_MAX_TOKENS', 600)  # UPDATED DEFAULT
-        temperature = current_app.config.get('CLAUDE_TEMPERATURE', 0.7)
+        request_kwargs = build_claude_request(user_input, previous_context)
+        model = request_kwargs['model']
         
-        current_app.logger.info(f"Using model: {model}, max_tokens: {max_tokens}")
+        current_app.logger.info(f"Using model: {model}, max_tokens: {request_kwargs['max_tokens']}")
         
-        # Make API call to Claude
-        response = client.messages.create(
-            model=model,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            system=system_prompt,
-            messages=messages
-        )
+        # Make API call to Claude (retries with jittered backoff)
+        response = call_with_retries(lambda: client.messages.create(**request_kwargs))
         
         # Post-process response to remove ALL asterisks and fix bullet formatting
-        ai_response = response.content[0].text.strip()
-        
-        # AGGRESSIVELY remove ALL asterisks and formatting characters
-        ai_response = ai_response.replace('**', '')  # Remove double asterisks
-        ai_response = ai_response.replace('*', '')   # Remove single asterisks
-        ai_response = ai_response.replace('__', '')  # Remove underscores
-        ai_response = ai_response.replace('_', '')   # Remove single underscores
-        
-        # Clean up any extra spaces left by removed formatting
-        import re
-        ai_response = re.sub(r'\s+', ' ', ai_response)  # Replace multiple spaces with single space
-        ai_response = re.sub(r'^\s+', '', ai_response, flags=re.MULTILINE)  # Remove leading spaces on lines
-        
-        # Convert bullet points to proper line breaks if Claude didn't format them correctly
-        if '•' in ai_response and '\n•' not in ai_response:
-            # Replace • with line break + • to ensure vertical formatting
-            ai_response = ai_response.replace('• ', '\n• ')
-            # Clean up any double line breaks
-            ai_response = ai_response.replace('\n\n• ', '\n• ')
-            # Ensure we start clean if the first character is a bullet
-            if ai_response.startswith('\n• '):
-                ai_response = ai_response[1:]  # Remove leading newline
-        
-        # Final cleanup
-        ai_response = ai_response.strip()
+        ai_response = clean_response_text(response.content[0].text)
         
         # Log response length for debugging
         current_app.logger.info(f"Response length: {len(ai_response)} characters, {len(ai_response.split())} words")
@@ -196,6 +284,58 @@ FORBIDDEN: Never use * _ ** __ or any formatting symbols except bullet points.""
         }
 
 
+def stream_claude_response(user_input, previous_context=None, on_text=None):
+    """
+    Stream a response from Claude API, formatting it as it arrives.
+    
+    Args:
+        user_input (str): User message
+        previous_context (dict or list): Previous turn(s), see build_claude_request
+        on_text (callable): Called with each formatted text fragment
+        
+    Returns:
+        dict: Response data, same shape as get_claude_response
+    """
+    client = claude_client()
+    request_kwargs = build_claude_request(user_input, previous_context)
+    model = request_kwargs['model']
+    formatter = None
+    
+    def run_stream():
+        nonlocal formatter
+        # Each attempt starts clean: a retry only happens when nothing was emitted,
+        # so state left pending by the failed attempt must not leak into this one
+        formatter = ResponseFormatter()
+        with client.messages.stream(**request_kwargs) as stream:
+            for raw_text in stream.text_stream:
+                text = formatter.feed(raw_text)
+                if text and on_text:
+                    on_text(text)
+            return stream.get_final_message()
+    
+    # Only retry while nothing has been shown to the student yet
+    final_message = call_with_retries(run_stream, retry_if=lambda: not formatter.text)
+    
+    tail = formatter.finish()
+    if tail and on_text:
+        on_text(tail)
+    
+    usage = final_message.usage if final_message else None
+    input_tokens = usage.input_tokens if usage else 0
+    output_tokens = usage.output_tokens if usage else 0
+    
+    current_app.logger.info(f"Claude stream usage - Input: {input_tokens}, Output: {output_tokens}")
+    
+    return {
+        "response": formatter.text,
+        "confidence": 0.9,
+        "model": f"claude-{model}",
+        "topic": classify_topic(user_input),
+        "tokens_used": input_tokens + output_tokens,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens
+    }
+
 
 def classify_topic(user_input):
     """
@@ -207,31 +347,217 @@ def classify_topic(user_input):
     Returns:
         str: Classified topic
     """
-    user_input_lower = user_input.lower()
-    
-    topic_keywords = {
-        'anxiety': ['anxious', 'anxiety', 'worried', 'panic', 'nervous', 'fear', 'panic attack'],
-        'depression': ['depressed', 'depression', 'sad', 'hopeless', 'empty', 'lonely', 'worthless'],
-        'stress': ['stressed', 'stress', 'overwhelmed', 'pressure', 'burden', 'burnout'],
-        'sleep': ['sleep', 'insomnia', 'tired', 'exhausted', 'rest', 'fatigue', 'can\'t sleep'],
-        'relationships': ['relationship', 'partner', 'family', 'friends', 'social', 'dating', 'breakup'],
-        'academic': ['study', 'exam', 'grades', 'school', 'university', 'assignment', 'homework', 'test'],
-        'work': ['work', 'job', 'career', 'boss', 'workplace', 'office', 'internship'],
-        'coping': ['cope', 'coping', 'manage', 'handle', 'deal with', 'strategies'],
-        'therapy': ['therapy', 'therapist', 'counseling', 'professional help', 'counselor'],
-        'self_esteem': ['confidence', 'self-worth', 'self-esteem', 'insecure', 'inadequate'],
-        'eating': ['eating', 'food', 'weight', 'body image', 'appetite', 'diet'],
-        'substance': ['alcohol', 'drinking', 'drugs', 'substance', 'addiction', 'smoking'],
-        'trauma': ['trauma', 'ptsd', 'abuse', 'assault', 'violence', 'flashbacks']
-    }
+    matcher = keyword_matcher.get_matcher()
+    hit_topics = {hit.category for hit in matcher.scan(user_input, {keyword_matcher.GROUP_TOPIC})}
     
-    # Check for each topic's keywords
-    for topic, keywords in topic_keywords.items():
-        if any(keyword in user_input_lower for keyword in keywords):
+    # Topics are checked in table order; the first one with a keyword hit wins
+    for topic in matcher.category_order.get(keyword_matcher.GROUP_TOPIC, []):
+        if topic in hit_topics:
             return topic
     
     return 'general_support'
 
+class ResponseCache:
+    """
+    In-process cache of Claude responses for repeated student messages.
+    
+    Exact tier: keyed by normalized message text plus topic. Approximate
+    tier (optional, needs scikit-learn): a hashed word/bigram vector per
+    entry, matched by cosine similarity within the same topic. Entries
+    expire after ttl_seconds and the least recently used entry is evicted
+    once max_entries is reached. Topics in excluded_topics are never cached.
+    """
+
+    def __init__(self, max_entries=500, ttl_seconds=3600, similarity_threshold=0.85,
+                 approximate=True, excluded_topics=('crisis',), min_words=3):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.excluded_topics = set(excluded_topics)
+        self.min_words = min_words
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'approximate_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+        self.vectorizer = None
+        if approximate and SKLEARN_AVAILABLE:
+            self.vectorizer = HashingVectorizer(
+                n_features=2 ** 14,
+                ngram_range=(1, 2),
+                alternate_sign=False,
+                norm='l2'
+            )
+
+    @staticmethod
+    def normalize(text):
+        """Lowercase, unify apostrophes and drop punctuation/extra spaces."""
+        text = text.lower().replace('\u2019', "'")
+        text = re.sub(r"[^a-z0-9' ]+", ' ', text)
+        return ' '.join(text.split())
+
+    def cacheable(self, normalized, topic):
+        return (topic not in self.excluded_topics
+                and len(normalized.split()) >= self.min_words)
+
+    def get(self, text, topic):
+        """Return a cached response dict for this message, or None."""
+        normalized = self.normalize(text)
+        if not self.cacheable(normalized, topic):
+            return None
+
+        now = time.time()
+        with self.lock:
+            key = (topic, normalized)
+            entry = self.entries.get(key)
+            if entry and now - entry['created_at'] > self.ttl_seconds:
+                del self.entries[key]
+                self.stats['expirations'] += 1
+                entry = None
+            if entry:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry['data']
+
+            if self.vectorizer is not None:
+                match_key = self._find_similar(normalized, topic, now)
+                if match_key is not None:
+                    self.entries.move_to_end(match_key)
+                    self.stats['approximate_hits'] += 1
+                    return self.entries[match_key]['data']
+
+            self.stats['misses'] += 1
+            return None
+
+    def _find_similar(self, normalized, topic, now):
+        """Best same-topic entry above the similarity threshold (lock held)."""
+        vector = self.vectorizer.transform([normalized])
+        best_key, best_score = None, self.similarity_threshold
+        for key, entry in list(self.entries.items()):
+            if key[0] != topic:
+                continue
+            if now - entry['created_at'] > self.ttl_seconds:
+                del self.entries[key]
+                self.stats['expirations'] += 1
+                continue
+            score = vector.multiply(entry['vector']).sum()
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def put(self, text, topic, data):
+        """Cache a successful response for this message and topic."""
+        normalized = self.normalize(text)
+        if not self.cacheable(normalized, topic):
+            return
+
+        entry = {
+            'data': data,
+            'created_at': time.time(),
+            'vector': self.vectorizer.transform([normalized]) if self.vectorizer is not None else None
+        }
+        with self.lock:
+            key = (topic, normalized)
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.stats['stores'] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self.entries)
+        lookups = stats['hits'] + stats['approximate_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['approximate_hits']) / lookups, 4) if lookups else 0.0
+        stats['approximate_enabled'] = self.vectorizer is not None
+        return stats
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    Get the process-wide response cache, or None if disabled in config.
+
+    Per worker on purpose: entries are context-free replies shared by every
+    student and are never invalidated, so a worker that hasn't seen an
+    opener only costs one extra Claude call.
+    """
+    global _response_cache
+    if not current_app.config.get('CHATBOT_CACHE_ENABLED', True):
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                config = current_app.config
+                _response_cache = ResponseCache(
+                    max_entries=config.get('CHATBOT_CACHE_MAX_ENTRIES', 500),
+                    ttl_seconds=config.get('CHATBOT_CACHE_TTL', 3600),
+                    similarity_threshold=config.get('CHATBOT_CACHE_SIMILARITY', 0.85),
+                    approximate=config.get('CHATBOT_CACHE_APPROXIMATE', True),
+                    excluded_topics=config.get('CHATBOT_CACHE_EXCLUDED_TOPICS', ['crisis']),
+                    min_words=config.get('CHATBOT_CACHE_MIN_WORDS', 3)
+                )
+    return _response_cache
+
+def get_cached_response(user_input, previous_context=None):
+    """
+    Look up a cached response for a message.
+    
+    Cached replies were generated without context, so a message with
+    previous_context (a follow-up in a conversation) always misses.
+    
+    Returns:
+        dict: Response data shaped like get_claude_response (no tokens,
+        no cost), or None on a miss
+    """
+    cache = get_response_cache()
+    if cache is None or previous_context:
+        return None
+    topic = classify_topic(user_input)
+    cached = cache.get(user_input, topic)
+    if cached is None:
+        return None
+    current_app.logger.info(f"Response cache hit (topic: {topic})")
+    return {
+        "response": cached["response"],
+        "confidence": cached["confidence"],
+        "model": "response-cache",
+        "topic": topic,
+        "tokens_used": 0,
+        "input_tokens": 0,
+        "output_tokens": 0
+    }
+
+def cache_response(user_input, claude_response, previous_context=None):
+    """
+    Store a successful Claude response in the response cache.
+
+    The cache is shared by every student, so a reply generated with
+    previous_context (one student's recent turns) is never stored.
+    """
+    cache = get_response_cache()
+    if cache is None or claude_response.get("topic") == "error" or not claude_response.get("response"):
+        return
+    if previous_context:
+        return
+    cache.put(user_input, claude_response["topic"], {
+        "response": claude_response["response"],
+        "confidence": claude_response["confidence"]
+    })
+
 def estimate_cost(input_tokens, output_tokens, model_name):
     """
     Estimate the cost of a Claude API call.
@@ -264,26 +590,83 @@ def estimate_cost(input_tokens, output_tokens, model_name):
     output_cost = (output_tokens / 1_000_000) * 1.25
     return input_cost + output_cost
 
-def check_budget_limits(estimated_cost):
+def estimate_request_cost(user_input, previous_context=None):
     """
-    Check if the estimated cost would exceed budget limits.
+    Upper-bound cost of a Claude call before it is made.
+    
+    Input tokens are estimated at ~4 characters per token (system prompt,
+    context and message); output assumes the full CLAUDE_MAX_TOKENS.
+    """
+    request_kwargs = build_claude_request(user_input, previous_context)
+    input_chars = len(request_kwargs['system']) + sum(len(m['content']) for m in request_kwargs['messages'])
+    return estimate_cost(input_chars // 4, request_kwargs['max_tokens'], request_kwargs['model'])
+
+def check_budget_limits(estimated_cost, user_id=None):
+    """
+    Check the spend ledger before a paid Claude call, reserving it if allowed.
     
     Args:
         estimated_cost (float): Estimated cost in USD
+        user_id (str): User making the request (per-user hourly limit)
         
     Returns:
-        bool: True if within budget, False if would exceed
+        str: Refusal reason (e.g. 'daily_budget', 'user_per_hour'), or None
+        when the call may go ahead
     """
-    daily_limit = current_app.config.get('DAILY_SPENDING_LIMIT', 0.50)  # UPDATED DEFAULT
-    monthly_limit = current_app.config.get('MAX_MONTHLY_SPEND', 5.00)   # UPDATED DEFAULT
+    ledger = get_spend_ledger()
+    if ledger is None:
+        return None
     
-    # In a real implementation, you'd check against actual daily/monthly spending
-    # For now, just check if single request exceeds reasonable limits
-    if estimated_cost > daily_limit / 10:  # Single request shouldn't be more than 10% of daily limit
-        current_app.logger.warning(f"High cost request: ${estimated_cost:.4f}")
-        return False
+    decision = ledger.admit(user_id, estimated_cost)
+    if not decision.allowed:
+        current_app.logger.warning(
+            f"Claude call refused ({decision.reason}) for user {user_id}, est. ${estimated_cost:.4f}"
+        )
+    return decision.reason
+
+def record_claude_spend(cost, reserved_cost=0.0):
+    """
+    Add a completed call's cost to the spend ledger, replacing the
+    estimate check_budget_limits reserved for it.
+    """
+    ledger = get_spend_ledger()
+    if ledger is None:
+        return
+    ledger.record_spend(cost, reserved_cost)
+    checkpoint_ledger(ledger)
+
+# Template replies used instead of a paid call when over budget or rate limits
+DEGRADED_RESPONSES = {
+    'anxiety': "I hear that you're feeling anxious. • Try slow breathing: in for 4, hold for 4, out for 6 • Name five things you can see around you • Remind yourself this feeling will pass",
+    'depression': "I'm sorry you're feeling this way, and I'm glad you reached out. • Be gentle with yourself today • Try one small thing you usually enjoy • Consider talking to someone you trust or a therapist",
+    'stress': "That sounds like a lot to carry. • Break tasks into small steps • Take short breaks and move your body • Focus on what you can control right now",
+    'sleep': "Sleep troubles can make everything harder. • Keep a regular bedtime • Put screens away an hour before bed • Avoid caffeine late in the day",
+    'academic': "Academic pressure is really common. • Plan your study time in short focused blocks • Ask your lecturers or classmates for help • Remember that your worth is more than your grades",
+}
+DEGRADED_DEFAULT = "Thank you for sharing that with me. I'm here to support you. If things feel heavy, you can book a session with a therapist from your dashboard, and the system can match you automatically."
+DEGRADED_RATE_NOTE = "You've sent quite a few messages in a short time, so here is a quick response while things catch up. "
+
+def get_degraded_response(user_input, reason):
+    """
+    Cheap reply served when the spend ledger refuses a paid call.
     
-    return True
+    Returns:
+        dict: Response data shaped like get_claude_response (no tokens,
+        no cost)
+    """
+    topic = classify_topic(user_input)
+    response = DEGRADED_RESPONSES.get(topic, DEGRADED_DEFAULT)
+    if reason == REASON_USER_HOURLY:
+        response = DEGRADED_RATE_NOTE + response
+    return {
+        "response": response,
+        "confidence": 0.5,
+        "model": f"degraded-{reason}",
+        "topic": topic,
+        "tokens_used": 0,
+        "input_tokens": 0,
+        "output_tokens": 0
+    }
 
 def process_message(user_id, user_input):
     """
@@ -307,6 +690,7 @@ def process_message(user_id, user_input):
     topic = "unknown"
     tokens_used = 0
     estimated_cost = 0.0
+    reserved_cost = 0.0
     
     try:
         # Check for crisis content first
@@ -320,11 +704,23 @@ def process_message(user_id, user_input):
             tokens_used = 0  # Crisis detection doesn't use API
             estimated_cost = 0.0
         else:
-            # Get previous context for better responses
-            previous_context = get_previous_message(user_id)
+            # Get previous context for better responses (context cache, no query on a hit)
+            previous_context = get_recent_turns(user_id, current_app.config.get('CHAT_CONTEXT_TURNS', 1))
+            
+            # Repeated openers (no prior turns) are served from the response cache
+            claude_response = get_cached_response(user_input, previous_context)
+            if claude_response is None:
+                # Over budget or rate limits: template reply instead of a paid call
+                reserved_cost = estimate_request_cost(user_input, previous_context)
+                refusal = check_budget_limits(reserved_cost, user_id)
+                if refusal:
+                    reserved_cost = 0.0
+                    claude_response = get_degraded_response(user_input, refusal)
+                else:
+                    # Use Claude API
+                    claude_response = get_claude_response(user_input, previous_context)
+                    cache_response(user_input, claude_response, previous_context)
             
-            # Use Claude API
-            claude_response = get_claude_response(user_input, previous_context)
             response = claude_response["response"]
             confidence = claude_response["confidence"]
             model_used = claude_response["model"]
@@ -337,6 +733,9 @@ def process_message(user_id, user_input):
             output_tokens = claude_response.get("output_tokens", 0)
             model_name = current_app.config.get('CLAUDE_MODEL', 'claude-sonnet-4-20250514')
             estimated_cost = estimate_cost(input_tokens, output_tokens, model_name)
+            if estimated_cost or reserved_cost:
+                record_claude_spend(estimated_cost, reserved_cost)
+                reserved_cost = 0.0
             
             # Log cost for monitoring
             current_app.logger.info(f"Request cost: ${estimated_cost:.6f} (Input: {input_tokens}, Output: {output_tokens})")
@@ -345,6 +744,9 @@ def process_message(user_id, user_input):
         current_app.logger.error(f"Error processing message: {str(model_error)}")
         # Keep the default error values set above
         topic = "error"
+        if reserved_cost:
+            # The call failed after its estimate was reserved: give it back
+            record_claude_spend(0.0, reserved_cost)
     
     # Calculate response time
     response_time = (datetime.now() - start_time).total_seconds() * 1000  # in milliseconds
@@ -379,4 +781,132 @@ def process_message(user_id, user_input):
         "response_time_ms": response_time,
         "tokens_used": tokens_used,
         "estimated_cost": estimated_cost
-    }
\ No newline at end of file
+    }
+
+
+def stream_message(app, user_id, user_input, socket_id, stream_id):
+    """
+    Process a user message and stream the response over Socket.IO.
+    
+    Runs as a Socket.IO background task so the HTTP worker is released
+    immediately. Emits chat_stream_start, chat_stream_token (one per
+    formatted fragment) and chat_stream_end to the client's own room, then
+    persists the finished turn with create_chat.
+    
+    Args:
+        app: Flask application (background tasks have no app context)
+        user_id (str): User ID
+        user_input (str): User message
+        socket_id (str): Socket.IO session ID of the requesting client
+        stream_id (str): Client-visible ID used to correlate the events
+    """
+    with app.app_context():
+        start_time = datetime.now()
+        first_token_ms = None
+        
+        response = "I'm having trouble understanding. Could you rephrase your question?"
+        confidence = 0.0
+        model_used = "error-fallback"
+        detected_intent = "unknown"
+        topic = "unknown"
+        tokens_used = 0
+        input_tokens = 0
+        output_tokens = 0
+        estimated_cost = 0.0
+        reserved_cost = 0.0
+        
+        def emit_text(text):
+            nonlocal first_token_ms
+            if first_token_ms is None:
+                first_token_ms = (datetime.now() - start_time).total_seconds() * 1000
+            socketio.emit('chat_stream_token', {
+                'stream_id': stream_id,
+                'text': text
+            }, room=socket_id)
+        
+        socketio.emit('chat_stream_start', {'stream_id': stream_id}, room=socket_id)
+        
+        try:
+            if check_for_crisis(user_input):
+                crisis_response = get_crisis_response()
+                response = crisis_response["response"]
+                confidence = crisis_response["confidence"]
+                model_used = "crisis_detection"
+                detected_intent = "crisis"
+                topic = "crisis"
+                emit_text(response)
+            else:
+                previous_context = get_recent_turns(user_id, current_app.config.get('CHAT_CONTEXT_TURNS', 1))
+                claude_response = get_cached_response(user_input, previous_context)
+                if claude_response is not None:
+                    emit_text(claude_response["response"])
+                else:
+                    reserved_cost = estimate_request_cost(user_input, previous_context)
+                    refusal = check_budget_limits(reserved_cost, user_id)
+                    if refusal:
+                        reserved_cost = 0.0
+                        claude_response = get_degraded_response(user_input, refusal)
+                        emit_text(claude_response["response"])
+                    else:
+                        claude_response = stream_claude_response(user_input, previous_context, on_text=emit_text)
+                        cache_response(user_input, claude_response, previous_context)
+                
+                response = claude_response["response"]
+                confidence = claude_response["confidence"]
+                model_used = claude_response["model"]
+                detected_intent = claude_response.get("topic", "general_support")
+                topic = claude_response.get("topic", "general_support")
+                tokens_used = claude_response.get("tokens_used", 0)
+                input_tokens = claude_response.get("input_tokens", 0)
+                output_tokens = claude_response.get("output_tokens", 0)
+                
+                model_name = current_app.config.get('CLAUDE_MODEL', 'claude-sonnet-4-20250514')
+                estimated_cost = estimate_cost(input_tokens, output_tokens, model_name)
+                if estimated_cost or reserved_cost:
+                    record_claude_spend(estimated_cost, reserved_cost)
+                    reserved_cost = 0.0
+                
+                current_app.logger.info(f"Streamed request cost: ${estimated_cost:.6f} (Input: {input_tokens}, Output: {output_tokens})")
+                
+        except Exception as stream_error:
+            current_app.logger.error(f"Error streaming message: {str(stream_error)}")
+            topic = "error"
+            if reserved_cost:
+                record_claude_spend(0.0, reserved_cost)
+            socketio.emit('chat_stream_error', {
+                'stream_id': stream_id,
+                'response': "I'm having trouble processing your message. Could you try rephrasing?"
+            }, room=socket_id)
+            return
+        
+        response_time = (datetime.now() - start_time).total_seconds() * 1000
+        
+        chat_id = create_chat(
+            user_id=user_id,
+            message=user_input,
+            response=response,
+            confidence=confidence,
+            model_used=model_used,
+            topic=topic,
+            session_id=str(uuid.uuid4()),
+            tokens_used=tokens_used,
+            estimated_cost=estimated_cost,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            response_time_ms=response_time,
+            detected_intent=detected_intent
+        )
+        
+        socketio.emit('chat_stream_end', {
+            'stream_id': stream_id,
+            'chat_id': chat_id,
+            'response': response,
+            'confidence': float(confidence),
+            'model': model_used,
+            'detected_intent': detected_intent,
+            'is_crisis': detected_intent == 'crisis',
+            'response_time_ms': response_time,
+            'time_to_first_token_ms': first_token_ms,
+            'tokens_used': tokens_used,
+            'estimated_cost': estimated_cost
+        }, room=socket_id)
@@ -0,0 +1,146 @@
+"""
+Process-wide Anthropic client registry with connection reuse and retries.
+
+Building ``anthropic.Anthropic(...)`` per message pays a fresh TCP/TLS
+handshake and connection-pool setup on every chat turn. Clients here are
+created once per (api_key, timeout, base_url) and shared by all requests in
+the process, so keep-alive connections are reused between turns.
+"""
+import random
+import threading
+import time
+
+import anthropic
+import httpx
+from flask import current_app
+
+# Errors worth retrying: throttling, transient network failures and 5xx
+RETRYABLE_ERRORS = (
+    anthropic.RateLimitError,
+    anthropic.APIConnectionError,
+    anthropic.InternalServerError,
+)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_claude_client(api_key, timeout=30, base_url=None, max_connections=20,
+                      max_keepalive_connections=10, keepalive_expiry=60.0):
+    """
+    Get the shared Anthropic client for an API key and timeout.
+
+    Args:
+        api_key (str): Anthropic API key
+        timeout (float): Request timeout in seconds
+        base_url (str): Optional API base URL (e.g. a local fake server)
+        max_connections (int): Connection pool size
+        max_keepalive_connections (int): Idle connections kept open
+        keepalive_expiry (float): Seconds an idle connection is kept open
+
+    Returns:
+        anthropic.Anthropic: Client reused across calls with the same key
+    """
+    key = (api_key, float(timeout), base_url)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            http_client = httpx.Client(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                    keepalive_expiry=keepalive_expiry
+                )
+            )
+            client = anthropic.Anthropic(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=timeout,
+                # Retries are handled by call_with_retries so the configured
+                # delay and jitter apply; don't retry twice
+                max_retries=0,
+                http_client=http_client
+            )
+            _clients[key] = client
+    return client
+
+
+def claude_client():
+    """Get the shared client configured for the current app."""
+    config = current_app.config
+    return get_claude_client(
+        config.get('CLAUDE_API_KEY'),
+        timeout=config.get('CLAUDE_TIMEOUT', 30),
+        base_url=config.get('CLAUDE_BASE_URL'),
+        max_connections=config.get('CLAUDE_HTTP_MAX_CONNECTIONS', 20),
+        max_keepalive_connections=config.get('CLAUDE_HTTP_MAX_KEEPALIVE', 10),
+        keepalive_expiry=config.get('CLAUDE_HTTP_KEEPALIVE_EXPIRY', 60.0)
+    )
+
+
+def close_claude_clients():
+    """Close every pooled client (used on shutdown and in benchmarks)."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+def backoff_delay(attempt, base_delay, max_delay=30.0):
+    """Full-jitter exponential backoff: uniform(0, base * 2**attempt)."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_retries(func, max_retries=None, base_delay=None, retry_if=None):
+    """
+    Call func, retrying retryable Anthropic errors with jittered backoff.
+
+    Args:
+        func (callable): Zero-argument callable making the API request
+        max_retries (int): Retries after the first attempt (CLAUDE_MAX_RETRIES)
+        base_delay (float): Backoff base in seconds (CLAUDE_RETRY_DELAY)
+        retry_if (callable): Optional guard; no retry when it returns False
+
+    Returns:
+        Whatever func returns
+    """
+    if max_retries is None:
+        max_retries = current_app.config.get('CLAUDE_MAX_RETRIES', 3)
+    if base_delay is None:
+        base_delay = current_app.config.get('CLAUDE_RETRY_DELAY', 1.0)
+
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except RETRYABLE_ERRORS as e:
+            if attempt >= max_retries or (retry_if and not retry_if()):
+                raise
+            delay = backoff_delay(attempt, base_delay)
+
+            # Honour the server's Retry-After hint when it asks for longer
+            response = getattr(e, 'response', None)
+            retry_after = response.headers.get('retry-after') if response is not None else None
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+
+            attempt += 1
+            try:
+                current_app.logger.warning(
+                    f"Claude request failed ({type(e).__name__}), retry {attempt}/{max_retries} in {delay:.2f}s"
+                )
+            except RuntimeError:
+                pass  # No app context (e.g. benchmarks)
+            time.sleep(delay)
@@ -0,0 +1,283 @@
+"""
+Student dashboard assembly.
+
+A dashboard is a set of named sections (recent chats, latest mood,
+appointment status, ...). Sections are grouped into stages: every section
+in a stage is independent of the others, so the stage runs concurrently on
+a bounded, process-wide thread pool; a later stage can use the results of
+earlier ones (the next appointment needs the assigned therapist).
+
+Assembled sections are cached per user for DASHBOARD_CACHE_TTL_SECONDS.
+Writes invalidate only the sections they affect, through
+invalidate_dashboard(user_id, 'moods' | 'chats' | 'appointments' | 'intake'),
+so logging a mood re-queries the latest mood and nothing else. The cached
+sections are in-process. With DASHBOARD_REDIS_URL set, or a Redis Socket.IO
+message queue, every invalidation is also recorded in Redis (change ->
+time, per user) and each worker drops sections built before it, so a write
+on one worker is seen by all of them. Without Redis, other workers see a
+change once their TTL runs out.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import current_app
+
+from wellbeing import logger
+from wellbeing.utils.socketio_queue import message_queue_url
+
+# Optional shared invalidations
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+REDIS_KEY_PREFIX = 'wellbeing:dashboard_invalidations:'
+ALL_SECTIONS = '*'
+
+# Change -> sections it makes stale (including sections built from them)
+CHANGE_SECTIONS = {
+    'moods': ('latest_mood',),
+    'chats': ('recent_chats',),
+    'appointments': ('appointment_status', 'next_appointment', 'all_appointments'),
+    'intake': ('intake_completed', 'assigned_therapist', 'next_appointment', 'all_appointments'),
+}
+
+Stage = Dict[str, Callable[[Dict[str, Any]], Any]]
+
+
+class DashboardAssembler:
+    """Runs dashboard stages on a thread pool and caches sections per user."""
+
+    def __init__(self, max_workers: int = 8, cache_ttl: float = 30,
+                 max_users: int = 2000, cache_enabled: bool = True, redis_client=None):
+        self.cache_ttl = cache_ttl
+        self.max_users = max_users
+        self.cache_enabled = cache_enabled
+        self.redis = redis_client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dashboard')
+        self._cache: 'OrderedDict[str, dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'assemblies': 0, 'section_hits': 0, 'section_misses': 0, 'invalidations': 0}
+
+    # ----- cache -----
+
+    def _redis_key(self, user_key: str) -> str:
+        return f"{REDIS_KEY_PREFIX}{user_key}"
+
+    def _shared_invalidations(self, user_key: str) -> Dict[str, float]:
+        """change -> time of its latest invalidation on any worker."""
+        if self.redis is None:
+            return {}
+        try:
+            return {change: float(at) for change, at in self.redis.hgetall(self._redis_key(user_key)).items()}
+        except Exception as e:
+            logger.error(f"Error reading dashboard invalidations for {user_key}: {e}")
+            return {}
+
+    def _cached_sections(self, user_key: str, version: Optional[str]) -> Dict[str, Any]:
+        """Fresh cached sections for a user (copies, safe to mutate)."""
+        if not self.cache_enabled:
+            return {}
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(user_key)
+            if entry is None:
+                return {}
+            if entry['version'] != version:
+                # e.g. a different therapist is assigned now: nothing carries over
+                del self._cache[user_key]
+                return {}
+            self._cache.move_to_end(user_key)
+            fresh = {name: (value, built_at) for name, (value, expires_at, built_at) in entry['sections'].items()
+                     if expires_at > now}
+        if not fresh:
+            return {}
+
+        # Drop sections built before another worker invalidated them
+        for change, invalidated_at in self._shared_invalidations(user_key).items():
+            names = list(fresh) if change == ALL_SECTIONS else CHANGE_SECTIONS.get(change, ())
+            for name in names:
+                if name in fresh and fresh[name][1] <= invalidated_at:
+                    del fresh[name]
+        return copy.deepcopy({name: value for name, (value, _) in fresh.items()})
+
+    def _store(self, user_key: str, version: Optional[str], sections: Dict[str, Any], built_at: float):
+        """Cache sections; built_at is the wall-clock time their queries started."""
+        if not self.cache_enabled or not sections:
+            return
+        expires_at = time.monotonic() + self.cache_ttl
+        sections = copy.deepcopy(sections)
+        with self._lock:
+            entry = self._cache.get(user_key)
+            if entry is None or entry['version'] != version:
+                entry = self._cache[user_key] = {'version': version, 'sections': {}}
+            for name, value in sections.items():
+                entry['sections'][name] = (value, expires_at, built_at)
+            self._cache.move_to_end(user_key)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, user_id, *changes: str):
+        """
+        Drop the sections a change makes stale; no changes drops the user.
+
+        Args:
+            changes: Keys of CHANGE_SECTIONS ('moods', 'chats', ...)
+        """
+        user_key = str(user_id)
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.hset(self._redis_key(user_key),
+                          mapping={change: time.time() for change in changes or (ALL_SECTIONS,)})
+                # Older invalidations can't matter: every section they could drop has expired
+                pipe.expire(self._redis_key(user_key), int(self.cache_ttl) + 1)
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"Error sharing dashboard invalidation for {user_key}: {e}")
+
+        with self._lock:
+            self.stats['invalidations'] += 1
+            entry = self._cache.get(user_key)
+            if entry is None:
+                return
+            if not changes:
+                del self._cache[user_key]
+                return
+            for change in changes:
+                for name in CHANGE_SECTIONS.get(change, ()):
+                    entry['sections'].pop(name, None)
+
+    # ----- assembly -----
+
+    def assemble(self, user_id, stages: List[Stage],
+                 version: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, Optional[float]]]:
+        """
+        Build every section, reusing cached ones.
+
+        Args:
+            user_id: Whose dashboard (the cache key)
+            stages: Lists of {section name: fn(results so far)}; sections of
+                one stage run concurrently, stages run in order
+            version: Anything the cached sections depend on besides the
+                user (a changed version discards the user's entry)
+
+        Returns:
+            tuple: (sections, timings) where timings maps each section to
+            milliseconds spent building it, or None if it came from cache
+        """
+        user_key = str(user_id)
+        built_at = time.time()
+        results = self._cached_sections(user_key, version)
+        timings: Dict[str, Optional[float]] = {name: None for name in results}
+        built = {}
+        app = current_app._get_current_object()
+
+        for stage in stages:
+            pending = {name: fn for name, fn in stage.items() if name not in results}
+            if not pending:
+                continue
+            # Later-stage functions only ever see a complete snapshot of earlier stages
+            snapshot = dict(results)
+            futures = {
+                name: self._executor.submit(self._run_section, app, fn, snapshot)
+                for name, fn in pending.items()
+            }
+            for name, future in futures.items():
+                value, elapsed_ms = future.result()
+                results[name] = built[name] = value
+                timings[name] = elapsed_ms
+
+        self._store(user_key, version, built, built_at)
+        with self._lock:
+            self.stats['assemblies'] += 1
+            self.stats['section_hits'] += len(results) - len(built)
+            self.stats['section_misses'] += len(built)
+        return results, timings
+
+    @staticmethod
+    def _run_section(app, fn, snapshot):
+        start = time.perf_counter()
+        with app.app_context():
+            value = fn(snapshot)
+        return value, (time.perf_counter() - start) * 1000
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['cached_users'] = len(self._cache)
+        stats['shared_invalidations'] = self.redis is not None
+        lookups = stats['section_hits'] + stats['section_misses']
+        stats['hit_rate'] = round(stats['section_hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_assembler = None
+_assembler_lock = threading.Lock()
+
+
+def get_dashboard_assembler() -> DashboardAssembler:
+    """Get the process-wide dashboard assembler (and its thread pool)."""
+    global _assembler
+    if _assembler is None:
+        with _assembler_lock:
+            if _assembler is None:
+                config = current_app.config
+                redis_client = None
+                redis_url = config.get('DASHBOARD_REDIS_URL') or message_queue_url(config)
+                if redis_url and REDIS_AVAILABLE:
+                    redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
+                _assembler = DashboardAssembler(
+                    max_workers=config.get('DASHBOARD_MAX_WORKERS', 8),
+                    cache_ttl=config.get('DASHBOARD_CACHE_TTL_SECONDS', 30),
+                    max_users=config.get('DASHBOARD_CACHE_MAX_USERS', 2000),
+                    cache_enabled=config.get('DASHBOARD_CACHE_ENABLED', True),
+                    redis_client=redis_client
+                )
+    return _assembler
+
+
+def invalidate_dashboard(user_id, *changes: str):
+    """
+    Mark a user's cached dashboard sections stale after a write.
+
+    Safe without an app context (write-behind hooks, scheduler jobs).
+    create_app builds the assembler at startup, so with Redis the
+    invalidation reaches other workers even if this one has not assembled
+    a dashboard yet.
+    """
+    if _assembler is None or user_id is None:
+        return
+    try:
+        _assembler.invalidate(user_id, *changes)
+    except Exception as e:
+        logger.error(f"Error invalidating dashboard cache for {user_id}: {e}")
+
+
+def server_timing_header(timings: Dict[str, Optional[float]], total_ms: float) -> str:
+    """Format section timings as a Server-Timing header value."""
+    parts = []
+    for name, elapsed_ms in timings.items():
+        if elapsed_ms is None:
+            parts.append(f'{name};desc="cache";dur=0')
+        else:
+            parts.append(f'{name};dur={elapsed_ms:.1f}')
+    parts.append(f'total;dur={total_ms:.1f}')
+    return ', '.join(parts)
+
+
+def invalidate_appointment_dashboard(appointment: Optional[dict]):
+    """invalidate_dashboard() for the student of an appointment document."""
+    if not appointment:
+        return
+    # Older appointments carry the student as user_id, newer ones as student_id
+    for user_id in {str(appointment[key]) for key in ('student_id', 'user_id') if appointment.get(key)}:
+        invalidate_dashboard(user_id, 'appointments')
@@ -0,0 +1,267 @@
+"""
+Background export jobs for large admin reports.
+
+A request enqueues a job and gets its id back straight away; the report is
+built on a worker and written to EXPORT_JOB_DIR. Job state lives in the
+export_jobs collection, so any worker can answer a status poll:
+
+    queued -> running (progress 0-100, stage) -> done | failed
+
+Progress and completion are also pushed to the requesting admin's
+Socket.IO room ('export_job_progress' / 'export_job_ready'), so a
+connected page does not need to poll.
+
+Workers run on the app's APScheduler instance, on a dedicated thread pool
+of EXPORT_JOB_WORKERS threads. With EXPORT_JOBS_INLINE (tests) the job
+runs synchronously inside enqueue_export(). Report types are registered
+by the blueprints with @export_builder('name').
+"""
+import json
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Optional
+
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo import ReturnDocument
+
+from wellbeing import mongo, socketio, logger, scheduler
+from wellbeing.models.notification import user_room
+from wellbeing.utils.streaming_export import json_default
+
+JOB_COLLECTION = 'export_jobs'
+PROGRESS_EVENT = 'export_job_progress'
+READY_EVENT = 'export_job_ready'
+EXECUTOR_ALIAS = 'exports'
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# What a builder returns: text chunks written to disk in order
+ExportOutput = namedtuple('ExportOutput', ['chunks', 'filename', 'mimetype'])
+
+# Report type -> builder(params, progress) -> ExportOutput
+EXPORT_BUILDERS: Dict[str, Callable] = {}
+
+
+def export_builder(job_type: str):
+    """Register a builder for a report type (decorator)."""
+    def register(fn):
+        EXPORT_BUILDERS[job_type] = fn
+        return fn
+    return register
+
+
+def json_output(data, filename: str) -> ExportOutput:
+    """ExportOutput for a report serialised as one JSON document."""
+    return ExportOutput([json.dumps(data, default=json_default, indent=2)], filename, 'application/json')
+
+
+# ----- storage -----
+
+def export_dir() -> str:
+    """Directory export files are written to (created on first use)."""
+    path = current_app.config.get('EXPORT_JOB_DIR') or os.path.join(current_app.instance_path, 'exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def export_path(job: dict) -> str:
+    """On-disk path of a job's file (named by job id, never by user input)."""
+    extension = os.path.splitext(job.get('filename') or '')[1]
+    return os.path.join(export_dir(), f"{job['_id']}{extension}")
+
+
+def _write_output(job: dict, output: ExportOutput) -> int:
+    """Write the chunks to a temporary file and move it into place."""
+    job = dict(job, filename=output.filename)
+    path = export_path(job)
+    partial = f'{path}.part'
+    size = 0
+    with open(partial, 'w', encoding='utf-8', newline='') as f:
+        for chunk in output.chunks:
+            f.write(chunk)
+            size += len(chunk)
+    os.replace(partial, path)
+    return size
+
+
+def purge_expired_exports():
+    """Delete jobs (and their files) past expires_at."""
+    now = datetime.now(timezone.utc)
+    expired = list(mongo.db[JOB_COLLECTION].find({'expires_at': {'$lt': now}}, {'filename': 1}))
+    for job in expired:
+        if job.get('filename'):
+            try:
+                os.remove(export_path(job))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error removing export file for job {job['_id']}: {e}")
+    if expired:
+        mongo.db[JOB_COLLECTION].delete_many({'_id': {'$in': [job['_id'] for job in expired]}})
+
+
+# ----- progress -----
+
+def _emit(event: str, job: dict):
+    try:
+        socketio.emit(event, public_job(job), room=user_room(job['user_id']))
+    except Exception as e:
+        logger.error(f"Error pushing export job update: {e}")
+
+
+class _ProgressReporter:
+    """progress(percent, stage) callable handed to builders."""
+
+    def __init__(self, job: dict):
+        self.job = job
+
+    def __call__(self, percent: int, stage: str = ''):
+        percent = max(0, min(int(percent), 99))  # 100 only once the file is on disk
+        job = mongo.db[JOB_COLLECTION].find_one_and_update(
+            {'_id': self.job['_id']},
+            {'$set': {'progress': percent, 'stage': stage}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None:
+            self.job = job
+            _emit(PROGRESS_EVENT, job)
+
+
+# ----- running -----
+
+def run_export_job(job_id) -> Optional[dict]:
+    """
+    Build one queued job (needs an app context).
+
+    Returns:
+        dict: The finished job document, or None if it was not queued
+    """
+    jobs = mongo.db[JOB_COLLECTION]
+    job = jobs.find_one_and_update(
+        {'_id': ObjectId(job_id), 'status': STATUS_QUEUED},
+        {'$set': {'status': STATUS_RUNNING, 'started_at': datetime.now(timezone.utc), 'stage': 'starting'}},
+        return_document=ReturnDocument.AFTER
+    )
+    if job is None:
+        return None
+
+    try:
+        builder = EXPORT_BUILDERS[job['type']]
+        output = builder(job.get('params', {}), _ProgressReporter(job))
+        size = _write_output(job, output)
+        finished_at = datetime.now(timezone.utc)
+        update = {
+            'status': STATUS_DONE,
+            'progress': 100,
+            'stage': 'ready',
+            'filename': output.filename,
+            'mimetype': output.mimetype,
+            'size': size,
+            'finished_at': finished_at,
+            'expires_at': finished_at + timedelta(hours=current_app.config.get('EXPORT_JOB_TTL_HOURS', 24))
+        }
+    except Exception as e:
+        logger.error(f"Export job {job_id} ({job.get('type')}) failed: {e}")
+        update = {
+            'status': STATUS_FAILED,
+            'stage': 'failed',
+            'error': str(e),
+            'finished_at': datetime.now(timezone.utc)
+        }
+
+    job = jobs.find_one_and_update({'_id': job['_id']}, {'$set': update},
+                                   return_document=ReturnDocument.AFTER)
+    _emit(READY_EVENT, job)
+    return job
+
+
+def _run_in_app(app, job_id):
+    with app.app_context():
+        run_export_job(job_id)
+
+
+_executor_ready = False
+_executor_lock = threading.Lock()
+
+
+def _get_scheduler():
+    """The app scheduler, with the export thread pool added and started."""
+    global _executor_ready
+    if not _executor_ready:
+        with _executor_lock:
+            if not _executor_ready:
+                from apscheduler.executors.pool import ThreadPoolExecutor
+                scheduler.add_executor(
+                    ThreadPoolExecutor(current_app.config.get('EXPORT_JOB_WORKERS', 2)),
+                    alias=EXECUTOR_ALIAS
+                )
+                if not scheduler.running:
+                    scheduler.start()
+                _executor_ready = True
+    return scheduler
+
+
+def enqueue_export(job_type: str, params: dict, user_id) -> dict:
+    """
+    Queue a report build and return the job document.
+
+    Args:
+        job_type: A registered builder name
+        params: JSON-serialisable builder arguments
+        user_id: The admin who asked (progress events go to their room)
+    """
+    if job_type not in EXPORT_BUILDERS:
+        raise ValueError(f"Unknown export type: {job_type}")
+
+    purge_expired_exports()
+    now = datetime.now(timezone.utc)
+    job = {
+        'type': job_type,
+        'params': params,
+        'user_id': str(user_id),
+        'status': STATUS_QUEUED,
+        'progress': 0,
+        'stage': 'queued',
+        'created_at': now,
+        # Unfinished jobs lost with a worker expire too
+        'expires_at': now + timedelta(hours=current_app.config.get('EXPORT_JOB_TTL_HOURS', 24))
+    }
+    job['_id'] = mongo.db[JOB_COLLECTION].insert_one(job).inserted_id
+
+    if current_app.config.get('EXPORT_JOBS_INLINE'):
+        return run_export_job(job['_id']) or job
+
+    app = current_app._get_current_object()
+    _get_scheduler().add_job(
+        _run_in_app, args=[app, job['_id']], id=f"export_{job['_id']}",
+        executor=EXECUTOR_ALIAS, misfire_grace_time=None
+    )
+    return job
+
+
+def get_export_job(job_id, user_id) -> Optional[dict]:
+    """A job document if it exists and belongs to user_id."""
+    if not ObjectId.is_valid(str(job_id)):
+        return None
+    return mongo.db[JOB_COLLECTION].find_one({'_id': ObjectId(job_id), 'user_id': str(user_id)})
+
+
+def list_export_jobs(user_id, limit: int = 20) -> Iterable[dict]:
+    """A user's most recent jobs, newest first."""
+    return mongo.db[JOB_COLLECTION].find({'user_id': str(user_id)}).sort('created_at', -1).limit(limit)
+
+
+def public_job(job: dict) -> dict:
+    """The JSON-safe view of a job returned to clients."""
+    fields = ('type', 'status', 'progress', 'stage', 'filename', 'size', 'error')
+    view = {'job_id': str(job['_id'])}
+    view.update({field: job.get(field) for field in fields})
+    for field in ('created_at', 'finished_at'):
+        view[field] = job[field].isoformat() if job.get(field) else None
+    return view
@@ -0,0 +1,187 @@
+"""
+Bulk slot search across a pool of therapists.
+
+Crisis intake, alternative-therapist suggestions and rescheduling all need
+"the earliest feasible slot" for several therapists at once. Instead of a
+therapist_availability find_one, a caseload count and an appointments
+query per therapist, load_candidates() fetches the whole pool in three
+$in queries:
+
+- therapist_availability: working days/hours, buffer_time,
+  max_daily_sessions, max_students, auto_schedule_enabled
+- therapists: caseload counters (wellbeing.services.caseload)
+- appointments: booked intervals (wellbeing.utils.availability)
+
+earliest_slots() then merges every candidate's free-slot iterator
+(heapq.merge), so finding the first slot across N therapists costs about
+N bisects, all in memory. Ties go to the lighter caseload, then the lower
+therapist id.
+"""
+import heapq
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from wellbeing import mongo
+from wellbeing.services.caseload import get_caseloads
+from wellbeing.utils.availability import (
+    DAY_NAMES,
+    DEFAULT_APPOINTMENT_MINUTES,
+    BookedIntervals,
+    iter_free_slots,
+    load_appointments_by_therapist
+)
+
+DEFAULT_MAX_STUDENTS = 20
+DEFAULT_WORKING_DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+
+SlotMatch = namedtuple('SlotMatch', ['datetime', 'candidate'])
+
+
+class TherapistCandidate:
+    """One therapist's calendar, settings and caseload, ready to search."""
+
+    def __init__(self, therapist: dict, availability: Optional[dict], caseload: int,
+                 appointments: List[dict]):
+        self.therapist = therapist
+        self.availability = availability
+        self.caseload = caseload
+        self.booked = BookedIntervals.from_appointments(appointments)
+        self.daily_sessions = Counter(apt['datetime'].date() for apt in appointments if apt.get('datetime'))
+
+        settings = availability or {}
+        self.working_hours = availability_working_hours(availability, therapist)
+        self.buffer = timedelta(minutes=int(settings.get('buffer_time') or 0))
+        self.max_daily_sessions = settings.get('max_daily_sessions')
+        self.max_students = settings.get('max_students', therapist.get('max_students', DEFAULT_MAX_STUDENTS))
+        self.auto_schedule_enabled = bool(settings.get('auto_schedule_enabled'))
+
+    @property
+    def therapist_id(self):
+        return self.therapist['_id']
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.caseload < self.max_students
+
+    def free_slots(self, start: datetime, end: datetime,
+                   slot: timedelta = timedelta(minutes=DEFAULT_APPOINTMENT_MINUTES)) -> Iterator[datetime]:
+        """Free slots, skipping days already at max_daily_sessions."""
+        for slot_start in iter_free_slots(self.booked, self.working_hours, start, end,
+                                          slot=slot, buffer=self.buffer):
+            if self.max_daily_sessions and self.daily_sessions[slot_start.date()] >= self.max_daily_sessions:
+                continue
+            yield slot_start
+
+    def next_slot(self, start: datetime, end: datetime, **options) -> Optional[datetime]:
+        return next(self.free_slots(start, end, **options), None)
+
+
+def availability_working_hours(availability: Optional[dict], therapist: Optional[dict] = None) -> Optional[dict]:
+    """
+    Scheduler-style working hours ({'monday': [(start, end)], ...}).
+
+    From a therapist_availability document (working_days plus one
+    start/end range), else the therapist's own working_hours, else None
+    (the scheduler's default week).
+    """
+    if availability and availability.get('working_hours'):
+        hours = availability['working_hours']
+        days = availability.get('working_days') or DEFAULT_WORKING_DAYS
+        return {day: [(hours.get('start', '09:00'), hours.get('end', '17:00'))] if day in days else []
+                for day in DAY_NAMES}
+    if therapist:
+        return therapist.get('working_hours')
+    return None
+
+
+def load_candidates(therapists: Iterable[dict], since: Optional[datetime] = None,
+                    until: Optional[datetime] = None, bookings: bool = True) -> List[TherapistCandidate]:
+    """
+    Availability, caseloads and bookings for a pool of therapist documents
+    (three queries; two with bookings=False, for capacity checks only).
+    """
+    therapists = [therapist for therapist in therapists if therapist and therapist.get('_id') is not None]
+    if not therapists:
+        return []
+    ids = [therapist['_id'] for therapist in therapists]
+
+    availability = {
+        doc['therapist_id']: doc
+        for doc in mongo.db.therapist_availability.find({'therapist_id': {'$in': ids}})
+    }
+    caseloads = get_caseloads(ids)
+    appointments = load_appointments_by_therapist(ids, since or datetime.now(), until) if bookings else {}
+
+    return [
+        TherapistCandidate(therapist, availability.get(therapist['_id']),
+                           caseloads.get(therapist['_id'], 0), appointments.get(therapist['_id'], []))
+        for therapist in therapists
+    ]
+
+
+def earliest_slots(candidates: Iterable[TherapistCandidate], start: datetime, end: datetime,
+                   count: int = 1, **options) -> List[SlotMatch]:
+    """
+    The first count (slot, candidate) pairs across the pool, earliest first.
+
+    Ties on time go to the lower caseload, then the lower therapist id, so
+    the result does not depend on the order candidates were loaded in.
+    """
+    def keyed(candidate):
+        tie_break = (candidate.caseload, str(candidate.therapist_id))
+        for slot_start in candidate.free_slots(start, end, **options):
+            yield (slot_start, tie_break), candidate
+
+    matches = []
+    for (slot_start, _), candidate in heapq.merge(*(keyed(c) for c in candidates), key=lambda item: item[0]):
+        matches.append(SlotMatch(slot_start, candidate))
+        if len(matches) >= count:
+            break
+    return matches
+
+
+def search_window(crisis_level: str = 'normal', days_ahead: int = 14, now: Optional[datetime] = None):
+    """
+    (start, end) of the slot search.
+
+    Crisis searches start now and cover two days; regular ones start
+    tomorrow, as get_therapist_available_slots does.
+    """
+    now = now or datetime.now()
+    if crisis_level in ('high', 'critical'):
+        return now, now + timedelta(days=2)
+    start = datetime.combine((now + timedelta(days=1)).date(), datetime.min.time())
+    return start, start + timedelta(days=days_ahead)
+
+
+def find_earliest_slot(therapists: Iterable[dict], crisis_level: str = 'normal',
+                       require_capacity: bool = True, days_ahead: int = 14) -> Optional[SlotMatch]:
+    """
+    The earliest feasible slot across a pool of therapists.
+
+    With require_capacity, therapists at max_students are skipped unless
+    every therapist is full (a crisis still needs someone). Crisis levels
+    with nothing in the next two days fall back to the regular window.
+    """
+    now = datetime.now()
+    start, end = search_window(crisis_level, days_ahead, now)
+    _, regular_end = search_window('normal', days_ahead, now)
+    candidates = load_candidates(therapists, since=now, until=max(end, regular_end))
+    if require_capacity:
+        candidates = [c for c in candidates if c.has_capacity] or candidates
+
+    matches = earliest_slots(candidates, start, end)
+    if not matches and end < regular_end:
+        matches = earliest_slots(candidates, *search_window('normal', days_ahead, now))
+    return matches[0] if matches else None
+
+
+def next_slots_by_therapist(therapists: Iterable[dict], days_ahead: int = 14) -> Dict[object, Optional[datetime]]:
+    """Each therapist's next regular slot, from one batched load."""
+    now = datetime.now()
+    start, end = search_window('normal', days_ahead, now)
+    return {
+        candidate.therapist_id: candidate.next_slot(start, end)
+        for candidate in load_candidates(therapists, since=now, until=end)
+    }
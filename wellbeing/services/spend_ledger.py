@@ -0,0 +1,423 @@
+"""
+In-memory spend and rate ledger gating Claude API calls.
+
+Every paid call goes through SpendLedger.admit() first:
+
+- CLAUDE_RATE_LIMIT_PER_MINUTE: token bucket (bursts up to the limit)
+- CLAUDE_RATE_LIMIT_PER_DAY: sliding 24h window
+- CLAUDE_RATE_LIMIT_PER_USER_PER_HOUR: sliding 1h window per user
+- DAILY_SPENDING_LIMIT / MAX_MONTHLY_SPEND: calendar-day and calendar-month
+  spend (UTC), seeded from the chat_usage_daily rollups
+
+All checks are dictionary lookups under one lock, so gating adds no
+database round trip to a chat turn. An admitted call's estimated cost is
+added to the spend straight away, so concurrent admissions can't all fit
+under the same remaining budget; record_spend() swaps the estimate for
+the actual cost once the call completes.
+
+Each worker checkpoints the calls it admitted itself to Mongo (or Redis
+when SPEND_LEDGER_REDIS_URL is set), under its own host:pid key, every
+SPEND_LEDGER_CHECKPOINT_SECONDS. At the same cadence it reads the other
+workers' checkpoints and counts their calls too, so the daily and per-user
+limits hold across workers; a restarted worker restores its own
+checkpoint. The per-minute token bucket is per worker. Spend is re-read
+from the rollups at the same cadence so several workers converge on the
+shared budget.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from flask import current_app
+from wellbeing import mongo
+from wellbeing.models.usage_rollup import DAILY_COLLECTION, day_key, day_start
+
+# Optional Redis checkpoint backend
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+CHECKPOINT_COLLECTION = 'spend_ledger'
+CHECKPOINT_ID = 'chatbot'
+REDIS_KEY = 'wellbeing:spend_ledger'
+CHECKPOINT_MAX_AGE = 86400  # older checkpoints hold nothing inside the longest window
+
+# Reasons a call is refused
+REASON_DAILY_BUDGET = 'daily_budget'
+REASON_MONTHLY_BUDGET = 'monthly_budget'
+REASON_RATE_MINUTE = 'rate_per_minute'
+REASON_RATE_DAY = 'rate_per_day'
+REASON_USER_HOURLY = 'user_per_hour'
+
+LedgerDecision = namedtuple('LedgerDecision', ['allowed', 'reason'])
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate tokens/second."""
+
+    def __init__(self, capacity, rate, tokens=None, updated=None):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = self.capacity if tokens is None else min(float(tokens), self.capacity)
+        self.updated = updated if updated is not None else time.time()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def available(self, now):
+        self._refill(now)
+        return self.tokens
+
+    def take(self, now, amount=1.0):
+        """Take tokens if available; returns False (and takes none) otherwise."""
+        self._refill(now)
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def to_dict(self):
+        return {'tokens': self.tokens, 'updated': self.updated}
+
+
+class SlidingWindowCounter:
+    """
+    Approximate sliding window made of fixed slots.
+
+    A 24h window with 96 slots counts events from the last 24h to within
+    15 minutes, using 96 integers regardless of traffic.
+    """
+
+    def __init__(self, window_seconds, slots, counts=None):
+        self.window_seconds = window_seconds
+        self.slots = slots
+        self.slot_seconds = window_seconds / slots
+        self.counts = {int(k): v for k, v in (counts or {}).items()}
+
+    def _prune(self, current):
+        oldest = current - self.slots + 1
+        for slot in [s for s in self.counts if s < oldest]:
+            del self.counts[slot]
+
+    def total(self, now):
+        current = int(now // self.slot_seconds)
+        self._prune(current)
+        return sum(self.counts.values())
+
+    def add(self, now, amount=1):
+        current = int(now // self.slot_seconds)
+        self._prune(current)
+        self.counts[current] = self.counts.get(current, 0) + amount
+
+    def to_dict(self):
+        return {str(k): v for k, v in self.counts.items()}
+
+    def merge(self, counts):
+        """Add another counter's to_dict() counts into this one."""
+        for slot, count in (counts or {}).items():
+            self.counts[int(slot)] = self.counts.get(int(slot), 0) + count
+
+
+class SpendLedger:
+    """Process-wide spend and rate counters for Claude calls."""
+
+    def __init__(self, per_minute, per_day, per_user_per_hour,
+                 daily_limit, monthly_limit, checkpoint_seconds=30):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.per_user_per_hour = per_user_per_hour
+        self.daily_limit = daily_limit
+        self.monthly_limit = monthly_limit
+        self.checkpoint_seconds = checkpoint_seconds
+
+        self.minute_bucket = TokenBucket(per_minute, per_minute / 60.0)
+        self.day_window = SlidingWindowCounter(86400, 96)
+        self.user_windows = {}
+        # Calls admitted by other workers, from their checkpoints
+        self.peer_day_window = SlidingWindowCounter(86400, 96)
+        self.peer_user_windows = {}
+        self.peer_count = 0
+
+        self.spend_day = None
+        self.spend_month = None
+        self.daily_spend = 0.0
+        self.monthly_spend = 0.0
+
+        self.last_checkpoint = 0.0
+        self.stats = {'admitted': 0, 'refused': {}}
+        self._lock = threading.Lock()
+
+    # ----- spend -----
+
+    def _roll_spend(self, now):
+        """Reset spend counters when the UTC day or month changes."""
+        today = day_key(datetime.fromtimestamp(now, timezone.utc))
+        if today != self.spend_day:
+            self.spend_day = today
+            self.daily_spend = 0.0
+        if today[:7] != self.spend_month:
+            self.spend_month = today[:7]
+            self.monthly_spend = 0.0
+
+    def record_spend(self, cost, reserved=0.0, now=None):
+        """
+        Add the actual cost of a completed call.
+
+        Args:
+            cost: Actual cost (0 for a call that failed)
+            reserved: Estimate admit() added for the call, replaced by cost
+        """
+        now = now or time.time()
+        with self._lock:
+            self._roll_spend(now)
+            # A reservation from before a day/month rollover was already reset
+            self.daily_spend = max(self.daily_spend + cost - reserved, 0.0)
+            self.monthly_spend = max(self.monthly_spend + cost - reserved, 0.0)
+
+    def sync_spend(self, daily_spend, monthly_spend, now=None):
+        """Merge spend read from the rollups (covers other workers)."""
+        now = now or time.time()
+        with self._lock:
+            self._roll_spend(now)
+            self.daily_spend = max(self.daily_spend, daily_spend)
+            self.monthly_spend = max(self.monthly_spend, monthly_spend)
+
+    # ----- admission -----
+
+    def _user_window(self, user_id):
+        user_id = str(user_id)
+        window = self.user_windows.get(user_id)
+        if window is None:
+            window = self.user_windows[user_id] = SlidingWindowCounter(3600, 60)
+        return window
+
+    def _user_total(self, user_id, now):
+        """Calls by a user in the last hour, on this worker and the others."""
+        total = self._user_window(user_id).total(now)
+        peer_window = self.peer_user_windows.get(str(user_id))
+        return total + peer_window.total(now) if peer_window is not None else total
+
+    def admit(self, user_id, estimated_cost=0.0, now=None):
+        """
+        Decide whether a paid call may go ahead, and reserve it if so.
+
+        A reservation counts the call against the rate limits and adds
+        estimated_cost to the daily and monthly spend; pass the same
+        estimate to record_spend() as reserved when the call completes.
+
+        Returns:
+            LedgerDecision: (allowed, reason); reason is None when allowed
+        """
+        now = now or time.time()
+        with self._lock:
+            self._roll_spend(now)
+            reason = None
+            if self.daily_limit and self.daily_spend + estimated_cost > self.daily_limit:
+                reason = REASON_DAILY_BUDGET
+            elif self.monthly_limit and self.monthly_spend + estimated_cost > self.monthly_limit:
+                reason = REASON_MONTHLY_BUDGET
+            elif self.per_user_per_hour and self._user_total(user_id, now) >= self.per_user_per_hour:
+                reason = REASON_USER_HOURLY
+            elif self.per_day and self.day_window.total(now) + self.peer_day_window.total(now) >= self.per_day:
+                reason = REASON_RATE_DAY
+            elif self.per_minute and not self.minute_bucket.take(now):
+                reason = REASON_RATE_MINUTE
+
+            if reason is not None:
+                self.stats['refused'][reason] = self.stats['refused'].get(reason, 0) + 1
+                return LedgerDecision(False, reason)
+
+            self._user_window(user_id).add(now)
+            self.day_window.add(now)
+            self.daily_spend += estimated_cost
+            self.monthly_spend += estimated_cost
+            self.stats['admitted'] += 1
+            return LedgerDecision(True, None)
+
+    # ----- checkpoints -----
+
+    def checkpoint_due(self, now=None):
+        now = now or time.time()
+        return now - self.last_checkpoint >= self.checkpoint_seconds
+
+    def to_dict(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            # Idle users fall out of the checkpoint (and out of memory)
+            for user_id in [u for u, w in self.user_windows.items() if not w.total(now)]:
+                del self.user_windows[user_id]
+            return {
+                'minute_bucket': self.minute_bucket.to_dict(),
+                'day_window': self.day_window.to_dict(),
+                'user_windows': {str(u): w.to_dict() for u, w in self.user_windows.items()},
+                'saved_at': now
+            }
+
+    def sync_peers(self, states):
+        """Replace other workers' calls with the sum of their checkpoints (to_dict() states)."""
+        day_window = SlidingWindowCounter(86400, 96)
+        user_windows = {}
+        count = 0
+        for state in states:
+            count += 1
+            day_window.merge(state.get('day_window'))
+            for user_id, counts in (state.get('user_windows') or {}).items():
+                user_windows.setdefault(user_id, SlidingWindowCounter(3600, 60)).merge(counts)
+        with self._lock:
+            self.peer_day_window = day_window
+            self.peer_user_windows = user_windows
+            self.peer_count = count
+
+    def restore(self, state):
+        """Load this worker's rate counters from a checkpoint written by to_dict()."""
+        if not state:
+            return
+        with self._lock:
+            bucket = state.get('minute_bucket') or {}
+            self.minute_bucket = TokenBucket(self.per_minute, self.per_minute / 60.0,
+                                             bucket.get('tokens'), bucket.get('updated'))
+            self.day_window = SlidingWindowCounter(86400, 96, state.get('day_window'))
+            self.user_windows = {
+                user_id: SlidingWindowCounter(3600, 60, counts)
+                for user_id, counts in (state.get('user_windows') or {}).items()
+            }
+
+    def get_stats(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            self._roll_spend(now)
+            return {
+                'daily_spend': round(self.daily_spend, 6),
+                'monthly_spend': round(self.monthly_spend, 6),
+                'daily_limit': self.daily_limit,
+                'monthly_limit': self.monthly_limit,
+                'calls_last_24h': self.day_window.total(now) + self.peer_day_window.total(now),
+                'peer_workers': self.peer_count,
+                'minute_tokens_available': round(self.minute_bucket.available(now), 2),
+                'tracked_users': len(self.user_windows),
+                'admitted': self.stats['admitted'],
+                'refused': dict(self.stats['refused'])
+            }
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+_redis_client = None
+
+
+def _get_redis():
+    global _redis_client
+    url = current_app.config.get('SPEND_LEDGER_REDIS_URL')
+    if not url or not REDIS_AVAILABLE:
+        return None
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(url, decode_responses=True)
+    return _redis_client
+
+
+def _worker_id():
+    """This worker's checkpoint key (read per call: workers fork after import)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _load_checkpoints():
+    """Every worker's recent checkpoint state, by worker id."""
+    cutoff = time.time() - CHECKPOINT_MAX_AGE
+    client = _get_redis()
+    if client is not None:
+        states = {worker: json.loads(raw) for worker, raw in client.hgetall(REDIS_KEY).items()}
+        stale = [worker for worker, state in states.items() if state.get('saved_at', 0) < cutoff]
+        if stale:
+            client.hdel(REDIS_KEY, *stale)
+        return {worker: state for worker, state in states.items() if worker not in stale}
+    return {
+        doc['worker']: doc['state']
+        for doc in mongo.db[CHECKPOINT_COLLECTION].find(
+            {'ledger': CHECKPOINT_ID, 'state.saved_at': {'$gte': cutoff}}, {'worker': 1, 'state': 1})
+    }
+
+
+def _save_checkpoint(state):
+    """Save this worker's own counters (never another worker's)."""
+    worker = _worker_id()
+    client = _get_redis()
+    if client is not None:
+        pipe = client.pipeline()
+        pipe.hset(REDIS_KEY, worker, json.dumps(state))
+        pipe.expire(REDIS_KEY, CHECKPOINT_MAX_AGE)
+        pipe.execute()
+        return
+    collection = mongo.db[CHECKPOINT_COLLECTION]
+    collection.update_one(
+        {'_id': f"{CHECKPOINT_ID}:{worker}"},
+        {'$set': {'ledger': CHECKPOINT_ID, 'worker': worker, 'state': state,
+                  'updated_at': datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    # Workers that stopped long ago
+    collection.delete_many({'ledger': CHECKPOINT_ID, 'state.saved_at': {'$lt': state['saved_at'] - CHECKPOINT_MAX_AGE}})
+
+
+def _read_rollup_spend():
+    """Today's and this month's spend from the chat_usage_daily rollups."""
+    today = day_key(datetime.now(timezone.utc))
+    month_start = day_start(today[:7] + '-01')
+    daily_spend = 0.0
+    monthly_spend = 0.0
+    for doc in mongo.db[DAILY_COLLECTION].find({'date': {'$gte': month_start}},
+                                               {'total_cost': 1}):
+        monthly_spend += doc.get('total_cost', 0)
+        if doc['_id'] == today:
+            daily_spend = doc.get('total_cost', 0)
+    return daily_spend, monthly_spend
+
+
+def checkpoint_ledger(ledger, force=False):
+    """
+    Persist this worker's rate counters, pick up the other workers' and
+    re-sync spend, at most every checkpoint interval.
+    """
+    now = time.time()
+    if not force and not ledger.checkpoint_due(now):
+        return
+    ledger.last_checkpoint = now
+    try:
+        ledger.sync_spend(*_read_rollup_spend(), now=now)
+        _save_checkpoint(ledger.to_dict(now))
+        worker = _worker_id()
+        ledger.sync_peers(state for peer, state in _load_checkpoints().items() if peer != worker)
+    except Exception as e:
+        current_app.logger.error(f"Error checkpointing spend ledger: {e}")
+
+
+def get_spend_ledger():
+    """Get the process-wide ledger, or None if disabled in config."""
+    global _ledger
+    if not current_app.config.get('SPEND_LEDGER_ENABLED', True):
+        return None
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                config = current_app.config
+                ledger = SpendLedger(
+                    per_minute=config.get('CLAUDE_RATE_LIMIT_PER_MINUTE', 50),
+                    per_day=config.get('CLAUDE_RATE_LIMIT_PER_DAY', 5000),
+                    per_user_per_hour=config.get('CLAUDE_RATE_LIMIT_PER_USER_PER_HOUR', 200),
+                    daily_limit=config.get('DAILY_SPENDING_LIMIT', 0.50),
+                    monthly_limit=config.get('MAX_MONTHLY_SPEND', 5.00),
+                    checkpoint_seconds=config.get('SPEND_LEDGER_CHECKPOINT_SECONDS', 30)
+                )
+                try:
+                    ledger.restore(_load_checkpoints().get(_worker_id()))
+                except Exception as e:
+                    current_app.logger.error(f"Error restoring spend ledger checkpoint: {e}")
+                checkpoint_ledger(ledger, force=True)
+                _ledger = ledger
+    return _ledger
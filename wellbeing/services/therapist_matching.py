@@ -0,0 +1,279 @@
+"""
+Therapist matching index.
+
+TherapistMatcher.find_best_match, mental_health.candidate_therapists
+(behind assign_therapist_immediately and crisis intake) and
+find_alternative_therapists all rank the same pool with the same score.
+The index keeps every active therapist as columns (a boolean column per
+specialization, gender code, emergency_hours, rating, total_sessions,
+max_students and the caseload counter, current_students), so a
+request filters and scores the whole pool in one vectorized pass instead
+of a query plus a Python loop.
+
+Score (match_score): specialization +10, emergency cover in a crisis +15,
+under 70% of max_students +5, over 100 sessions +3, rating >= 4.5 +5
+(>= 4.0 +3), preferred gender +5. Ranking is score descending, then
+caseload ascending, then therapist id, so equal candidates always come
+back in the same order.
+
+Freshness: assignment writes (wellbeing.services.caseload) call
+notify_assignment_change(therapist_id), and those counters are re-read
+(one _id $in lookup) before the next ranking.
+Therapist profile writes call invalidate_matching_index(). The index is
+also rebuilt every MATCHING_INDEX_TTL_SECONDS, which is how other workers
+pick up changes.
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from flask import current_app
+
+from wellbeing import mongo, logger
+
+# Optional vectorized scoring
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+DEFAULT_MAX_STUDENTS = 20
+CRISIS_LEVELS = ('high', 'critical')
+
+
+def match_score(therapist: dict, caseload: int, specialization: Optional[str] = None,
+                gender: Optional[str] = None, crisis: bool = False) -> int:
+    """Score one therapist (the reference for the vectorized pass, and its fallback)."""
+    score = 0
+    if specialization and specialization in (therapist.get('specializations') or []):
+        score += 10
+    if crisis and therapist.get('emergency_hours'):
+        score += 15
+    if caseload < (therapist.get('max_students') or DEFAULT_MAX_STUDENTS) * 0.7:
+        score += 5
+    if (therapist.get('total_sessions') or 0) > 100:
+        score += 3
+    rating = therapist.get('rating') or 0
+    if rating >= 4.5:
+        score += 5
+    elif rating >= 4.0:
+        score += 3
+    if gender and therapist.get('gender') == gender:
+        score += 5
+    return score
+
+
+class MatchingIndex:
+    """Column snapshot of the active therapist pool."""
+
+    def __init__(self, therapists: List[dict]):
+        self.therapists = therapists
+        self.rows = {therapist['_id']: row for row, therapist in enumerate(therapists)}
+        caseload = [int(therapist.get('current_students') or 0) for therapist in therapists]
+        if not NUMPY_AVAILABLE:
+            self.caseload = caseload
+            return
+
+        count = len(therapists)
+        self.caseload = np.array(caseload, dtype=np.int64)
+        self.max_students = np.array([t.get('max_students') or DEFAULT_MAX_STUDENTS for t in therapists],
+                                     dtype=np.int64)
+        self.emergency = np.array([bool(t.get('emergency_hours')) for t in therapists], dtype=bool)
+        self.rating = np.array([float(t.get('rating') or 0) for t in therapists])
+        self.sessions = np.array([t.get('total_sessions') or 0 for t in therapists], dtype=np.int64)
+        genders = [t.get('gender') or '' for t in therapists]
+        self.gender_codes = {gender: code for code, gender in enumerate(sorted(set(genders)))}
+        self.gender = np.array([self.gender_codes[g] for g in genders], dtype=np.int64)
+        self.specializations: Dict[str, 'np.ndarray'] = {}
+        for row, therapist in enumerate(therapists):
+            for specialization in therapist.get('specializations') or []:
+                column = self.specializations.setdefault(specialization, np.zeros(count, dtype=bool))
+                column[row] = True
+        # Position of each id in string order: the final tie-break
+        order = sorted(range(count), key=lambda row: str(therapists[row]['_id']))
+        self.id_rank = np.empty(count, dtype=np.int64)
+        self.id_rank[order] = np.arange(count)
+
+    def set_caseloads(self, caseloads: Dict[object, int]):
+        """Replace the caseloads of some therapists (copy-on-write, safe for concurrent readers)."""
+        updated = self.caseload.copy() if NUMPY_AVAILABLE else list(self.caseload)
+        for therapist_id, row in self.rows.items():
+            if therapist_id in caseloads:
+                updated[row] = caseloads[therapist_id]
+        self.caseload = updated
+
+    def rank(self, specialization: Optional[str] = None, require_specialization: bool = False,
+             gender: Optional[str] = None, require_gender: bool = False,
+             crisis: bool = False, require_emergency: bool = False,
+             require_capacity: bool = True, exclude: Iterable = (),
+             limit: Optional[int] = None) -> List[dict]:
+        """
+        Therapist documents passing the filters, best match first.
+
+        Args:
+            specialization / gender / crisis: What the score rewards
+            require_*: Turn the matching criterion into a filter
+            require_capacity: Skip therapists at max_students
+            exclude: Therapist ids to leave out
+        """
+        if not self.therapists:
+            return []
+        if not NUMPY_AVAILABLE:
+            return self._rank_rows(specialization, require_specialization, gender, require_gender,
+                                   crisis, require_emergency, require_capacity, exclude, limit)
+
+        count = len(self.therapists)
+        caseload = self.caseload
+        no_match = np.zeros(count, dtype=bool)
+        spec = self.specializations.get(specialization, no_match) if specialization else no_match
+        gender_match = (self.gender == self.gender_codes[gender]) if gender in self.gender_codes else no_match
+
+        score = (
+            10 * spec
+            + (15 * self.emergency if crisis else 0)
+            + 5 * (caseload < self.max_students * 0.7)
+            + 3 * (self.sessions > 100)
+            + np.where(self.rating >= 4.5, 5, np.where(self.rating >= 4.0, 3, 0))
+            + (5 * gender_match if gender else 0)
+        )
+
+        mask = np.ones(count, dtype=bool)
+        if require_specialization and specialization:
+            mask &= spec
+        if require_gender and gender:
+            mask &= gender_match
+        if require_emergency:
+            mask &= self.emergency
+        if require_capacity:
+            mask &= caseload < self.max_students
+        for therapist_id in exclude:
+            row = self.rows.get(therapist_id)
+            if row is not None:
+                mask[row] = False
+
+        rows = np.flatnonzero(mask)
+        # lexsort: last key is primary
+        rows = rows[np.lexsort((self.id_rank[rows], caseload[rows], -score[rows]))]
+        if limit is not None:
+            rows = rows[:limit]
+        return [self.therapists[row] for row in rows]
+
+    def _rank_rows(self, specialization, require_specialization, gender, require_gender,
+                   crisis, require_emergency, require_capacity, exclude, limit) -> List[dict]:
+        """rank() without NumPy: the same filters and order, one row at a time."""
+        excluded = set(exclude)
+        ranked = []
+        for row, therapist in enumerate(self.therapists):
+            caseload = self.caseload[row]
+            if therapist['_id'] in excluded:
+                continue
+            if require_specialization and specialization and \
+                    specialization not in (therapist.get('specializations') or []):
+                continue
+            if require_gender and gender and therapist.get('gender') != gender:
+                continue
+            if require_emergency and not therapist.get('emergency_hours'):
+                continue
+            if require_capacity and caseload >= (therapist.get('max_students') or DEFAULT_MAX_STUDENTS):
+                continue
+            score = match_score(therapist, caseload, specialization, gender, crisis)
+            ranked.append((-score, caseload, str(therapist['_id']), row))
+        ranked.sort()
+        return [self.therapists[row] for *_, row in ranked[:limit]]
+
+
+class MatchingIndexManager:
+    """Builds the index, applies change notifications and expires it."""
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._index: Optional[MatchingIndex] = None
+        self._built_at = 0.0
+        self._dirty: set = set()
+        self._refresh_all = False
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Rebuild from the therapists collection before the next ranking."""
+        with self._lock:
+            self._index = None
+
+    def notify_assignment_change(self, *therapist_ids):
+        """Re-read these therapists' caseloads (all of them if none are given) before the next ranking."""
+        with self._lock:
+            if therapist_ids:
+                self._dirty.update(therapist_id for therapist_id in therapist_ids if therapist_id is not None)
+            else:
+                self._refresh_all = True
+
+    def get_index(self) -> MatchingIndex:
+        # Import here to avoid circular imports (caseload writes notify this module)
+        from wellbeing.services.caseload import get_caseloads
+
+        with self._lock:
+            if self._index is None or time.monotonic() - self._built_at > self.ttl_seconds:
+                therapists = list(mongo.db.therapists.find({'status': 'active'}))
+                self._index = MatchingIndex(therapists)
+                self._built_at = time.monotonic()
+                self._dirty.clear()
+                self._refresh_all = False
+            elif self._refresh_all or self._dirty:
+                ids = self._index.rows if self._refresh_all else self._dirty
+                self._index.set_caseloads(get_caseloads(ids))
+                self._dirty.clear()
+                self._refresh_all = False
+            return self._index
+
+    def rank(self, **criteria) -> List[dict]:
+        return self.get_index().rank(**criteria)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_matching_index() -> MatchingIndexManager:
+    """Get the process-wide matching index."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = MatchingIndexManager(
+                    ttl_seconds=current_app.config.get('MATCHING_INDEX_TTL_SECONDS', 300)
+                )
+    return _manager
+
+
+def notify_assignment_change(*therapist_ids):
+    """
+    Mark therapists' caseloads stale after an assignment write.
+
+    Safe without an app context; a no-op until the index has been built.
+    """
+    if _manager is None:
+        return
+    try:
+        _manager.notify_assignment_change(*therapist_ids)
+    except Exception as e:
+        logger.error(f"Error notifying matching index: {e}")
+
+
+def invalidate_matching_index():
+    """Rebuild the index after a therapist document changes."""
+    if _manager is not None:
+        _manager.invalidate()
+
+
+def rank_therapists(specialization: Optional[str] = None, gender: Optional[str] = None,
+                    crisis_level: Optional[str] = None, **filters) -> List[dict]:
+    """
+    Rank the active pool for a student's needs.
+
+    gender 'no_preference' counts as no preference; filters are passed to
+    MatchingIndex.rank (require_specialization, require_capacity, ...).
+    """
+    if gender == 'no_preference':
+        gender = None
+    return get_matching_index().rank(specialization=specialization, gender=gender,
+                                     crisis=crisis_level in CRISIS_LEVELS, **filters)
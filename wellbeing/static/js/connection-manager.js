@@ -286,12 +286,17 @@ class ConnectionManager {
         }
     }
     
-    async loadMessages(limit = 50, offset = 0) {
+    async loadMessages(limit = 50, cursor = null) {
         try {
-            const response = await fetch(`${this.apiBase}/get-messages?limit=${limit}&offset=${offset}&student_id=${this.studentId}&therapist_id=${this.therapistId}`);
+            // cursor: next_cursor from the previous page, for older messages
+            const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+            const response = await fetch(`${this.apiBase}/get-messages?limit=${limit}${cursorParam}&student_id=${this.studentId}&therapist_id=${this.therapistId}`);
             const data = await response.json();
             
             if (data.messages) {
+                if (!cursor) {
+                    this.markMessagesRead();
+                }
                 return data;
             } else {
                 throw new Error(data.error || 'Failed to load messages');
@@ -299,7 +304,22 @@ class ConnectionManager {
             
         } catch (error) {
             console.error('Failed to load messages:', error);
-            return { messages: [], total_count: 0, has_more: false };
+            return { messages: [], total_count: 0, has_more: false, next_cursor: null };
+        }
+    }
+    
+    async markMessagesRead() {
+        try {
+            await fetch(`${this.apiBase}/mark-messages-read`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    student_id: this.studentId,
+                    therapist_id: this.therapistId
+                })
+            });
+        } catch (error) {
+            console.error('Failed to mark messages read:', error);
         }
     }
     
@@ -7,9 +7,16 @@ from typing import Dict, List, Tuple, Optional
 from bson.objectid import ObjectId
 import hashlib
 
+from wellbeing.utils import keyword_matcher
+from wellbeing.utils.keyword_matcher import KeywordHit
+
 # Import these after creating the file
 try:
     from wellbeing import mongo, logger
+    from wellbeing.utils.write_behind import write_behind
+    from wellbeing.models.notification import create_notification
+    from wellbeing.models.therapist_chat import insert_therapist_chat
+    from wellbeing.services.dashboard_service import invalidate_appointment_dashboard
     from textblob import TextBlob
 except ImportError:
     # For development/testing
@@ -20,46 +27,15 @@ except ImportError:
 class AutomatedModerator:
     """Fully automated message moderation with minimal human intervention"""
     
+    # Keyword tables live in keyword_matcher so every scanner shares one automaton
     # Enhanced profanity filter with severity levels
-    PROFANITY_CONFIG = {
-        'mild': ['damn', 'hell', 'crap', 'stupid'],
-        'moderate': ['shit', 'bitch', 'asshole', 'idiot'],
-        'severe': ['fuck', 'fucking', 'cunt']  # Add more as needed
-    }
+    PROFANITY_CONFIG = keyword_matcher.PROFANITY_CONFIG
     
     # Crisis keywords with confidence levels
-    CRISIS_INDICATORS = {
-        'high_confidence': [
-            'i want to die', 'kill myself', 'suicide', 'end my life',
-            'not worth living', 'better off dead', 'want to disappear',
-            'take my own life', 'end it all'
-        ],
-        'medium_confidence': [
-            'hurt myself', 'self harm', 'cutting', 'overdose',
-            'can\'t go on', 'give up', 'no point', 'want to die',
-            'life is meaningless', 'nothing matters'
-        ],
-        'low_confidence': [
-            'depressed', 'hopeless', 'worthless', 'empty inside',
-            'feel terrible', 'can\'t take it', 'very sad'
-        ]
-    }
+    CRISIS_INDICATORS = keyword_matcher.CRISIS_INDICATORS
     
     # Boundary violations with auto-actions
-    BOUNDARY_VIOLATIONS = {
-        'block_immediately': [
-            'personal phone number', 'my address is', 'meet me at',
-            'sexual', 'romantic feelings', 'in love with you',
-            'date me', 'kiss you', 'sleep with'
-        ],
-        'filter_and_warn': [
-            'personal email', 'social media', 'outside appointment',
-            'personal life', 'dating', 'phone number', 'home address'
-        ],
-        'log_only': [
-            'friend', 'personal', 'outside therapy', 'after work'
-        ]
-    }
+    BOUNDARY_VIOLATIONS = keyword_matcher.BOUNDARY_VIOLATIONS
     
     @staticmethod
     def moderate_message(message: str, sender_type: str, sender_id: str, recipient_id: str) -> Dict:
@@ -111,8 +87,15 @@ class AutomatedModerator:
         elif spam_score > 0.5:
             result['flags'].append('potential_spam')
         
+        # One pass over the message for crisis, profanity and boundary keywords
+        keyword_hits = keyword_matcher.scan(message, {
+            keyword_matcher.GROUP_CRISIS_INDICATOR,
+            keyword_matcher.GROUP_PROFANITY,
+            keyword_matcher.GROUP_BOUNDARY
+        })
+        
         # 5. Crisis detection (automatic escalation)
-        crisis_level, crisis_confidence = AutomatedModerator._detect_crisis_automated(message)
+        crisis_level, crisis_confidence = AutomatedModerator._detect_crisis_automated(message, keyword_hits)
         if crisis_level != 'none':
             result['flags'].append(f'crisis_{crisis_level}')
             result['escalation_level'] = crisis_level
@@ -124,7 +107,7 @@ class AutomatedModerator:
                 result['auto_response'] = "Your message indicates you may need immediate support. Your therapist has been notified and will prioritize your message."
             
         # 6. Profanity filtering (automatic)
-        filtered_message, profanity_level = AutomatedModerator._filter_profanity_automated(message)
+        filtered_message, profanity_level = AutomatedModerator._filter_profanity_automated(message, keyword_hits)
         if profanity_level:
             result['filtered_message'] = filtered_message
             result['flags'].append(f'profanity_{profanity_level}')
@@ -132,7 +115,7 @@ class AutomatedModerator:
                 result['action'] = 'filter'
         
         # 7. Boundary violation detection (automatic actions)
-        boundary_action, boundary_flags = AutomatedModerator._check_boundaries_automated(message, sender_type)
+        boundary_action, boundary_flags = AutomatedModerator._check_boundaries_automated(message, sender_type, keyword_hits)
         if boundary_action == 'block':
             result['action'] = 'block'
             result['flags'].extend(boundary_flags)
@@ -259,20 +242,18 @@ class AutomatedModerator:
         return min(spam_score, 1.0)
     
     @staticmethod
-    def _detect_crisis_automated(message: str) -> Tuple[str, float]:
+    def _detect_crisis_automated(message: str, hits: Optional[List[KeywordHit]] = None) -> Tuple[str, float]:
         """Automated crisis detection with confidence levels"""
-        message_lower = message.lower()
+        if hits is None:
+            hits = keyword_matcher.scan(message, {keyword_matcher.GROUP_CRISIS_INDICATOR})
+        group = keyword_matcher.GROUP_CRISIS_INDICATOR
         
         # High confidence crisis indicators
-        for indicator in AutomatedModerator.CRISIS_INDICATORS['high_confidence']:
-            if indicator in message_lower:
-                return 'critical', 0.95
+        if keyword_matcher.distinct_keywords(hits, group, 'high_confidence'):
+            return 'critical', 0.95
         
         # Medium confidence indicators
-        medium_count = 0
-        for indicator in AutomatedModerator.CRISIS_INDICATORS['medium_confidence']:
-            if indicator in message_lower:
-                medium_count += 1
+        medium_count = len(keyword_matcher.distinct_keywords(hits, group, 'medium_confidence'))
         
         if medium_count >= 2:
             return 'high', 0.8
@@ -280,10 +261,7 @@ class AutomatedModerator:
             return 'medium', 0.6
         
         # Low confidence indicators
-        low_count = 0
-        for indicator in AutomatedModerator.CRISIS_INDICATORS['low_confidence']:
-            if indicator in message_lower:
-                low_count += 1
+        low_count = len(keyword_matcher.distinct_keywords(hits, group, 'low_confidence'))
         
         if low_count >= 3:
             return 'medium', 0.5
@@ -293,49 +271,54 @@ class AutomatedModerator:
         return 'none', 0.0
     
     @staticmethod
-    def _filter_profanity_automated(message: str) -> Tuple[str, str]:
+    def _filter_profanity_automated(message: str, hits: Optional[List[KeywordHit]] = None) -> Tuple[str, str]:
         """Automatic profanity filtering with severity levels"""
-        filtered_message = message
+        if hits is None:
+            hits = keyword_matcher.scan(message, {keyword_matcher.GROUP_PROFANITY})
+        profanity_hits = [hit for hit in hits if hit.group == keyword_matcher.GROUP_PROFANITY]
+        
         detected_level = None
+        levels = {hit.category for hit in profanity_hits}
+        for level in ('severe', 'moderate', 'mild'):
+            if level in levels:
+                detected_level = level
+                break
         
-        # Check each severity level
-        for level, words in AutomatedModerator.PROFANITY_CONFIG.items():
-            for word in words:
-                pattern = r'\b' + re.escape(word) + r'\b'
-                if re.search(pattern, message, re.IGNORECASE):
-                    if level == 'severe':
-                        filtered_message = re.sub(pattern, '[filtered]', filtered_message, flags=re.IGNORECASE)
-                        detected_level = 'severe'
-                    elif level == 'moderate' and detected_level != 'severe':
-                        filtered_message = re.sub(pattern, '*' * len(word), filtered_message, flags=re.IGNORECASE)
-                        detected_level = 'moderate'
-                    elif level == 'mild' and not detected_level:
-                        detected_level = 'mild'
+        # Replace right-to-left so earlier spans stay valid
+        filtered_message = message
+        for hit in sorted(profanity_hits, key=lambda h: h.start, reverse=True):
+            if hit.category == 'severe':
+                replacement = '[filtered]'
+            elif hit.category == 'moderate':
+                replacement = '*' * (hit.end - hit.start)
+            else:
+                continue
+            filtered_message = filtered_message[:hit.start] + replacement + filtered_message[hit.end:]
         
         return filtered_message, detected_level
     
     @staticmethod
-    def _check_boundaries_automated(message: str, sender_type: str) -> Tuple[str, List[str]]:
+    def _check_boundaries_automated(message: str, sender_type: str,
+                                    hits: Optional[List[KeywordHit]] = None) -> Tuple[str, List[str]]:
         """Automatic boundary violation detection with actions"""
-        message_lower = message.lower()
+        if hits is None:
+            hits = keyword_matcher.scan(message, {keyword_matcher.GROUP_BOUNDARY})
+        group = keyword_matcher.GROUP_BOUNDARY
         flags = []
         
         # Check for immediate blocking violations
-        for violation in AutomatedModerator.BOUNDARY_VIOLATIONS['block_immediately']:
-            if violation in message_lower:
-                flags.append('boundary_violation_severe')
-                return 'block', flags
+        if keyword_matcher.distinct_keywords(hits, group, 'block_immediately'):
+            flags.append('boundary_violation_severe')
+            return 'block', flags
         
         # Check for filter violations
-        for violation in AutomatedModerator.BOUNDARY_VIOLATIONS['filter_and_warn']:
-            if violation in message_lower:
-                flags.append('boundary_violation_moderate')
-                return 'filter', flags
+        if keyword_matcher.distinct_keywords(hits, group, 'filter_and_warn'):
+            flags.append('boundary_violation_moderate')
+            return 'filter', flags
         
         # Check for logging violations
-        for violation in AutomatedModerator.BOUNDARY_VIOLATIONS['log_only']:
-            if violation in message_lower:
-                flags.append('boundary_violation_mild')
+        for _ in keyword_matcher.distinct_keywords(hits, group, 'log_only'):
+            flags.append('boundary_violation_mild')
         
         return 'allow', flags
     
@@ -400,7 +383,7 @@ class AutomatedModerator:
             mongo.db.crisis_alerts.insert_one(crisis_alert)
             
             # Immediately notify therapist
-            mongo.db.notifications.insert_one({
+            create_notification({
                 'user_id': ObjectId(recipient_id),
                 'type': 'crisis_alert_urgent',
                 'message': f'URGENT: Crisis indicators detected in student message. Immediate attention required.',
@@ -449,9 +432,10 @@ class AutomatedModerator:
             }
             
             result = mongo.db.appointments.insert_one(emergency_appointment)
+            invalidate_appointment_dashboard(emergency_appointment)
             
             # Notify both parties
-            mongo.db.notifications.insert_one({
+            create_notification({
                 'user_id': ObjectId(student_id),
                 'type': 'emergency_session_scheduled',
                 'message': f'An emergency session has been scheduled for {emergency_time.strftime("%I:%M %p")} today. Your therapist will contact you.',
@@ -459,7 +443,7 @@ class AutomatedModerator:
                 'created_at': datetime.datetime.now()
             })
             
-            mongo.db.notifications.insert_one({
+            create_notification({
                 'user_id': ObjectId(therapist_id),
                 'type': 'emergency_session_scheduled',
                 'message': f'Emergency session auto-scheduled for {emergency_time.strftime("%I:%M %p")} due to crisis detection.',
@@ -493,7 +477,7 @@ class AutomatedModerator:
                 'timestamp': datetime.datetime.now()
             }
             
-            mongo.db.automated_moderation_log.insert_one(log_entry)
+            write_behind('automated_moderation_log', log_entry)
         except Exception as e:
             if logger:
                 logger.error(f"Error logging moderation action: {e}")
@@ -540,15 +524,15 @@ def send_auto_moderated_message(sender_id: str, recipient_id: str, message: str,
         }
         
         # Save message
-        result = mongo.db.therapist_chats.insert_one(message_data)
-        message_id = str(result.inserted_id)
+        inserted_id = insert_therapist_chat(message_data)
+        message_id = str(inserted_id)
         
         # Create notification for recipient
-        mongo.db.notifications.insert_one({
+        create_notification({
             'user_id': ObjectId(recipient_id),
             'type': 'new_message',
             'message': f'You have a new message from your {sender_type}',
-            'related_id': result.inserted_id,
+            'related_id': inserted_id,
             'read': False,
             'created_at': datetime.datetime.now()
         })
@@ -0,0 +1,207 @@
+# wellbeing/utils/availability.py
+# Therapist availability engine: booked intervals in sorted arrays, queried with bisect
+
+import bisect
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from wellbeing import mongo
+
+# Appointment statuses that occupy the therapist's calendar
+BOOKED_STATUSES = ['confirmed', 'suggested']
+
+DEFAULT_APPOINTMENT_MINUTES = 60
+
+# Used when a therapist document has no working_hours
+DEFAULT_WORKING_HOURS = {
+    'monday': [(9, 17)],
+    'tuesday': [(9, 17)],
+    'wednesday': [(9, 17)],
+    'thursday': [(9, 17)],
+    'friday': [(9, 17)],
+    'saturday': [],
+    'sunday': []
+}
+
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+Interval = Tuple[datetime, datetime]
+
+
+class BookedIntervals:
+    """
+    A therapist's booked time as sorted, non-overlapping [start, end) intervals.
+
+    Overlapping or touching bookings are merged, so both the start and the
+    end arrays are sorted and the only interval that can overlap a query
+    [a, b) is the last one starting before b: one bisect per check.
+    """
+
+    def __init__(self, intervals: Iterable[Interval] = ()):
+        self._starts: List[datetime] = []
+        self._ends: List[datetime] = []
+        for start, end in sorted(intervals):
+            if self._ends and start <= self._ends[-1]:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    @classmethod
+    def from_appointments(cls, appointments: Iterable[dict],
+                          default_minutes: int = DEFAULT_APPOINTMENT_MINUTES) -> 'BookedIntervals':
+        """Intervals for appointment documents (datetime plus optional duration in minutes)."""
+        return cls(appointment_interval(apt, default_minutes) for apt in appointments if apt.get('datetime'))
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __iter__(self) -> Iterator[Interval]:
+        return iter(zip(self._starts, self._ends))
+
+    def add(self, start: datetime, end: datetime):
+        """Book [start, end), merging with any intervals it overlaps or touches."""
+        lo = bisect.bisect_left(self._ends, start)   # first interval ending at/after start
+        hi = bisect.bisect_right(self._starts, end)  # intervals starting at/before end
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+
+    def overlapping(self, start: datetime, end: datetime) -> Optional[Interval]:
+        """The booked interval overlapping [start, end), or None if it is free."""
+        index = bisect.bisect_left(self._starts, end) - 1
+        if index >= 0 and self._ends[index] > start:
+            return self._starts[index], self._ends[index]
+        return None
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        return self.overlapping(start, end) is None
+
+
+def appointment_interval(appointment: dict, default_minutes: int = DEFAULT_APPOINTMENT_MINUTES) -> Interval:
+    """[start, end) of an appointment document."""
+    start = appointment['datetime']
+    minutes = appointment.get('duration') or default_minutes
+    try:
+        minutes = int(minutes)
+    except (TypeError, ValueError):
+        minutes = default_minutes
+    return start, start + timedelta(minutes=minutes)
+
+
+def load_appointments_by_therapist(therapist_ids: Iterable, since: datetime,
+                                   until: Optional[datetime] = None) -> Dict[object, List[dict]]:
+    """
+    Booked appointments (datetime and duration only) for several
+    therapists from one $in query, grouped by therapist_id.
+
+    Every requested id gets an entry, keyed by the id as passed in.
+    """
+    therapist_ids = list(therapist_ids)
+    # Appointments that started up to a session ago may still be running
+    window = {'$gte': since - timedelta(minutes=DEFAULT_APPOINTMENT_MINUTES)}
+    if until is not None:
+        window['$lt'] = until
+    appointments = mongo.db.appointments.find({
+        'therapist_id': {'$in': therapist_ids},
+        'status': {'$in': BOOKED_STATUSES},
+        'datetime': window
+    }, {'therapist_id': 1, 'datetime': 1, 'duration': 1})
+
+    by_therapist: Dict[object, list] = {therapist_id: [] for therapist_id in therapist_ids}
+    for appointment in appointments:
+        by_therapist.setdefault(appointment['therapist_id'], []).append(appointment)
+    return by_therapist
+
+
+def load_booked_intervals(therapist_ids: Iterable, since: datetime,
+                          until: Optional[datetime] = None) -> Dict[object, BookedIntervals]:
+    """Booked intervals for several therapists from one $in query (an empty calendar if nothing is booked)."""
+    return {
+        therapist_id: BookedIntervals.from_appointments(appointments)
+        for therapist_id, appointments in load_appointments_by_therapist(therapist_ids, since, until).items()
+    }
+
+
+def _to_time(value) -> time:
+    """time for an hour (9, 17.5) or an 'HH:MM' string."""
+    if isinstance(value, str):
+        return datetime.strptime(value, '%H:%M').time()
+    hours = float(value)
+    if hours >= 24:
+        return time.max
+    return time(int(hours), int(round((hours - int(hours)) * 60)))
+
+
+def _day_ranges(day_hours) -> List[Tuple[time, time]]:
+    """
+    Working ranges for one day.
+
+    Accepts the scheduler's [(9, 17), ...] pairs and the older
+    {'start': '09:00', 'end': '17:00'} availability documents.
+    """
+    if not day_hours:
+        return []
+    if isinstance(day_hours, dict):
+        day_hours = [(day_hours.get('start'), day_hours.get('end'))]
+    return [(_to_time(start), _to_time(end)) for start, end in day_hours if start is not None and end is not None]
+
+
+def working_windows(working_hours: Optional[dict], start: datetime, end: datetime) -> Iterator[Interval]:
+    """Working [start, end) windows between two datetimes, in order."""
+    working_hours = working_hours if working_hours is not None else DEFAULT_WORKING_HOURS
+    day = start.date()
+    while day <= end.date():
+        for range_start, range_end in sorted(_day_ranges(working_hours.get(DAY_NAMES[day.weekday()]))):
+            window_start = datetime.combine(day, range_start)
+            window_end = datetime.combine(day, range_end)
+            if window_end > start and window_start < end:
+                yield window_start, window_end
+        day += timedelta(days=1)
+
+
+def iter_free_slots(booked: BookedIntervals, working_hours: Optional[dict],
+                    start: datetime, end: datetime,
+                    slot: timedelta = timedelta(minutes=DEFAULT_APPOINTMENT_MINUTES),
+                    buffer: timedelta = timedelta(0),
+                    step: Optional[timedelta] = None) -> Iterator[datetime]:
+    """
+    Free slot start times between start and end, earliest first.
+
+    Slots are aligned to the start of each working window every step
+    (default: the slot length), must fit inside the window, and need
+    buffer clear on both sides. A candidate that hits a booking jumps to
+    the first aligned time after it, so each slot yielded or booking
+    skipped costs one bisect rather than a scan of the calendar.
+    """
+    step = step or slot
+    for window_start, window_end in working_windows(working_hours, start, end):
+        candidate = _align(max(window_start, start), window_start, step)
+        while candidate + slot <= window_end:
+            hit = booked.overlapping(candidate - buffer, candidate + slot + buffer)
+            if hit is None:
+                yield candidate
+                candidate += step
+            else:
+                candidate = _align(hit[1] + buffer, window_start, step)
+
+
+def next_free_slots(booked: BookedIntervals, working_hours: Optional[dict],
+                    start: datetime, end: datetime, count: int, **options) -> List[datetime]:
+    """The first count free slots (see iter_free_slots)."""
+    slots = []
+    for slot_start in iter_free_slots(booked, working_hours, start, end, **options):
+        slots.append(slot_start)
+        if len(slots) >= count:
+            break
+    return slots
+
+
+def _align(moment: datetime, origin: datetime, step: timedelta) -> datetime:
+    """The first origin + k * step at or after moment."""
+    if moment <= origin:
+        return origin
+    steps = -((origin - moment) // step)  # ceiling division
+    return origin + steps * step
@@ -0,0 +1,104 @@
+# wellbeing/utils/batch_loader.py
+# Request-scoped batch loading of documents by _id (DataLoader-style)
+
+from typing import Dict, Iterable, Optional, Tuple
+
+from bson.objectid import ObjectId
+from flask import g, has_app_context
+
+from wellbeing import mongo
+
+# Loader name -> collections tried in order. 'people' follows the
+# users-then-students fallback the therapist views use for student records.
+LOADER_COLLECTIONS = {
+    'users': ('users',),
+    'people': ('users', 'students'),
+    'therapists': ('therapists',),
+}
+
+
+def _normalize_id(value):
+    """ObjectId for anything that looks like one; other ids are kept as-is."""
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return value
+
+
+class BatchLoader:
+    """
+    Loads documents by _id with one $in query per collection.
+
+    Views prime() every id they will need before their loop, then call
+    load() per row; each id is fetched at most once and remembered
+    (including misses) for the loader's lifetime, which is one request.
+    """
+
+    def __init__(self, collections: Tuple[str, ...], projection: Optional[dict] = None):
+        self.collections = collections
+        self.projection = projection
+        self._cache: Dict[object, Optional[dict]] = {}
+        self._pending = set()
+        self.queries = 0
+
+    def prime(self, ids: Iterable):
+        """Queue ids for the next batch."""
+        for value in ids:
+            if value is None:
+                continue
+            key = _normalize_id(value)
+            if key not in self._cache:
+                self._pending.add(key)
+        return self
+
+    def _dispatch(self):
+        missing = set(self._pending)
+        self._pending.clear()
+        for collection in self.collections:
+            if not missing:
+                break
+            self.queries += 1
+            for doc in mongo.db[collection].find({'_id': {'$in': list(missing)}}, self.projection):
+                self._cache[doc['_id']] = doc
+                missing.discard(doc['_id'])
+        for key in missing:
+            self._cache[key] = None
+
+    def load(self, value) -> Optional[dict]:
+        """The document for one id (None if no collection has it)."""
+        if value is None:
+            return None
+        key = _normalize_id(value)
+        if key not in self._cache:
+            # Resolve everything primed so far in the same round trip
+            self._pending.add(key)
+            self._dispatch()
+        return self._cache.get(key)
+
+    def load_many(self, ids: Iterable) -> Dict[object, Optional[dict]]:
+        """{id: document or None} for several ids, in one batch."""
+        ids = list(ids)
+        self.prime(ids)
+        if self._pending:
+            self._dispatch()
+        return {value: self._cache.get(_normalize_id(value)) for value in ids if value is not None}
+
+
+def get_loader(name: str) -> BatchLoader:
+    """
+    The current request's loader for a LOADER_COLLECTIONS entry.
+
+    Outside an app context (scripts, scheduler jobs) a fresh loader is
+    returned, so batching still works within one call site.
+    """
+    if not has_app_context():
+        return BatchLoader(LOADER_COLLECTIONS[name])
+    loaders = g.setdefault('_batch_loaders', {})
+    loader = loaders.get(name)
+    if loader is None:
+        loader = loaders[name] = BatchLoader(LOADER_COLLECTIONS[name])
+    return loader
+
+
+def prime(name: str, ids: Iterable) -> BatchLoader:
+    """Shortcut: queue ids on the request's loader and return it."""
+    return get_loader(name).prime(ids)
@@ -3,6 +3,7 @@
 
 from datetime import datetime, timedelta, timezone
 from wellbeing import mongo, logger
+from wellbeing.utils.write_behind import write_behind
 from typing import Dict, List, Optional
 from bson.objectid import ObjectId
 import json
@@ -26,7 +27,7 @@ class ConnectionMonitor:
                 'user_agent': request.headers.get('User-Agent', 'unknown') if request else 'unknown'
             }
             
-            mongo.db.connection_logs.insert_one(log_entry)
+            write_behind('connection_logs', log_entry)
             
         except Exception as e:
             logger.error(f"Failed to log connection event: {str(e)}")
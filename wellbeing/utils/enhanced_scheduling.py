@@ -7,15 +7,19 @@ from flask import session, request, jsonify, flash, Blueprint
 import uuid
 
 from wellbeing.extensions import mongo, logger, socketio
+from wellbeing.models.notification import create_notification, create_notifications
+from wellbeing.services.dashboard_service import invalidate_dashboard
 from wellbeing.utils.scheduling import (
-    get_therapist_available_slots,
     auto_schedule_best_time,
-    schedule_appointment_automatically
+    schedule_appointment_automatically,
+    slot_data
 )
 from wellbeing.utils.mental_health import (
     detect_crisis_level,
-    assign_therapist_immediately
+    assign_therapist_immediately,
+    candidate_therapists
 )
+from wellbeing.services.slot_search import find_earliest_slot, next_slots_by_therapist
 
 # Socket.IO for real-time updates (if available)
 try:
@@ -137,7 +141,7 @@ class EnhancedAppointmentManager:
                 }
             ]
             
-            mongo.db.notifications.insert_many(notifications)
+            create_notifications(notifications)
             
         except Exception as e:
             logger.error(f"Error sending real-time appointment notifications: {str(e)}")
@@ -183,35 +187,38 @@ class CrisisSchedulingManager:
             crisis_level = crisis_result['level']
             
             if crisis_level in ['high', 'critical']:
-                # Use your existing therapist assignment
-                therapist = assign_therapist_immediately(intake_data)
+                # Earliest slot across every suitable therapist, from one batched load
+                match = find_earliest_slot(candidate_therapists(intake_data, crisis_level), crisis_level=crisis_level)
                 
-                if therapist:
+                if match:
+                    therapist = match.candidate.therapist
+                    
                     # Send immediate real-time alert to therapist
                     CrisisSchedulingManager._send_crisis_alert(user_id, therapist, crisis_level, intake_data)
                     
-                    # Use enhanced scheduling with real-time updates
-                    available_slots = get_therapist_available_slots(therapist, crisis_level=crisis_level)
+                    # Schedule immediately with real-time notifications
+                    appointment_id, appointment_doc, zoom_success = EnhancedAppointmentManager.create_appointment_with_zoom_and_notifications(
+                        user_id, therapist, slot_data(match.datetime, crisis_level), crisis_level, 'crisis'
+                    )
                     
-                    if available_slots:
-                        # Schedule immediately with real-time notifications
-                        appointment_id, appointment_doc, zoom_success = EnhancedAppointmentManager.create_appointment_with_zoom_and_notifications(
-                            user_id, therapist, available_slots[0], crisis_level, 'crisis'
+                    if appointment_id:
+                        # Additional crisis-specific notifications
+                        CrisisSchedulingManager._send_crisis_scheduled_notifications(
+                            appointment_id, appointment_doc, user_id, therapist, crisis_level
                         )
                         
-                        if appointment_id:
-                            # Additional crisis-specific notifications
-                            CrisisSchedulingManager._send_crisis_scheduled_notifications(
-                                appointment_id, appointment_doc, user_id, therapist, crisis_level
-                            )
-                            
-                            return {
-                                'success': True,
-                                'appointment_id': appointment_id,
-                                'therapist': therapist,
-                                'crisis_level': crisis_level,
-                                'immediate_scheduling': True
-                            }
+                        return {
+                            'success': True,
+                            'appointment_id': appointment_id,
+                            'therapist': therapist,
+                            'crisis_level': crisis_level,
+                            'immediate_scheduling': True
+                        }
+                else:
+                    # No open slot anywhere: still alert the best-placed therapist
+                    therapist = assign_therapist_immediately(intake_data, crisis_level)
+                    if therapist:
+                        CrisisSchedulingManager._send_crisis_alert(user_id, therapist, crisis_level, intake_data)
             
             # Fall back to your existing non-crisis scheduling
             return CrisisSchedulingManager._handle_normal_intake_scheduling(intake_data, user_id)
@@ -242,7 +249,7 @@ class CrisisSchedulingManager:
                 }, room=f"therapist_{therapist_id}")
             
             # High-priority database notification
-            mongo.db.notifications.insert_one({
+            create_notification({
                 'user_id': therapist['_id'],
                 'type': 'crisis_alert',
                 'message': f'URGENT: Crisis-level student requires immediate attention',
@@ -352,6 +359,7 @@ class EnhancedReschedulingManager:
                     }
                 }
             )
+            invalidate_dashboard(student_id, 'appointments')
             
             if result.modified_count > 0:
                 # Send real-time updates
@@ -390,15 +398,16 @@ class EnhancedReschedulingManager:
             if alternative_therapists:
                 # Create alternative options with real-time scheduling
                 alternatives = []
+                next_slots = next_slots_by_therapist(alternative_therapists[:3])
                 for alt_therapist in alternative_therapists[:3]:
-                    alt_slots = get_therapist_available_slots(alt_therapist, crisis_level='normal')
-                    if alt_slots:
+                    alt_slot = next_slots.get(alt_therapist['_id'])
+                    if alt_slot:
                         alternatives.append({
                             'therapist_id': str(alt_therapist['_id']),
                             'therapist_name': alt_therapist['name'],
                             'license_number': alt_therapist.get('license_number', ''),
-                            'available_time': alt_slots[0]['formatted'],
-                            'available_datetime': alt_slots[0]['datetime'].isoformat(),
+                            'available_time': alt_slot.strftime('%A, %B %d at %I:%M %p'),
+                            'available_datetime': alt_slot.isoformat(),
                             'specializations': alt_therapist.get('specializations', [])
                         })
                 
@@ -478,7 +487,7 @@ class EnhancedReschedulingManager:
                 }
             ]
             
-            mongo.db.notifications.insert_many(notifications)
+            create_notifications(notifications)
             
         except Exception as e:
             logger.error(f"Error sending reschedule notifications: {str(e)}")
@@ -0,0 +1,233 @@
+# wellbeing/utils/fake_zoom.py
+# Local stand-in for the Zoom OAuth and meetings API, for tests and benchmarks
+
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+MEETINGS_PATH = re.compile(r'^/v2/users/[^/]+/meetings$')
+MEETING_PATH = re.compile(r'^/v2/meetings/([^/]+)$')
+
+
+class _ZoomHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is visible
+    # One write per response, sent at once: split writes on a kept-alive
+    # connection stall on delayed ACKs and would swamp the latency being measured
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.fake.connection_opened()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if not raw:
+            return {}
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            return json.loads(raw)
+        return {}
+
+    def _send(self, status: int, payload: Optional[dict] = None, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _handle(self, method: str):
+        path = urlparse(self.path).path
+        body = self._body()
+        status, payload, headers = self.server.fake.handle(method, path, self.headers, body)
+        self._send(status, payload, headers)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class FakeZoomServer:
+    """
+    Zoom OAuth (account_credentials) and meetings endpoints on 127.0.0.1.
+
+    Point ZoomMeetingManager at it with the ZOOM_* variables from env().
+    latency simulates Zoom's response time; fail_next() queues error
+    responses (429 with Retry-After, 5xx) to exercise retries;
+    revoke_tokens() makes the next API call return 401. stats() reports
+    requests per route, tokens granted and TCP connections opened.
+
+        with FakeZoomServer(latency=0.02) as zoom:
+            os.environ.update(zoom.env())
+            ...
+    """
+
+    def __init__(self, latency: float = 0.0, token_ttl: int = 3600):
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.meetings: Dict[str, dict] = {}
+        self._tokens = set()
+        self._failures = deque()
+        self._requests = Counter()
+        self._token_grants = 0
+        self._connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _ZoomHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    # ----- lifecycle -----
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def env(self) -> Dict[str, str]:
+        """Environment for ZoomMeetingManager to use this server."""
+        return {
+            'ZOOM_CLIENT_ID': 'fake-client',
+            'ZOOM_CLIENT_SECRET': 'fake-secret',
+            'ZOOM_ACCOUNT_ID': 'fake-account',
+            'ZOOM_API_BASE_URL': f'{self.url}/v2',
+            'ZOOM_OAUTH_URL': f'{self.url}/oauth/token'
+        }
+
+    def start(self) -> 'FakeZoomServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-zoom', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ----- test controls -----
+
+    def fail_next(self, status: int, count: int = 1, retry_after: Optional[float] = None):
+        """Answer the next count API or token requests with status."""
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+        with self._lock:
+            self._failures.extend([(status, headers)] * count)
+
+    def revoke_tokens(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requests': dict(self._requests),
+                'total_requests': sum(self._requests.values()),
+                'token_grants': self._token_grants,
+                'connections': self._connections,
+                'meetings': len(self.meetings)
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._requests.clear()
+            self._token_grants = 0
+            self._connections = 0
+
+    def connection_opened(self):
+        with self._lock:
+            self._connections += 1
+
+    # ----- request handling -----
+
+    def handle(self, method: str, path: str, headers, body: dict):
+        """(status, payload, headers) for one request."""
+        if self.latency:
+            time.sleep(self.latency)
+
+        route = 'token' if path == '/oauth/token' else \
+            'meetings' if MEETINGS_PATH.match(path) else \
+            'meeting' if MEETING_PATH.match(path) else 'other'
+        with self._lock:
+            self._requests[f'{method} {route}'] += 1
+            failure = self._failures.popleft() if self._failures else None
+        if failure:
+            status, failure_headers = failure
+            return status, {'code': status, 'message': 'Injected failure'}, failure_headers
+
+        if route == 'token' and method == 'POST':
+            return self._grant_token(headers)
+
+        token = (headers.get('Authorization') or '').replace('Bearer ', '', 1)
+        with self._lock:
+            authorized = token in self._tokens
+        if not authorized:
+            return 401, {'code': 124, 'message': 'Invalid access token.'}, None
+
+        if route == 'meetings' and method == 'POST':
+            return 201, self._create_meeting(body), None
+        match = MEETING_PATH.match(path)
+        if match:
+            meeting_id = match.group(1)
+            with self._lock:
+                meeting = self.meetings.get(meeting_id)
+                if meeting is None:
+                    return 404, {'code': 3001, 'message': 'Meeting does not exist.'}, None
+                if method == 'GET':
+                    return 200, meeting, None
+                if method == 'PATCH':
+                    meeting.update(body)
+                    return 204, None, None
+                if method == 'DELETE':
+                    del self.meetings[meeting_id]
+                    return 204, None, None
+        return 404, {'code': 404, 'message': 'Not found'}, None
+
+    def _grant_token(self, headers):
+        if not (headers.get('Authorization') or '').startswith('Basic '):
+            return 400, {'reason': 'Invalid client_id or client_secret', 'error': 'invalid_client'}, None
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._tokens.add(token)
+            self._token_grants += 1
+        return 200, {'access_token': token, 'token_type': 'bearer', 'expires_in': self.token_ttl}, None
+
+    def _create_meeting(self, body: dict) -> dict:
+        meeting_id = str(uuid.uuid4().int % 10 ** 11)
+        meeting = dict(
+            body,
+            id=int(meeting_id),
+            uuid=uuid.uuid4().hex,
+            join_url=f'{self.url}/j/{meeting_id}',
+            start_url=f'{self.url}/s/{meeting_id}',
+            password=body.get('password', ''),
+            dial_in_numbers=[{'country_name': 'US', 'number': '+1 646 558 8656'}]
+        )
+        with self._lock:
+            self.meetings[meeting_id] = meeting
+        return meeting
@@ -0,0 +1,226 @@
+# wellbeing/utils/index_registry.py
+# Declarative MongoDB index registry and explain()-based index advisor
+
+import datetime
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+
+from wellbeing import mongo, logger
+
+IndexSpec = namedtuple('IndexSpec', ['collection', 'keys', 'options'])
+QueryShape = namedtuple('QueryShape', ['name', 'collection', 'filter', 'sort'])
+
+
+def _index(collection: str, keys: List[tuple], **options) -> IndexSpec:
+    return IndexSpec(collection, keys, options)
+
+
+# ===== INDEXES =====
+# Single source of truth for application indexes. Compound keys follow the
+# equality -> sort -> range rule for the query shapes below.
+INDEXES = [
+    # Users
+    _index('users', [('name', 'text'), ('email', 'text'), ('student_id', 'text')]),
+    _index('users', [('email', 1)]),
+    _index('users', [('student_id', 1)]),
+
+    # Resources
+    _index('resources', [('title', 'text'), ('description', 'text')]),
+    _index('resources', [('type', 1)]),
+
+    # Chats: per-user history (get_previous_message, get_recent_chats).
+    # archived trails the sort key so {'$ne': True} is checked on index keys
+    # without breaking the timestamp order.
+    _index('chats', [('user_id', 1), ('timestamp', -1), ('archived', 1)]),
+    _index('chats', [('timestamp', 1), ('user_id', 1)]),  # analytics and budget windows
+    _index('chats', [('conversation_context.topic', 1)]),
+    _index('chats', [('feedback.rating', 1)]),
+
+    # Feedback
+    _index('feedback', [('user_id', 1)]),
+    _index('feedback', [('chat_id', 1)]),
+    # Feedback waiting for its chat's queued insert; chats that never land expire
+    _index('pending_feedback', [('created_at', 1)], expireAfterSeconds=7 * 24 * 3600),
+
+    # Therapist chats: unread counts per student (student_id, sender, read),
+    # per student-therapist pair (all four keys) and per caseload ($group by
+    # student_id over one therapist's unread messages)
+    _index('therapist_chats', [('student_id', 1), ('sender', 1), ('read', 1), ('therapist_id', 1)]),
+    _index('therapist_chats', [('therapist_id', 1), ('sender', 1), ('read', 1), ('student_id', 1)]),
+    # History pages: keyset on (timestamp, _id), _id breaking timestamp ties
+    _index('therapist_chats', [('student_id', 1), ('therapist_id', 1), ('timestamp', -1), ('_id', -1)]),
+
+    # Notifications: unread list/count and the full feed
+    _index('notifications', [('user_id', 1), ('read', 1), ('created_at', -1)]),
+    _index('notifications', [('user_id', 1), ('created_at', -1)]),
+
+    # Moods, journals, goals
+    _index('moods', [('user_id', 1), ('timestamp', -1)]),
+    _index('moods', [('timestamp', 1), ('user_id', 1)]),  # admin mood report windows
+    _index('journals', [('user_id', 1), ('date', -1)]),
+    _index('goals', [('user_id', 1), ('type', 1)]),
+
+    # Export jobs: an admin's recent jobs, and the expiry sweep
+    _index('export_jobs', [('user_id', 1), ('created_at', -1)]),
+    _index('export_jobs', [('expires_at', 1)]),
+]
+
+# ===== QUERY SHAPES =====
+# Representative hot queries checked by the advisor. Values are placeholders;
+# only the shape matters to the planner.
+_SAMPLE_ID = ObjectId()
+
+QUERY_SHAPES = [
+    QueryShape('chats.previous_message', 'chats',
+               {'user_id': str(_SAMPLE_ID), 'archived': {'$ne': True}}, [('timestamp', -1)]),
+    QueryShape('chats.analytics_window', 'chats',
+               {'timestamp': {'$gte': datetime.datetime(2020, 1, 1)}}, None),
+    QueryShape('therapist_chats.unread_for_student', 'therapist_chats',
+               {'student_id': _SAMPLE_ID, 'sender': 'therapist', 'read': False}, None),
+    QueryShape('therapist_chats.unread_for_pair', 'therapist_chats',
+               {'student_id': _SAMPLE_ID, 'therapist_id': _SAMPLE_ID, 'sender': 'student', 'read': False}, None),
+    QueryShape('therapist_chats.unread_for_therapist', 'therapist_chats',
+               {'therapist_id': _SAMPLE_ID, 'sender': 'student', 'read': False}, None),
+    QueryShape('therapist_chats.history', 'therapist_chats',
+               {'student_id': _SAMPLE_ID, 'therapist_id': _SAMPLE_ID}, [('timestamp', -1), ('_id', -1)]),
+    QueryShape('notifications.unread', 'notifications',
+               {'user_id': _SAMPLE_ID, 'read': False}, [('created_at', -1)]),
+    QueryShape('notifications.feed', 'notifications',
+               {'user_id': _SAMPLE_ID}, [('created_at', -1)]),
+    QueryShape('moods.history', 'moods', {'user_id': _SAMPLE_ID}, [('timestamp', -1)]),
+    QueryShape('moods.report_window', 'moods',
+               {'timestamp': {'$gte': datetime.datetime(2020, 1, 1)}}, [('timestamp', 1)]),
+    QueryShape('journals.history', 'journals', {'user_id': _SAMPLE_ID}, [('date', -1)]),
+]
+
+
+def ensure_indexes(db=None) -> Dict[str, List[str]]:
+    """
+    Create every registered index (no-op for indexes that already exist).
+
+    An index that conflicts with an existing one (same keys, different
+    options, or a second text index) is logged and skipped rather than
+    aborting startup.
+
+    Returns:
+        dict: 'created' and 'failed' index names
+    """
+    db = db if db is not None else mongo.db
+    result = {'created': [], 'failed': []}
+
+    for spec in INDEXES:
+        try:
+            name = db[spec.collection].create_index(spec.keys, **spec.options)
+            result['created'].append(f"{spec.collection}.{name}")
+        except OperationFailure as e:
+            label = f"{spec.collection}.{'_'.join(f'{k}_{d}' for k, d in spec.keys)}"
+            result['failed'].append(label)
+            logger.warning(f"Index {label} not created: {e}")
+
+    logger.info(f"MongoDB indexes ensured: {len(result['created'])} ok, {len(result['failed'])} failed")
+    return result
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    """Flatten an explain() plan tree into its stage names."""
+    if not plan:
+        return []
+    stages = [plan.get('stage')] if plan.get('stage') else []
+    # Slot-based engine wraps the classic plan in 'queryPlan'
+    if 'queryPlan' in plan:
+        stages.extend(_plan_stages(plan['queryPlan']))
+    if 'inputStage' in plan:
+        stages.extend(_plan_stages(plan['inputStage']))
+    for child in plan.get('inputStages', []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+def _plan_index_names(plan: dict) -> List[str]:
+    names = []
+    if not plan:
+        return names
+    if plan.get('indexName'):
+        names.append(plan['indexName'])
+    for key in ('queryPlan', 'inputStage'):
+        if key in plan:
+            names.extend(_plan_index_names(plan[key]))
+    for child in plan.get('inputStages', []):
+        names.extend(_plan_index_names(child))
+    return names
+
+
+def explain_query_shape(shape: QueryShape, db=None) -> dict:
+    """
+    Run explain() on one query shape.
+
+    Returns:
+        dict: name, collection, stages, indexes used and a list of issues
+        ('COLLSCAN' for a collection scan, 'SORT' for an in-memory sort)
+    """
+    db = db if db is not None else mongo.db
+    cursor = db[shape.collection].find(shape.filter)
+    if shape.sort:
+        cursor = cursor.sort(shape.sort)
+    explanation = cursor.limit(1).explain()
+
+    winning_plan = explanation.get('queryPlanner', {}).get('winningPlan', {})
+    stages = _plan_stages(winning_plan)
+
+    issues = []
+    if 'COLLSCAN' in stages:
+        issues.append('COLLSCAN')
+    if 'SORT' in stages:
+        issues.append('SORT')
+
+    return {
+        'name': shape.name,
+        'collection': shape.collection,
+        'stages': stages,
+        'indexes': _plan_index_names(winning_plan),
+        'issues': issues
+    }
+
+
+def run_index_advisor(db=None, shapes: Optional[List[QueryShape]] = None) -> List[dict]:
+    """
+    Explain every registered query shape and log the ones that scan or sort.
+
+    Returns:
+        list: One explain_query_shape() report per shape
+    """
+    reports = []
+    for shape in shapes or QUERY_SHAPES:
+        try:
+            report = explain_query_shape(shape, db)
+        except Exception as e:
+            report = {'name': shape.name, 'collection': shape.collection,
+                      'stages': [], 'indexes': [], 'issues': [f'error: {e}']}
+        reports.append(report)
+
+        if report['issues']:
+            logger.warning(f"Index advisor: {shape.name} -> {', '.join(report['issues'])} "
+                           f"(plan: {' <- '.join(report['stages'])})")
+        else:
+            logger.info(f"Index advisor: {shape.name} uses {', '.join(report['indexes']) or 'no index'}")
+
+    flagged = sum(1 for report in reports if report['issues'])
+    logger.info(f"Index advisor checked {len(reports)} query shapes, {flagged} flagged")
+    return reports
+
+
+if __name__ == '__main__':
+    # CLI: python -m wellbeing.utils.index_registry [--create]
+    import sys
+    from wellbeing import create_app
+
+    app = create_app()
+    with app.app_context():
+        if '--create' in sys.argv:
+            ensure_indexes()
+        for report in run_index_advisor():
+            status = 'FLAG ' + ','.join(report['issues']) if report['issues'] else 'ok'
+            print(f"{report['name']:<40} {status:<16} {' <- '.join(report['stages'])}")
@@ -0,0 +1,254 @@
+# wellbeing/utils/keyword_matcher.py
+# Shared Aho-Corasick keyword matcher for crisis, topic, profanity and boundary scanning
+
+import copy
+import threading
+from collections import deque, namedtuple
+from typing import Dict, List, Optional
+
+# ===== KEYWORD TABLES =====
+# Single source of truth for every keyword scanner. chatbot_service and
+# AutomatedModerator re-export these under their historical names.
+
+# Chatbot crisis keywords (any hit routes to the crisis response)
+CRISIS_KEYWORDS = [
+    'suicide', 'kill myself', 'end my life', 'want to die', 'hurt myself',
+    'self harm', 'no point living', 'better off dead', 'ending it all',
+    'don\'t want to live', 'cutting', 'overdose', 'jump off', 'hang myself',
+    'self-harm', 'self-injury', 'suicidal thoughts', 'suicidal ideation'
+]
+
+# Chatbot topic classification (first topic in this order wins)
+TOPIC_KEYWORDS = {
+    'anxiety': ['anxious', 'anxiety', 'worried', 'panic', 'nervous', 'fear', 'panic attack'],
+    'depression': ['depressed', 'depression', 'sad', 'hopeless', 'empty', 'lonely', 'worthless'],
+    'stress': ['stressed', 'stress', 'overwhelmed', 'pressure', 'burden', 'burnout'],
+    'sleep': ['sleep', 'insomnia', 'tired', 'exhausted', 'rest', 'fatigue', 'can\'t sleep'],
+    'relationships': ['relationship', 'partner', 'family', 'friends', 'social', 'dating', 'breakup'],
+    'academic': ['study', 'exam', 'grades', 'school', 'university', 'assignment', 'homework', 'test'],
+    'work': ['work', 'job', 'career', 'boss', 'workplace', 'office', 'internship'],
+    'coping': ['cope', 'coping', 'manage', 'handle', 'deal with', 'strategies'],
+    'therapy': ['therapy', 'therapist', 'counseling', 'professional help', 'counselor'],
+    'self_esteem': ['confidence', 'self-worth', 'self-esteem', 'insecure', 'inadequate'],
+    'eating': ['eating', 'food', 'weight', 'body image', 'appetite', 'diet'],
+    'substance': ['alcohol', 'drinking', 'drugs', 'substance', 'addiction', 'smoking'],
+    'trauma': ['trauma', 'ptsd', 'abuse', 'assault', 'violence', 'flashbacks']
+}
+
+# Moderation profanity filter with severity levels (whole-word matches)
+PROFANITY_CONFIG = {
+    'mild': ['damn', 'hell', 'crap', 'stupid'],
+    'moderate': ['shit', 'bitch', 'asshole', 'idiot'],
+    'severe': ['fuck', 'fucking', 'cunt']  # Add more as needed
+}
+
+# Moderation crisis keywords with confidence levels
+CRISIS_INDICATORS = {
+    'high_confidence': [
+        'i want to die', 'kill myself', 'suicide', 'end my life',
+        'not worth living', 'better off dead', 'want to disappear',
+        'take my own life', 'end it all'
+    ],
+    'medium_confidence': [
+        'hurt myself', 'self harm', 'cutting', 'overdose',
+        'can\'t go on', 'give up', 'no point', 'want to die',
+        'life is meaningless', 'nothing matters'
+    ],
+    'low_confidence': [
+        'depressed', 'hopeless', 'worthless', 'empty inside',
+        'feel terrible', 'can\'t take it', 'very sad'
+    ]
+}
+
+# Moderation boundary violations with auto-actions
+BOUNDARY_VIOLATIONS = {
+    'block_immediately': [
+        'personal phone number', 'my address is', 'meet me at',
+        'sexual', 'romantic feelings', 'in love with you',
+        'date me', 'kiss you', 'sleep with'
+    ],
+    'filter_and_warn': [
+        'personal email', 'social media', 'outside appointment',
+        'personal life', 'dating', 'phone number', 'home address'
+    ],
+    'log_only': [
+        'friend', 'personal', 'outside therapy', 'after work'
+    ]
+}
+
+# Pristine copies so a hot reload with partial overrides starts from defaults
+_DEFAULT_TABLES = {
+    'crisis_keywords': copy.deepcopy(CRISIS_KEYWORDS),
+    'topics': copy.deepcopy(TOPIC_KEYWORDS),
+    'profanity': copy.deepcopy(PROFANITY_CONFIG),
+    'crisis_indicators': copy.deepcopy(CRISIS_INDICATORS),
+    'boundary_violations': copy.deepcopy(BOUNDARY_VIOLATIONS)
+}
+
+# Keyword groups reported on each hit
+GROUP_CRISIS = 'crisis'
+GROUP_TOPIC = 'topic'
+GROUP_PROFANITY = 'profanity'
+GROUP_CRISIS_INDICATOR = 'crisis_indicator'
+GROUP_BOUNDARY = 'boundary'
+
+KeywordHit = namedtuple('KeywordHit', ['group', 'category', 'keyword', 'start', 'end'])
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over every keyword table.
+
+    scan() walks the text once and returns every hit with its group,
+    category and span, regardless of how many keywords are registered.
+    Matching is case-insensitive; patterns flagged whole_word only match
+    on word boundaries (like a regex \\b...\\b).
+    """
+
+    def __init__(self, patterns: List[tuple]):
+        """
+        Args:
+            patterns: (keyword, group, category, whole_word) tuples
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.entries = []
+        self.keyword_count = 0
+        # Categories per group in table order (e.g. topic priority)
+        self.category_order = {}
+
+        for keyword, group, category, whole_word in patterns:
+            keyword = keyword.lower()
+            if not keyword:
+                continue
+            node = 0
+            for ch in keyword:
+                next_node = self.goto[node].get(ch)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][ch] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = next_node
+            self.output[node].append(len(self.entries))
+            self.entries.append((keyword, group, category, whole_word))
+            categories = self.category_order.setdefault(group, [])
+            if category not in categories:
+                categories.append(category)
+        self.keyword_count = len(self.entries)
+
+        # Breadth-first failure links; each node inherits its fail target's outputs
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(ch, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def scan(self, text: str, groups: Optional[set] = None) -> List[KeywordHit]:
+        """Return every keyword hit in text, optionally limited to some groups."""
+        if not text:
+            return []
+
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # A few characters change length when lowercased; keep spans aligned
+            lowered = ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+        hits = []
+        goto, fail, output, entries = self.goto, self.fail, self.output, self.entries
+        state = 0
+        for index, ch in enumerate(lowered):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for entry_id in output[state]:
+                keyword, group, category, whole_word = entries[entry_id]
+                if groups is not None and group not in groups:
+                    continue
+                end = index + 1
+                start = end - len(keyword)
+                if whole_word and (
+                    (start > 0 and _is_word_char(lowered[start - 1])) or
+                    (end < len(lowered) and _is_word_char(lowered[end]))
+                ):
+                    continue
+                hits.append(KeywordHit(group, category, keyword, start, end))
+        return hits
+
+
+def _build_patterns() -> List[tuple]:
+    patterns = [(keyword, GROUP_CRISIS, 'crisis', False) for keyword in CRISIS_KEYWORDS]
+    for topic, keywords in TOPIC_KEYWORDS.items():
+        patterns.extend((keyword, GROUP_TOPIC, topic, False) for keyword in keywords)
+    for level, words in PROFANITY_CONFIG.items():
+        patterns.extend((word, GROUP_PROFANITY, level, True) for word in words)
+    for level, indicators in CRISIS_INDICATORS.items():
+        patterns.extend((indicator, GROUP_CRISIS_INDICATOR, level, False) for indicator in indicators)
+    for action, violations in BOUNDARY_VIOLATIONS.items():
+        patterns.extend((violation, GROUP_BOUNDARY, action, False) for violation in violations)
+    return patterns
+
+
+_matcher = KeywordMatcher(_build_patterns())
+_reload_lock = threading.Lock()
+
+
+def get_matcher() -> KeywordMatcher:
+    """Get the current compiled matcher."""
+    return _matcher
+
+
+def scan(text: str, groups: Optional[set] = None) -> List[KeywordHit]:
+    """Scan text once against every keyword table."""
+    return _matcher.scan(text, groups)
+
+
+def distinct_keywords(hits: List[KeywordHit], group: str, category: str) -> set:
+    """Distinct keywords hit for one group/category."""
+    return {hit.keyword for hit in hits if hit.group == group and hit.category == category}
+
+
+def reload_keywords(keyword_lists: Optional[Dict] = None) -> KeywordMatcher:
+    """
+    Rebuild the automaton, optionally overriding keyword tables.
+
+    Args:
+        keyword_lists: Optional dict with any of 'crisis_keywords', 'topics',
+            'profanity', 'crisis_indicators', 'boundary_violations'. Missing
+            tables revert to the built-in defaults.
+
+    The tables are updated in place, so AutomatedModerator.PROFANITY_CONFIG
+    and friends stay in step with the matcher.
+    """
+    global _matcher
+    keyword_lists = keyword_lists or {}
+
+    with _reload_lock:
+        tables = {
+            name: copy.deepcopy(keyword_lists.get(name) or default)
+            for name, default in _DEFAULT_TABLES.items()
+        }
+        CRISIS_KEYWORDS[:] = tables['crisis_keywords']
+        for current, name in ((TOPIC_KEYWORDS, 'topics'),
+                              (PROFANITY_CONFIG, 'profanity'),
+                              (CRISIS_INDICATORS, 'crisis_indicators'),
+                              (BOUNDARY_VIOLATIONS, 'boundary_violations')):
+            current.clear()
+            current.update(tables[name])
+
+        # Build fully before swapping so concurrent scans never see a partial automaton
+        _matcher = KeywordMatcher(_build_patterns())
+        return _matcher
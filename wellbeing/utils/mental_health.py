@@ -3,6 +3,8 @@
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 from wellbeing import mongo
+from wellbeing.services.dashboard_service import invalidate_appointment_dashboard
+from wellbeing.services.therapist_matching import rank_therapists
 
 def detect_crisis_level(intake_data):
     """
@@ -27,10 +29,13 @@ def detect_crisis_level(intake_data):
     else:
         return {'level': 'low', 'keywords': []}
 
-def assign_therapist_immediately(intake_data):
+def candidate_therapists(intake_data, crisis_level=None):
     """
-    Find and assign therapist right away
-    Returns: therapist document or None
+    Therapists suitable for an intake, best match first: active specialists
+    in the student's concern (and preferred gender), or every active
+    therapist if none match. Therapists with room for another student come
+    before full ones at each step.
+    Returns: list of therapist documents
     """
     concern = intake_data.get('primary_concern')
     gender_pref = intake_data.get('therapist_gender', 'no_preference')
@@ -46,30 +51,31 @@ def assign_therapist_immediately(intake_data):
     
     needed_specialization = specialization_map.get(concern, 'general_counseling')
     
-    # Step 2: Build search criteria
-    search_criteria = {
-        'status': 'active',
-        'specializations': needed_specialization
-    }
-    
-    # Add gender preference if specified
-    if gender_pref != 'no_preference':
-        search_criteria['gender'] = gender_pref
-    
-    # Step 3: Find available therapists
-    available_therapists = list(mongo.db.therapists.find(search_criteria))
-    
-    # Step 4: If no specialists available, find any therapist
-    if not available_therapists:
-        available_therapists = list(mongo.db.therapists.find({'status': 'active'}))
-    
-    # Step 5: Pick therapist with lowest caseload
-    if available_therapists:
-        best_therapist = min(available_therapists, 
-                           key=lambda t: t.get('current_students', 0))
-        return best_therapist
+    # Step 2: Rank specialists from the matching index, then fall back to anyone
+    for require_specialization in (True, False):
+        for require_capacity in (True, False):
+            available_therapists = rank_therapists(
+                specialization=needed_specialization,
+                require_specialization=require_specialization,
+                gender=gender_pref,
+                require_gender=require_specialization,
+                crisis_level=crisis_level,
+                require_capacity=require_capacity
+            )
+            if available_therapists:
+                return available_therapists
+    
+    return []
+
+def assign_therapist_immediately(intake_data, crisis_level=None):
+    """
+    Find and assign therapist right away
+    Returns: therapist document or None
+    """
+    available_therapists = candidate_therapists(intake_data, crisis_level)
     
-    return None
+    # Best-ranked therapist (ties go to the lowest caseload)
+    return available_therapists[0] if available_therapists else None
 
 def create_immediate_appointment(student_id, therapist, crisis_level):
     """
@@ -95,6 +101,7 @@ def create_immediate_appointment(student_id, therapist, crisis_level):
     
     # Save to database
     result = mongo.db.appointments.insert_one(appointment)
+    invalidate_appointment_dashboard(appointment)
     return result.inserted_id
 
 def update_student_with_therapist(student_id, therapist_id, crisis_level):
@@ -115,15 +122,6 @@ def update_student_with_therapist(student_id, therapist_id, crisis_level):
         }
     )
 
-def update_therapist_caseload(therapist_id):
-    """
-    Increase therapist's current student count
-    """
-    mongo.db.therapists.update_one(
-        {'_id': therapist_id},
-        {'$inc': {'current_students': 1}}
-    )
-
 def send_crisis_alert(student_id, therapist_id):
     """
     Send alert for high-risk students
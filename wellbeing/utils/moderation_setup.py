@@ -1,6 +1,7 @@
 
 import datetime
 from wellbeing import mongo, logger
+from wellbeing.models.notification import create_notification
 from bson.objectid import ObjectId
 from flask import request, session, redirect, url_for, flash, render_template, jsonify
 from wellbeing.utils.decorators import login_required
@@ -146,7 +147,32 @@ class ModerationConfig:
             upsert=True
         )
         
+        # Hot-reload the shared keyword automaton when the lists change
+        if 'keyword_lists' in new_settings:
+            ModerationConfig.reload_keyword_lists(new_settings['keyword_lists'])
+        
         return result.modified_count > 0 or result.upserted_id is not None
+    
+    @staticmethod
+    def reload_keyword_lists(keyword_lists=None):
+        """
+        Rebuild the keyword matcher from custom lists (or stored settings).
+        
+        keyword_lists may override any of 'crisis_keywords', 'topics',
+        'profanity', 'crisis_indicators' and 'boundary_violations'.
+        """
+        from wellbeing.utils.keyword_matcher import reload_keywords
+        
+        if keyword_lists is None:
+            keyword_lists = ModerationConfig.get_settings().get('keyword_lists')
+        
+        try:
+            matcher = reload_keywords(keyword_lists)
+            logger.info(f"Keyword matcher reloaded with {matcher.keyword_count} keywords")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to reload keyword lists: {e}")
+            return False
 
 def test_automated_moderation():
     """Test automated moderation system"""
@@ -191,6 +217,9 @@ def initialize_automated_moderation(app):
         if setup_automated_moderation():
             print("✅ Automated moderation initialized successfully")
             
+            # Apply any custom keyword lists saved by admins
+            ModerationConfig.reload_keyword_lists()
+            
             # Test the system
             test_result = test_automated_moderation()
             if test_result:
@@ -240,7 +269,7 @@ def generate_daily_moderation_report():
             if report.get('crisis_alerts', 0) > 10:  # High crisis activity
                 supervisors = mongo.db.users.find({'role': 'supervisor'})
                 for supervisor in supervisors:
-                    mongo.db.notifications.insert_one({
+                    create_notification({
                         'user_id': supervisor['_id'],
                         'type': 'high_crisis_activity',
                         'message': f'High crisis activity detected: {report["crisis_alerts"]} alerts in 24h',
@@ -266,7 +295,7 @@ def check_unresolved_crisis_alerts():
             # Escalate to supervisor
             supervisors = mongo.db.users.find({'role': 'supervisor'})
             for supervisor in supervisors:
-                mongo.db.notifications.insert_one({
+                create_notification({
                     'user_id': supervisor['_id'],
                     'type': 'unresolved_crisis_alert',
                     'message': f'Crisis alert has been unresolved for over 1 hour. Immediate intervention required.',
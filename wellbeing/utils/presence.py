@@ -0,0 +1,348 @@
+# wellbeing/utils/presence.py
+# Indexed presence registry for Socket.IO connections (sid, user and room indexes)
+
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from flask import current_app
+
+from wellbeing.utils.socketio_queue import message_queue_url
+
+# Optional shared backend
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+REDIS_KEY_PREFIX = 'wellbeing:presence:'
+
+
+class PresenceRegistry:
+    """
+    Who is connected, and which rooms each connection has joined.
+
+    Keeps three indexes so the hot questions are set lookups instead of
+    scans over every connection:
+
+    - sid  -> connection info (user_id, user_role, connected_at, ...)
+    - user -> sids (a user may have several tabs open)
+    - room -> sids
+
+    In memory all indexes live behind one lock. With a Redis client the
+    same indexes are kept as Redis hashes and sets, so presence is shared
+    by every Socket.IO worker process. Redis keys expire after ttl_seconds
+    without activity, which clears connections left behind by a worker
+    that died without running its disconnect handlers; sids whose
+    connection key has expired are pruned from the user and all-sids sets
+    when those sets are read.
+    """
+
+    def __init__(self, redis_client=None, ttl_seconds: int = 86400):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self._connections: Dict[str, dict] = {}
+        self._user_sids: Dict[str, Set[str]] = {}
+        self._room_sids: Dict[str, Set[str]] = {}
+        self._sid_rooms: Dict[str, Set[str]] = {}
+        self._lock = threading.RLock()
+        self.stats = {'connects': 0, 'disconnects': 0, 'joins': 0, 'leaves': 0}
+
+    # ----- redis keys -----
+
+    def _conn_key(self, sid):
+        return f"{REDIS_KEY_PREFIX}conn:{sid}"
+
+    def _user_key(self, user_id):
+        return f"{REDIS_KEY_PREFIX}user:{user_id}"
+
+    def _room_key(self, room):
+        return f"{REDIS_KEY_PREFIX}room:{room}"
+
+    def _sid_rooms_key(self, sid):
+        return f"{REDIS_KEY_PREFIX}sid_rooms:{sid}"
+
+    def _all_sids_key(self):
+        return f"{REDIS_KEY_PREFIX}sids"
+
+    @staticmethod
+    def _encode(info: dict) -> str:
+        return json.dumps({
+            k: v.isoformat() if isinstance(v, datetime) else v
+            for k, v in info.items()
+        })
+
+    @staticmethod
+    def _decode(raw: Optional[str]) -> Optional[dict]:
+        if not raw:
+            return None
+        info = json.loads(raw)
+        if info.get('connected_at'):
+            info['connected_at'] = datetime.fromisoformat(info['connected_at'])
+        return info
+
+    def _live_sids(self, set_key, sids) -> Set[str]:
+        """The sids whose connection key still exists; the rest are removed from set_key."""
+        sids = sorted(sids)
+        if not sids:
+            return set()
+        raws = self.redis.mget([self._conn_key(sid) for sid in sids])
+        dead = [sid for sid, raw in zip(sids, raws) if not raw]
+        if dead:
+            self.redis.srem(set_key, *dead)
+        return {sid for sid, raw in zip(sids, raws) if raw}
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    # ----- connections -----
+
+    def add_connection(self, sid: str, user_id: str, **info):
+        """Register a new connection for a user."""
+        user_id = str(user_id)
+        info = dict(info, user_id=user_id)
+        self._count('connects')
+
+        if self.redis is not None:
+            pipe = self.redis.pipeline()
+            pipe.set(self._conn_key(sid), self._encode(info), ex=self.ttl_seconds)
+            pipe.sadd(self._user_key(user_id), sid)
+            pipe.expire(self._user_key(user_id), self.ttl_seconds)
+            pipe.sadd(self._all_sids_key(), sid)
+            pipe.expire(self._all_sids_key(), self.ttl_seconds)
+            pipe.execute()
+            return
+
+        with self._lock:
+            self._connections[sid] = info
+            self._user_sids.setdefault(user_id, set()).add(sid)
+
+    def remove_connection(self, sid: str) -> Optional[dict]:
+        """
+        Drop a connection and all its room memberships.
+
+        Returns:
+            dict: The connection info plus the 'rooms' it was in, or None
+            if the sid was not registered
+        """
+        if self.redis is not None:
+            info = self._decode(self.redis.get(self._conn_key(sid)))
+            rooms = self.redis.smembers(self._sid_rooms_key(sid))
+            pipe = self.redis.pipeline()
+            pipe.delete(self._conn_key(sid), self._sid_rooms_key(sid))
+            pipe.srem(self._all_sids_key(), sid)
+            for room in rooms:
+                pipe.srem(self._room_key(room), sid)
+            if info:
+                pipe.srem(self._user_key(info['user_id']), sid)
+            pipe.execute()
+            if info is None:
+                return None
+            self._count('disconnects')
+            info['rooms'] = set(rooms)
+            return info
+
+        with self._lock:
+            info = self._connections.pop(sid, None)
+            rooms = self._sid_rooms.pop(sid, set())
+            for room in rooms:
+                self._discard(self._room_sids, room, sid)
+            if info is None:
+                return None
+            self._discard(self._user_sids, info['user_id'], sid)
+            self.stats['disconnects'] += 1
+            info = dict(info, rooms=rooms)
+            return info
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], key: str, sid: str):
+        sids = index.get(key)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del index[key]
+
+    def get_connection(self, sid: str) -> Optional[dict]:
+        """Connection info for a sid (a copy), or None."""
+        if self.redis is not None:
+            return self._decode(self.redis.get(self._conn_key(sid)))
+        with self._lock:
+            info = self._connections.get(sid)
+            return dict(info) if info is not None else None
+
+    def update_connection(self, sid: str, **fields):
+        """Set fields on a connection; a value of None removes the field."""
+        if self.redis is not None:
+            info = self._decode(self.redis.get(self._conn_key(sid)))
+            if info is None:
+                return
+            self._apply_fields(info, fields)
+            self.redis.set(self._conn_key(sid), self._encode(info), ex=self.ttl_seconds)
+            return
+
+        with self._lock:
+            info = self._connections.get(sid)
+            if info is not None:
+                self._apply_fields(info, fields)
+
+    @staticmethod
+    def _apply_fields(info: dict, fields: dict):
+        for key, value in fields.items():
+            if value is None:
+                info.pop(key, None)
+            else:
+                info[key] = value
+
+    def connections(self) -> List[tuple]:
+        """All (sid, info) pairs, for admin monitoring."""
+        if self.redis is not None:
+            sids = sorted(self.redis.smembers(self._all_sids_key()))
+            if not sids:
+                return []
+            raws = self.redis.mget([self._conn_key(sid) for sid in sids])
+            dead = [sid for sid, raw in zip(sids, raws) if not raw]
+            if dead:
+                self.redis.srem(self._all_sids_key(), *dead)
+            return [(sid, self._decode(raw)) for sid, raw in zip(sids, raws) if raw]
+        with self._lock:
+            return [(sid, dict(info)) for sid, info in self._connections.items()]
+
+    def connection_count(self) -> int:
+        if self.redis is not None:
+            key = self._all_sids_key()
+            return len(self._live_sids(key, self.redis.smembers(key)))
+        with self._lock:
+            return len(self._connections)
+
+    # ----- users -----
+
+    def user_sids(self, user_id: str) -> Set[str]:
+        if self.redis is not None:
+            key = self._user_key(str(user_id))
+            return self._live_sids(key, self.redis.smembers(key))
+        with self._lock:
+            return set(self._user_sids.get(str(user_id), ()))
+
+    def is_online(self, user_id: str) -> bool:
+        """True if the user has at least one open connection."""
+        if self.redis is not None:
+            return bool(self.user_sids(user_id))
+        with self._lock:
+            return str(user_id) in self._user_sids
+
+    def online_users(self, user_ids: Iterable[str]) -> Set[str]:
+        """The subset of user_ids that are online (one round trip in Redis)."""
+        user_ids = [str(user_id) for user_id in user_ids]
+        if self.redis is not None:
+            if not user_ids:
+                return set()
+            pipe = self.redis.pipeline()
+            for user_id in user_ids:
+                pipe.smembers(self._user_key(user_id))
+            user_sids = dict(zip(user_ids, pipe.execute()))
+            sids = sorted(set().union(*user_sids.values()))
+            if not sids:
+                return set()
+            # One MGET checks every candidate connection is still alive
+            raws = self.redis.mget([self._conn_key(sid) for sid in sids])
+            live = {sid for sid, raw in zip(sids, raws) if raw}
+            pipe = self.redis.pipeline()
+            for user_id, members in user_sids.items():
+                dead = members - live
+                if dead:
+                    pipe.srem(self._user_key(user_id), *dead)
+            pipe.execute()
+            return {user_id for user_id, members in user_sids.items() if members & live}
+        with self._lock:
+            return {user_id for user_id in user_ids if user_id in self._user_sids}
+
+    # ----- rooms -----
+
+    def join_room(self, sid: str, room: str):
+        self._count('joins')
+        if self.redis is not None:
+            pipe = self.redis.pipeline()
+            pipe.sadd(self._room_key(room), sid)
+            pipe.expire(self._room_key(room), self.ttl_seconds)
+            pipe.sadd(self._sid_rooms_key(sid), room)
+            pipe.expire(self._sid_rooms_key(sid), self.ttl_seconds)
+            pipe.execute()
+            return
+        with self._lock:
+            self._room_sids.setdefault(room, set()).add(sid)
+            self._sid_rooms.setdefault(sid, set()).add(room)
+
+    def leave_room(self, sid: str, room: str):
+        self._count('leaves')
+        if self.redis is not None:
+            pipe = self.redis.pipeline()
+            pipe.srem(self._room_key(room), sid)
+            pipe.srem(self._sid_rooms_key(sid), room)
+            pipe.execute()
+            return
+        with self._lock:
+            self._discard(self._room_sids, room, sid)
+            self._discard(self._sid_rooms, sid, room)
+
+    def rooms_for(self, sid: str) -> Set[str]:
+        if self.redis is not None:
+            return set(self.redis.smembers(self._sid_rooms_key(sid)))
+        with self._lock:
+            return set(self._sid_rooms.get(sid, ()))
+
+    def room_members(self, room: str) -> List[dict]:
+        """Connection info for every sid in a room."""
+        if self.redis is not None:
+            sids = sorted(self.redis.smembers(self._room_key(room)))
+            if not sids:
+                return []
+            raws = self.redis.mget([self._conn_key(sid) for sid in sids])
+            return [self._decode(raw) for raw in raws if raw]
+        with self._lock:
+            return [dict(self._connections[sid]) for sid in self._room_sids.get(room, ())
+                    if sid in self._connections]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        if self.redis is None:
+            with self._lock:
+                stats.update({
+                    'connections': len(self._connections),
+                    'online_users': len(self._user_sids),
+                    'rooms': len(self._room_sids)
+                })
+        else:
+            stats['connections'] = self.connection_count()
+        stats['backend'] = 'redis' if self.redis is not None else 'memory'
+        return stats
+
+
+_presence = None
+_presence_lock = threading.Lock()
+
+
+def get_presence_registry() -> PresenceRegistry:
+    """
+    Get the process-wide presence registry.
+
+    Redis-backed when PRESENCE_REDIS_URL is set, or when the Socket.IO
+    message queue is Redis, so all workers share one view of who is online.
+    """
+    global _presence
+    if _presence is None:
+        with _presence_lock:
+            if _presence is None:
+                config = current_app.config
+                redis_client = None
+                redis_url = config.get('PRESENCE_REDIS_URL') or message_queue_url(config)
+                if redis_url and REDIS_AVAILABLE:
+                    redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
+                _presence = PresenceRegistry(
+                    redis_client=redis_client,
+                    ttl_seconds=config.get('PRESENCE_TTL_SECONDS', 86400)
+                )
+    return _presence
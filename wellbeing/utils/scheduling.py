@@ -14,6 +14,8 @@ from bson.objectid import ObjectId
 import uuid
 
 from wellbeing import mongo
+from wellbeing.services.dashboard_service import invalidate_appointment_dashboard
+from wellbeing.utils.availability import load_booked_intervals, next_free_slots
 from wellbeing.utils.zoom_integration import (
     create_zoom_therapy_meeting,
     update_zoom_meeting,
@@ -22,6 +24,17 @@ from wellbeing.utils.zoom_integration import (
 
 logger = logging.getLogger(__name__)
 
+def slot_data(slot_time: datetime, crisis_level: str = 'normal') -> Dict[str, Any]:
+    """The slot dict returned to views for a free start time."""
+    return {
+        'datetime': slot_time,
+        'date': slot_time.strftime('%Y-%m-%d'),
+        'time': slot_time.strftime('%I:%M %p'),
+        'formatted': slot_time.strftime('%A, %B %d at %I:%M %p'),
+        'day_name': slot_time.strftime('%A'),
+        'crisis_priority': crisis_level == 'high'
+    }
+
 class AppointmentScheduler:
     """Enhanced appointment scheduler with OAuth Zoom integration for real meetings"""
     
@@ -32,7 +45,9 @@ class AppointmentScheduler:
                                     therapist: Dict[str, Any], 
                                     crisis_level: str = 'normal',
                                     days_ahead: int = 14,
-                                    limit: int = None) -> List[Dict[str, Any]]:
+                                    limit: int = None,
+                                    slot_minutes: int = 60,
+                                    buffer_minutes: int = 0) -> List[Dict[str, Any]]:
         """
         Get available time slots for a therapist
         
@@ -41,108 +56,38 @@ class AppointmentScheduler:
             crisis_level: Priority level affecting slot availability
             days_ahead: Number of days to look ahead
             limit: Maximum number of slots to return (optional)
+            slot_minutes: Session length (slots are offered on this grid)
+            buffer_minutes: Free time required before and after existing appointments
             
         Returns:
             List of available time slots
         """
         try:
-            available_slots = []
-            
-            # Get therapist's working hours (default to 9 AM - 5 PM)
-            working_hours = therapist.get('working_hours', {
-                'monday': [(9, 17)],
-                'tuesday': [(9, 17)],
-                'wednesday': [(9, 17)],
-                'thursday': [(9, 17)],
-                'friday': [(9, 17)],
-                'saturday': [],
-                'sunday': []
-            })
-            
-            # Get existing appointments from database
-            existing_appointments = list(mongo.db.appointments.find({
-                'therapist_id': therapist['_id'],
-                'status': {'$in': ['confirmed', 'suggested']},
-                'datetime': {'$gte': datetime.now()}
-            }))
-            
-            existing_times = [apt['datetime'] for apt in existing_appointments]
-            
-            # Generate available slots
-            current_date = datetime.now() + timedelta(days=1)  # Start tomorrow
+            now = datetime.now()
             
-            for day_offset in range(days_ahead):
-                check_date = current_date + timedelta(days=day_offset)
-                day_name = check_date.strftime('%A').lower()
-                
-                # Skip if no working hours for this day
-                if day_name not in working_hours or not working_hours[day_name]:
-                    continue
-                
-                # Check each working hour block
-                for start_hour, end_hour in working_hours[day_name]:
-                    for hour in range(start_hour, end_hour):
-                        slot_time = check_date.replace(hour=hour, minute=0, second=0, microsecond=0)
-                        
-                        # Skip past times
-                        if slot_time <= datetime.now():
-                            continue
-                        
-                        # Check if slot is available
-                        if self._is_slot_available(slot_time, existing_times):
-                            slot_data = {
-                                'datetime': slot_time,
-                                'date': slot_time.strftime('%Y-%m-%d'),
-                                'time': slot_time.strftime('%I:%M %p'),
-                                'formatted': slot_time.strftime('%A, %B %d at %I:%M %p'),
-                                'day_name': slot_time.strftime('%A'),
-                                'crisis_priority': crisis_level == 'high'
-                            }
-                            available_slots.append(slot_data)
-                            
-                            # Early exit if we've reached the limit
-                            if limit and len(available_slots) >= limit:
-                                logger.info(f"Found {len(available_slots)} available slots for therapist {therapist['_id']} (limited to {limit})")
-                                return available_slots
+            # Slots start tomorrow and run for days_ahead days
+            search_start = datetime.combine((now + timedelta(days=1)).date(), datetime.min.time())
+            search_end = search_start + timedelta(days=days_ahead)
             
             # Apply default limits based on crisis level if no explicit limit provided
             if limit is None:
-                if crisis_level == 'high':
-                    available_slots = available_slots[:10]  # Limit to next 10 slots for crisis
-                else:
-                    available_slots = available_slots[:20]  # More options for regular appointments
-            else:
-                # Apply the explicit limit
-                available_slots = available_slots[:limit]
+                limit = 10 if crisis_level == 'high' else 20  # More options for regular appointments
             
-            logger.info(f"Found {len(available_slots)} available slots for therapist {therapist['_id']}")
+            # One query for the therapist's bookings, then a bisect per slot
+            booked = load_booked_intervals([therapist['_id']], since=now, until=search_end)[therapist['_id']]
+            slot_times = next_free_slots(
+                booked, therapist.get('working_hours'), max(search_start, now), search_end, limit,
+                slot=timedelta(minutes=slot_minutes), buffer=timedelta(minutes=buffer_minutes)
+            )
+            available_slots = [slot_data(slot_time, crisis_level) for slot_time in slot_times]
+            
+            logger.info(f"Found {len(available_slots)} available slots for therapist {therapist['_id']} (limited to {limit})")
             return available_slots
             
         except Exception as e:
             logger.error(f"Error getting therapist availability: {str(e)}")
             return []
     
-    def _is_slot_available(self, 
-                          slot_time: datetime, 
-                          existing_times: List[datetime]) -> bool:
-        """
-        Check if a time slot is available
-        
-        Args:
-            slot_time: Time slot to check
-            existing_times: List of existing appointment times from database
-            
-        Returns:
-            True if slot is available, False otherwise
-        """
-        # Check database appointments (1-hour buffer)
-        for existing_time in existing_times:
-            time_diff = abs((slot_time - existing_time).total_seconds()) / 3600
-            if time_diff < 1:  # Less than 1 hour difference
-                return False
-        
-        return True
-    
     def auto_schedule_best_time(self, 
                               student_id: ObjectId,
                               therapist: Dict[str, Any],
@@ -296,6 +241,7 @@ class AppointmentScheduler:
             
             # Insert appointment into database
             result = mongo.db.appointments.insert_one(appointment_doc)
+            invalidate_appointment_dashboard(appointment_doc)
             appointment_id = result.inserted_id
             
             # Update document with ID
@@ -493,6 +439,7 @@ def update_appointment_meeting_info(appointment_id: ObjectId) -> bool:
             {'_id': appointment_id},
             {'$set': {'meeting_info': new_meeting_info, 'updated_at': datetime.utcnow()}}
         )
+        invalidate_appointment_dashboard(appointment)
         
         logger.info(f"Updated meeting info for appointment {appointment_id}")
         return True
@@ -528,6 +475,7 @@ def update_zoom_meeting_in_appointment(appointment_id: ObjectId,
                         'zoom_updated': True
                     }}
                 )
+                invalidate_appointment_dashboard(appointment)
                 return True
             else:
                 logger.warning(f"❌ Failed to update OAuth Zoom meeting: {result}")
@@ -565,6 +513,7 @@ def cancel_zoom_meeting_in_appointment(appointment_id: ObjectId) -> bool:
                         'zoom_cancelled': True
                     }}
                 )
+                invalidate_appointment_dashboard(appointment)
                 return True
             else:
                 logger.warning(f"❌ Failed to cancel OAuth Zoom meeting: {result}")
@@ -654,6 +603,7 @@ def refresh_zoom_meeting_for_appointment(appointment_id: ObjectId) -> bool:
                         'refreshed_at': datetime.utcnow()
                     }}
                 )
+                invalidate_appointment_dashboard(appointment)
                 
                 logger.info(f"✅ Refreshed OAuth Zoom meeting for appointment {appointment_id}")
                 return True
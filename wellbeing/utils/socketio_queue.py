@@ -0,0 +1,111 @@
+# wellbeing/utils/socketio_queue.py
+# Socket.IO message-queue configuration for multi-worker deployments
+
+import pickle
+import queue
+import threading
+from typing import Dict, Optional
+
+# Optional: python-socketio ships with Flask-SocketIO
+try:
+    import socketio as python_socketio
+    PYTHON_SOCKETIO_AVAILABLE = True
+except ImportError:
+    PYTHON_SOCKETIO_AVAILABLE = False
+
+LOCAL_QUEUE_SCHEME = 'local://'
+DEFAULT_CHANNEL = 'wellbeing-socketio'
+
+
+if PYTHON_SOCKETIO_AVAILABLE:
+
+    class LocalPubSubManager(python_socketio.PubSubManager):
+        """
+        In-process stand-in for a Redis message queue.
+
+        Every manager on the same channel in this process receives every
+        published message, exactly as separate workers subscribed to one
+        Redis channel would. Messages are pickled on publish, like
+        RedisManager does, so handlers cannot share mutable payloads.
+        Used for tests and for the load test, not for production.
+        """
+
+        name = 'local'
+
+        _subscribers: Dict[str, list] = {}
+        _subscribers_lock = threading.Lock()
+
+        def __init__(self, url: str = LOCAL_QUEUE_SCHEME, channel: str = DEFAULT_CHANNEL,
+                     write_only: bool = False, logger=None):
+            super().__init__(channel=channel, write_only=write_only, logger=logger)
+            self._inbox = None
+            if not write_only:
+                self._inbox = queue.Queue()
+                with self._subscribers_lock:
+                    self._subscribers.setdefault(channel, []).append(self._inbox)
+
+        def _publish(self, data):
+            message = pickle.dumps(data)
+            with self._subscribers_lock:
+                inboxes = list(self._subscribers.get(self.channel, ()))
+            for inbox in inboxes:
+                inbox.put(message)
+
+        def _listen(self):
+            while True:
+                yield self._inbox.get()
+
+        def close(self):
+            """Unsubscribe from the channel."""
+            if self._inbox is None:
+                return
+            with self._subscribers_lock:
+                inboxes = self._subscribers.get(self.channel, [])
+                if self._inbox in inboxes:
+                    inboxes.remove(self._inbox)
+
+
+def make_client_manager(url: str, channel: str = DEFAULT_CHANNEL, write_only: bool = False):
+    """
+    Build a python-socketio client manager for a message-queue URL.
+
+    redis:// and rediss:// use RedisManager, local:// the in-process
+    LocalPubSubManager; anything else is handed to KombuManager.
+    """
+    if not PYTHON_SOCKETIO_AVAILABLE:
+        raise RuntimeError('python-socketio is required for a Socket.IO message queue')
+    if url.startswith(LOCAL_QUEUE_SCHEME):
+        return LocalPubSubManager(url, channel=channel, write_only=write_only)
+    if url.startswith(('redis://', 'rediss://')):
+        return python_socketio.RedisManager(url, channel=channel, write_only=write_only)
+    return python_socketio.KombuManager(url, channel=channel, write_only=write_only)
+
+
+def socketio_options(config) -> dict:
+    """
+    Keyword arguments for socketio.init_app() from app config.
+
+    Without SOCKETIO_MESSAGE_QUEUE the server keeps its single-process
+    in-memory manager. With it, emits are published on SOCKETIO_CHANNEL so
+    a client connected to any worker receives events emitted by any other
+    worker (or by a process that only emits, such as a scheduler job).
+    """
+    options = {'async_mode': config.get('SOCKETIO_ASYNC_MODE', 'threading')}
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    if url:
+        options['client_manager'] = make_client_manager(
+            url, channel=config.get('SOCKETIO_CHANNEL', DEFAULT_CHANNEL)
+        )
+    return options
+
+
+def runs_multiple_workers(config) -> bool:
+    """Whether a message queue connects several worker processes (local:// is one process)."""
+    url = config.get('SOCKETIO_MESSAGE_QUEUE') or ''
+    return bool(url) and not url.startswith(LOCAL_QUEUE_SCHEME)
+
+
+def message_queue_url(config) -> Optional[str]:
+    """The message-queue URL if it is a Redis URL (shared state can live there too)."""
+    url = config.get('SOCKETIO_MESSAGE_QUEUE') or ''
+    return url if url.startswith(('redis://', 'rediss://')) else None
@@ -0,0 +1,124 @@
+# wellbeing/utils/streaming_export.py
+# Constant-memory CSV / NDJSON exports streamed from Mongo cursors
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import Iterable, Iterator, List, Optional
+
+from bson.objectid import ObjectId
+from flask import Response, current_app, request, stream_with_context
+
+from wellbeing import logger
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS  # zlib stream with a gzip header
+
+
+def iter_cursor(cursor, batch_size: Optional[int] = None) -> Iterator[dict]:
+    """
+    Documents from a cursor, fetched EXPORT_BATCH_SIZE at a time.
+
+    Only one batch is held in memory; nothing is materialised with list().
+    """
+    batch_size = batch_size or current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    yield from cursor.batch_size(batch_size)
+
+
+def json_default(value):
+    """json.dumps fallback for Mongo types (ObjectId, datetime)."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_chunks(rows: Iterable[List], header: Optional[List] = None,
+               chunk_bytes: Optional[int] = None) -> Iterator[str]:
+    """
+    Encode rows as CSV, yielding text in chunks of about chunk_bytes.
+
+    A single buffer is reused, so memory stays at one chunk however many
+    rows there are.
+    """
+    chunk_bytes = chunk_bytes or current_app.config.get('EXPORT_CHUNK_BYTES', 65536)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(documents: Iterable[dict], chunk_bytes: Optional[int] = None) -> Iterator[str]:
+    """Encode documents as newline-delimited JSON, in chunks of about chunk_bytes."""
+    chunk_bytes = chunk_bytes or current_app.config.get('EXPORT_CHUNK_BYTES', 65536)
+    lines, size = [], 0
+    for document in documents:
+        line = json.dumps(document, default=json_default) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield ''.join(lines)
+            lines, size = [], 0
+    if lines:
+        yield ''.join(lines)
+
+
+def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _client_accepts_gzip() -> bool:
+    return current_app.config.get('EXPORT_GZIP', True) and 'gzip' in request.headers.get('Accept-Encoding', '')
+
+
+def streaming_response(chunks: Iterable[str], filename: str, mimetype: str) -> Response:
+    """
+    Stream text chunks as a download (chunked transfer, no Content-Length).
+
+    The body is gzip-encoded (Content-Encoding: gzip) when the client
+    accepts it and EXPORT_GZIP is on; browsers save the decoded file.
+    """
+    gzip = _client_accepts_gzip()
+
+    def generate():
+        try:
+            encoded = (chunk.encode('utf-8') for chunk in chunks)
+            yield from (_gzip(encoded) if gzip else encoded)
+        except Exception as e:
+            # Headers are already sent: log and abort so the client sees a
+            # failed download rather than a silently truncated file
+            logger.error(f"Streaming export {filename} failed: {e}")
+            raise
+
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a proxy buffer the whole export
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def stream_csv(rows: Iterable[List], filename: str, header: Optional[List] = None) -> Response:
+    """Stream rows as a CSV download."""
+    return streaming_response(csv_chunks(rows, header), filename, 'text/csv')
+
+
+def stream_ndjson(documents: Iterable[dict], filename: str) -> Response:
+    """Stream documents as an NDJSON download."""
+    return streaming_response(ndjson_chunks(documents), filename, 'application/x-ndjson')
@@ -0,0 +1,345 @@
+# wellbeing/utils/write_behind.py
+# Write-behind queue: batches fire-and-forget inserts into insert_many on a background thread
+
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from bson import json_util
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo.errors import BulkWriteError
+
+from wellbeing import mongo, logger
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue of (collection, document) inserts flushed in batches.
+
+    Callers get the document _id immediately (generated client-side).
+    When the queue is full, enqueue() blocks for up to block_timeout
+    seconds (backpressure); if it is still full the document is written
+    synchronously, so nothing is dropped.
+
+    A failed insert is retried max_retries times with exponential backoff
+    (retry_backoff, 2x, 4x ... seconds). Documents that still fail are
+    appended to spill_path as JSON lines and re-queued by the next worker
+    that starts (replay_spill); without a spill_path they are logged and
+    counted as failed.
+    """
+
+    _STOP = object()
+
+    def __init__(self, max_size: int = 10000, batch_size: int = 100,
+                 flush_interval: float = 0.25, block_timeout: float = 1.0,
+                 max_retries: int = 3, retry_backoff: float = 0.5,
+                 spill_path: Optional[str] = None):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.spill_path = spill_path
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._after_insert: Dict[str, List[Callable]] = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'retries': 0,
+            'failed': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'sync_writes': 0,
+            'max_depth': 0
+        }
+
+    # ----- producer side -----
+
+    def register_after_insert(self, collection: str, callback: Callable[[List[dict]], None]):
+        """Run callback(documents) on the worker after each batch for a collection."""
+        self._after_insert.setdefault(collection, []).append(callback)
+
+    def enqueue(self, collection: str, document: dict) -> ObjectId:
+        """Queue a document for insertion and return its _id."""
+        document.setdefault('_id', ObjectId())
+        self.start()
+
+        try:
+            self._queue.put((collection, document), timeout=self.block_timeout)
+        except queue.Full:
+            # Still full after the backpressure wait: write inline rather than drop
+            logger.warning(f"Write-behind queue full ({self.max_size}), writing {collection} synchronously")
+            self._write_batch(collection, [document])
+            with self._lock:
+                self.stats['sync_writes'] += 1
+            return document['_id']
+
+        with self._lock:
+            self.stats['enqueued'] += 1
+            self.stats['max_depth'] = max(self.stats['max_depth'], self._queue.qsize())
+        return document['_id']
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    # ----- worker side -----
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            self.replay_spill()
+        except Exception as e:
+            logger.error(f"Write-behind spill replay failed: {e}")
+
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                self._queue.task_done()
+                return
+
+            # Gather a batch: whatever arrives within flush_interval, up to batch_size
+            items = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    next_item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_item is self._STOP:
+                    stop = True
+                    break
+                items.append(next_item)
+
+            by_collection = {}
+            for collection, document in items:
+                by_collection.setdefault(collection, []).append(document)
+            for collection, documents in by_collection.items():
+                self._write_batch(collection, documents)
+
+            for _ in items:
+                self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _insert(self, collection: str, documents: List[dict]):
+        """One insert_many: (documents written, documents still to write, error)."""
+        try:
+            mongo.db[collection].insert_many(documents, ordered=False)
+            return documents, [], None
+        except BulkWriteError as e:
+            # A duplicate _id means an earlier attempt (or a replay) already wrote the document
+            errors = [err for err in e.details.get('writeErrors', []) if err.get('code') != DUPLICATE_KEY_ERROR]
+            failed_indexes = {err['index'] for err in errors}
+            written = [doc for i, doc in enumerate(documents) if i not in failed_indexes]
+            pending = [doc for i, doc in enumerate(documents) if i in failed_indexes]
+            return written, pending, errors[0].get('errmsg') if errors else None
+        except Exception as e:
+            # Connection errors and the like: some documents may have landed, retry them all
+            return [], documents, e
+
+    def _write_batch(self, collection: str, documents: List[dict]):
+        written, pending, error = self._insert(collection, documents)
+        for attempt in range(self.max_retries):
+            if not pending:
+                break
+            time.sleep(self.retry_backoff * 2 ** attempt)
+            with self._lock:
+                self.stats['retries'] += 1
+            landed, pending, error = self._insert(collection, pending)
+            written.extend(landed)
+
+        if pending:
+            logger.error(f"Write-behind insert into {collection} failed for {len(pending)} documents "
+                         f"after {self.max_retries + 1} attempts: {error}")
+            self._spill(collection, pending)
+
+        with self._lock:
+            self.stats['written'] += len(written)
+            self.stats['batches'] += 1
+        if not written:
+            return
+
+        for callback in self._after_insert.get(collection, []):
+            try:
+                callback(written)
+            except Exception as e:
+                logger.error(f"Write-behind after-insert hook for {collection} failed: {e}")
+
+    # ----- spill file -----
+
+    def _spill(self, collection: str, documents: List[dict]):
+        """Append documents that could not be written to the spill file."""
+        if self.spill_path:
+            try:
+                with self._spill_lock:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+                    with open(self.spill_path, 'a') as spill:
+                        for document in documents:
+                            spill.write(json_util.dumps({'collection': collection, 'document': document}) + '\n')
+                logger.warning(f"Spilled {len(documents)} {collection} documents to {self.spill_path}")
+                with self._lock:
+                    self.stats['spilled'] += len(documents)
+                return
+            except OSError as e:
+                logger.error(f"Write-behind spill to {self.spill_path} failed: {e}")
+        with self._lock:
+            self.stats['failed'] += len(documents)
+
+    def replay_spill(self) -> int:
+        """Write documents spilled by this or an earlier process; returns how many were read back."""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return 0
+        replay_path = f"{self.spill_path}.{os.getpid()}.replay"
+        try:
+            # Claim the file, so two workers starting together don't both replay it
+            with self._spill_lock:
+                os.replace(self.spill_path, replay_path)
+        except FileNotFoundError:
+            return 0
+
+        by_collection = {}
+        with open(replay_path) as spill:
+            for line in spill:
+                if line.strip():
+                    item = json_util.loads(line)
+                    by_collection.setdefault(item['collection'], []).append(item['document'])
+        os.remove(replay_path)
+
+        count = sum(len(documents) for documents in by_collection.values())
+        logger.info(f"Replaying {count} spilled write-behind documents")
+        with self._lock:
+            self.stats['replayed'] += count
+        for collection, documents in by_collection.items():
+            for start in range(0, len(documents), self.batch_size):
+                # Anything that fails again goes back to the spill file
+                self._write_batch(collection, documents[start:start + self.batch_size])
+        return count
+
+    # ----- shutdown -----
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued document has been written."""
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.empty()
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def stop(self, timeout: float = 10.0):
+        """Flush remaining documents and stop the worker."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats['depth'] = self.depth()
+        stats['max_size'] = self.max_size
+        return stats
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue() -> Optional[WriteBehindQueue]:
+    """Get the process-wide write-behind queue, or None if disabled in config."""
+    global _write_queue
+    if not current_app.config.get('WRITE_BEHIND_ENABLED', True):
+        return None
+    if _write_queue is None:
+        with _write_queue_lock:
+            if _write_queue is None:
+                config = current_app.config
+                write_queue = WriteBehindQueue(
+                    max_size=config.get('WRITE_BEHIND_MAX_QUEUE', 10000),
+                    batch_size=config.get('WRITE_BEHIND_BATCH_SIZE', 100),
+                    flush_interval=config.get('WRITE_BEHIND_FLUSH_INTERVAL', 0.25),
+                    block_timeout=config.get('WRITE_BEHIND_BLOCK_TIMEOUT', 1.0),
+                    max_retries=config.get('WRITE_BEHIND_MAX_RETRIES', 3),
+                    retry_backoff=config.get('WRITE_BEHIND_RETRY_BACKOFF', 0.5),
+                    spill_path=config.get('WRITE_BEHIND_SPILL_PATH') or
+                    os.path.join(current_app.instance_path, 'write_behind_spill.jsonl')
+                )
+                for collection, callback in _pending_hooks:
+                    write_queue.register_after_insert(collection, callback)
+                atexit.register(write_queue.stop)
+                _write_queue = write_queue
+    return _write_queue
+
+
+# Hooks registered at import time, before the queue exists
+_pending_hooks = []
+
+
+def after_insert(collection: str):
+    """Decorator: run fn(documents) after documents are inserted into a collection."""
+    def decorator(fn):
+        _pending_hooks.append((collection, fn))
+        if _write_queue is not None:
+            _write_queue.register_after_insert(collection, fn)
+        return fn
+    return decorator
+
+
+def flush_write_behind(timeout: Optional[float] = None) -> bool:
+    """
+    Wait for queued inserts to land, so a following update or query sees them.
+
+    A no-op (True) when write-behind is disabled or nothing is queued.
+    """
+    write_queue = get_write_queue()
+    if write_queue is None:
+        return True
+    return write_queue.flush(timeout)
+
+
+def write_behind(collection: str, document: dict) -> ObjectId:
+    """
+    Insert a document without waiting for MongoDB.
+
+    Returns the (client-generated) _id straight away. Falls back to a
+    synchronous insert_one, plus the after-insert hooks, when write-behind
+    is disabled.
+    """
+    write_queue = get_write_queue()
+    if write_queue is not None:
+        return write_queue.enqueue(collection, document)
+
+    document.setdefault('_id', ObjectId())
+    mongo.db[collection].insert_one(document)
+    for hook_collection, callback in _pending_hooks:
+        if hook_collection == collection:
+            try:
+                callback([document])
+            except Exception as e:
+                logger.error(f"After-insert hook for {collection} failed: {e}")
+    return document['_id']
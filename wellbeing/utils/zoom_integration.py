@@ -5,14 +5,98 @@ load_dotenv()
 import os
 import requests
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Any, Tuple, Optional
+from typing import Callable, Dict, Any, Iterable, List, Tuple, Optional
+import random
+import threading
 import time
 import uuid
 import base64
 
+from requests.adapters import HTTPAdapter
+
 logger = logging.getLogger(__name__)
 
+# Connection pool, worker pool and retry tuning (read once per process)
+ZOOM_POOL_SIZE = int(os.getenv('ZOOM_POOL_SIZE', '10'))  # keep-alive connections to the Zoom API
+ZOOM_WORKERS = int(os.getenv('ZOOM_WORKERS', '4'))  # concurrent background meeting calls
+ZOOM_MAX_RETRIES = int(os.getenv('ZOOM_MAX_RETRIES', '3'))  # extra attempts on 429/5xx/connection errors
+ZOOM_BACKOFF_SECONDS = float(os.getenv('ZOOM_BACKOFF_SECONDS', '0.5'))  # first retry delay, doubled per attempt
+ZOOM_MAX_BACKOFF_SECONDS = 30  # cap on backoff and on a server's Retry-After
+ZOOM_TIMEOUT = (5, 30)  # (connect, read) seconds
+
+# Zoom may not have acted on these, so every method can be retried
+RETRY_STATUSES = {429, 503}
+# These may follow a half-done write: only retried for idempotent methods
+IDEMPOTENT_RETRY_STATUSES = {500, 502, 504}
+IDEMPOTENT_METHODS = {'GET', 'PATCH', 'PUT', 'DELETE'}
+
+# ----- process-wide HTTP session and OAuth token -----
+
+_session = None
+_session_lock = threading.Lock()
+
+# (oauth_url, client_id, account_id) -> (access_token, expires_at)
+_tokens: Dict[tuple, Tuple[str, float]] = {}
+_token_lock = threading.Lock()
+
+
+def get_zoom_session() -> requests.Session:
+    """The process-wide Session: one keep-alive connection pool for every Zoom call."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=ZOOM_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _retry_delay(attempt: int, response: Optional[requests.Response] = None) -> float:
+    """Retry-After if the server sent one, else exponential backoff with jitter."""
+    if response is not None:
+        try:
+            return min(float(response.headers.get('Retry-After')), ZOOM_MAX_BACKOFF_SECONDS)
+        except (TypeError, ValueError):
+            pass
+    delay = ZOOM_BACKOFF_SECONDS * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), ZOOM_MAX_BACKOFF_SECONDS)
+
+
+def zoom_request(method: str, url: str, max_retries: Optional[int] = None, **kwargs) -> requests.Response:
+    """
+    One Zoom HTTP call on the shared session, retried with backoff.
+
+    429 and 503 are retried for every method; 500/502/504 only for
+    idempotent ones, so a create is never sent twice after Zoom may have
+    acted on it. Connection failures are retried; read timeouts are not.
+    Returns the last response; raises if the last attempt could not connect.
+    """
+    method = method.upper()
+    max_retries = ZOOM_MAX_RETRIES if max_retries is None else max_retries
+    kwargs.setdefault('timeout', ZOOM_TIMEOUT)
+    retry_statuses = RETRY_STATUSES | (IDEMPOTENT_RETRY_STATUSES if method in IDEMPOTENT_METHODS else set())
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = get_zoom_session().request(method, url, **kwargs)
+        except requests.exceptions.ConnectionError:
+            if attempt == max_retries:
+                raise
+            time.sleep(_retry_delay(attempt))
+            continue
+        if response.status_code not in retry_statuses or attempt == max_retries:
+            return response
+        delay = _retry_delay(attempt, response)
+        logger.warning(f"Zoom API {method} {url} returned {response.status_code}, retrying in {delay:.2f}s")
+        time.sleep(delay)
+    return response
+
+
 class ZoomMeetingManager:
     """Manages Zoom meeting creation for therapy appointments using OAuth"""
     
@@ -23,24 +107,45 @@ class ZoomMeetingManager:
         self.account_id = os.getenv('ZOOM_ACCOUNT_ID')
         self.user_email = os.getenv('ZOOM_USER_EMAIL')
         
-        # API endpoints
-        self.base_url = 'https://api.zoom.us/v2'
-        self.oauth_url = 'https://zoom.us/oauth/token'
-        
-        # Token caching
-        self._access_token = None
-        self._token_expires_at = 0
+        # API endpoints (overridable to point at a local fake server)
+        self.base_url = os.getenv('ZOOM_API_BASE_URL', 'https://api.zoom.us/v2')
+        self.oauth_url = os.getenv('ZOOM_OAUTH_URL', 'https://zoom.us/oauth/token')
         
         if not all([self.client_id, self.client_secret, self.account_id]):
             logger.warning("Zoom OAuth credentials not configured - using fallback mode")
     
+    @property
+    def _token_key(self) -> tuple:
+        return (self.oauth_url, self.client_id, self.account_id)
+    
     def get_access_token(self) -> Optional[str]:
-        """Get OAuth access token for Zoom API authentication"""
+        """
+        Get OAuth access token for Zoom API authentication
+        
+        The token is shared by every manager in the process; only one
+        thread requests a new one when it expires.
+        """
+        cached = _tokens.get(self._token_key)
+        if cached and time.time() < cached[1]:
+            return cached[0]
+        
+        with _token_lock:
+            # Another thread may have refreshed it while we waited
+            cached = _tokens.get(self._token_key)
+            if cached and time.time() < cached[1]:
+                return cached[0]
+            return self._request_access_token()
+    
+    def invalidate_access_token(self, token: Optional[str] = None):
+        """Drop the shared token (only if it is still the given one) so the next call fetches a new one."""
+        with _token_lock:
+            cached = _tokens.get(self._token_key)
+            if cached and (token is None or cached[0] == token):
+                del _tokens[self._token_key]
+    
+    def _request_access_token(self) -> Optional[str]:
+        """Request a new token from Zoom and cache it (call with _token_lock held)."""
         try:
-            # Return cached token if still valid
-            if self._access_token and time.time() < self._token_expires_at:
-                return self._access_token
-            
             # Create base64 encoded authorization header
             credentials = f"{self.client_id}:{self.client_secret}"
             encoded_credentials = base64.b64encode(credentials.encode()).decode()
@@ -55,22 +160,22 @@ class ZoomMeetingManager:
                 'account_id': self.account_id
             }
             
-            response = requests.post(
+            response = zoom_request(
+                'POST',
                 self.oauth_url,
                 headers=headers,
-                data=data,
-                timeout=30
+                data=data
             )
             
             if response.status_code == 200:
                 token_data = response.json()
-                self._access_token = token_data['access_token']
+                access_token = token_data['access_token']
                 
                 # Set expiration time (subtract 5 minutes for safety)
                 expires_in = token_data.get('expires_in', 3600)
-                self._token_expires_at = time.time() + expires_in - 300
+                _tokens[self._token_key] = (access_token, time.time() + expires_in - 300)
                 
-                return self._access_token
+                return access_token
             else:
                 logger.error(f"OAuth token request failed: {response.status_code} - {response.text}")
                 return None
@@ -79,6 +184,25 @@ class ZoomMeetingManager:
             logger.error(f"Error getting OAuth access token: {str(e)}")
             return None
     
+    def _api_request(self, method: str, path: str, **kwargs) -> Optional[requests.Response]:
+        """
+        Authenticated Zoom API call (None if no token could be obtained)
+        
+        A 401 means the shared token was revoked or expired early: it is
+        refreshed once and the call repeated.
+        """
+        headers = kwargs.pop('headers', None) or {}
+        for _ in range(2):
+            token = self.get_access_token()
+            if not token:
+                return None
+            response = zoom_request(method, f'{self.base_url}{path}',
+                                    headers={**headers, 'Authorization': f'Bearer {token}'}, **kwargs)
+            if response.status_code != 401:
+                return response
+            self.invalidate_access_token(token)
+        return response
+    
     def create_therapy_meeting(self, 
                              appointment_data: Dict[str, Any],
                              student_email: str = None,
@@ -98,29 +222,16 @@ class ZoomMeetingManager:
             if not all([self.client_id, self.client_secret, self.account_id]):
                 return self._create_fallback_meeting(appointment_data)
             
-            # Get OAuth access token
-            token = self.get_access_token()
-            if not token:
-                return self._create_fallback_meeting(appointment_data)
-            
             # Prepare meeting data
             meeting_data = self._prepare_meeting_data(appointment_data, student_email, therapist_email)
             
-            # Create meeting via Zoom API
-            headers = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json'
-            }
-            
             # Use 'me' or the configured user email
             user_id = self.user_email if self.user_email else 'me'
             
-            response = requests.post(
-                f'{self.base_url}/users/{user_id}/meetings',
-                json=meeting_data,
-                headers=headers,
-                timeout=30
-            )
+            # Create meeting via Zoom API
+            response = self._api_request('POST', f'/users/{user_id}/meetings', json=meeting_data)
+            if response is None:
+                return self._create_fallback_meeting(appointment_data)
             
             if response.status_code == 201:
                 meeting_response = response.json()
@@ -277,15 +388,6 @@ This is a confidential therapy session. Please maintain privacy and professional
             if not all([self.client_id, self.client_secret, self.account_id]):
                 return False, {'error': 'Zoom OAuth not configured'}
             
-            token = self.get_access_token()
-            if not token:
-                return False, {'error': 'Failed to get access token'}
-            
-            headers = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json'
-            }
-            
             # Prepare update data
             update_data = {
                 'start_time': appointment_data['datetime'].strftime('%Y-%m-%dT%H:%M:%S'),
@@ -293,12 +395,9 @@ This is a confidential therapy session. Please maintain privacy and professional
                 'timezone': 'America/New_York'
             }
             
-            response = requests.patch(
-                f'{self.base_url}/meetings/{meeting_id}',
-                json=update_data,
-                headers=headers,
-                timeout=30
-            )
+            response = self._api_request('PATCH', f'/meetings/{meeting_id}', json=update_data)
+            if response is None:
+                return False, {'error': 'Failed to get access token'}
             
             if response.status_code == 204:  # No content = success
                 logger.info(f"Updated Zoom meeting: {meeting_id}")
@@ -317,20 +416,10 @@ This is a confidential therapy session. Please maintain privacy and professional
             if not all([self.client_id, self.client_secret, self.account_id]):
                 return False, {'error': 'Zoom OAuth not configured'}
             
-            token = self.get_access_token()
-            if not token:
+            response = self._api_request('DELETE', f'/meetings/{meeting_id}')
+            if response is None:
                 return False, {'error': 'Failed to get access token'}
             
-            headers = {
-                'Authorization': f'Bearer {token}'
-            }
-            
-            response = requests.delete(
-                f'{self.base_url}/meetings/{meeting_id}',
-                headers=headers,
-                timeout=30
-            )
-            
             if response.status_code == 204:  # No content = success
                 logger.info(f"Cancelled Zoom meeting: {meeting_id}")
                 return True, {'message': 'Meeting cancelled successfully'}
@@ -348,20 +437,10 @@ This is a confidential therapy session. Please maintain privacy and professional
             if not all([self.client_id, self.client_secret, self.account_id]):
                 return False, {'error': 'Zoom OAuth not configured'}
             
-            token = self.get_access_token()
-            if not token:
+            response = self._api_request('GET', f'/meetings/{meeting_id}')
+            if response is None:
                 return False, {'error': 'Failed to get access token'}
             
-            headers = {
-                'Authorization': f'Bearer {token}'
-            }
-            
-            response = requests.get(
-                f'{self.base_url}/meetings/{meeting_id}',
-                headers=headers,
-                timeout=30
-            )
-            
             if response.status_code == 200:
                 meeting_data = response.json()
                 return True, meeting_data
@@ -372,6 +451,60 @@ This is a confidential therapy session. Please maintain privacy and professional
             logger.error(f"Error getting Zoom meeting info: {str(e)}")
             return False, {'error': str(e)}
 
+# ----- process-wide manager and worker pool -----
+
+_manager = None
+_executor = None
+_pool_lock = threading.Lock()
+
+
+def get_zoom_manager() -> ZoomMeetingManager:
+    """The process-wide manager (credentials are read once)."""
+    global _manager
+    if _manager is None:
+        with _pool_lock:
+            if _manager is None:
+                _manager = ZoomMeetingManager()
+    return _manager
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ZOOM_WORKERS, thread_name_prefix='zoom')
+    return _executor
+
+
+def submit_zoom_task(fn: Callable, *args, **kwargs) -> Future:
+    """
+    Run a Zoom call in the background on the bounded worker pool
+    
+    At most ZOOM_WORKERS calls run at once; the rest queue. Errors are
+    logged rather than lost with the thread.
+    """
+    def run():
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Background Zoom task {getattr(fn, '__name__', fn)} failed: {str(e)}")
+            raise
+    return _get_executor().submit(run)
+
+
+def _run_batch(fn: Callable, calls: Iterable[tuple]) -> List[Tuple[bool, Dict[str, Any]]]:
+    """Run fn(*call) for every call on the worker pool; results in input order."""
+    futures = [submit_zoom_task(fn, *call) for call in calls]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append((False, {'error': str(e)}))
+    return results
+
+
 # Convenience functions for easy integration
 
 def create_zoom_therapy_meeting(appointment_data: Dict[str, Any], 
@@ -388,23 +521,41 @@ def create_zoom_therapy_meeting(appointment_data: Dict[str, Any],
     Returns:
         Tuple of (success: bool, meeting_info: dict)
     """
-    zoom_manager = ZoomMeetingManager()
-    return zoom_manager.create_therapy_meeting(appointment_data, student_email, therapist_email)
+    return get_zoom_manager().create_therapy_meeting(appointment_data, student_email, therapist_email)
 
 def update_zoom_meeting(meeting_id: str, appointment_data: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
     """Update a Zoom meeting"""
-    zoom_manager = ZoomMeetingManager()
-    return zoom_manager.update_meeting(meeting_id, appointment_data)
+    return get_zoom_manager().update_meeting(meeting_id, appointment_data)
 
 def cancel_zoom_meeting(meeting_id: str) -> Tuple[bool, Dict[str, Any]]:
     """Cancel a Zoom meeting"""
-    zoom_manager = ZoomMeetingManager()
-    return zoom_manager.cancel_meeting(meeting_id)
+    return get_zoom_manager().cancel_meeting(meeting_id)
+
+def create_zoom_therapy_meetings(meetings: Iterable[Tuple[Dict[str, Any], Optional[str], Optional[str]]]
+                                 ) -> List[Tuple[bool, Dict[str, Any]]]:
+    """
+    Create several meetings concurrently on the worker pool
+    
+    Args:
+        meetings: (appointment_data, student_email, therapist_email) tuples
+        
+    Returns:
+        One (success, meeting_info) per request, in the same order
+    """
+    return _run_batch(create_zoom_therapy_meeting, meetings)
+
+def update_zoom_meetings(updates: Iterable[Tuple[str, Dict[str, Any]]]) -> List[Tuple[bool, Dict[str, Any]]]:
+    """Update several meetings concurrently ((meeting_id, appointment_data) tuples), in order"""
+    return _run_batch(update_zoom_meeting, updates)
+
+def cancel_zoom_meetings(meeting_ids: Iterable[str]) -> List[Tuple[bool, Dict[str, Any]]]:
+    """Cancel several meetings concurrently, results in order"""
+    return _run_batch(cancel_zoom_meeting, [(meeting_id,) for meeting_id in meeting_ids])
 
 def test_zoom_integration() -> bool:
     """Test Zoom OAuth integration"""
     try:
-        zoom_manager = ZoomMeetingManager()
+        zoom_manager = get_zoom_manager()
         
         # Test with dummy data
         test_appointment = {
@@ -176,96 +176,36 @@ class TherapistMatcher:
     @classmethod
     def find_best_match(cls, student_data: Dict, crisis_level: str) -> Optional[Dict]:
         """Find the best therapist match for student needs"""
-        from app import mongo  # Import here to avoid circular imports
+        # Import here to avoid circular imports
+        from wellbeing.services.therapist_matching import rank_therapists
         
         # Build matching criteria
         primary_concern = student_data.get('primary_concern')
         gender_preference = student_data.get('therapist_gender', 'no_preference')
-        appointment_type = student_data.get('appointment_type', 'virtual')
-        
-        # Base query
-        query = {
-            'status': 'active',
-            'current_students': {'$lt': '$max_students'}
-        }
-        
-        # Add specialization filter
-        if primary_concern and primary_concern != 'other':
-            query['specializations'] = {'$in': [primary_concern]}
-        
-        # Add gender preference
-        if gender_preference != 'no_preference':
-            query['gender'] = gender_preference
-        
-        # Crisis-specific filters
-        if crisis_level in ['high', 'critical']:
-            query['emergency_hours'] = True
-        
-        # Get potential matches
-        therapists = list(mongo.db.therapists.find(query))
+        is_crisis = crisis_level in ['high', 'critical']
+        
+        # Specialists with room for another student, scored and ranked by the matching index
+        matches = rank_therapists(
+            specialization=primary_concern,
+            require_specialization=bool(primary_concern and primary_concern != 'other'),
+            gender=gender_preference,
+            require_gender=True,
+            crisis_level=crisis_level,
+            require_emergency=is_crisis,
+            limit=1
+        )
         
-        if not therapists:
+        if not matches and is_crisis:
             # Fallback: Remove strict filters for emergency cases
-            if crisis_level in ['high', 'critical']:
-                fallback_query = {
-                    'status': 'active',
-                    'current_students': {'$lt': '$max_students'},
-                    'emergency_hours': True
-                }
-                therapists = list(mongo.db.therapists.find(fallback_query))
-        
-        if not therapists:
-            return None
-        
-        # Score and rank therapists
-        scored_therapists = []
-        for therapist in therapists:
-            score = cls._calculate_match_score(therapist, student_data, crisis_level)
-            scored_therapists.append((score, therapist))
-        
-        # Sort by score (highest first)
-        scored_therapists.sort(key=lambda x: x[0], reverse=True)
-        
-        return scored_therapists[0][1] if scored_therapists else None
-    
-    @classmethod
-    def _calculate_match_score(cls, therapist: Dict, student_data: Dict, crisis_level: str) -> int:
-        """Calculate matching score for therapist-student pair"""
-        score = 0
-        
-        # Specialization match
-        primary_concern = student_data.get('primary_concern')
-        if primary_concern in therapist.get('specializations', []):
-            score += 10
-        
-        # Crisis handling capability
-        if crisis_level in ['high', 'critical'] and therapist.get('emergency_hours'):
-            score += 15
-        
-        # Workload factor (prefer less busy therapists)
-        current_load = therapist.get('current_students', 0)
-        max_students = therapist.get('max_students', 20)
-        if current_load < max_students * 0.7:  # Less than 70% capacity
-            score += 5
-        
-        # Experience factor
-        total_sessions = therapist.get('total_sessions', 0)
-        if total_sessions > 100:
-            score += 3
-        
-        # Rating factor
-        rating = therapist.get('rating', 0)
-        if rating >= 4.5:
-            score += 5
-        elif rating >= 4.0:
-            score += 3
-        
-        # Gender preference match
-        gender_pref = student_data.get('therapist_gender', 'no_preference')
-        if gender_pref != 'no_preference' and therapist.get('gender') == gender_pref:
-            score += 5
+            matches = rank_therapists(
+                specialization=primary_concern,
+                gender=gender_preference,
+                crisis_level=crisis_level,
+                require_emergency=True,
+                limit=1
+            )
         
-        return score
+        return matches[0] if matches else None
 
 # =============================================================================
 # 4. GOOGLE MEET INTEGRATION
@@ -372,6 +312,12 @@ class AppointmentScheduler:
         
         availability = therapist.get('availability', {})
         
+        # All bookings in the window at once instead of a query per slot
+        from wellbeing.utils.availability import load_booked_intervals
+        booked = load_booked_intervals(
+            [therapist['_id']], since=now, until=now + timedelta(days=days_ahead + 1)
+        )[therapist['_id']]
+        
         for day_offset in range(days_ahead):
             check_date = now + timedelta(days=day_offset)
             day_name = check_date.strftime('%A').lower()
@@ -388,7 +334,7 @@ class AppointmentScheduler:
                 while current_time < end_datetime:
                     if current_time > now:  # Only future slots
                         # Check if slot is available (not booked)
-                        if cls._is_slot_available(therapist['_id'], current_time):
+                        if booked.is_free(current_time, current_time + timedelta(hours=1)):
                             slots.append({
                                 'datetime': current_time,
                                 'formatted': current_time.strftime('%A, %B %d at %I:%M %p'),
@@ -401,20 +347,6 @@ class AppointmentScheduler:
         
         return slots[:10]  # Limit to first 10 available slots
     
-    @classmethod
-    def _is_slot_available(cls, therapist_id: str, slot_datetime: datetime) -> bool:
-        """Check if appointment slot is available"""
-        from app import mongo
-        
-        # Check for existing appointments in this time slot
-        existing = mongo.db.appointments.find_one({
-            'therapist_id': therapist_id,
-            'datetime': slot_datetime,
-            'status': {'$in': ['confirmed', 'suggested']}
-        })
-        
-        return existing is None
-    
     @classmethod
     def _select_optimal_slot(cls, slots: List[Dict], crisis_level: str) -> Dict:
         """Select the best available slot based on urgency"""